@@ -148,6 +148,7 @@ else:
     # Checkpointing
     #-----------------------------
     from anuga.shallow_water.checkpoint import load_checkpoint_file
+    from anuga.shallow_water.checkpoint import load_checkpoint_state
 
 
     #-----------------------------
@@ -274,6 +275,8 @@ else:
     from anuga.operators.erosion_operators import Flat_slice_erosion_operator
     from anuga.operators.erosion_operators import Flat_fill_slice_erosion_operator
 
+    from anuga.operators.probe_operator import Probe_operator
+
 
 
 
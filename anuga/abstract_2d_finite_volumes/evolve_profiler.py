@@ -0,0 +1,268 @@
+"""Low overhead timing of the phases of the evolve loop
+
+Enable with
+
+    domain.set_profiling()
+
+The profiler replaces the methods of the domain listed in profiled_methods
+by timed versions (on the domain instance only, so there is no cost when
+profiling is off), and accumulates the wall time and number of calls of
+each phase. Fractional step operators are timed by their label. Counters
+provided by the domain (eg the number of edge flux evaluations done by
+the C kernels) are sampled at each yieldstep.
+
+Phases are timed inclusively: 'step' is the whole timestep (including
+'fluxes', 'extrapolation', ...) and 'timestep' includes the reduction of
+the timestep over all processors in parallel runs.
+
+Results are available from domain.get_profile(), as text from
+domain.profile_statistics() and per yieldstep as csv or json from
+domain.write_profile(filename).
+"""
+
+import json
+from time import time as walltime
+
+
+# Domain methods timed by the profiler and the name of their phase
+profiled_methods = [('evolve_one_euler_step', 'step'),
+                    ('evolve_one_rk2_step', 'step'),
+                    ('evolve_one_rk3_step', 'step'),
+                    ('distribute_to_vertices_and_edges', 'extrapolation'),
+                    ('update_boundary', 'boundary'),
+                    ('compute_fluxes', 'fluxes'),
+                    ('compute_forcing_terms', 'forcing'),
+                    ('update_conserved_quantities', 'update'),
+                    ('update_timestep', 'timestep'),
+                    ('update_ghosts', 'ghosts'),
+                    ('store_timestep', 'storage')]
+
+
+class Evolve_profiler:
+    """Accumulate wall time and call counts of the phases of evolve
+    """
+
+    def __init__(self):
+
+        # phase name: [wall time, calls], since the start of profiling
+        self.phases = {}
+
+        # Counters of the domain at the start of profiling and last record
+        self.counters_start = None
+        self.counters_last = None
+
+        # Phases at the last record
+        self.phases_last = {}
+
+        # One dictionary per yieldstep (see record)
+        self.records = []
+
+        self.walltime_last = walltime()
+
+    def wrap(self, domain):
+        """Replace the profiled methods of domain by timed versions
+        """
+
+        for method_name, phase in profiled_methods:
+            if method_name in domain.__dict__:
+                continue
+            method = getattr(domain, method_name, None)
+            if method is not None:
+                setattr(domain, method_name, self.timed(method, phase))
+
+        if self.counters_start is None:
+            self.counters_start = domain.get_profile_counters()
+            self.counters_last = self.counters_start
+
+    def unwrap(self, domain):
+        """Restore the methods of the domain
+        """
+
+        for method_name, phase in profiled_methods:
+            if method_name in domain.__dict__:
+                delattr(domain, method_name)
+
+    def timed(self, method, phase):
+        """Return method wrapped to accumulate its time under phase
+        """
+
+        entry = self.phases.setdefault(phase, [0.0, 0])
+
+        def timed_method(*args, **kwargs):
+            t0 = walltime()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                entry[0] += walltime() - t0
+                entry[1] += 1
+
+        return timed_method
+
+    def time_operator(self, operator):
+        """Call a fractional step operator and accumulate its time under
+        'operator:<label>'
+        """
+
+        label = getattr(operator, 'label', operator.__class__.__name__)
+        entry = self.phases.setdefault('operator:' + label, [0.0, 0])
+
+        t0 = walltime()
+        operator()
+        entry[0] += walltime() - t0
+        entry[1] += 1
+
+    def record(self, domain):
+        """Store the phase times, calls and counters since the previous
+        record, called at each yieldstep
+        """
+
+        now = walltime()
+        counters = domain.get_profile_counters()
+
+        record = {'time': domain.get_time(),
+                  'walltime': now - self.walltime_last,
+                  'phases': {},
+                  'counters': {}}
+
+        for phase, (time, calls) in self.phases.items():
+            time_last, calls_last = self.phases_last.get(phase, (0.0, 0))
+            record['phases'][phase] = {'time': time - time_last,
+                                       'calls': calls - calls_last}
+
+        for name, value in counters.items():
+            record['counters'][name] = value - self.counters_last.get(name, 0)
+
+        self.records.append(record)
+
+        self.phases_last = dict((phase, tuple(entry))
+                                for phase, entry in self.phases.items())
+        self.counters_last = counters
+        self.walltime_last = now
+
+    def get_profile(self, domain):
+        """Return dictionary with the totals since the start of profiling
+
+            'phases':     {phase: {'time': seconds, 'calls': n}}
+            'counters':   {counter: value}
+            'yieldsteps': list of the per yieldstep records
+        """
+
+        counters = domain.get_profile_counters()
+
+        profile = {'phases': {}, 'counters': {}, 'yieldsteps': self.records}
+        for phase, (time, calls) in self.phases.items():
+            profile['phases'][phase] = {'time': time, 'calls': calls}
+        for name, value in counters.items():
+            profile['counters'][name] = value - self.counters_start.get(name, 0)
+
+        return profile
+
+
+def profile_statistics(profile):
+    """Return string with the phase times and counters of profile (as
+    returned by get_profile or aggregate_profiles)
+    """
+
+    phases = profile['phases']
+    step_time = phases.get('step', {}).get('time', 0.0)
+
+    msg = 'Evolve profile:\n'
+    msg += '    %-32s %12s %10s %8s\n' % ('phase', 'time [s]', 'calls', '% step')
+    for phase in sorted(phases.keys(), key=lambda p: -phases[p]['time']):
+        time = phases[phase]['time']
+        if step_time > 0.0:
+            fraction = '%8.1f' % (100.0*time/step_time)
+        else:
+            fraction = '%8s' % '-'
+        msg += '    %-32s %12.4f %10d %s\n' % (phase, time,
+                                                phases[phase]['calls'],
+                                                fraction)
+
+    for name in sorted(profile['counters'].keys()):
+        msg += '    %-32s %12d\n' % (name, profile['counters'][name])
+
+    return msg
+
+
+def aggregate_profiles(profiles):
+    """Combine the profiles of the processors of a parallel run.
+
+    Phase times and calls of each processor are reduced to their
+    minimum, mean and maximum ('time' and 'calls' are the maximum, the
+    critical path), counters are summed. The per yieldstep records are
+    combined in the same way.
+    """
+
+    def combine(phases_list, counters_list):
+        phases = {}
+        names = set()
+        for p in phases_list:
+            names.update(p.keys())
+        for name in names:
+            times = [p.get(name, {'time': 0.0})['time'] for p in phases_list]
+            calls = [p.get(name, {'calls': 0})['calls'] for p in phases_list]
+            phases[name] = {'time': max(times),
+                            'time_min': min(times),
+                            'time_mean': sum(times)/len(times),
+                            'calls': max(calls)}
+
+        counters = {}
+        for c in counters_list:
+            for name, value in c.items():
+                counters[name] = counters.get(name, 0) + value
+
+        return phases, counters
+
+    phases, counters = combine([p['phases'] for p in profiles],
+                               [p['counters'] for p in profiles])
+
+    yieldsteps = []
+    for records in zip(*[p['yieldsteps'] for p in profiles]):
+        r_phases, r_counters = combine([r['phases'] for r in records],
+                                       [r['counters'] for r in records])
+        yieldsteps.append({'time': records[0]['time'],
+                           'walltime': max([r['walltime'] for r in records]),
+                           'phases': r_phases,
+                           'counters': r_counters})
+
+    return {'phases': phases, 'counters': counters, 'yieldsteps': yieldsteps,
+            'numprocs': len(profiles)}
+
+
+def write_profile(profile, filename):
+    """Write the per yieldstep records of profile to filename, as json if
+    filename ends with '.json' and otherwise as csv with one row per
+    yieldstep and columns <phase>_time, <phase>_calls and the counters
+    """
+
+    if filename.endswith('.json'):
+        fid = open(filename, 'w')
+        json.dump(profile, fid, indent=1, sort_keys=True)
+        fid.close()
+        return
+
+    records = profile['yieldsteps']
+
+    phases = set()
+    counters = set()
+    for r in records:
+        phases.update(r['phases'].keys())
+        counters.update(r['counters'].keys())
+    phases = sorted(phases)
+    counters = sorted(counters)
+
+    header = ['time', 'walltime']
+    for phase in phases:
+        header += [phase + '_time', phase + '_calls']
+    header += counters
+
+    fid = open(filename, 'w')
+    fid.write(','.join(header) + '\n')
+    for r in records:
+        row = ['%.6f' % r['time'], '%.6f' % r['walltime']]
+        for phase in phases:
+            entry = r['phases'].get(phase, {'time': 0.0, 'calls': 0})
+            row += ['%.6f' % entry['time'], '%d' % entry['calls']]
+        row += ['%d' % r['counters'].get(name, 0) for name in counters]
+        fid.write(','.join(row) + '\n')
+    fid.close()
@@ -16,6 +16,7 @@ import numpy as num
 
 from anuga.geospatial_data.geospatial_data import ensure_absolute
 from anuga.file.netcdf import NetCDFFile
+from anuga.file.sww import is_timeseries_chunked, read_timeseries
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
 from anuga.utilities.numerical_tools import ensure_numeric
 
@@ -445,9 +446,27 @@ def get_netcdf_file_function(filename,
     
     # Produce values for desired data points at
     # each timestep for each quantity
+    vertex_ids = None
+    if spatial and interpolation_points is not None and \
+           filename.endswith('sww') and \
+           num.any([is_timeseries_chunked(fid.variables[name])
+                    for name in quantity_names]):
+        # Read only the time series of the vertices used by the
+        # interpolation, one read per chunk
+        vertex_ids = get_interpolation_vertices(vertex_coordinates,
+                                                triangles,
+                                                interpolation_points,
+                                                output_centroids)
+
     quantities = {}
     for i, name in enumerate(quantity_names):
-        quantities[name] = fid.variables[name][:]
+        var = fid.variables[name]
+        if vertex_ids is None:
+            quantities[name] = var[:]
+        elif is_timeseries_chunked(var):
+            quantities[name] = read_timeseries(var, vertex_ids)
+        else:
+            quantities[name] = num.take(var[:], vertex_ids, axis=-1)
         if boundary_polygon is not None:
             #removes sts points that do not lie on boundary
             quantities[name] = num.take(quantities[name], gauge_id, axis=1)
@@ -477,8 +496,25 @@ def get_netcdf_file_function(filename,
                                    time_thinning=time_thinning,
                                    verbose=verbose,
                                    gauge_neighbour_id=gauge_neighbour_id,
-                                   output_centroids=output_centroids),
+                                   output_centroids=output_centroids,
+                                   vertex_ids=vertex_ids),
             starttime)
 
     # NOTE (Ole): Caching Interpolation function is too slow as
     # the very long parameters need to be hashed.
+
+
+def get_interpolation_vertices(vertex_coordinates, triangles,
+                               interpolation_points, output_centroids=False):
+    """Return the sorted indices of the vertices of the triangles which
+    contain the interpolation points, the only vertex values needed to
+    interpolate at these points.
+    """
+
+    from anuga.fit_interpolate.interpolate import Interpolate
+
+    interpol = Interpolate(vertex_coordinates, triangles)
+    A = interpol._build_interpolation_matrix_A(interpolation_points,
+                                               output_centroids)[0]
+
+    return sorted(set([j for (i, j) in A.Data.keys()]))
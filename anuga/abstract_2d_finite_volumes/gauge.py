@@ -22,6 +22,11 @@ import anuga.utilities.log as log
 
 from math import sqrt
 
+from anuga.utilities.numerical_tools import NAN
+
+# Default number of timesteps read and interpolated at a time
+DEFAULT_TIME_BLOCK = 100
+
 def _quantities2csv(quantities, point_quantities, centroids, point_i):
     points_list = []
     
@@ -84,7 +89,8 @@ def sww2csv_gauges(sww_file,
                                'xmomentum', 'ymomentum'],
                    verbose=False,
                    use_cache=True,
-                   output_centroids=False):
+                   output_centroids=False,
+                   time_block=DEFAULT_TIME_BLOCK):
     """
     
     Inputs: 
@@ -104,6 +110,11 @@ def sww2csv_gauges(sww_file,
         must be the same! ALL lowercaps!
 
         out_name: prefix for output file name (default is 'gauge_')
+
+        time_block: number of timesteps read from the sww file and
+        interpolated to all gauges at a time (see Gauge_interpolator).
+        use_cache is no longer used, the interpolation matrix is built
+        once per sww file.
         
     Outputs: 
         one file for each gauge/point location in the points file. They
@@ -131,47 +142,13 @@ def sww2csv_gauges(sww_file,
     This is really returning speed, not velocity.
     """
     
-    from csv import reader,writer
-    from anuga.utilities.numerical_tools import ensure_numeric, mean, NAN
-    import string
+    from csv import writer
     from anuga.utilities.file_utils import get_all_swwfiles
-    from anuga.abstract_2d_finite_volumes.util import file_function    
 
     assert isinstance(gauge_file,str) or isinstance(gauge_file, unicode), 'Gauge filename must be a string or unicode'
     assert isinstance(out_name,str) or isinstance(out_name, unicode), 'Output filename prefix must be a string'
-    
-    try:
-        point_reader = reader(file(gauge_file))
-    except Exception, e:
-        msg = 'File "%s" could not be opened: Error="%s"' % (gauge_file, e)
-        raise Exception(msg)
 
-    if verbose: log.critical('Gauges obtained from: %s' % gauge_file)
-    
-    point_reader = reader(file(gauge_file))
-    points = []
-    point_name = []
-    
-    # read point info from file
-    for i,row in enumerate(point_reader):
-        # read header and determine the column numbers to read correctly.
-        if i==0:
-            for j,value in enumerate(row):
-                if value.strip()=='easting':easting=j
-                if value.strip()=='northing':northing=j
-                if value.strip()=='name':name=j
-                if value.strip()=='elevation':elevation=j
-        else:
-            #points.append([float(row[easting]),float(row[northing])])
-            points.append([float(row[easting]),float(row[northing])])
-            point_name.append(row[name])
-        
-    #convert to array for file_function
-    points_array = num.array(points,num.float)
-        
-    points_array = ensure_absolute(points_array)
-
-    #print 'points_array', points_array
+    points_array, point_name = _read_gauge_file(gauge_file, verbose)
 
     dir_name, base = os.path.split(sww_file)    
 
@@ -199,11 +176,6 @@ def sww2csv_gauges(sww_file,
     #to make all the quantities lower case for file_function
     quantities = [quantity.lower() for quantity in quantities]
 
-    # what is quantities are needed from sww file to calculate output quantities
-    # also 
-
-    core_quantities = ['stage', 'elevation', 'xmomentum', 'ymomentum']
-
     gauge_file = out_name
 
     heading = [quantity for quantity in quantities]
@@ -217,40 +189,299 @@ def sww2csv_gauges(sww_file,
     is_opened = [False]*len(points_array)
     for sww_file in sww_files:
         sww_file = join(dir_name, sww_file+'.sww')
-        callable_sww = file_function(sww_file,
-                                     quantities=core_quantities,
-                                     interpolation_points=points_array,
-                                     verbose=verbose,
-                                     use_cache=use_cache,
-                                     output_centroids = output_centroids)
+        gauges = Gauge_interpolator(sww_file, points_array,
+                                    output_centroids=output_centroids,
+                                    verbose=verbose)
 
         if quake_offset_time is None:
-            quake_offset_time = callable_sww.starttime
+            quake_offset_time = gauges.starttime
 
-        for point_i, point in enumerate(points_array):
-            for time in callable_sww.get_time():
-                # add domain starttime to relative time.
-                quake_time = time + quake_offset_time
-                point_quantities = callable_sww(time, point_i) # __call__ is overridden
+        if verbose:
+            for point_i in gauges.get_outside_indices():
+                msg = 'gauge' + point_name[point_i] + 'falls off the mesh in file ' + sww_file + '.'
+                log.warning(msg)
+
+        inside = gauges.get_inside_indices()
+
+        # Append each block of timesteps to the csv files of all gauges
+        for time, values in gauges.blocks(time_block):
+            point_quantities = num.array([values[name] for name in
+                                          gauges.quantity_names])
+
+            for point_i in inside:
+                filename = dir_name + sep + gauge_file + point_name[point_i] + '.csv'
+                if is_opened[point_i] == False:
+                    points_file = file(filename, "wb")
+                    points_writer = writer(points_file)
+                    points_writer.writerow(heading)
+                    is_opened[point_i] = True
+                else:
+                    points_file = file(filename, "ab")
+                    points_writer = writer(points_file)
+
+                for j, t in enumerate(time):
+                    # add domain starttime to relative time.
+                    quake_time = t + quake_offset_time
+                    points_list = [quake_time, quake_time/3600.] + \
+                        _quantities2csv(quantities,
+                                        point_quantities[:, point_i, j],
+                                        gauges.centroids, point_i)
+                    points_writer.writerow(points_list)
 
+                points_file.close()
 
-                if point_quantities[0] != NAN:
-                    if is_opened[point_i] == False:
-                        points_writer = writer(file(dir_name + sep + gauge_file
-                                                    + point_name[point_i] + '.csv', "wb"))
-                        points_writer.writerow(heading)
-                        is_opened[point_i] = True
-                    else:
-                        points_writer = writer(file(dir_name + sep + gauge_file
-                                                    + point_name[point_i] + '.csv', "ab"))
+        gauges.close()
 
 
-                    points_list = [quake_time, quake_time/3600.] +  _quantities2csv(quantities, point_quantities, callable_sww.centroids, point_i)
-                    points_writer.writerow(points_list)
+def _read_gauge_file(gauge_file, verbose=False):
+    """Return the absolute coordinates and the names of the gauges of a
+    csv file with columns name, easting and northing
+    """
+
+    from csv import reader
+
+    try:
+        point_reader = reader(file(gauge_file))
+    except Exception, e:
+        msg = 'File "%s" could not be opened: Error="%s"' % (gauge_file, e)
+        raise Exception(msg)
+
+    if verbose: log.critical('Gauges obtained from: %s' % gauge_file)
+    
+    point_reader = reader(file(gauge_file))
+    points = []
+    point_name = []
+    
+    # read point info from file
+    for i,row in enumerate(point_reader):
+        # read header and determine the column numbers to read correctly.
+        if i==0:
+            for j,value in enumerate(row):
+                if value.strip()=='easting':easting=j
+                if value.strip()=='northing':northing=j
+                if value.strip()=='name':name=j
+                if value.strip()=='elevation':elevation=j
+        else:
+            points.append([float(row[easting]),float(row[northing])])
+            point_name.append(row[name])
+        
+    points_array = num.array(points,num.float)
+        
+    points_array = ensure_absolute(points_array)
+
+    return points_array, point_name
+
+
+class Gauge_interpolator:
+    """Time series of the quantities of an sww file at a set of points.
+
+    The sparse interpolation matrix from the vertices to the points is
+    built once, restricted to the vertices of the triangles containing the
+    points. The file is then read in blocks of timesteps, reading only
+    these vertices, and each block is interpolated to all points with one
+    sparse matrix product.
+
+    points are absolute coordinates. With output_centroids the values are
+    those at the centroids of the triangles containing the points (see
+    file_function). Values at points outside the mesh are NAN.
+    """
+
+    def __init__(self, sww_file, points,
+                 quantity_names=['stage', 'elevation',
+                                 'xmomentum', 'ymomentum'],
+                 output_centroids=False,
+                 verbose=False):
+
+        from anuga.file.netcdf import NetCDFFile
+        from anuga.fit_interpolate.interpolate import Interpolate
+        from anuga.utilities.sparse import Sparse_CSR
+
+        self.fid = fid = NetCDFFile(sww_file)
+        self.quantity_names = quantity_names
+
+        self.starttime = float(fid.starttime)
+        self.time = num.array(fid.variables['time'][:], num.float)
+
+        x = num.array(fid.variables['x'][:], num.float)
+        y = num.array(fid.variables['y'][:], num.float)
+        vertex_coordinates = num.concatenate((x[:,num.newaxis],
+                                              y[:,num.newaxis]), axis=1)
+        triangles = num.array(fid.variables['volumes'][:], num.int)
+
+        points = num.array(points, num.float)
+        points[:,0] -= fid.xllcorner
+        points[:,1] -= fid.yllcorner
+        self.number_of_points = len(points)
+
+        if verbose:
+            log.critical('Building interpolation matrix for %d gauges'
+                         % len(points))
+
+        interpol = Interpolate(vertex_coordinates, triangles)
+        A, inside, outside, centroids = \
+           interpol._build_interpolation_matrix_A(points, output_centroids)
+
+        self.inside = num.array(inside, num.int)
+        self.outside = num.array(outside, num.int)
+
+        self.centroids = num.zeros((len(points), 2), num.float)
+        self.centroids[:] = NAN
+        if output_centroids and len(inside) > 0:
+            self.centroids[self.inside] = centroids
+
+        # Only the vertices used by the interpolation are read
+        keys = A.Data.keys()
+        keys.sort()
+        rows = num.array([i for (i, j) in keys], num.int)
+        columns = num.array([j for (i, j) in keys], num.int)
+        data = num.array([A.Data[key] for key in keys], num.float)
+
+        self.vertex_ids = num.unique(columns)
+        row_ptr = num.searchsorted(rows, num.arange(len(points) + 1))
+
+        self.A = Sparse_CSR(None, data,
+                            num.searchsorted(self.vertex_ids, columns),
+                            row_ptr, len(points), max(len(self.vertex_ids), 1))
+
+    def get_time(self):
+        """Return the times of the file, relative to its starttime
+        """
+
+        return self.time
+
+    def get_inside_indices(self):
+        """Return the indices of the points inside the mesh
+        """
+
+        return self.inside
+
+    def get_outside_indices(self):
+        """Return the indices of the points outside the mesh
+        """
+
+        return self.outside
+
+    def interpolate(self, values):
+        """Return the values at the points of the values at the vertices
+        vertex_ids, one column per timestep if values is an array of
+        timesteps x vertices
+        """
+
+        values = num.array(values, num.float)
+        if len(values.shape) == 2:
+            result = self.A*num.ascontiguousarray(values.T)
+        else:
+            result = self.A*values
+
+        result[self.outside] = NAN
+
+        return result
+
+    def blocks(self, time_block=DEFAULT_TIME_BLOCK):
+        """Iterate over the timesteps of the file time_block at a time,
+        returning the times and a dictionary of the values of each quantity
+        at the points (an array of points x timesteps)
+        """
+
+        from anuga.file.sww import read_timeseries
+
+        n = len(self.vertex_ids)
+        number_of_timesteps = len(self.time)
+
+        static = {}
+        for name in self.quantity_names:
+            var = self.fid.variables[name]
+            if len(var.shape) == 1:
+                if n > 0:
+                    static[name] = self.interpolate(var[:][self.vertex_ids])
+                else:
+                    static[name] = self.interpolate(num.zeros(1))
+
+        for start in range(0, number_of_timesteps, time_block):
+            end = min(start + time_block, number_of_timesteps)
+
+            values = {}
+            for name in self.quantity_names:
+                if static.has_key(name):
+                    values[name] = num.repeat(static[name][:,num.newaxis],
+                                              end - start, axis=1)
+                elif n > 0:
+                    var = self.fid.variables[name]
+                    values[name] = self.interpolate(
+                        read_timeseries(var, self.vertex_ids, start, end))
                 else:
-                    if verbose:
-                        msg = 'gauge' + point_name[point_i] + 'falls off the mesh in file ' + sww_file + '.'
-                        log.warning(msg)
+                    values[name] = self.interpolate(num.zeros((end - start, 1)))
+
+            yield self.time[start:end], values
+
+    def close(self):
+
+        self.fid.close()
+
+
+def sww2nc_gauges(sww_file,
+                  gauge_file,
+                  out_name='gauges.nc',
+                  quantities=['stage', 'elevation',
+                              'xmomentum', 'ymomentum'],
+                  time_block=DEFAULT_TIME_BLOCK,
+                  verbose=False,
+                  output_centroids=False):
+    """Write the time series of the quantities of an sww file at the gauges
+    of gauge_file (see sww2csv_gauges) to the single NetCDF file out_name.
+
+    The file has the dimensions number_of_gauges and number_of_timesteps,
+    the variables x, y (absolute gauge coordinates), time (absolute, i.e.
+    including the starttime of the sww file) and one variable of number of
+    timesteps x number_of_gauges for each quantity, NAN at gauges off the
+    mesh. The gauge names are stored in the attribute gauge_names, separated
+    by commas. quantities are quantities stored in the sww file.
+
+    The time series are written time_block timesteps at a time.
+    """
+
+    from anuga.file.netcdf import NetCDFFile
+    from anuga.config import netcdf_mode_w, netcdf_float
+
+    points_array, point_name = _read_gauge_file(gauge_file, verbose)
+
+    gauges = Gauge_interpolator(sww_file, points_array,
+                                quantity_names=quantities,
+                                output_centroids=output_centroids,
+                                verbose=verbose)
+
+    if verbose: log.critical('Writing %s' % out_name)
+
+    outfile = NetCDFFile(out_name, netcdf_mode_w)
+    outfile.institution = 'Geoscience Australia'
+    outfile.description = 'Time series at gauges of %s' % sww_file
+    outfile.gauge_names = ','.join(point_name)
+    outfile.starttime = gauges.starttime
+
+    outfile.createDimension('number_of_gauges', len(points_array))
+    outfile.createDimension('number_of_timesteps', len(gauges.get_time()))
+
+    outfile.createVariable('x', netcdf_float, ('number_of_gauges',))
+    outfile.createVariable('y', netcdf_float, ('number_of_gauges',))
+    outfile.createVariable('time', netcdf_float, ('number_of_timesteps',))
+    for name in quantities:
+        outfile.createVariable(name, netcdf_float,
+                               ('number_of_timesteps', 'number_of_gauges'))
+
+    outfile.variables['x'][:] = points_array[:,0]
+    outfile.variables['y'][:] = points_array[:,1]
+
+    start = 0
+    for time, values in gauges.blocks(time_block):
+        end = start + len(time)
+        outfile.variables['time'][start:end] = time + gauges.starttime
+        for name in quantities:
+            outfile.variables[name][start:end,:] = values[name].T
+        start = end
+
+    outfile.close()
+    gauges.close()
+
 
 def sww2timeseries(swwfiles,
                    gauge_filename,
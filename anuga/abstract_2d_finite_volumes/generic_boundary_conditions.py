@@ -87,6 +87,45 @@ class Boundary:
                 Q.boundary_values[i] = q_evol[j]
 
 
+    def set_segment_values(self, domain, segment_edges, q_bdry):
+        """Set the boundary values of the edges in segment_edges from
+        q_bdry, which has one entry per conserved or evolved quantity.
+        Each entry is either a scalar or an array with one value per edge
+        in segment_edges.
+
+        This is the vectorised counterpart of the loop in evaluate_segment
+        for use by the evaluate_segment method of subclasses.
+        """
+
+        ids = segment_edges
+        n = len(ids)
+
+        q_bdry = num.array([num.zeros(n, num.float) + q for q in q_bdry])
+
+        if len(q_bdry) == len(domain.evolved_quantities):
+            # conserved and evolved quantities are the same
+            q_evol = q_bdry
+        elif len(q_bdry) == len(domain.conserved_quantities):
+            # boundary just returns conserved quantities
+            # Need to calculate all the evolved quantities
+            # Use default conversion
+            vol_ids  = domain.boundary_cells[ids]
+            edge_ids = domain.boundary_edges[ids]
+
+            q_evol = num.array([domain.quantities[name].edge_values[vol_ids, edge_ids]
+                                for name in domain.evolved_quantities])
+
+            q_evol = domain.conserved_values_to_evolved_values(q_bdry, q_evol)
+        else:
+            msg = 'Boundary must return array of either conserved'
+            msg += ' or evolved quantities'
+            raise Exception(msg)
+
+        for j, name in enumerate(domain.evolved_quantities):
+            Q = domain.quantities[name]
+            Q.boundary_values[ids] = q_evol[j]
+
+
     def get_time(self):
 
         return self.domain.get_time()
@@ -471,6 +510,10 @@ class Time_space_boundary(Boundary):
         self.function = function
         self.domain = domain
 
+        # Whether function can be evaluated with arrays of x and y,
+        # found at the first call of evaluate_segment
+        self.vectorised = None
+
     def __repr__(self):
         return 'Time space boundary'
 
@@ -512,6 +555,80 @@ class Time_space_boundary(Boundary):
 
         return res
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Evaluate the function once with the arrays of the x and y
+        coordinates of the edge midpoints of the segment.
+
+        Functions which only work with scalar x and y (eg using math.sin
+        or if statements on x) are evaluated edge by edge instead.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+
+        if len(ids) == 0:
+            return
+
+        if self.vectorised is False:
+            Boundary.evaluate_segment(self, domain, segment_edges)
+            return
+
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+
+        E = domain.edge_coordinates[3*vol_ids + edge_ids]
+        x = E[:,0]
+        y = E[:,1]
+
+        try:
+            res = self.function(self.domain.get_time(), x, y)
+        except Modeltime_too_early, e:
+            raise Modeltime_too_early(e)
+        except Modeltime_too_late, e:
+            if self.default_boundary is None:
+                raise Exception(e) # Reraise exception
+            else:
+                # Pass control to default boundary
+                self.default_boundary.evaluate_segment(domain, segment_edges)
+
+                if self.default_boundary_invoked is False:
+                    if self.verbose:
+                        # Issue warning the first time
+                        msg = '%s' %str(e)
+                        msg += 'Instead I will use the default boundary: %s\n'\
+                            %str(self.default_boundary)
+                        msg += 'Note: Further warnings will be supressed'
+                        log.critical(msg)
+
+                    self.default_boundary_invoked = True
+                return
+        except (TypeError, ValueError):
+            # Function does not accept arrays (eg math.sin raises a
+            # TypeError, if statements on x a ValueError). Once the
+            # function is known to accept arrays errors are passed on.
+            if self.vectorised is True:
+                raise
+            self.vectorised = False
+            Boundary.evaluate_segment(self, domain, segment_edges)
+            return
+
+        try:
+            self.set_segment_values(domain, segment_edges, res)
+        except (TypeError, ValueError):
+            # Function does not return one value (or one value per edge)
+            # for each quantity when given arrays
+            if self.vectorised is True:
+                raise
+            self.vectorised = False
+            Boundary.evaluate_segment(self, domain, segment_edges)
+            return
+
+        self.vectorised = True
+
 class File_boundary(Boundary):
     """The File_boundary reads values for the conserved
     quantities from an sww NetCDF file, and returns interpolated values
@@ -611,6 +728,9 @@ class File_boundary(Boundary):
         self.domain = domain
         self.verbose = verbose
 
+        # Map from boundary edge to point index, set up by get_segment_values
+        self.point_ids = None
+
 
         # Here we'll flag indices outside the mesh as a warning
         # as suggested by Joaquim Luis in sourceforge posting
@@ -686,27 +806,7 @@ class File_boundary(Boundary):
                         self.default_boundary_invoked = True
             
             if num.any(res == NAN):
-                x,y=self.midpoint_coordinates[i,:]
-                msg = 'NAN value found in file_boundary at '
-                msg += 'point id #%d: (%.2f, %.2f).\n' %(i, x, y)
-
-                if hasattr(self.F, 'indices_outside_mesh') and\
-                       len(self.F.indices_outside_mesh) > 0:
-                    # Check if NAN point is due it being outside
-                    # boundary defined in sww file.
-
-                    if i in self.F.indices_outside_mesh:
-                        msg += 'This point refers to one outside the '
-                        msg += 'mesh defined by the file %s.\n'\
-                               %self.F.filename
-                        msg += 'Make sure that the file covers '
-                        msg += 'the boundary segment it is assigned to '
-                        msg += 'in set_boundary.'
-                    else:
-                        msg += 'This point is inside the mesh defined '
-                        msg += 'the file %s.\n' %self.F.filename
-                        msg += 'Check this file for NANs.'
-                raise Exception(msg)
+                raise Exception(self.nan_message(i))
             
             return res 
         else:
@@ -714,6 +814,101 @@ class File_boundary(Boundary):
             msg += 'vol_id=%s, edge_id=%s' %(str(vol_id), str(edge_id))
             raise Exception(msg)
 
+    def nan_message(self, i):
+        """Return error message for a NAN value at point i
+        """
+
+        x,y=self.midpoint_coordinates[i,:]
+        msg = 'NAN value found in file_boundary at '
+        msg += 'point id #%d: (%.2f, %.2f).\n' %(i, x, y)
+
+        if hasattr(self.F, 'indices_outside_mesh') and\
+               len(self.F.indices_outside_mesh) > 0:
+            # Check if NAN point is due it being outside
+            # boundary defined in sww file.
+
+            if i in self.F.indices_outside_mesh:
+                msg += 'This point refers to one outside the '
+                msg += 'mesh defined by the file %s.\n'\
+                       %self.F.filename
+                msg += 'Make sure that the file covers '
+                msg += 'the boundary segment it is assigned to '
+                msg += 'in set_boundary.'
+            else:
+                msg += 'This point is inside the mesh defined '
+                msg += 'the file %s.\n' %self.F.filename
+                msg += 'Check this file for NANs.'
+
+        return msg
+
+    def get_segment_values(self, domain, segment_edges):
+        """Return array with one row of linearly interpolated values per
+        conserved quantity for the midpoints of the edges in
+        segment_edges, based on domain.time
+        """
+
+        ids = segment_edges
+
+        if self.point_ids is None:
+            # Index of the point in the file function of each
+            # boundary edge of the domain
+            self.point_ids = num.array([self.boundary_indices[vol_id, edge_id]
+                                        for vol_id, edge_id in
+                                        zip(domain.boundary_cells,
+                                            domain.boundary_edges)], num.int)
+
+        point_ids = self.point_ids[ids]
+
+        # FIXME (Ole): I think this should be get_time(), see ticket:306
+        t = self.domain.time
+
+        try:
+            res = self.F(t, point_id=point_ids)
+        except Modeltime_too_early, e:
+            raise Modeltime_too_early(e)
+        except Modeltime_too_late, e:
+            if self.default_boundary is None:
+                raise Exception(e) # Reraise exception
+            else:
+                # Pass control to default boundary and read back its values
+                self.default_boundary.evaluate_segment(domain, segment_edges)
+                res = num.array([domain.quantities[name].boundary_values[ids]
+                                 for name in domain.conserved_quantities])
+
+                if self.default_boundary_invoked is False:
+                    # Issue warning the first time
+                    if self.verbose:
+                        msg = '%s' %str(e)
+                        msg += 'Instead I will use the default boundary: %s\n'\
+                            %str(self.default_boundary)
+                        msg += 'Note: Further warnings will be supressed'
+                        log.critical(msg)
+
+                    self.default_boundary_invoked = True
+
+        if num.any(res == NAN):
+            k = num.nonzero(res == NAN)[1][0]
+            raise Exception(self.nan_message(point_ids[k]))
+
+        return res
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Set the boundary values of all edges in segment_edges from
+        one interpolation of the file function
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        if len(segment_edges) == 0:
+            return
+
+        res = self.get_segment_values(domain, segment_edges)
+
+        self.set_segment_values(domain, segment_edges, res)
+
 class AWI_boundary(Boundary):
     """The AWI_boundary reads values for the conserved
     quantities (only STAGE) from an sww NetCDF file, and returns interpolated values
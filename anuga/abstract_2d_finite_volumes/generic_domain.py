@@ -19,7 +19,8 @@ from pmesh2domain import pmesh_to_domain
 from tag_region import Set_tag_region as region_set_tag_region
 from anuga.geometry.polygon import inside_polygon
 from anuga.abstract_2d_finite_volumes.util import get_textual_float
-from quantity import Quantity
+from quantity import Quantity, saxpy_centroid_block
+import evolve_profiler
 import anuga.utilities.log as log
 
 import numpy as num
@@ -53,7 +54,8 @@ class Generic_Domain:
                        numproc=1,
                        number_of_full_nodes=None,
                        number_of_full_triangles=None,
-                       ghost_layer_width=2):
+                       ghost_layer_width=2,
+                       renumbering=None):
 
         """Instantiate generic computational Domain.
 
@@ -71,6 +73,11 @@ class Generic_Domain:
 
           tagged_elements:
           ...
+          renumbering: None or one of 'hilbert', 'morton' or 'rcm'. Renumber
+                       triangles and nodes to improve memory locality (see
+                       mesh_renumbering.py). The maps from the original to
+                       the new numbering are kept in tri_original_to_new and
+                       node_original_to_new.
         """
         
         if verbose: log.critical('Domain: Initialising')
@@ -96,6 +103,30 @@ class Generic_Domain:
                                          use_cache=use_cache,
                                          verbose=verbose)
 
+        # Optionally renumber triangles and nodes for memory locality
+        self.tri_original_to_new = None
+        self.node_original_to_new = None
+        if renumbering is not None:
+            if full_send_dict or ghost_recv_dict:
+                msg = 'Renumbering is not supported for parallel domains'
+                raise Exception(msg)
+
+            if verbose: log.critical('Domain: Renumbering mesh (%s)' % renumbering)
+
+            from mesh_renumbering import renumber_mesh, permute_values
+            coordinates, triangles, boundary, tagged_elements, \
+                         self.tri_original_to_new, self.node_original_to_new = \
+                         renumber_mesh(coordinates, triangles,
+                                       boundary=boundary,
+                                       tagged_elements=tagged_elements,
+                                       method=renumbering)
+
+            if mesh_filename is not None:
+                for name in vertex_quantity_dict:
+                    vertex_quantity_dict[name] = \
+                        permute_values(vertex_quantity_dict[name],
+                                       self.node_original_to_new)
+
         # Initialise underlying mesh structure
         self.mesh = Mesh(coordinates, triangles,
                          boundary=boundary,
@@ -179,6 +210,13 @@ class Generic_Domain:
             #self.quantities[name] = Quantity(self, name=name)
             Quantity(self, name=name , register=True)
 
+        # Contiguous blocks holding the arrays of the evolved quantities
+        # (see set_contiguous_quantity_storage)
+        self.quantity_storage = None
+
+        # Timing of the phases of evolve (see set_profiling)
+        self.profiler = None
+
         # Create an empty list for forcing terms
         self.forcing_terms = []
 
@@ -1343,6 +1381,128 @@ class Generic_Domain:
                 info_block['min_location'] = minloc
                 info_block['min_time'] = self.get_time()
 
+    def get_memory_usage(self):
+        """Return the number of bytes used by the numpy arrays of the domain
+        as a dictionary with entries
+
+           'quantities': {quantity name: {array name: bytes}}
+           'domain':     {array name: bytes} for the arrays of the domain
+                         and of its mesh
+
+        Arrays shared between the domain and the mesh are counted once.
+        Quantity arrays which are views of contiguous blocks (see
+        set_contiguous_quantity_storage) count their share of the block.
+        """
+
+        usage = {'quantities': {}, 'domain': {}}
+
+        for name, Q in self.quantities.items():
+            usage['quantities'][name] = Q.get_memory_usage()
+
+        counted = set()
+        for obj in [self, self.mesh]:
+            for name, value in obj.__dict__.items():
+                if isinstance(value, num.ndarray) and id(value) not in counted:
+                    counted.add(id(value))
+                    usage['domain'][name] = value.nbytes
+
+        return usage
+
+    def memory_report(self):
+        """Return string with the memory used by each quantity, broken down
+        by array, and by the other arrays of the domain and mesh, for
+        printing or logging
+        """
+
+        def megabytes(nbytes):
+            return '%10.2f MB' % (nbytes/1.0e6)
+
+        usage = self.get_memory_usage()
+
+        msg = 'Memory used by domain with %d triangles:\n' % len(self)
+
+        quantity_total = 0
+        for name in sorted(usage['quantities'].keys()):
+            arrays = usage['quantities'][name]
+            total = sum(arrays.values())
+            quantity_total += total
+
+            msg += '    %-34s%s\n' % ('Quantity ' + name, megabytes(total))
+            for array in sorted(arrays.keys(), key=lambda a: -arrays[a]):
+                msg += '        %-30s%s\n' % (array, megabytes(arrays[array]))
+
+        arrays = usage['domain']
+        domain_total = sum(arrays.values())
+        msg += '    %-34s%s\n' % ('Domain and mesh arrays', megabytes(domain_total))
+        for array in sorted(arrays.keys(), key=lambda a: -arrays[a]):
+            msg += '        %-30s%s\n' % (array, megabytes(arrays[array]))
+
+        msg += '    Total: quantities%s, domain%s\n' \
+               % (megabytes(quantity_total), megabytes(domain_total))
+
+        return msg
+
+    def print_memory_report(self):
+        print self.memory_report()
+
+    def set_profiling(self, flag=True):
+        """Time the phases of evolve (extrapolation, boundary, fluxes,
+        forcing, update, timestep, ghosts, storage and each fractional step
+        operator) and record them at each yieldstep, together with the
+        counters of get_profile_counters. See evolve_profiler.
+
+        Switching profiling off discards the recorded profile.
+        """
+
+        if self.profiler is not None:
+            self.profiler.unwrap(self)
+            self.profiler = None
+
+        if flag:
+            self.profiler = evolve_profiler.Evolve_profiler()
+            self.profiler.wrap(self)
+
+    def get_profiling(self):
+        """Get flag showing whether evolve is profiled.
+        """
+
+        return self.profiler is not None
+
+    def get_profile_counters(self):
+        """Return dictionary of the work counters sampled by the profiler.
+        Subclasses provide the counters of their computational kernels,
+        the number of timesteps is the number of calls of the 'step' phase.
+        """
+
+        return {}
+
+    def get_profile(self):
+        """Return the profile of evolve as a dictionary, see
+        Evolve_profiler.get_profile
+        """
+
+        if self.profiler is None:
+            msg = 'Profiling is not switched on, use domain.set_profiling()'
+            raise Exception(msg)
+
+        return self.profiler.get_profile(self)
+
+    def profile_statistics(self):
+        """Return string with the time spent in each phase of evolve
+        """
+
+        return evolve_profiler.profile_statistics(self.get_profile())
+
+    def print_profile_statistics(self):
+        print self.profile_statistics()
+
+    def write_profile(self, filename):
+        """Write the per yieldstep profile of evolve to filename, as json
+        if the filename ends with .json and as csv otherwise
+        """
+
+        evolve_profiler.write_profile(self.get_profile(), filename)
+
     def quantity_statistics(self, precision='%.4f'):
         """Return string with statistics about quantities for
         printing or logging
@@ -1549,6 +1709,9 @@ class Generic_Domain:
                                    finaltime=finaltime, duration=duration,
                                    skip_initial_step=skip_initial_step):
             
+            if self.profiler is not None:
+                self.profiler.record(self)
+
             # Pass control on to outer loop for more specific actions
             yield(t)
         
@@ -1645,7 +1808,6 @@ class Generic_Domain:
             return
             
 
-        N = len(self)                             # Number of triangles
         self.yieldtime = self.get_time() + yieldstep    # set next yield time
 
         # Initialise interval of timestep sizes (for reporting only)
@@ -1710,7 +1872,7 @@ class Generic_Domain:
             # Update time
             self.set_time(initial_time + self.timestep)
 
-            self.update_ghosts()
+            self.start_update_ghosts()
 
             # Update extrema (only uses centroid values)
             self.update_extrema()            
@@ -1758,7 +1920,7 @@ class Generic_Domain:
                 self.recorded_max_timestep = self.evolve_min_timestep
                 self.number_of_steps = 0
                 self.number_of_first_order_steps = 0
-                self.max_speed = num.zeros(N, num.float)
+                self.max_speed = num.zeros(len(self), num.float)
 
 
     def evolve_one_euler_step(self, yieldstep, finaltime):
@@ -1868,6 +2030,10 @@ class Generic_Domain:
         # Combine steps
         self.saxpy_conserved_quantities(0.5, 0.5)
 
+        if self.max_flux_update_frequency is not 1:
+            # Update flux_update_frequency for the next step
+            self.compute_flux_update_frequency()
+
         # Update special conditions
         #self.update_special_conditions()
 
@@ -1989,9 +2155,17 @@ class Generic_Domain:
         
         # So do this instead!
         self.saxpy_conserved_quantities(2.0, 1.0)
-        for name in self.conserved_quantities:
-            Q = self.quantities[name]
-            Q.centroid_values[:] = Q.centroid_values/3.0
+        centroid_values = self.get_quantity_block('centroid_values')
+        if centroid_values is not None:
+            centroid_values[:] = centroid_values/3.0
+        else:
+            for name in self.conserved_quantities:
+                Q = self.quantities[name]
+                Q.centroid_values[:] = Q.centroid_values/3.0
+
+        if self.max_flux_update_frequency is not 1:
+            # Update flux_update_frequency for the next step
+            self.compute_flux_update_frequency()
             
 
         # Update special conditions
@@ -2013,6 +2187,12 @@ class Generic_Domain:
 
     def backup_conserved_quantities(self):
 
+        centroid_values = self.get_quantity_block('centroid_values')
+        if centroid_values is not None:
+            backup_values = self.get_quantity_block('centroid_backup_values')
+            backup_values[:] = centroid_values
+            return
+
         # Backup conserved_quantities centroid values
         for name in self.conserved_quantities:
             Q = self.quantities[name]
@@ -2020,6 +2200,12 @@ class Generic_Domain:
 
     def saxpy_conserved_quantities(self, a, b):
 
+        centroid_values = self.get_quantity_block('centroid_values')
+        if centroid_values is not None:
+            backup_values = self.get_quantity_block('centroid_backup_values')
+            saxpy_centroid_block(centroid_values, backup_values, a, b)
+            return
+
         # Backup conserved_quantities centroid values
         for name in self.conserved_quantities:
             Q = self.quantities[name]
@@ -2153,6 +2339,11 @@ class Generic_Domain:
 
     def apply_fractional_steps(self):
 
+        if self.profiler is not None:
+            for operator in self.fractional_step_operators:
+                self.profiler.time_operator(operator)
+            return
+
         for operator in self.fractional_step_operators:
             operator()
 
@@ -2170,6 +2361,101 @@ class Generic_Domain:
             operator.print_statistics()
 
 
+    def set_contiguous_quantity_storage(self, flag=True):
+        """Store the arrays of the evolved quantities in one contiguous
+        block per field.
+
+        For each field listed in Quantity.contiguous_fields (centroid_values,
+        edge_values, explicit_update, ...) the domain owns an array of shape
+        (number of evolved quantities, N) or (..., N, 3), with one row per
+        evolved quantity in the order of evolved_quantities. The quantity
+        attributes become views of these rows, so existing code and the C
+        extensions see no difference. The blocks are available from
+        get_quantity_block, and the rk backup and saxpy and the ghost
+        updates then work on all quantities with a single numpy operation.
+
+        The current values are kept. Code which replaces (rather than
+        updates in place) a quantity array would break the link with
+        the block.
+        """
+
+        if not flag:
+            if self.quantity_storage is not None:
+                # Give each quantity its own copy of the values
+                for name in self.evolved_quantities:
+                    Q = self.quantities[name]
+                    for field in Quantity.contiguous_fields:
+                        setattr(Q, field, getattr(Q, field).copy())
+            self.quantity_storage = None
+            return
+
+        quantities = [self.quantities[name] for name in self.evolved_quantities]
+
+        storage = {}
+        for field in Quantity.contiguous_fields:
+            shape = getattr(quantities[0], field).shape
+            block = num.zeros((len(quantities),) + shape, num.float)
+            for i, Q in enumerate(quantities):
+                block[i] = getattr(Q, field)
+                setattr(Q, field, block[i])
+            storage[field] = block
+
+        self.quantity_storage = storage
+
+    def get_contiguous_quantity_storage(self):
+        """Get flag showing whether the evolved quantities are stored in
+        contiguous blocks.
+        """
+
+        return self.quantity_storage is not None
+
+    def get_quantity_block(self, field, quantities=None):
+        """Return the rows of the contiguous block of field (eg
+        'centroid_values') belonging to quantities, a list of quantity
+        names which defaults to the conserved quantities.
+
+        Return None if contiguous storage is not used or quantities are not
+        the leading entries of evolved_quantities, in which case the
+        caller has to loop over the quantities.
+        """
+
+        if self.quantity_storage is None:
+            return None
+
+        if quantities is None:
+            quantities = self.conserved_quantities
+
+        n = len(quantities)
+        if list(quantities) != list(self.evolved_quantities[:n]):
+            return None
+
+        return self.quantity_storage[field][:n]
+
+    def __getstate__(self):
+        """Do not pickle the contiguous blocks. Pickled views become
+        independent arrays, so __setstate__ rebuilds the blocks from the
+        quantities. The timed methods of the profiler are rewrapped too.
+        """
+
+        state = self.__dict__.copy()
+        if state.get('quantity_storage') is not None:
+            state['quantity_storage'] = 'contiguous'
+
+        for method_name, phase in evolve_profiler.profiled_methods:
+            state.pop(method_name, None)
+
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        if self.__dict__.get('quantity_storage') is not None:
+            self.quantity_storage = None
+            self.set_contiguous_quantity_storage(True)
+
+        if self.__dict__.get('profiler') is not None:
+            self.profiler.wrap(self)
+
     def set_fractional_step_operator(self,operator):
 
         self.fractional_step_operators.append(operator)
@@ -2292,10 +2578,23 @@ class Generic_Domain:
             # now store ghost as local id, global id, value
             Idg = self.ghost_recv_dict[iproc][0]
 
+            block = self.get_quantity_block('centroid_values', quantities)
+            if block is not None:
+                block[:,Idg] = block[:,Idf]
+                return
+
             for i, q in enumerate(quantities):
                 Q_cv =  self.quantities[q].centroid_values
                 num.put(Q_cv, Idg, num.take(Q_cv, Idf, axis=0))
 
+    def start_update_ghosts(self):
+        """Update the conserved quantities in the ghost cells at the end
+        of a timestep. Here the update is done at once, a parallel domain
+        may complete it while the next timestep is computed.
+        """
+
+        self.update_ghosts()
+
 #    def update_special_conditions(self):
 #        """There may be a need to change the values of the conserved
 #        quantities to satisfy special conditions at the very lowest level
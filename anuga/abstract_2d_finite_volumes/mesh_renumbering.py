@@ -0,0 +1,245 @@
+"""Renumbering of triangles and nodes of a mesh to improve memory locality
+
+The finite volume kernels loop over triangles and access the values of
+the neighbouring triangles and of the vertices. If neighbouring triangles
+are stored close together in memory these accesses are much more cache
+friendly. The order produced by mesh generators is often quite scattered.
+
+Supported orderings of the triangles:
+
+  'hilbert': Hilbert space filling curve through the centroids
+  'morton':  Morton (Z order) space filling curve through the centroids
+  'rcm':     Reverse Cuthill-McKee ordering of the triangle adjacency graph
+
+The nodes are then numbered in order of their first use by the
+renumbered triangles.
+"""
+
+from collections import deque
+
+import numpy as num
+
+
+renumbering_methods = ['hilbert', 'morton', 'rcm']
+
+
+def renumber_mesh(coordinates, triangles, boundary=None,
+                  tagged_elements=None, method='hilbert'):
+    """Renumber triangles and nodes of a mesh.
+
+    coordinates:     Nx2 array of node coordinates
+    triangles:       Mx3 array of node indices
+    boundary:        Dictionary {(vol_id, edge_id): tag}
+    tagged_elements: Dictionary {tag: [vol_ids]}
+    method:          One of 'hilbert', 'morton' or 'rcm'
+
+    Return coordinates, triangles, boundary and tagged_elements in the new
+    numbering, together with the arrays tri_original_to_new and
+    node_original_to_new mapping the original indices to the new ones.
+    """
+
+    if method not in renumbering_methods:
+        msg = 'Unknown renumbering method %s. Possible choices are: %s' \
+              % (method, ', '.join(renumbering_methods))
+        raise Exception(msg)
+
+    coordinates = num.array(coordinates, num.float)
+    triangles = num.array(triangles, num.int)
+
+    if method == 'rcm':
+        tri_order = rcm_order(triangles)
+    else:
+        centroids = num.sum(coordinates[triangles], axis=1)/3.0
+        if method == 'hilbert':
+            tri_order = hilbert_order(centroids)
+        else:
+            tri_order = morton_order(centroids)
+
+    # tri_order[new] = original
+    tri_original_to_new = inverse_permutation(tri_order)
+    triangles = triangles[tri_order]
+
+    # Number nodes by first use, unused nodes go last
+    number_of_nodes = coordinates.shape[0]
+    first_use = num.zeros(number_of_nodes, num.int) + triangles.size
+    used, first_index = num.unique(triangles.flat, return_index=True)
+    first_use[used] = first_index
+    node_order = num.argsort(first_use, kind='mergesort')
+
+    node_original_to_new = inverse_permutation(node_order)
+    coordinates = coordinates[node_order]
+    triangles = node_original_to_new[triangles]
+
+    if boundary is not None:
+        new_boundary = {}
+        for (vol_id, edge_id), tag in boundary.items():
+            new_boundary[(int(tri_original_to_new[vol_id]), edge_id)] = tag
+        boundary = new_boundary
+
+    if tagged_elements is not None:
+        new_tagged_elements = {}
+        for tag, elements in tagged_elements.items():
+            new_tagged_elements[tag] = \
+                [int(i) for i in tri_original_to_new[num.array(elements, num.int)]]
+        tagged_elements = new_tagged_elements
+
+    return (coordinates, triangles, boundary, tagged_elements,
+            tri_original_to_new, node_original_to_new)
+
+
+def inverse_permutation(order):
+    """Return the inverse of the permutation order, so that
+    inverse[order[i]] = i
+    """
+
+    inverse = num.zeros(len(order), num.int)
+    inverse[order] = num.arange(len(order))
+
+    return inverse
+
+
+def permute_values(values, original_to_new):
+    """Move values given in original order to the new order
+    """
+
+    values = num.array(values)
+    new_values = num.zeros_like(values)
+    new_values[original_to_new] = values
+
+    return new_values
+
+
+def _integer_grid(points, order):
+    """Map points onto a 2**order by 2**order integer grid
+    """
+
+    points = num.array(points, num.float)
+    pmin = num.min(points, axis=0)
+    extent = max(num.max(points[:,0]) - pmin[0], num.max(points[:,1]) - pmin[1])
+    if extent == 0.0:
+        extent = 1.0
+
+    n = 2**order
+    grid = ((points - pmin)/extent*(n-1)).astype(num.int64)
+
+    return grid[:,0], grid[:,1]
+
+
+def hilbert_order(points, order=16):
+    """Return indices which sort points along a Hilbert curve
+    """
+
+    x, y = _integer_grid(points, order)
+
+    n = 2**order
+    d = num.zeros(len(x), num.int64)
+
+    s = n/2
+    while s > 0:
+        rx = ((x & s) > 0).astype(num.int64)
+        ry = ((y & s) > 0).astype(num.int64)
+        d += s*s*((3*rx) ^ ry)
+
+        # Rotate the quadrant
+        flip = (ry == 0) & (rx == 1)
+        x = num.where(flip, n-1-x, x)
+        y = num.where(flip, n-1-y, y)
+        swap = (ry == 0)
+        x, y = num.where(swap, y, x), num.where(swap, x, y)
+
+        s = s/2
+
+    return num.argsort(d, kind='mergesort')
+
+
+def morton_order(points, order=16):
+    """Return indices which sort points along a Morton (Z order) curve
+    """
+
+    x, y = _integer_grid(points, order)
+
+    def spread_bits(v):
+        v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+        v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+        v = (v | (v << 2)) & 0x3333333333333333
+        v = (v | (v << 1)) & 0x5555555555555555
+        return v
+
+    d = spread_bits(x) | (spread_bits(y) << 1)
+
+    return num.argsort(d, kind='mergesort')
+
+
+def triangle_adjacency(triangles):
+    """Return Mx3 array of the triangles sharing an edge with each
+    triangle, -1 where there is none.
+    """
+
+    triangles = num.array(triangles, num.int)
+    M = triangles.shape[0]
+
+    # Edge i of a triangle is opposite vertex i
+    a = triangles[:,[1,2,0]].flatten()
+    b = triangles[:,[2,0,1]].flatten()
+    lo = num.minimum(a, b)
+    hi = num.maximum(a, b)
+
+    key = lo.astype(num.int64)*(num.max(triangles)+1) + hi
+    order = num.argsort(key, kind='mergesort')
+    key = key[order]
+
+    adjacency = num.zeros(3*M, num.int) - 1
+    pair = num.where(key[1:] == key[:-1])[0]
+    e0 = order[pair]
+    e1 = order[pair+1]
+    adjacency[e0] = e1/3
+    adjacency[e1] = e0/3
+
+    return adjacency.reshape(M, 3)
+
+
+def rcm_order(triangles):
+    """Return indices which order the triangles by reverse Cuthill-McKee
+    on the triangle adjacency graph
+    """
+
+    adjacency = triangle_adjacency(triangles)
+    M = adjacency.shape[0]
+    degree = num.sum(adjacency >= 0, axis=1)
+
+    neighbour_lists = []
+    for k in xrange(M):
+        nbrs = [int(j) for j in adjacency[k] if j >= 0]
+        nbrs.sort(key=lambda j: degree[j])
+        neighbour_lists.append(nbrs)
+
+    visited = num.zeros(M, num.bool)
+    order = []
+
+    def bfs(start):
+        component = [start]
+        visited[start] = True
+        queue = deque([start])
+        while queue:
+            k = queue.popleft()
+            for j in neighbour_lists[k]:
+                if not visited[j]:
+                    visited[j] = True
+                    component.append(j)
+                    queue.append(j)
+        return component
+
+    for seed in num.argsort(degree, kind='mergesort'):
+        if visited[seed]:
+            continue
+
+        # Start from a pseudo peripheral triangle, the last one reached
+        # by a search from the seed
+        component = bfs(seed)
+        visited[component] = False
+        component = bfs(component[-1])
+
+        order.extend(component)
+
+    return num.array(order[::-1], num.int)
@@ -13,7 +13,7 @@ import anuga.utilities.log as log
 
 
 def pmesh_to_domain_instance(source, DomainClass, use_cache=False,
-                             verbose=False):
+                             verbose=False, renumbering=None):
     """Converts a mesh file(.tsh or .msh), to a Domain instance.
 
     file_name is the name of the mesh file to convert, including the extension
@@ -22,19 +22,24 @@ def pmesh_to_domain_instance(source, DomainClass, use_cache=False,
     It must be a subclass of Domain, with the same interface as domain.
 
     use_cache: True means that caching is attempted for the computed domain.    
+
+    renumbering: None or one of 'hilbert', 'morton' or 'rcm' to renumber
+    the triangles and nodes of the domain for memory locality.
     """
 
     if use_cache is True:
         from anuga.caching import cache
-        result = cache(_pmesh_to_domain_instance, (source, DomainClass),
+        result = cache(_pmesh_to_domain_instance,
+                       (source, DomainClass, renumbering),
                        dependencies=[source], verbose=verbose)
     else:
-        result = apply(_pmesh_to_domain_instance, (source, DomainClass))        
+        result = apply(_pmesh_to_domain_instance,
+                       (source, DomainClass, renumbering))
         
     return result
 
 
-def _pmesh_to_domain_instance(source, DomainClass):
+def _pmesh_to_domain_instance(source, DomainClass, renumbering=None):
     """Converts a mesh file(.tsh or .msh), to a Domain instance.
 
     Internal function. See public interface pmesh_to_domain_instance for details
@@ -55,11 +60,18 @@ def _pmesh_to_domain_instance(source, DomainClass):
     (vertex_coordinates, vertices, tag_dict, vertex_quantity_dict,
      tagged_elements_dict, geo_reference) = pmesh_to_domain(**parm)
 
+    # Only pass renumbering on if requested, so that domain classes
+    # without the keyword still work
+    kwargs = {}
+    if renumbering is not None:
+        kwargs['renumbering'] = renumbering
+
     domain = DomainClass(coordinates = vertex_coordinates,
                          vertices = vertices,
                          boundary = tag_dict,
                          tagged_elements = tagged_elements_dict,
-                         geo_reference = geo_reference )
+                         geo_reference = geo_reference,
+                         **kwargs)
 
     # FIXME (Ole): Is this really the right place to apply a default
     # value specific to the shallow water wave equation?
@@ -77,6 +89,15 @@ def _pmesh_to_domain_instance(source, DomainClass):
     if (vertex_quantity_dict.has_key('elevation') and
         not vertex_quantity_dict.has_key('stage')):
         vertex_quantity_dict['stage'] = vertex_quantity_dict['elevation']
+
+    # Node values are given in the original numbering
+    if getattr(domain, 'node_original_to_new', None) is not None:
+        from mesh_renumbering import permute_values
+        for name in vertex_quantity_dict:
+            vertex_quantity_dict[name] = \
+                permute_values(vertex_quantity_dict[name],
+                               domain.node_original_to_new)
+
     domain.set_quantity_vertices_dict(vertex_quantity_dict)
 
     return domain
@@ -40,6 +40,13 @@ class Quantity:
 
     counter = 0
 
+    # Arrays which a domain can store in one contiguous block per field
+    # (see Generic_Domain.set_contiguous_quantity_storage)
+    contiguous_fields = ['centroid_values', 'edge_values', 'vertex_values',
+                         'x_gradient', 'y_gradient', 'phi',
+                         'explicit_update', 'semi_implicit_update',
+                         'centroid_backup_values']
+
     def __init__(self, domain, vertex_values=None, name=None, register=False):
         from anuga.abstract_2d_finite_volumes.generic_domain \
                             import Generic_Domain
@@ -49,9 +56,10 @@ class Quantity:
                % (str(Generic_Domain.__name__),str(domain.__class__)))
         assert isinstance(domain, Generic_Domain), msg
 
+        self.domain = domain
+
         if vertex_values is None:
             N = len(domain)             # number_of_elements
-            self.vertex_values = num.zeros((N, 3), num.float)
         else:
             self.vertex_values = num.array(vertex_values, num.float)
 
@@ -62,34 +70,18 @@ class Quantity:
             msg += 'number of elements in specified domain (%d).' % len(domain)
             assert N == len(domain), msg
 
-        self.domain = domain
-
         # Allocate space for other quantities
         self.centroid_values = num.zeros(N, num.float)
-        self.edge_values = num.zeros((N, 3), num.float)
-
-        # Allocate space for Gradient
-        self.x_gradient = num.zeros(N, num.float)
-        self.y_gradient = num.zeros(N, num.float)
 
-        # Allocate space for Limiter Phi
-        self.phi = num.zeros(N, num.float)
+        # The vertex and edge values, the gradients, the limiter phi, the
+        # boundary values and the update fields are only allocated when
+        # first used (see __getattr__), as many quantities (eg friction)
+        # never use most of them.
+        self.boundary_length = self.domain.boundary_length
 
         # Intialise centroid and edge_values
-        self.interpolate()
-
-        # Allocate space for boundary values
-        #self.boundary_length = domain.boundary_length
-        self.boundary_length = L = self.domain.boundary_length
-        self.boundary_values = num.zeros(L, num.float)
-
-        # Allocate space for updates of conserved quantities by
-        # flux calculations and forcing functions
-
-        # Allocate space for update fields
-        self.explicit_update = num.zeros(N, num.float )
-        self.semi_implicit_update = num.zeros(N, num.float )
-        self.centroid_backup_values = num.zeros(N, num.float)
+        if vertex_values is not None:
+            self.interpolate()
 
         self.set_beta(1.0)
 
@@ -102,6 +94,49 @@ class Quantity:
         if register:
             self.domain.quantities[self.name] = self
 
+    # Arrays allocated (as zeros) on first use, with their shapes in terms
+    # of the number of elements N and the boundary length L
+    lazy_arrays = {'vertex_values': ('N', 3),
+                   'edge_values': ('N', 3),
+                   'x_gradient': ('N',),
+                   'y_gradient': ('N',),
+                   'phi': ('N',),
+                   'boundary_values': ('L',),
+                   'explicit_update': ('N',),
+                   'semi_implicit_update': ('N',),
+                   'centroid_backup_values': ('N',)}
+
+    def __getattr__(self, name):
+        """Allocate the work arrays listed in lazy_arrays on first use.
+
+        Only called when name is not found in the usual way, so there is
+        no cost once an array exists.
+        """
+
+        if name not in Quantity.lazy_arrays or 'centroid_values' not in self.__dict__:
+            raise AttributeError(name)
+
+        sizes = {'N': len(self.__dict__['centroid_values']),
+                 'L': self.__dict__['boundary_length']}
+        shape = tuple([sizes.get(n, n) for n in Quantity.lazy_arrays[name]])
+
+        values = num.zeros(shape, num.float)
+        self.__dict__[name] = values
+
+        return values
+
+    def get_memory_usage(self):
+        """Return dictionary of the number of bytes used by each array
+        allocated by this quantity.
+        """
+
+        usage = {}
+        for name, value in self.__dict__.items():
+            if isinstance(value, num.ndarray):
+                usage[name] = value.nbytes
+
+        return usage
+
     ############################################################################
     # Methods for operator overloading
     ############################################################################
@@ -2245,6 +2280,7 @@ from quantity_ext import \
          average_centroid_values,\
          backup_centroid_values,\
          saxpy_centroid_values,\
+         saxpy_centroid_block,\
          compute_gradients,\
          compute_local_gradients,\
          limit_old,\
@@ -1085,6 +1085,45 @@ PyObject *saxpy_centroid_values(PyObject *self, PyObject *args) {
 	return Py_BuildValue("");
 }
 
+PyObject *saxpy_centroid_block(PyObject *self, PyObject *args) {
+	//
+	// saxpy_centroid_block(centroid_values, centroid_backup_values, a, b)
+	//
+	// Saxpy of the contiguous blocks holding the centroid values of
+	// several quantities (see Generic_Domain.set_contiguous_quantity_storage)
+
+	PyArrayObject *centroid_values, *centroid_backup_values;
+
+	double a,b;
+	keyint N;
+	int err;
+
+
+	// Convert Python arguments to C
+	if (!PyArg_ParseTuple(args, "OOdd", &centroid_values, &centroid_backup_values, &a, &b)) {
+	  PyErr_SetString(PyExc_RuntimeError, 
+			  "quantity_ext.c: saxpy_centroid_block could not parse input");
+	  return NULL;
+	}
+
+	CHECK_C_CONTIG(centroid_values);
+	CHECK_C_CONTIG(centroid_backup_values);
+
+	N = PyArray_SIZE(centroid_values);
+
+	if (PyArray_SIZE(centroid_backup_values) != N) {
+	  PyErr_SetString(PyExc_RuntimeError, 
+			  "quantity_ext.c: saxpy_centroid_block arrays differ in size");
+	  return NULL;
+	}
+
+	err = _saxpy_centroid_values(N,a,b,
+		      (double*) centroid_values -> data,
+		      (double*) centroid_backup_values -> data);
+
+	return Py_BuildValue("");
+}
+
 PyObject *set_vertex_values_c(PyObject *self, PyObject *args) {
 
   PyObject *quantity,*domain,*mesh;
@@ -2444,6 +2483,7 @@ static struct PyMethodDef MethodTable[] = {
 	{"update", update, METH_VARARGS, "Print out"},
 	{"backup_centroid_values", backup_centroid_values, METH_VARARGS, "Print out"},
 	{"saxpy_centroid_values", saxpy_centroid_values, METH_VARARGS, "Print out"},
+	{"saxpy_centroid_block", saxpy_centroid_block, METH_VARARGS, "Print out"},
 	{"compute_gradients", compute_gradients, METH_VARARGS, "Print out"},
         {"compute_local_gradients", compute_gradients, METH_VARARGS, "Print out"},
 	{"extrapolate_from_gradient", extrapolate_from_gradient,
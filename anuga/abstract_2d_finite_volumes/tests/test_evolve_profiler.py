@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+
+from anuga.abstract_2d_finite_volumes.evolve_profiler import \
+     aggregate_profiles, profile_statistics, write_profile
+
+import numpy as num
+
+
+def make_profile(step_time, fluxes_time, flux_evaluations):
+
+    record = {'time': 1.0, 'walltime': step_time,
+              'phases': {'step': {'time': step_time, 'calls': 10},
+                         'fluxes': {'time': fluxes_time, 'calls': 20}},
+              'counters': {'flux_evaluations': flux_evaluations}}
+
+    return {'phases': {'step': {'time': step_time, 'calls': 10},
+                       'fluxes': {'time': fluxes_time, 'calls': 20}},
+            'counters': {'flux_evaluations': flux_evaluations},
+            'yieldsteps': [record]}
+
+
+class Test_evolve_profiler(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['profile_test.csv', 'profile_test.json']:
+            try:
+                os.remove(filename)
+            except:
+                pass
+
+    def test_aggregate_profiles(self):
+
+        profiles = [make_profile(2.0, 1.0, 100),
+                    make_profile(4.0, 3.0, 300),
+                    make_profile(3.0, 2.0, 200)]
+
+        profile = aggregate_profiles(profiles)
+
+        assert profile['numprocs'] == 3
+
+        fluxes = profile['phases']['fluxes']
+        assert num.allclose(fluxes['time'], 3.0)
+        assert num.allclose(fluxes['time_min'], 1.0)
+        assert num.allclose(fluxes['time_mean'], 2.0)
+        assert fluxes['calls'] == 20
+
+        assert profile['counters']['flux_evaluations'] == 600
+
+        assert len(profile['yieldsteps']) == 1
+        record = profile['yieldsteps'][0]
+        assert num.allclose(record['walltime'], 4.0)
+        assert num.allclose(record['phases']['step']['time_mean'], 3.0)
+        assert record['counters']['flux_evaluations'] == 600
+
+        msg = profile_statistics(profile)
+        assert 'fluxes' in msg
+        assert '75.0' in msg
+
+    def test_write_profile(self):
+
+        profile = make_profile(2.0, 1.0, 100)
+
+        write_profile(profile, 'profile_test.csv')
+        lines = open('profile_test.csv').readlines()
+
+        assert lines[0].strip() == 'time,walltime,fluxes_time,fluxes_calls,' \
+                                   'step_time,step_calls,flux_evaluations'
+        values = [float(x) for x in lines[1].split(',')]
+        assert num.allclose(values, [1.0, 2.0, 1.0, 20, 2.0, 10, 100])
+
+        write_profile(profile, 'profile_test.json')
+        import json
+        assert json.load(open('profile_test.json')) == profile
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_evolve_profiler, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
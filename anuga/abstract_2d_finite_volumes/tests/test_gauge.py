@@ -10,8 +10,9 @@ import numpy as num
 
 import anuga
 
-from anuga.abstract_2d_finite_volumes.gauge import sww2csv_gauges
-from anuga.utilities.numerical_tools import mean
+from anuga.abstract_2d_finite_volumes.gauge import sww2csv_gauges, \
+     sww2nc_gauges, Gauge_interpolator
+from anuga.utilities.numerical_tools import mean, NAN
 from anuga.pmesh.mesh import Mesh
 from anuga.file.sww import SWW_file
 
@@ -550,6 +551,91 @@ point2, 0.5, 2.0\n")
         os.remove(basename+".sww")
         #os.remove(basename+str(time.time())+".sww")
 
+    def test_gauge_interpolator(self):
+        """Check that the time series interpolated block by block are
+        those of file_function, for stored and chunked sww files
+        """
+
+        from anuga.abstract_2d_finite_volumes.file_function import file_function
+        from anuga.file.netcdf import NetCDFFile
+
+        self.sww = None
+        points = num.array([[1.2, 0.7], [5.1, 3.3], [2.5, 4.25], [7.0, 1.0],
+                            [3.3, 5.9]])
+
+        for sww_format in [None, {'format': 'netcdf4', 'chunking': (3, 8)}]:
+            domain = anuga.rectangular_cross_domain(8, 8, len1=6.0, len2=6.0)
+            domain.set_name('test_gauge_interpolator')
+            if sww_format is not None:
+                domain.set_sww_format(**sww_format)
+            domain.set_quantity('elevation', lambda x, y: -x/6.0)
+            domain.set_quantity('stage',
+                                lambda x, y: num.where(x < 2.0, 0.5, -x/6.0))
+            B = anuga.Reflective_boundary(domain)
+            domain.set_boundary({'left': B, 'right': B, 'top': B, 'bottom': B})
+            for t in domain.evolve(yieldstep=0.1, finaltime=1.0):
+                pass
+
+            filename = 'test_gauge_interpolator.sww'
+            names = ['stage', 'elevation', 'xmomentum', 'ymomentum']
+            f = file_function(filename, quantities=names,
+                              interpolation_points=points.copy())
+
+            for output_centroids in [False, True]:
+                gauges = Gauge_interpolator(filename, points,
+                                            output_centroids=output_centroids)
+                assert num.all(gauges.get_inside_indices() == [0, 1, 2, 4])
+                assert num.all(gauges.get_outside_indices() == [3])
+                assert num.allclose(gauges.get_time(), f.get_time())
+
+                if not output_centroids:
+                    times = []
+                    for time, values in gauges.blocks(time_block=4):
+                        assert len(time) <= 4
+                        for j, t in enumerate(time):
+                            expected = f(t, point_id=num.arange(5))
+                            for i, name in enumerate(names):
+                                assert num.allclose(values[name][:,j][[0, 1, 2, 4]],
+                                                    expected[i][[0, 1, 2, 4]])
+                                assert values[name][3,j] == NAN
+                        times.extend(time)
+                    assert num.allclose(times, f.get_time())
+                else:
+                    assert num.allclose(gauges.centroids[1],
+                                        [5.125, 3.375])
+                gauges.close()
+
+            # All time series in a single NetCDF file
+            gauge_file = 'test_gauges.csv'
+            fid = open(gauge_file, 'w')
+            fid.write('name,easting,northing\n')
+            for i, point in enumerate(points):
+                fid.write('g%d,%f,%f\n' % (i, point[0], point[1]))
+            fid.close()
+
+            sww2nc_gauges(filename, gauge_file, 'test_gauges.nc',
+                          quantities=['stage', 'xmomentum'], time_block=3)
+
+            fid = NetCDFFile('test_gauges.nc')
+            assert fid.gauge_names == 'g0,g1,g2,g3,g4'
+            assert num.allclose(fid.variables['x'][:], points[:,0])
+            assert num.allclose(fid.variables['time'][:], f.get_time())
+            stage = fid.variables['stage'][:]
+            xmomentum = fid.variables['xmomentum'][:]
+            fid.close()
+
+            for j, t in enumerate(f.get_time()):
+                expected = f(t, point_id=num.arange(5))
+                assert num.allclose(stage[j,[0, 1, 2, 4]],
+                                    expected[0][[0, 1, 2, 4]])
+                assert num.allclose(xmomentum[j,[0, 1, 2, 4]],
+                                    expected[2][[0, 1, 2, 4]])
+            assert num.all(stage[:,3] == NAN)
+
+            os.remove(filename)
+            os.remove(gauge_file)
+            os.remove('test_gauges.nc')
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
@@ -901,6 +901,108 @@ class Test_Domain(unittest.TestCase):
         domain.check_integrity()
 
 
+    def test_contiguous_quantity_storage(self):
+
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_periodic
+        import cPickle
+
+        points, vertices, boundary, full_send_dict, ghost_recv_dict = \
+                rectangular_periodic(5, 2)
+
+        def make_domain():
+            domain = Generic_Domain(points, vertices, boundary,
+                                    conserved_quantities=['quant1', 'quant2'],
+                                    evolved_quantities=['quant1', 'quant2', 'quant3'],
+                                    full_send_dict=full_send_dict,
+                                    ghost_recv_dict=ghost_recv_dict)
+
+            domain.set_quantity('quant1', lambda x, y: 15*x + 9*y, location='centroids')
+            domain.set_quantity('quant2', lambda x, y: x - y, location='centroids')
+            domain.set_quantity('quant3', 2.0)
+            return domain
+
+        domain = make_domain()
+        domain_c = make_domain()
+
+        assert not domain_c.get_contiguous_quantity_storage()
+        assert domain_c.get_quantity_block('centroid_values') is None
+
+        domain_c.set_contiguous_quantity_storage()
+        assert domain_c.get_contiguous_quantity_storage()
+
+        # Values are kept and quantity arrays are views of the blocks
+        block = domain_c.get_quantity_block('centroid_values')
+        assert block.shape == (2, len(domain))
+        for i, name in enumerate(['quant1', 'quant2', 'quant3']):
+            Q = domain_c.quantities[name]
+            assert num.all(Q.centroid_values == domain.quantities[name].centroid_values)
+            assert Q.centroid_values.flags['C_CONTIGUOUS']
+            for field in Quantity.contiguous_fields:
+                values = getattr(Q, field)
+                assert values.base is domain_c.quantity_storage[field]
+                assert num.all(values == domain_c.quantity_storage[field][i])
+
+        assert domain_c.get_quantity_block('vertex_values',
+                                           ['quant1', 'quant2', 'quant3']).shape == \
+               (3, len(domain), 3)
+        assert domain_c.get_quantity_block('centroid_values', ['quant2']) is None
+
+        # Backup, saxpy and ghost updates give the same results
+        for d in [domain, domain_c]:
+            d.backup_conserved_quantities()
+            for name in d.conserved_quantities:
+                d.quantities[name].centroid_values[:] += 1.0
+            d.saxpy_conserved_quantities(0.25, 0.75)
+            d.update_ghosts()
+
+        for name in ['quant1', 'quant2', 'quant3']:
+            assert num.all(domain.quantities[name].centroid_values ==
+                           domain_c.quantities[name].centroid_values)
+
+        assert num.allclose(domain_c.quantities['quant1'].centroid_values[:4],
+                            [15.75, 16.25, 20.25, 20.75])
+
+        # The blocks are rebuilt when the domain is unpickled
+        domain_p = cPickle.loads(cPickle.dumps(domain_c, protocol=2))
+        assert domain_p.get_contiguous_quantity_storage()
+        Q = domain_p.quantities['quant2']
+        assert Q.centroid_values.base is domain_p.quantity_storage['centroid_values']
+        assert num.all(Q.centroid_values == domain_c.quantities['quant2'].centroid_values)
+
+        # Switch back to separate arrays
+        domain_c.set_contiguous_quantity_storage(False)
+        Q = domain_c.quantities['quant1']
+        assert Q.centroid_values.base is None
+        assert num.all(Q.centroid_values == domain.quantities['quant1'].centroid_values)
+
+
+    def test_memory_report(self):
+
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular
+
+        points, vertices, boundary = rectangular(4, 3)
+        domain = Generic_Domain(points, vertices, boundary,
+                                conserved_quantities=['stage'],
+                                other_quantities=['friction'])
+        N = len(domain)
+
+        usage = domain.get_memory_usage()
+        assert usage['quantities']['friction'] == {'centroid_values': N*8}
+        assert usage['domain']['areas'] == N*8
+        assert usage['domain']['neighbours'] == 3*N*domain.neighbours.itemsize
+
+        # Quantity arrays are allocated as they get used
+        domain.quantities['stage'].explicit_update[:] = 1.0
+        usage = domain.get_memory_usage()
+        assert usage['quantities']['stage']['explicit_update'] == N*8
+
+        msg = domain.memory_report()
+        assert 'Memory used by domain with %d triangles' % N in msg
+        assert 'Quantity friction' in msg
+        assert 'explicit_update' in msg
+        assert 'Domain and mesh arrays' in msg
+
+
 #-------------------------------------------------------------
 
 if __name__ == "__main__":
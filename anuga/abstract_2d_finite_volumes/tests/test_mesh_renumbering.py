@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+
+import numpy as num
+
+from anuga.abstract_2d_finite_volumes.mesh_renumbering import \
+     renumber_mesh, renumbering_methods, triangle_adjacency, \
+     inverse_permutation, permute_values
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.shallow_water.shallow_water_domain import Domain
+from anuga.shallow_water.boundaries import Reflective_boundary
+from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+     import Dirichlet_boundary
+
+
+class Test_mesh_renumbering(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for name in ['renumbered_original.sww', 'renumbered_plain.sww']:
+            try:
+                os.remove(name)
+            except:
+                pass
+
+    def shuffled_mesh(self, m=6, n=5):
+        """Rectangular cross mesh with randomly ordered triangles
+        """
+
+        points, vertices, boundary = rectangular_cross(m, n)
+        vertices = num.array(vertices, num.int)
+
+        num.random.seed(17)
+        order = num.random.permutation(len(vertices))
+        o2n = inverse_permutation(order)
+
+        vertices = vertices[order]
+        boundary = dict(((int(o2n[vol]), edge), tag)
+                        for (vol, edge), tag in boundary.items())
+
+        return points, vertices, boundary
+
+    def test_renumber_mesh(self):
+        points, vertices, boundary = self.shuffled_mesh()
+        points = num.array(points, num.float)
+        tagged_elements = {'first': [0, 1, 2], 'odd': range(1, len(vertices), 2)}
+
+        for method in renumbering_methods:
+            new_points, new_vertices, new_boundary, new_tagged, \
+                tri_o2n, node_o2n = renumber_mesh(points, vertices,
+                                                  boundary=boundary,
+                                                  tagged_elements=tagged_elements,
+                                                  method=method)
+
+            # Valid permutations
+            assert num.all(num.sort(tri_o2n) == num.arange(len(vertices)))
+            assert num.all(num.sort(node_o2n) == num.arange(len(points)))
+
+            # Same triangles (including orientation)
+            assert num.allclose(new_points[new_vertices[tri_o2n]],
+                                points[vertices])
+            assert num.allclose(new_points[node_o2n], points)
+
+            # Boundary and tags follow the triangles
+            assert len(new_boundary) == len(boundary)
+            for (vol, edge), tag in boundary.items():
+                assert new_boundary[(tri_o2n[vol], edge)] == tag
+
+            for tag, elements in tagged_elements.items():
+                assert new_tagged[tag] == list(tri_o2n[elements])
+
+            # Node values
+            values = num.arange(len(points))*1.0
+            assert num.allclose(permute_values(values, node_o2n)[node_o2n],
+                                values)
+
+        try:
+            renumber_mesh(points, vertices, method='random')
+        except Exception:
+            pass
+        else:
+            raise Exception('Should have raised an exception')
+
+    def test_locality(self):
+        """Renumbering should bring neighbours closer together in memory
+        """
+
+        points, vertices, boundary = self.shuffled_mesh(20, 20)
+
+        def bandwidth(triangles):
+            adjacency = triangle_adjacency(triangles)
+            k = num.arange(len(triangles))[:,num.newaxis]
+            return num.mean(num.abs(adjacency - k)[adjacency >= 0])
+
+        shuffled = bandwidth(vertices)
+        for method in renumbering_methods:
+            _, new_vertices, _, _, _, _ = renumber_mesh(points, vertices,
+                                                        method=method)
+            assert bandwidth(new_vertices) < 0.25*shuffled
+
+    def test_triangle_adjacency(self):
+        points, vertices, boundary = rectangular_cross(3, 3)
+        domain = Domain(points, vertices, boundary)
+
+        adjacency = triangle_adjacency(vertices)
+        neighbours = domain.neighbours.copy()
+        neighbours[neighbours < 0] = -1
+
+        assert num.all(adjacency == neighbours)
+
+    def run_domain(self, renumbering, name):
+        points, vertices, boundary = self.shuffled_mesh(8, 8)
+
+        domain = Domain(points, vertices, boundary, renumbering=renumbering)
+        domain.set_flow_algorithm('DE0')
+        domain.set_name(name)
+        domain.set_datadir('.')
+        domain.set_store_original_order(True)
+
+        domain.set_quantity('elevation', lambda x, y: -0.1*x)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', lambda x, y: 0.5*(x < 0.5))
+
+        Br = Reflective_boundary(domain)
+        Bd = Dirichlet_boundary([0.2, 0.0, 0.0])
+        domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+        for t in domain.evolve(yieldstep=0.1, finaltime=0.2):
+            pass
+
+        return domain
+
+    def test_renumbered_domain(self):
+        """Evolving a renumbered domain gives the same solution, and the
+        sww file can be stored in the original order
+        """
+
+        from anuga.file.netcdf import NetCDFFile
+
+        plain = self.run_domain(None, 'renumbered_plain')
+        renumbered = self.run_domain('hilbert', 'renumbered_original')
+
+        tri_o2n = renumbered.tri_original_to_new
+        assert renumbered.node_original_to_new is not None
+        assert plain.tri_original_to_new is None
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            q_plain = plain.quantities[name].centroid_values
+            q_renumbered = renumbered.quantities[name].centroid_values
+            assert num.allclose(q_renumbered[tri_o2n], q_plain)
+
+        fid_plain = NetCDFFile('renumbered_plain.sww')
+        fid_original = NetCDFFile('renumbered_original.sww')
+
+        for name in ['x', 'y', 'volumes', 'elevation', 'stage',
+                     'xmomentum', 'stage_c', 'elevation_c']:
+            assert num.allclose(fid_plain.variables[name][:],
+                                fid_original.variables[name][:])
+
+        fid_plain.close()
+        fid_original.close()
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_mesh_renumbering, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
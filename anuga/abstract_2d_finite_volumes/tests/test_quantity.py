@@ -152,6 +152,39 @@ class Test_Quantity(unittest.TestCase):
         assert num.allclose(quantity.vertex_values, [[0.,0.,0.], [0.,0.,0.],
                                                      [0.,0.,0.], [0.,0.,0.]])
 
+    def test_lazy_allocation(self):
+
+        quantity = Quantity(self.mesh4)
+
+        # Only the centroid values are allocated up front
+        assert quantity.get_memory_usage() == {'centroid_values': 4*8}
+
+        # Other arrays are allocated (as zeros) when first used
+        assert num.allclose(quantity.edge_values, 0.0)
+        assert quantity.edge_values.shape == (4, 3)
+        assert quantity.explicit_update.shape == (4,)
+        assert quantity.boundary_values.shape == (self.mesh4.boundary_length,)
+
+        quantity.x_gradient[:] = 1.0
+        assert num.allclose(quantity.x_gradient, 1.0)
+
+        usage = quantity.get_memory_usage()
+        assert usage['edge_values'] == 4*3*8
+        assert 'vertex_values' not in usage
+        assert 'semi_implicit_update' not in usage
+
+        try:
+            quantity.no_such_array
+        except AttributeError:
+            pass
+        else:
+            raise Exception('Should have raised an AttributeError')
+
+        # Given vertex values are interpolated straight away
+        quantity = Quantity(self.mesh1, [[1,2,3]])
+        assert num.allclose(quantity.centroid_values, [2.0])
+        assert num.allclose(quantity.edge_values, [[2.5, 2.0, 1.5]])
+
     def test_set_boundary_values(self):
 
         quantity = Quantity(self.mesh1)
@@ -200,6 +200,7 @@ maximum_froude_number = 100.0 # To be used in limiters.
 use_psyco = False      # Use psyco optimisations
 
 optimise_dry_cells = True # Exclude dry and still cells from flux computation
+omp_num_threads = 1        # OpenMP threads per process used by the DE kernels
 optimised_gradient_limiter = True # Use hardwired gradient limiter
 
 points_file_block_line_size = 1e6 # Number of lines read in from a points file
@@ -216,6 +217,10 @@ netcdf_float = 'd'
 netcdf_float64 = 'd'
 netcdf_float32 = 'f'
 
+# Chunk shape (timesteps, points) of time dependent quantities in NETCDF4
+# sww files with 'timeseries' chunking (see Domain.set_sww_format)
+sww_timeseries_chunk_shape = (32, 4096)
+
 ################################################################################
 # Dynamically-defined constants.
 ################################################################################
@@ -39,11 +39,12 @@ def rectangular_cross_domain(*args, **kwargs):
 #----------------------------
 # Create domain from file
 #----------------------------
-def create_domain_from_file(filename, DomainClass=Domain):
+def create_domain_from_file(filename, DomainClass=Domain, renumbering=None):
     """
     Create a domain from a file
     """
-    return pmesh_to_domain_instance(filename,DomainClass=DomainClass)
+    return pmesh_to_domain_instance(filename,DomainClass=DomainClass,
+                                    renumbering=renumbering)
 
 #---------------------------
 # Create domain from regions
@@ -63,7 +64,8 @@ def create_domain_from_regions(bounding_polygon,
                                minimum_triangle_angle=28.0,
                                fail_if_polygons_outside=True,
                                use_cache=False,
-                               verbose=False):
+                               verbose=False,
+                               renumbering=None):
     
 
     """Create domain from bounding polygons and resolutions.
@@ -121,8 +123,9 @@ def create_domain_from_regions(bounding_polygon,
     fail_if_polygons_outside: If True (the default) Exception in thrown
     where interior polygons fall outside bounding polygon. If False, these
     will be ignored and execution continued.
-        
-    
+
+    renumbering: None or one of 'hilbert', 'morton' or 'rcm'. Renumber the
+    triangles and nodes of the domain to improve memory locality.
     """
 
 
@@ -146,7 +149,8 @@ def create_domain_from_regions(bounding_polygon,
               'regionPtArea' : regionPtArea,
               'minimum_triangle_angle': minimum_triangle_angle,
               'fail_if_polygons_outside': fail_if_polygons_outside,
-              'verbose': verbose} #FIXME (Ole): See ticket:14
+              'verbose': verbose,
+              'renumbering': renumbering} #FIXME (Ole): See ticket:14
 
     # Call underlying engine with or without caching
     if use_cache is True:
@@ -182,7 +186,8 @@ def _create_domain_from_regions(bounding_polygon,
                                 regionPtArea=None,
                                 minimum_triangle_angle=28.0,
                                 fail_if_polygons_outside=True,
-                                verbose=True):
+                                verbose=True,
+                                renumbering=None):
     """_create_domain_from_regions - internal function.
 
     See create_domain_from_regions for documentation.
@@ -207,7 +212,8 @@ def _create_domain_from_regions(bounding_polygon,
                              use_cache=False,
                              verbose=verbose)
 
-    domain = Domain(mesh_filename, use_cache=False, verbose=verbose)
+    domain = Domain(mesh_filename, use_cache=False, verbose=verbose,
+                    renumbering=renumbering)
 
 
     return domain
@@ -0,0 +1,114 @@
+"""Compare classic and chunked, compressed netcdf4 sww files.
+
+   Evolves the same dam break with each output format (see
+   Domain.set_sww_format) and reports the size of the sww file, the
+   time spent storing timesteps (from the evolve profiler), the time to
+   read the stage time series of the vertices around a few gauges (as
+   file_function does), the time to extract the gauges with file_function
+   (including the interpolation) and the time to read every timestep with
+   plot_utils.get_output.
+
+   Usage:
+
+       python benchmark_sww_format.py
+"""
+
+import os
+import time
+
+import numpy as num
+
+from anuga import rectangular_cross_domain, Reflective_boundary
+from anuga.config import sww_timeseries_chunk_shape
+from anuga.abstract_2d_finite_volumes.util import file_function
+from anuga.abstract_2d_finite_volumes.file_function import \
+     get_interpolation_vertices
+from anuga.file.netcdf import NetCDFFile
+from anuga.file.sww import is_timeseries_chunked, read_timeseries
+from anuga.utilities.plot_utils import get_output
+
+
+formats = [('classic', {'format': 'netcdf3'}),
+           ('frames', {'format': 'netcdf4', 'chunking': 'frames'}),
+           ('timeseries', {'format': 'netcdf4', 'chunking': 'timeseries'}),
+           ('quantised', {'format': 'netcdf4', 'chunking': 'timeseries',
+                          'least_significant_digit': 3})]
+
+
+def run_model(name, sww_format, m, n, finaltime, yieldstep):
+    """Evolve a dam break on a rectangular_cross domain of m x n squares
+    storing to name.sww and return the time spent storing
+    """
+
+    domain = rectangular_cross_domain(m, n, len1=float(m), len2=float(n))
+    domain.set_name(name)
+    domain.set_sww_format(**sww_format)
+    # Flush once per block of timesteps of the timeseries chunks, as
+    # flushing compresses the incomplete chunks
+    domain.set_sww_persistent(flush_step=sww_timeseries_chunk_shape[0])
+    domain.set_profiling()
+
+    domain.set_quantity('elevation', lambda x, y: -x/m)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage',
+                        lambda x, y: num.where(x < m/4.0, 1.0, -x/m))
+
+    Br = Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    for t in domain.evolve(yieldstep=yieldstep, finaltime=finaltime):
+        pass
+
+    return domain.get_profile()['phases']['storage']['time']
+
+
+def benchmark(m=200, n=200, finaltime=20.0, yieldstep=0.2, gauges=10):
+
+    points = num.zeros((gauges, 2), num.float)
+    points[:, 0] = num.linspace(0.1*m, 0.9*m, gauges)
+    points[:, 1] = n/2.0 + 0.25
+
+    print '%-12s %10s %10s %10s %10s %10s' % ('format', 'size [MB]',
+                                              'write [s]', 'series [s]',
+                                              'gauges [s]', 'frames [s]')
+
+    for name, sww_format in formats:
+        filename = 'benchmark_sww_%s.sww' % name
+
+        write_time = run_model(filename[:-4], sww_format, m, n,
+                               finaltime, yieldstep)
+        size = os.stat(filename)[6]/2.0**20
+
+        fid = NetCDFFile(filename)
+        x = fid.variables['x'][:]
+        y = fid.variables['y'][:]
+        vertex_ids = get_interpolation_vertices(num.array([x, y]).T,
+                                                fid.variables['volumes'][:],
+                                                points)
+        t0 = time.time()
+        var = fid.variables['stage']
+        if is_timeseries_chunked(var):
+            series = read_timeseries(var, vertex_ids)
+        else:
+            series = var[:][:, vertex_ids]
+        series_time = time.time() - t0
+        fid.close()
+
+        t0 = time.time()
+        f = file_function(filename, quantities=['stage', 'xmomentum'],
+                          interpolation_points=points)
+        gauge_time = time.time() - t0
+
+        t0 = time.time()
+        p = get_output(filename)
+        frames_time = time.time() - t0
+
+        print '%-12s %10.2f %10.3f %10.3f %10.3f %10.3f' % \
+              (name, size, write_time, series_time, gauge_time, frames_time)
+
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+
+    benchmark()
@@ -0,0 +1,451 @@
+"""Lazy random access to the quantities of an sww file.
+
+Lazy_sww opens an sww file and exposes its quantities as array like
+handles, indexable by [time_slices, point_subset], which read only the
+requested values from the file:
+
+    > from anuga.file.lazy_sww import Lazy_sww
+    > sww = Lazy_sww('channel.sww')
+    > sww['stage'][-1]                 # Last timestep of stage
+    > sww['stage'][:, [10, 20]]        # Time series at two vertices
+    > sww['velocity_c'][10:20, ids]    # Derived at centroids
+
+Whole timesteps (frames) are kept in a least recently used cache of
+limited size, so moving back and forth between timesteps does not read
+them again. Subsets of points are read as hyperslabs of the variables,
+chunk by chunk for chunked (netcdf4) files.
+
+Besides the quantities stored in the file, the reader derives height
+(depth), xvelocity, yvelocity, velocity (speed) and momentum (h|v|) on
+demand, at vertices and at centroids (suffix _c). Centroid values of
+quantities only stored at vertices are the means of the vertex values.
+
+A Lazy_sww can be given to plot_utils.get_output and get_centroids in
+place of a file name.
+"""
+
+import numpy as num
+
+from anuga.config import netcdf_mode_r
+from anuga.file.netcdf import NetCDFFile
+from anuga.file.sww import set_chunk_cache, read_timeseries
+
+
+class Frame_cache:
+    """Least recently used cache of arrays (eg the values of a quantity at
+    one timestep) holding at most max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+
+        from collections import OrderedDict
+
+        self.max_bytes = max_bytes
+        self.arrays = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the array stored for key, or None
+        """
+
+        try:
+            A = self.arrays.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.arrays[key] = A
+        self.hits += 1
+        return A
+
+    def put(self, key, A):
+        """Store A for key, dropping the least recently used arrays to
+        keep within max_bytes. Arrays larger than max_bytes are not stored.
+        """
+
+        if key in self.arrays:
+            self.nbytes -= self.arrays.pop(key).nbytes
+
+        if A.nbytes > self.max_bytes:
+            return
+
+        self.arrays[key] = A
+        self.nbytes += A.nbytes
+
+        while self.nbytes > self.max_bytes:
+            _, B = self.arrays.popitem(last=False)
+            self.nbytes -= B.nbytes
+
+    def clear(self):
+
+        self.arrays.clear()
+        self.nbytes = 0
+
+
+def _get_indices(key, n):
+    """Return the indices selected by key in an axis of length n (None for
+    all) and whether key is a single index
+    """
+
+    if isinstance(key, slice):
+        if key == slice(None):
+            return None, False
+        return num.arange(*key.indices(n)), False
+
+    if isinstance(key, (int, long, num.integer)):
+        if not -n <= key < n:
+            raise IndexError('index %d out of range 0 to %d' % (key, n - 1))
+        return num.array([key % n]), True
+
+    indices = num.asarray(key)
+    if indices.dtype == num.bool:
+        return num.nonzero(indices)[0], False
+
+    indices = indices.astype(num.int).reshape(-1,)
+    if num.any(indices >= n) or num.any(indices < -n):
+        raise IndexError('index out of range 0 to %d' % (n - 1))
+
+    return indices % n, False
+
+
+class Lazy_quantity:
+    """Array like handle to a quantity of a Lazy_sww.
+
+    Time dependent quantities have shape (number_of_timesteps,
+    number_of_points) and are indexed by [time_slices, point_subset] with
+    integers, slices, sequences of integers or boolean masks, reading
+    only the requested values. Other quantities are read once and
+    indexed as numpy arrays.
+    """
+
+    def __init__(self, name, shape, dtype, read, dynamic=True):
+
+        self.name = name
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self.dtype = num.dtype(dtype)
+        self.dynamic = dynamic
+
+        # read(frames, ids) returns the values of the frames (times) at
+        # the points ids (None for all), or all values if not dynamic
+        self.read = read
+
+    def __len__(self):
+
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+
+        A = self[:]
+        if dtype is not None:
+            A = A.astype(dtype)
+        return A
+
+    def __getitem__(self, key):
+
+        if not self.dynamic:
+            return self.read(None, None)[key]
+
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 2:
+            raise IndexError('Too many indices for quantity %s' % self.name)
+
+        frames, single_frame = _get_indices(key[0], self.shape[0])
+        if frames is None:
+            frames = num.arange(self.shape[0])
+
+        if len(key) > 1:
+            ids, single_point = _get_indices(key[1], self.shape[1])
+        else:
+            ids, single_point = None, False
+
+        values = self.read(frames, ids)
+
+        if single_point:
+            values = values[:, 0]
+        if single_frame:
+            values = values[0]
+
+        return values
+
+
+class Lazy_sww:
+    """Read the quantities of an sww file on demand, see module
+    documentation.
+
+    filename: The sww file
+    cache_size: Maximal size in bytes of the cached timesteps
+    minimum_allowed_height: Velocities are zero where the height is
+        smaller
+    """
+
+    derived_quantities = ['height', 'xvelocity', 'yvelocity', 'velocity',
+                          'momentum']
+
+    def __init__(self, filename, cache_size=2**28,
+                 minimum_allowed_height=1.0e-03):
+
+        self.filename = filename
+        self.minimum_allowed_height = minimum_allowed_height
+        self.cache = Frame_cache(cache_size)
+
+        self.fid = fid = NetCDFFile(filename, netcdf_mode_r)
+
+        self.xllcorner = fid.xllcorner
+        self.yllcorner = fid.yllcorner
+        self.starttime = fid.starttime
+
+        self.time = num.array(fid.variables['time'][:], num.float)
+        self.x = num.array(fid.variables['x'][:])
+        self.y = num.array(fid.variables['y'][:])
+        self.vols = num.array(fid.variables['volumes'][:], num.int)
+
+        self.number_of_timesteps = len(self.time)
+        self.number_of_points = len(self.x)
+        self.number_of_volumes = len(self.vols)
+
+        # Handles of the variables stored in the file
+        self.variables = {}
+        for name, var in fid.variables.items():
+            set_chunk_cache(var)
+            dynamic = len(var.shape) == 2 and \
+                      var.dimensions[0] == 'number_of_timesteps'
+            if dynamic:
+                read = self._get_variable_reader(name)
+            else:
+                read = self._get_static_reader(name,
+                                               self._get_variable_loader(name))
+            self.variables[name] = Lazy_quantity(name, var.shape, var.dtype,
+                                                 read, dynamic)
+
+        self.quantities = {}
+
+    def close(self):
+
+        self.cache.clear()
+        self.fid.close()
+
+    def __getitem__(self, name):
+
+        return self.get_quantity(name)
+
+    def get_quantity_names(self):
+        """Return the names of the quantities stored at vertices and
+        centroids, and of the derived quantities
+        """
+
+        names = [name for name, var in self.variables.items()
+                 if var.shape[-1] in [self.number_of_points,
+                                      self.number_of_volumes]
+                 and name not in ['x', 'y', 'volumes']]
+        for name in self.derived_quantities:
+            for suffix in ['', '_c']:
+                if name + suffix not in names:
+                    names.append(name + suffix)
+
+        return names
+
+    def get_quantity(self, name):
+        """Return the handle (Lazy_quantity) of a quantity stored in the
+        file or derived from stored quantities. Names ending in _c are
+        centroid values.
+        """
+
+        if name in self.variables:
+            return self.variables[name]
+
+        if name in self.quantities:
+            return self.quantities[name]
+
+        if name.endswith('_c'):
+            base, suffix = name[:-2], '_c'
+            number_of_points = self.number_of_volumes
+        else:
+            base, suffix = name, ''
+            number_of_points = self.number_of_points
+
+        if base in self.derived_quantities:
+            names = ['stage', 'elevation']
+            if base != 'height':
+                names += ['xmomentum', 'ymomentum']
+            inputs = [self.get_quantity(q + suffix) for q in names]
+            read = self._get_derived_reader(inputs,
+                                            getattr(self, '_compute_' + base))
+        elif suffix == '_c' and base in self.variables:
+            inputs = [self.variables[base]]
+            read = self._get_centroid_reader(inputs[0])
+        else:
+            msg = 'Quantity %s is neither stored in nor derived from %s' \
+                  % (name, self.filename)
+            raise Exception(msg)
+
+        dynamic = max([Q.dynamic for Q in inputs])
+        if dynamic:
+            shape = (self.number_of_timesteps, number_of_points)
+        else:
+            shape = (number_of_points,)
+            read = self._get_static_reader(name, self._get_loader(read))
+
+        Q = Lazy_quantity(name, shape, num.float32, read, dynamic)
+        self.quantities[name] = Q
+
+        return Q
+
+    def _read(self, Q, frames, ids):
+        """Return the values of quantity Q at frames and points ids, or
+        the values of a static quantity at points ids (which broadcast
+        against the values of time dependent quantities)
+        """
+
+        if Q.dynamic and frames is not None:
+            return Q.read(frames, ids)
+
+        A = Q.read(None, None)
+        if ids is None:
+            return A
+        return A[..., ids]
+
+    def _get_variable_loader(self, name):
+
+        def load():
+            return num.array(self.fid.variables[name][:])
+
+        return load
+
+    def _get_loader(self, read):
+
+        def load():
+            return read(None, None)
+
+        return load
+
+    def _get_derived_reader(self, inputs, compute):
+        """Return a reader computing a quantity from the values of the
+        quantities inputs
+        """
+
+        def read(frames, ids):
+            return compute(*[self._read(Q, frames, ids) for Q in inputs])
+
+        return read
+
+    def _get_static_reader(self, name, load):
+        """Return a reader of all values of a quantity, kept in the cache
+        """
+
+        def read(frames, ids):
+            A = self.cache.get((name, None))
+            if A is None:
+                A = load()
+                self.cache.put((name, None), A)
+            return A
+
+        return read
+
+    def _get_variable_reader(self, name):
+        """Return a reader of the time dependent variable name. Whole
+        timesteps are read in blocks of consecutive timesteps and cached.
+        Subsets of points of timesteps that are not cached are read as
+        hyperslabs, which are not cached.
+        """
+
+        var = self.fid.variables[name]
+
+        def read(frames, ids):
+            if ids is None:
+                values = num.zeros((len(frames), var.shape[1]), var.dtype)
+            else:
+                values = num.zeros((len(frames), len(ids)), var.dtype)
+
+            missing = []
+            for i, frame in enumerate(frames):
+                A = self.cache.get((name, frame))
+                if A is None:
+                    missing.append(i)
+                elif ids is None:
+                    values[i] = A
+                else:
+                    values[i] = A[ids]
+
+            if len(missing) == 0:
+                return values
+
+            missing = num.array(missing)
+            missing_frames = frames[missing]
+            runs = num.unique(missing_frames)
+            runs = num.split(runs, num.nonzero(num.diff(runs) != 1)[0] + 1)
+            for run in runs:
+                start = run[0]
+                end = run[-1] + 1
+                if ids is None:
+                    block = num.array(var[start:end])
+                    for k in range(end - start):
+                        self.cache.put((name, start + k), block[k].copy())
+                else:
+                    block = read_timeseries(var, ids, start, end)
+
+                selected = (missing_frames >= start) & (missing_frames < end)
+                values[missing[selected]] = \
+                    block[missing_frames[selected] - start]
+
+            return values
+
+        return read
+
+    def _get_centroid_reader(self, Q):
+        """Return a reader of the centroid values computed from the vertex
+        values of quantity Q, reading the vertices of the triangles only
+        """
+
+        def read(frames, ids):
+            if ids is None:
+                return self._compute_centroid_values(self._read(Q, frames, None))
+
+            vols = self.vols[ids]
+            vertices, inverse = num.unique(vols, return_inverse=True)
+            A = self._read(Q, frames, vertices)
+            return self._compute_centroid_values(A, inverse.reshape(vols.shape))
+
+        return read
+
+    def _compute_centroid_values(self, A, vols=None):
+
+        if vols is None:
+            vols = self.vols
+
+        return (A[..., vols[:,0]] + A[..., vols[:,1]] + A[..., vols[:,2]])/3.0
+
+    def _compute_height(self, stage, elevation):
+
+        height = stage - elevation
+        return height*(height > 0.)
+
+    def _compute_velocity_factor(self, height):
+        """Return 1/height where wet, 0 where dry
+        """
+
+        h_inv = 1.0/(height + 1.0e-12)
+        return h_inv*(height > self.minimum_allowed_height)
+
+    def _compute_xvelocity(self, stage, elevation, xmomentum, ymomentum):
+
+        height = self._compute_height(stage, elevation)
+        return xmomentum*self._compute_velocity_factor(height)
+
+    def _compute_yvelocity(self, stage, elevation, xmomentum, ymomentum):
+
+        height = self._compute_height(stage, elevation)
+        return ymomentum*self._compute_velocity_factor(height)
+
+    def _compute_velocity(self, stage, elevation, xmomentum, ymomentum):
+
+        height = self._compute_height(stage, elevation)
+        return self._compute_momentum(stage, elevation, xmomentum, ymomentum)*\
+               self._compute_velocity_factor(height)
+
+    def _compute_momentum(self, stage, elevation, xmomentum, ymomentum):
+
+        return (xmomentum**2 + ymomentum**2)**0.5
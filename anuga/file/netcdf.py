@@ -22,7 +22,7 @@ precision = netcdf_float # So if we want to change the precision its done here
 
 
 
-def NetCDFFile(file_name, netcdf_mode=netcdf_mode_r):
+def NetCDFFile(file_name, netcdf_mode=netcdf_mode_r, format=None):
     """Wrapper to isolate changes of the netcdf libray.
 
     In theory we should be able to change over to NetCDF4 via this
@@ -38,7 +38,10 @@ def NetCDFFile(file_name, netcdf_mode=netcdf_mode_r):
     except: # works with Scientific.IO.NetCDF
         number_of_timesteps = fid.dimensions['number_of_timesteps']
         number_of_points = fid.dimensions['number_of_points']
-    
+
+    format is the format of new files, 'NETCDF3_64BIT' by default.
+    'NETCDF4' files (which allow chunked and compressed variables) need
+    the netCDF4 library. Existing files are opened in their own format.
     """
    
     using_scientific = using_netcdf4 = False
@@ -52,14 +55,20 @@ def NetCDFFile(file_name, netcdf_mode=netcdf_mode_r):
 
     assert using_scientific or using_netcdf4
 
+    if format is None:
+        format = 'NETCDF3_64BIT'
+
     if using_scientific:
+        if format.startswith('NETCDF4'):
+            msg = 'Format %s requires the netCDF4 library' % format
+            raise Exception(msg)
         return NetCDFFile(file_name, netcdf_mode)
 
     if using_netcdf4:
         if netcdf_mode == 'wl' :
-            return Dataset(file_name, 'w', format='NETCDF3_64BIT')
+            return Dataset(file_name, 'w', format=format)
         else:
-            return Dataset(file_name, netcdf_mode, format='NETCDF3_64BIT')
+            return Dataset(file_name, netcdf_mode, format=format)
 
 
 
@@ -13,7 +13,10 @@ from anuga.coordinate_transforms.geo_reference import Geo_reference
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
 from anuga.config import netcdf_float, netcdf_float32, netcdf_int, netcdf_float64
 from anuga.config import max_float
+from anuga.config import sww_timeseries_chunk_shape
 from anuga.utilities.numerical_tools import ensure_numeric
+from anuga.abstract_2d_finite_volumes.quantity_ext import \
+     average_vertex_values, average_centroid_values
 import anuga.utilities.log as log
 from anuga.file.netcdf import NetCDFFile
 
@@ -87,6 +90,37 @@ class SWW_file(Data_format):
         else:
             self.minimum_storable_height = default_minimum_storable_height
 
+        # Store triangles and nodes in their original numbering if
+        # the domain has been renumbered and this has been requested
+        self.tri_original_to_new = None
+        self.node_original_to_new = None
+        if getattr(domain, 'store_original_order', False) and \
+               getattr(domain, 'tri_original_to_new', None) is not None:
+            self.tri_original_to_new = domain.tri_original_to_new
+            self.node_original_to_new = domain.node_original_to_new
+
+        # Keep the file open between timesteps (see store_timestep),
+        # optionally writing from a separate thread
+        self.asynchronous = getattr(domain, 'sww_asynchronous', False)
+        self.persistent = getattr(domain, 'sww_persistent', False) or \
+                          self.asynchronous
+        self.flush_step = getattr(domain, 'sww_flush_step', 1)
+        self.fid = None
+        self.worker = None
+
+        # File format and layout of the time dependent quantities
+        # (see set_sww_format)
+        self.format = getattr(domain, 'sww_format', 'netcdf3')
+        if self.format == 'netcdf4':
+            self.chunking = getattr(domain, 'sww_chunking', 'frames')
+            self.zlib_level = getattr(domain, 'sww_zlib_level', None)
+            self.least_significant_digit = \
+                getattr(domain, 'sww_least_significant_digit', None)
+        else:
+            self.chunking = None
+            self.zlib_level = None
+            self.least_significant_digit = None
+
         # Call parent constructor
         Data_format.__init__(self, domain, 'sww', mode)
 
@@ -113,21 +147,38 @@ class SWW_file(Data_format):
                 if self.store_centroids: dynamic_c_quantities.append(q+'_c')
                        
         
+        # In append mode (netcdf_mode_a) timesteps are appended to an
+        # existing file, e.g. when restoring a checkpoint
+        self.writer = Write_sww(static_quantities,
+                                dynamic_quantities,
+                                static_c_quantities,
+                                dynamic_c_quantities,
+                                chunking=self.chunking,
+                                zlib_level=self.zlib_level,
+                                least_significant_digit=\
+                                self.least_significant_digit)
+
+        self._create_file(mode)
+
+    def _create_file(self, mode):
+        """Create the NetCDF file and write its header
+        """
+
+        domain = self.domain
+
         # NetCDF file definition
-        fid = NetCDFFile(self.filename, mode)
+        if self.format == 'netcdf4':
+            fid = NetCDFFile(self.filename, mode, format='NETCDF4')
+        else:
+            fid = NetCDFFile(self.filename, mode)
         if mode[0] == 'w':
             description = 'Output from anuga.file.sww ' \
                           'suitable for plotting'
                           
-            self.writer = Write_sww(static_quantities,
-                                    dynamic_quantities,
-                                    static_c_quantities,
-                                    dynamic_c_quantities)
-            
             self.writer.store_header(fid,
                                      domain.starttime,
                                      self.number_of_volumes,
-                                     self.domain.number_of_nodes,
+                                     self.number_of_nodes,
                                      description=description,
                                      smoothing=domain.smooth,
                                      order=domain.default_order,
@@ -192,6 +243,10 @@ class SWW_file(Data_format):
         Q = domain.quantities.values()[0]
         X,Y,_,V = Q.get_vertex_values(xy=True, precision=self.precision)
 
+        X = self._original_vertex_values(X)
+        Y = self._original_vertex_values(Y)
+        V = self._original_triangles(V)
+
         # store the connectivity data
         points = num.concatenate((X[:,num.newaxis],Y[:,num.newaxis]), axis=1)
         self.writer.store_triangulation(fid,
@@ -218,14 +273,15 @@ class SWW_file(Data_format):
             Q = domain.quantities[name]
             A, _ = Q.get_vertex_values(xy=False, 
                                        precision=self.precision)
-            static_quantities[name] = A
+            static_quantities[name] = self._original_vertex_values(A)
 
         #print domain.quantities
         #print self.writer.static_c_quantities
 
         for name in self.writer.static_c_quantities:
             Q = domain.quantities[name[:-2]]  # rip off _c from name
-            static_quantities_centroid[name] = Q.centroid_values
+            static_quantities_centroid[name] = \
+                self._original_centroid_values(Q.centroid_values)
         
         # Store static quantities        
         self.writer.store_static_quantities(fid, **static_quantities)
@@ -238,6 +294,10 @@ class SWW_file(Data_format):
         """Store time and time dependent quantities
         """
 
+        if self.persistent:
+            self._store_timestep_persistent()
+            return
+
         #import types
         from time import sleep
         from os import stat
@@ -266,6 +326,8 @@ class SWW_file(Data_format):
             msg = 'File %s could not be opened for append' % self.filename
             raise DataFileNotOpenError, msg
 
+        self.writer.set_chunk_cache(fid)
+
         # Check to see if the file is already too big:
         time = fid.variables['time'][:]
 
@@ -273,110 +335,14 @@ class SWW_file(Data_format):
         file_size = stat(self.filename)[6]
         file_size_increase = file_size / i
         if file_size + file_size_increase > self.max_size * 2**self.recursion:
-            # In order to get the file name and start time correct,
-            # I change the domain.filename and domain.starttime.
-            # This is the only way to do this without changing
-            # other modules (I think).
-
-            # Write a filename addon that won't break the anuga viewers
-            # (10.sww is bad)
-            filename_ext = '_time_%s' % self.domain.time
-            filename_ext = filename_ext.replace('.', '_')
-
-            # Remember the old filename, then give domain a
-            # name with the extension
-            old_domain_filename = self.domain.get_name()
-            if not self.recursion:
-                self.domain.set_name(old_domain_filename + filename_ext)
-
-            # Temporarily change the domain starttime to the current time
-            old_domain_starttime = self.domain.starttime
-            self.domain.starttime = self.domain.get_time()
-
-            # Build a new data_structure.
-            next_data_structure = SWW_file(self.domain, mode=self.mode,
-                                           max_size=self.max_size,
-                                           recursion=self.recursion+1)
-            if not self.recursion:
-                log.critical('    file_size = %s' % file_size)
-                log.critical('    saving file to %s'
-                             % next_data_structure.filename) 
-
-            # Set up the new data_structure
-            self.domain.writer = next_data_structure
-
-            # Store connectivity and first timestep
-            next_data_structure.store_connectivity()
-            next_data_structure.store_timestep()
+            self._split_file(file_size)
             fid.sync()
             fid.close()
-
-            # Restore the old starttime and filename
-            self.domain.starttime = old_domain_starttime
-            self.domain.set_name(old_domain_filename)
         else:
             self.recursion = False
-            domain = self.domain
-
-            # Get the variables
-            time = fid.variables['time'][:]
-            i = len(time)
-             
-            if 'stage' in self.writer.dynamic_quantities:            
-                # Select only those values for stage, 
-                # xmomentum and ymomentum (if stored) where 
-                # depth exceeds minimum_storable_height
-                #
-                # In this branch it is assumed that elevation
-                # is also available as a quantity
 
-
-                # Smoothing for the get_vertex_values will be obtained
-                # from the smooth setting in domain
-            
-                Q = domain.quantities['stage']
-                w, _ = Q.get_vertex_values(xy=False)
-                
-                Q = domain.quantities['elevation']
-                z, _ = Q.get_vertex_values(xy=False)                
-                
-                storable_indices = num.array(w-z >= self.minimum_storable_height)
-                
-                #print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
-            else:
-                # Very unlikely branch
-                storable_indices = None # This means take all
-            
-            # Now store dynamic quantities
-            dynamic_quantities = {}
-            dynamic_quantities_centroid = {}
-            
-            for name in self.writer.dynamic_quantities:
-                #netcdf_array = fid.variables[name]
-                
-                Q = domain.quantities[name]
-                A, _ = Q.get_vertex_values(xy=False,
-                                           precision=self.precision)
-                
-                if storable_indices is not None:
-                    if name == 'stage':
-                        A = num.choose(storable_indices, (z, A))
-
-                    if name in ['xmomentum', 'ymomentum']:
-                        # Get xmomentum where depth exceeds 
-                        # minimum_storable_height
-                        
-                        # Define a zero vector of same size and type as A
-                        # for use with momenta
-                        null = num.zeros(num.size(A), A.dtype.char)
-                        A = num.choose(storable_indices, (null, A))
-                
-                dynamic_quantities[name] = A
-                
-            for name in self.writer.dynamic_c_quantities:
-                Q = domain.quantities[name[:-2]]
-                dynamic_quantities_centroid[name] = Q.centroid_values
-                
+            dynamic_quantities, dynamic_quantities_centroid = \
+                                self._get_dynamic_quantities()
                                         
             # Store dynamic quantities
             slice_index = self.writer.store_quantities(fid,
@@ -393,25 +359,468 @@ class SWW_file(Data_format):
 
 
             # Update extrema if requested
-            domain = self.domain
-            if domain.quantities_to_be_monitored is not None:
-                for q, info in domain.quantities_to_be_monitored.items():
-                    if info['min'] is not None:
-                        fid.variables[q + '.extrema'][0] = info['min']
-                        fid.variables[q + '.min_location'][:] = \
-                                        info['min_location']
-                        fid.variables[q + '.min_time'][0] = info['min_time']
-
-                    if info['max'] is not None:
-                        fid.variables[q + '.extrema'][1] = info['max']
-                        fid.variables[q + '.max_location'][:] = \
-                                        info['max_location']
-                        fid.variables[q + '.max_time'][0] = info['max_time']
+            self._store_extrema(fid)
 
             # Flush and close
             #fid.sync()
             fid.close()
 
+    def _split_file(self, file_size):
+        """Continue storing in a new file as the current one would exceed
+        max_size
+        """
+
+        # In order to get the file name and start time correct,
+        # I change the domain.filename and domain.starttime.
+        # This is the only way to do this without changing
+        # other modules (I think).
+
+        # Write a filename addon that won't break the anuga viewers
+        # (10.sww is bad)
+        filename_ext = '_time_%s' % self.domain.time
+        filename_ext = filename_ext.replace('.', '_')
+
+        # Remember the old filename, then give domain a
+        # name with the extension
+        old_domain_filename = self.domain.get_name()
+        if not self.recursion:
+            self.domain.set_name(old_domain_filename + filename_ext)
+
+        # Temporarily change the domain starttime to the current time
+        old_domain_starttime = self.domain.starttime
+        self.domain.starttime = self.domain.get_time()
+
+        # Build a new data_structure.
+        next_data_structure = SWW_file(self.domain, mode=netcdf_mode_w,
+                                       max_size=self.max_size,
+                                       recursion=self.recursion+1)
+        if not self.recursion:
+            log.critical('    file_size = %s' % file_size)
+            log.critical('    saving file to %s'
+                         % next_data_structure.filename) 
+
+        # Set up the new data_structure
+        self.domain.writer = next_data_structure
+
+        # Store connectivity and first timestep
+        next_data_structure.store_connectivity()
+        next_data_structure.store_timestep()
+
+        # Restore the old starttime and filename
+        self.domain.starttime = old_domain_starttime
+        self.domain.set_name(old_domain_filename)
+
+    def _get_dynamic_quantities(self, values=None):
+        """Return dictionaries of the vertex and centroid values of the
+        dynamic quantities to be stored for the current timestep, or from
+        values copied by _copy_values
+        """
+
+        domain = self.domain
+             
+        if 'stage' in self.writer.dynamic_quantities:            
+            # Select only those values for stage, 
+            # xmomentum and ymomentum (if stored) where 
+            # depth exceeds minimum_storable_height
+            #
+            # In this branch it is assumed that elevation
+            # is also available as a quantity
+
+
+            # Smoothing for the get_vertex_values will be obtained
+            # from the smooth setting in domain
+        
+            w = self._get_vertex_values('stage', values)
+            z = self._get_vertex_values('elevation', values)
+            
+            storable_indices = num.array(w-z >= self.minimum_storable_height)
+            
+            #print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
+        else:
+            # Very unlikely branch
+            storable_indices = None # This means take all
+        
+        # Now store dynamic quantities
+        dynamic_quantities = {}
+        dynamic_quantities_centroid = {}
+        
+        for name in self.writer.dynamic_quantities:
+            #netcdf_array = fid.variables[name]
+            
+            A = self._get_vertex_values(name, values, self.precision)
+            
+            if storable_indices is not None:
+                if name == 'stage':
+                    A = num.choose(storable_indices, (z, A))
+
+                if name in ['xmomentum', 'ymomentum']:
+                    # Get xmomentum where depth exceeds 
+                    # minimum_storable_height
+                    
+                    # Define a zero vector of same size and type as A
+                    # for use with momenta
+                    null = num.zeros(num.size(A), A.dtype.char)
+                    A = num.choose(storable_indices, (null, A))
+            
+            dynamic_quantities[name] = self._original_vertex_values(A)
+            
+        for name in self.writer.dynamic_c_quantities:
+            if values is None:
+                A = domain.quantities[name[:-2]].centroid_values
+            else:
+                A = values[0][name[:-2]]
+            dynamic_quantities_centroid[name] = \
+                self._original_centroid_values(A)
+
+        return dynamic_quantities, dynamic_quantities_centroid
+
+    def _get_vertex_values(self, name, values=None, precision=num.float):
+        """Return the vertex values of a quantity as given by
+        get_vertex_values(xy=False), or the same from values copied by
+        _copy_values
+        """
+
+        domain = self.domain
+
+        if values is None:
+            A, _ = domain.quantities[name].get_vertex_values(xy=False,
+                                                    precision=precision)
+            return A
+
+        centroid_values, vertex_values = values
+
+        if domain.smooth:
+            A = num.zeros(domain.number_of_full_nodes, num.float)
+            if domain.get_using_discontinuous_elevation():
+                average_centroid_values(ensure_numeric(domain.vertex_value_indices),
+                                        ensure_numeric(domain.number_of_triangles_per_node),
+                                        centroid_values[name], A)
+            else:
+                average_vertex_values(ensure_numeric(domain.vertex_value_indices),
+                                      ensure_numeric(domain.number_of_triangles_per_node),
+                                      vertex_values[name], A)
+            return A.astype(precision)
+        else:
+            return vertex_values[name].flatten().astype(precision)
+
+    def _copy_values(self, centroid_values, vertex_values):
+        """Copy the centroid and vertex values of the quantities needed by
+        _get_dynamic_quantities into the dictionaries centroid_values and
+        vertex_values, reusing their arrays
+        """
+
+        domain = self.domain
+
+        names = list(self.writer.dynamic_quantities)
+        if 'stage' in names:
+            names.append('elevation')
+        centroid_names = [name[:-2] for name in self.writer.dynamic_c_quantities]
+
+        # Only the values used by get_vertex_values
+        if domain.smooth and domain.get_using_discontinuous_elevation():
+            centroid_names += names
+            names = []
+
+        for copies, values, field in [(centroid_names, centroid_values, 'centroid_values'),
+                                      (names, vertex_values, 'vertex_values')]:
+            for name in copies:
+                A = getattr(domain.quantities[name], field)
+                if name not in values:
+                    values[name] = num.empty_like(A)
+                values[name][:] = A
+
+    def _store_extrema(self, fid, monitored=None):
+        """Store the extrema of the monitored quantities, if requested.
+        monitored is a copy of domain.quantities_to_be_monitored taken
+        for asynchronous storage.
+        """
+
+        if monitored is None:
+            monitored = self.domain.quantities_to_be_monitored
+        if monitored is not None:
+            for q, info in monitored.items():
+                if info['min'] is not None:
+                    fid.variables[q + '.extrema'][0] = info['min']
+                    fid.variables[q + '.min_location'][:] = \
+                                    info['min_location']
+                    fid.variables[q + '.min_time'][0] = info['min_time']
+
+                if info['max'] is not None:
+                    fid.variables[q + '.extrema'][1] = info['max']
+                    fid.variables[q + '.max_location'][:] = \
+                                    info['max_location']
+                    fid.variables[q + '.max_time'][0] = info['max_time']
+
+    def open(self):
+        """Open the file for the persistent writer, reading the stored
+        times and the ranges of the dynamic quantities once.
+        """
+
+        from os import stat
+
+        self.fid = NetCDFFile(self.filename, netcdf_mode_a)
+        self.writer.set_chunk_cache(self.fid)
+
+        self.times = list(self.fid.variables['time'][:])
+        self.ranges = {}
+        for q in self.writer.dynamic_quantities:
+            self.ranges[q] = num.array(self.fid.variables[q + Write_sww.RANGE][:])
+
+        # Bytes added to the file by each timestep
+        itemsize = num.dtype(self.precision).itemsize
+        self.timestep_size = num.dtype(netcdf_float).itemsize
+        for q in self.writer.dynamic_quantities + self.writer.dynamic_c_quantities:
+            self.timestep_size += itemsize*num.prod(self.fid.variables[q].shape[1:])
+
+        self.file_size = stat(self.filename)[6]
+        self.unflushed = 0
+
+    def flush(self):
+        """Write the ranges and extrema held in memory and flush the
+        persistent file to disk, after waiting for the asynchronous
+        writes to finish
+        """
+
+        if self.fid is None:
+            return
+
+        self.drain()
+        self._flush()
+
+    def _flush(self, monitored=None):
+
+        for q in self.writer.dynamic_quantities:
+            self.fid.variables[q + Write_sww.RANGE][:] = self.ranges[q]
+
+        self._store_extrema(self.fid, monitored)
+
+        self.fid.sync()
+        self.unflushed = 0
+
+    def close(self):
+        """Flush and close the persistent file, stopping the writer thread
+        of asynchronous storage. The file is opened again by the next
+        store_timestep.
+        """
+
+        if self.fid is None:
+            return
+
+        try:
+            self.flush()
+        finally:
+            if self.worker is not None:
+                self.queue.put(None)
+                self.worker.join()
+                self.worker = None
+
+            self.fid.close()
+            self.fid = None
+
+    def _store_timestep_persistent(self):
+        """Store time and time dependent quantities keeping the file open.
+
+        The slice index, the ranges and the file size are tracked in
+        memory instead of being read from the file at each timestep, and
+        the file is flushed every flush_step timesteps.
+
+        With asynchronous storage the centroid and vertex values are
+        copied into one of two buffers, and converted and written by a
+        separate thread, see _write_asynchronous.
+        """
+
+        if self.fid is None:
+            self.open()
+        elif self.file_size + self.timestep_size > \
+                 self.max_size * 2**self.recursion:
+            self.close()
+            self._split_file(self.file_size)
+            return
+
+        self.recursion = False
+
+        self.file_size += self.timestep_size
+
+        if self.asynchronous:
+            self._write_asynchronous(self.domain.time)
+        else:
+            dynamic_quantities, dynamic_quantities_centroid = \
+                                self._get_dynamic_quantities()
+            self._write_timestep(self.domain.time,
+                                 dynamic_quantities,
+                                 dynamic_quantities_centroid)
+
+    def _write_timestep(self, time, dynamic_quantities,
+                        dynamic_quantities_centroid, monitored=None):
+        """Write one timestep to the persistent file
+        """
+
+        # Check if time already saved as in check pointing
+        slice_index = len(self.times)
+        if slice_index > 0 and time <= self.times[-1]:
+            check = num.where(num.abs(num.array(self.times) - time) < 1.0e-14)
+            slice_index = int(check[0][0])
+        else:
+            self.times.append(time)
+        self.fid.variables['time'][slice_index] = time
+
+        self.writer.store_quantities(self.fid,
+                                     slice_index=slice_index,
+                                     sww_precision=self.precision,
+                                     ranges=self.ranges,
+                                     **dynamic_quantities)
+
+        if self.store_centroids:
+            self.writer.store_quantities_centroid(self.fid,
+                                                  slice_index=slice_index,
+                                                  sww_precision=self.precision,
+                                                  **dynamic_quantities_centroid)
+
+        self.unflushed += 1
+        if self.unflushed >= self.flush_step:
+            self._flush(monitored)
+
+    def _write_asynchronous(self, time):
+        """Copy the values of this timestep into the next of two buffers
+        and queue them for the writer thread, which computes the values
+        to store. Only blocks if the writer thread is still writing the
+        values previously stored in the buffer.
+        """
+
+        if self.worker is None:
+            self._start_worker()
+
+        self._check_worker_error()
+
+        k = self.next_buffer
+        self.buffer_free[k].wait()
+        self._check_worker_error()
+        self.buffer_free[k].clear()
+
+        if self.buffers[k] is None:
+            self.buffers[k] = ({}, {})
+        self._copy_values(*self.buffers[k])
+
+        # Extrema of the monitored quantities at this time
+        monitored = None
+        if self.domain.quantities_to_be_monitored is not None:
+            from copy import deepcopy
+            monitored = deepcopy(self.domain.quantities_to_be_monitored)
+
+        self.queue.put((k, time, monitored))
+        self.next_buffer = 1 - k
+
+    def _start_worker(self):
+
+        import threading
+        import Queue
+
+        self.queue = Queue.Queue()
+        self.buffers = [None, None]
+        self.buffer_free = [threading.Event(), threading.Event()]
+        for event in self.buffer_free:
+            event.set()
+        self.next_buffer = 0
+        self.worker_error = None
+
+        self.worker = threading.Thread(target=self._worker_loop)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def _worker_loop(self):
+        """Write the queued buffers to the file until None is queued
+        """
+
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+
+                k, time, monitored = item
+                if self.worker_error is None:
+                    try:
+                        dynamic_quantities, dynamic_quantities_centroid = \
+                            self._get_dynamic_quantities(self.buffers[k])
+                        self._write_timestep(time, dynamic_quantities,
+                                             dynamic_quantities_centroid,
+                                             monitored)
+                    except Exception, e:
+                        self.worker_error = e
+                self.buffer_free[k].set()
+            finally:
+                self.queue.task_done()
+
+    def _check_worker_error(self):
+
+        if self.worker is not None and self.worker_error is not None:
+            msg = 'Asynchronous storage to %s failed: %s' \
+                  % (self.filename, self.worker_error)
+            raise Exception(msg)
+
+    def drain(self):
+        """Wait until the writer thread of asynchronous storage has
+        written all queued timesteps
+        """
+
+        if self.worker is None:
+            return
+
+        self.queue.join()
+        self._check_worker_error()
+
+    def __getstate__(self):
+        """Flush the persistent file, waiting for asynchronous writes, and
+        do not pickle its handle and the writer thread (eg when
+        checkpointing the domain)
+        """
+
+        self.flush()
+
+        state = self.__dict__.copy()
+        state['fid'] = None
+        for name in ['worker', 'queue', 'buffers', 'buffer_free']:
+            state[name] = None
+
+        return state
+
+    def _original_centroid_values(self, A):
+        """Return centroid values in the original triangle numbering
+        (unchanged unless storing a renumbered domain in original order)
+        """
+
+        if self.tri_original_to_new is None:
+            return A
+
+        return A[self.tri_original_to_new]
+
+    def _original_vertex_values(self, A):
+        """Return values as given by get_vertex_values in the original
+        numbering of nodes (smooth) or triangles (not smooth)
+        """
+
+        if self.tri_original_to_new is None:
+            return A
+
+        if self.domain.smooth:
+            return A[self.node_original_to_new]
+        else:
+            return A.reshape(-1, 3)[self.tri_original_to_new].flatten()
+
+    def _original_triangles(self, V):
+        """Return connectivity as given by get_vertex_values in the
+        original numbering
+        """
+
+        if self.tri_original_to_new is None:
+            return V
+
+        if self.domain.smooth:
+            node_new_to_original = num.argsort(self.node_original_to_new)
+            return node_new_to_original[V[self.tri_original_to_new]]
+        else:
+            return V
+
 
 class Read_sww:
 
@@ -514,7 +923,10 @@ class Write_sww(Write_sts):
                  static_quantities,
                  dynamic_quantities,
                  static_c_quantities = [],
-                 dynamic_c_quantities = []):
+                 dynamic_c_quantities = [],
+                 chunking = None,
+                 zlib_level = None,
+                 least_significant_digit = None):
         
         """Initialise Write_sww with two (or 4) list af quantity names: 
         
@@ -531,17 +943,82 @@ class Write_sww(Write_sts):
         dynamic_c_quantities (e.g stage_c):
             Stored every timestep in a 2D array with 
             dimensions number_of_triangles X number_of_timesteps 
-        
+
+        chunking, zlib_level and least_significant_digit set the chunk
+        shape ('frames', 'timeseries' or a tuple), the deflate level and
+        the quantisation of the dynamic quantities in NETCDF4 files, see
+        Domain.set_sww_format. They are not used for classic files.
         """
         self.static_quantities = static_quantities   
         self.dynamic_quantities = dynamic_quantities
         self.static_c_quantities = static_c_quantities
         self.dynamic_c_quantities = dynamic_c_quantities
 
+        self.chunking = chunking
+        self.zlib_level = zlib_level
+        self.least_significant_digit = least_significant_digit
+
         self.store_centroids = False
         if static_c_quantities or dynamic_c_quantities:
             self.store_centroids = True
 
+    def get_chunk_shape(self, number_of_points):
+        """Return the chunk shape (timesteps, points) of a dynamic
+        quantity with number_of_points values per timestep, or None for
+        the default layout.
+        """
+
+        if self.chunking is None:
+            return None
+
+        if self.chunking == 'frames':
+            return (1, number_of_points)
+
+        if self.chunking == 'timeseries':
+            timesteps, points = sww_timeseries_chunk_shape
+        else:
+            timesteps, points = self.chunking
+
+        return (timesteps, max(1, min(points, number_of_points)))
+
+    def get_variable_options(self, outfile, dimension):
+        """Return the keyword arguments of createVariable for a dynamic
+        quantity with points along dimension.
+        """
+
+        options = {}
+
+        if getattr(outfile, 'file_format', 'NETCDF3').startswith('NETCDF3'):
+            return options
+
+        number_of_points = len(outfile.dimensions[dimension])
+        chunk_shape = self.get_chunk_shape(number_of_points)
+        if chunk_shape is not None:
+            options['chunksizes'] = chunk_shape
+
+        if self.zlib_level:
+            options['zlib'] = True
+            options['complevel'] = self.zlib_level
+            options['shuffle'] = True
+
+        if self.least_significant_digit is not None:
+            options['least_significant_digit'] = self.least_significant_digit
+
+        return options
+
+    def set_chunk_cache(self, outfile):
+        """Make the chunk cache of each dynamic quantity large enough
+        to hold the chunks touched by one timestep, so that timeseries
+        chunks are compressed once when they are complete instead of at
+        every timestep.
+        """
+
+        if self.chunking is None:
+            return
+
+        for q in self.dynamic_quantities + self.dynamic_c_quantities:
+            set_chunk_cache(outfile.variables[q])
+
 
     def store_header(self,
                      outfile,
@@ -775,9 +1252,11 @@ class Write_sww(Write_sts):
         """
         
 
+        options = self.get_variable_options(outfile, 'number_of_points')
         for q in self.dynamic_quantities:
             outfile.createVariable(q, precis, ('number_of_timesteps',
-                                               'number_of_points'))
+                                               'number_of_points'),
+                                   **options)
             outfile.createVariable(q + Write_sts.RANGE, precis,
                                    ('numbers_in_range',))
             
@@ -786,9 +1265,13 @@ class Write_sww(Write_sts):
             outfile.variables[q+Write_sts.RANGE][0] = max_float  # Min
             outfile.variables[q+Write_sts.RANGE][1] = -max_float # Max
 
+        options = self.get_variable_options(outfile, 'number_of_volumes')
         for q in self.dynamic_c_quantities:
             outfile.createVariable(q, precis, ('number_of_timesteps',
-                                                    'number_of_volumes'))
+                                                    'number_of_volumes'),
+                                   **options)
+
+        self.set_chunk_cache(outfile)
 
         # Doing sts_precision instead of Float gives cast errors.
         outfile.createVariable('time', netcdf_float, ('number_of_timesteps',))
@@ -947,6 +1430,7 @@ class Write_sww(Write_sts):
                          slice_index=None,
                          time=None,
                          verbose=False, 
+                         ranges=None,
                          **quant):
         """
         Write the quantity info at each timestep.
@@ -966,6 +1450,10 @@ class Write_sww(Write_sts):
         * single precision (default): num.float32
         * double precision: num.float64 or num.float 
 
+        If ranges (a dictionary of [min, max] arrays for each quantity) is
+        given the ranges are updated there instead of in the file and the
+        caller is responsible for storing them.
+
         Precondition:
             store_triangulation and
             store_header have been called.
@@ -1002,6 +1490,12 @@ class Write_sww(Write_sts):
                 
                 q_retyped = q_values.astype(sww_precision)
                 outfile.variables[q][slice_index] = q_retyped
+
+                if ranges is not None:
+                    q_range = ranges[q]
+                    q_range[0] = min(q_range[0], num.min(q_values))
+                    q_range[1] = max(q_range[1], num.max(q_values))
+                    continue
                     
                 # This updates the _range values
                 q_range = outfile.variables[q + Write_sww.RANGE][:]
@@ -1088,6 +1582,88 @@ class Write_sww(Write_sts):
 
 
 
+def get_chunk_shape(var):
+    """Return the chunk shape of the variable var of an open NetCDF file,
+    or None if it is not chunked (eg in classic NetCDF files).
+    """
+
+    if not hasattr(var, 'chunking'):
+        return None
+
+    chunk_shape = var.chunking()
+    if chunk_shape is None or chunk_shape == 'contiguous':
+        return None
+
+    return chunk_shape
+
+
+def is_timeseries_chunked(var):
+    """Return True if the time dependent variable var is stored in chunks
+    holding part of the points, so that the time series of a few points
+    can be read without reading all points of each timestep (see
+    Domain.set_sww_format).
+    """
+
+    chunk_shape = get_chunk_shape(var)
+    if chunk_shape is None or len(var.shape) != 2:
+        return False
+
+    return chunk_shape[1] < var.shape[1]
+
+
+def read_timeseries(var, point_ids, start=0, end=None):
+    """Return the values of the time dependent variable var at the points
+    point_ids for timesteps start to end - 1 (by default all timesteps) as
+    a number_of_timesteps x len(point_ids) array, reading once each chunk
+    holding some of the points. Best used with variables for which
+    is_timeseries_chunked is True. For variables that are not chunked the
+    range of points from the first to the last of point_ids is read.
+    """
+
+    if end is None:
+        end = var.shape[0]
+
+    point_ids = num.array(point_ids, num.int)
+    values = num.zeros((end - start, len(point_ids)), var.dtype)
+    if len(point_ids) == 0 or end <= start:
+        return values
+
+    chunk_shape = get_chunk_shape(var)
+    if chunk_shape is None:
+        first = num.min(point_ids)
+        last = num.max(point_ids)
+        values[:] = var[start:end, first:last+1][:, point_ids - first]
+        return values
+
+    chunk_points = chunk_shape[1]
+    chunks = point_ids/chunk_points
+    for chunk in num.unique(chunks):
+        indices = num.nonzero(chunks == chunk)[0]
+        first = chunk*chunk_points
+        last = min(first + chunk_points, var.shape[1])
+        values[:, indices] = \
+            var[start:end, first:last][:, point_ids[indices] - first]
+
+    return values
+
+
+def set_chunk_cache(var):
+    """Make the chunk cache of the time dependent variable var large
+    enough to hold the chunks of all points for one block of timesteps,
+    so that reading or writing whole timesteps (de)compresses each chunk
+    only once.
+    """
+
+    chunk_shape = get_chunk_shape(var)
+    if chunk_shape is None or len(var.shape) != 2:
+        return
+
+    number_of_chunks = (var.shape[1] + chunk_shape[1] - 1)/chunk_shape[1]
+    size = number_of_chunks*chunk_shape[0]*chunk_shape[1]*var.dtype.itemsize
+    var.set_var_chunk_cache(size=max(size, 2**20),
+                            nelems=max(2*number_of_chunks + 1, 521))
+
+
 def extent_sww(file_name):
     """Read in an sww file, then get its extents
 
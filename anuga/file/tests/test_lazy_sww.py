@@ -0,0 +1,158 @@
+import os
+import unittest
+import numpy as num
+
+from anuga import rectangular_cross_domain, Reflective_boundary
+from anuga.file.netcdf import NetCDFFile
+from anuga.file.lazy_sww import Lazy_sww, Frame_cache
+
+
+class Test_lazy_sww(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['test_lazy_sww.sww']:
+            try:
+                os.remove(filename)
+            except:
+                pass
+
+    def create_sww(self, sww_format=None, store_centroids=True):
+        """Evolve a small dam break storing test_lazy_sww.sww. sww_format
+        is a dictionary of arguments of set_sww_format
+        """
+
+        domain = rectangular_cross_domain(6, 4, len1=6.0, len2=4.0)
+        domain.set_name('test_lazy_sww')
+        domain.set_store_centroids(store_centroids)
+        if sww_format is not None:
+            domain.set_sww_format(**sww_format)
+
+        domain.set_quantity('elevation', lambda x, y: -x/6.0)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', lambda x, y: num.where(x < 2.0, 0.5, -x/6.0))
+
+        Br = Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        for t in domain.evolve(yieldstep=0.1, finaltime=1.0):
+            pass
+
+        return 'test_lazy_sww.sww'
+
+    def test_frame_cache(self):
+
+        cache = Frame_cache(3*80)
+        for i in range(5):
+            cache.put(i, num.zeros(10))
+
+        assert cache.nbytes == 3*80
+        assert cache.get(0) is None
+        assert cache.get(1) is None
+        assert cache.get(2) is not None
+
+        # 2 is now the most recently used
+        cache.put(5, num.zeros(10))
+        assert cache.get(3) is None
+        assert cache.get(2) is not None
+
+        # Too large to be cached
+        cache.put(6, num.zeros(100))
+        assert cache.get(6) is None
+        assert cache.nbytes == 3*80
+
+    def test_stored_quantities(self):
+
+        for sww_format in [None, {'format': 'netcdf4',
+                                  'chunking': (4, 16)}]:
+            filename = self.create_sww(sww_format)
+
+            fid = NetCDFFile(filename)
+            stage = fid.variables['stage'][:]
+            stage_c = fid.variables['stage_c'][:]
+            elevation = fid.variables['elevation'][:]
+            time = fid.variables['time'][:]
+            fid.close()
+
+            sww = Lazy_sww(filename, cache_size=4*stage.shape[1]*4)
+
+            assert num.allclose(sww.time, time)
+            assert sww['stage'].shape == stage.shape
+            assert num.all(sww['elevation'][:] == elevation)
+            assert num.all(sww['elevation'][[3, 1]] == elevation[[3, 1]])
+
+            Q = sww['stage']
+            ids = [20, 3, 7, 3]
+            mask = num.arange(stage.shape[1]) % 3 == 0
+            for key in [5, -1, slice(2, 8, 3), [4, 2, 4],
+                        (slice(None), 7), (3, ids), (slice(1, 9), ids),
+                        ([0, 10, 9], slice(5, 30)), (-2, mask)]:
+                assert num.all(Q[key] == stage[key]), key
+
+            # Reading whole timesteps caches them, up to the cache size
+            Q[2:4]
+            hits = sww.cache.hits
+            Q[2]
+            Q[3, ids]
+            assert sww.cache.hits == hits + 2
+            assert sww.cache.nbytes <= sww.cache.max_bytes
+
+            # Subsets of uncached timesteps are not cached
+            Q[9, ids]
+            assert sww.cache.get(('stage', 9)) is None
+
+            assert num.all(sww['stage_c'][3:5, ids] == stage_c[3:5, ids])
+            assert num.all(num.array(sww['stage_c']) == stage_c)
+
+            sww.close()
+
+    def test_derived_quantities(self):
+
+        for store_centroids in [True, False]:
+            filename = self.create_sww(store_centroids=store_centroids)
+
+            fid = NetCDFFile(filename)
+            vols = fid.variables['volumes'][:]
+            stage = fid.variables['stage'][:]
+            elevation = fid.variables['elevation'][:]
+            xmom = fid.variables['xmomentum'][:]
+            ymom = fid.variables['ymomentum'][:]
+            fid.close()
+
+            sww = Lazy_sww(filename, minimum_allowed_height=0.01)
+            assert 'velocity_c' in sww.get_quantity_names()
+
+            height = num.maximum(stage - elevation, 0.0)
+            wet = height > 0.01
+            xvel = xmom/(height + 1.0e-12)*wet
+            vel = (xmom**2 + ymom**2)**0.5/(height + 1.0e-12)*wet
+
+            assert num.allclose(sww['height'][:], height)
+            assert num.allclose(sww['xvelocity'][3:6], xvel[3:6])
+            assert num.allclose(sww['velocity'][-1, [1, 5]], vel[-1, [1, 5]])
+            assert num.allclose(sww['momentum'][4], (xmom[4]**2 + ymom[4]**2)**0.5)
+
+            def centroids(A):
+                return (A[..., vols[:,0]] + A[..., vols[:,1]] + A[..., vols[:,2]])/3.0
+
+            if not store_centroids:
+                # Centroid values from the vertex values
+                ids = [30, 2, 11]
+                assert num.allclose(sww['elevation_c'][ids],
+                                    centroids(elevation)[ids])
+                assert num.allclose(sww['stage_c'][4:6, ids],
+                                    centroids(stage)[4:6, ids])
+                assert num.allclose(sww['height_c'][:],
+                                    num.maximum(centroids(stage) -
+                                                centroids(elevation), 0.0))
+
+            self.assertRaises(Exception, sww.get_quantity, 'vorticity')
+
+            sww.close()
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_lazy_sww, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -875,6 +875,203 @@ class Test_sww(unittest.TestCase):
                                            new_origin)),points_utm)
         os.remove(filename)
 
+    def run_dam_break(self, name, persistent=False, asynchronous=False,
+                      finaltime=1.0, fail_time=None, sww_format=None,
+                      smooth=True):
+        """Evolve a small dam break storing to name.sww, sww_format is
+        a dictionary of arguments of set_sww_format
+        """
+
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+
+        points, vertices, boundary = rectangular_cross(6, 6)
+
+        domain = Domain(points, vertices, boundary)
+        domain.set_name(name)
+        domain.set_store_centroids(True)
+        domain.set_sww_persistent(persistent, flush_step=3)
+        domain.set_sww_asynchronous(asynchronous)
+        domain.set_store_vertices_smoothly(smooth)
+        if sww_format is not None:
+            domain.set_sww_format(**sww_format)
+        domain.set_quantities_to_be_monitored('stage')
+
+        domain.set_quantity('elevation', lambda x, y: -x/2.0)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', lambda x, y: num.where(x < 0.5, 0.2, -x/2.0))
+
+        Br = Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        for t in domain.evolve(yieldstep=0.1, finaltime=finaltime):
+            if fail_time is not None and t >= fail_time:
+                raise Exception('Failure during evolve')
+
+        return domain
+
+    def compare_sww_files(self, filename1, filename2):
+
+        fid1 = NetCDFFile(filename1)
+        fid2 = NetCDFFile(filename2)
+
+        for name in ['time', 'stage', 'xmomentum', 'ymomentum', 'stage_c',
+                     'stage_range', 'xmomentum_range', 'ymomentum_range',
+                     'stage.extrema', 'stage.max_location']:
+            assert num.allclose(fid1.variables[name][:],
+                                fid2.variables[name][:])
+
+        fid1.close()
+        fid2.close()
+
+    def test_persistent_sww_writer(self):
+        """Check that keeping the sww file open gives the same file as
+        reopening it every yieldstep, and that it is closed at the end of
+        evolve and on an exception
+        """
+
+        import cPickle
+
+        run_domain = self.run_dam_break
+
+        domain = run_domain('test_sww_reopen', False)
+        domain_persistent = run_domain('test_sww_persistent', True)
+
+        assert not domain.get_sww_persistent()
+        assert domain_persistent.get_sww_persistent()
+        assert domain_persistent.writer.fid is None
+
+        fid = NetCDFFile('test_sww_reopen.sww')
+        assert len(fid.variables['time']) == 11
+        fid.close()
+
+        self.compare_sww_files('test_sww_reopen.sww', 'test_sww_persistent.sww')
+
+        # The file is flushed and closed on an exception
+        try:
+            run_domain('test_sww_persistent_failure', True, fail_time=0.35)
+        except Exception:
+            pass
+        else:
+            raise Exception('Should have raised an exception')
+
+        fid = NetCDFFile('test_sww_persistent_failure.sww')
+        assert num.allclose(fid.variables['time'][:], [0.0, 0.1, 0.2, 0.3, 0.4])
+        assert num.all(fid.variables['stage_range'][:] < 1.0e10)
+        fid.close()
+
+        # The file handle is not pickled, the copy continues the file
+        domain_copy = cPickle.loads(cPickle.dumps(domain_persistent))
+        for t in domain_copy.evolve(yieldstep=0.1, finaltime=1.5):
+            pass
+
+        fid = NetCDFFile('test_sww_persistent.sww')
+        assert len(fid.variables['time']) == 16
+        fid.close()
+
+        for name in ['test_sww_reopen', 'test_sww_persistent',
+                     'test_sww_persistent_failure']:
+            os.remove(name + '.sww')
+
+    def test_asynchronous_sww_writer(self):
+        """Check that writing the sww file from a separate thread gives the
+        same file, also across a checkpoint
+        """
+
+        import cPickle
+
+        domain = self.run_dam_break('test_sww_sync', finaltime=1.5)
+        domain_async = self.run_dam_break('test_sww_async', asynchronous=True)
+
+        assert domain_async.get_sww_asynchronous()
+        assert domain_async.writer.worker is None
+        assert domain_async.writer.fid is None
+
+        # Continue a pickled copy (as for a checkpoint) to the final time,
+        # appending to the same file. Pickling the copy again during the
+        # evolve must flush the writer thread
+        domain_copy = cPickle.loads(cPickle.dumps(domain_async))
+        checkpoints = 0
+        for t in domain_copy.evolve(yieldstep=0.1, finaltime=1.5):
+            if abs(t - 1.2) < 1.0e-10:
+                cPickle.dumps(domain_copy)
+                assert domain_copy.writer.unflushed == 0
+                checkpoints += 1
+        assert checkpoints == 1
+
+        self.compare_sww_files('test_sww_sync.sww', 'test_sww_async.sww')
+
+        # Unique vertex values are computed by the writer thread from the
+        # copied vertex values instead of the centroid values
+        self.run_dam_break('test_sww_sync', smooth=False)
+        self.run_dam_break('test_sww_async', smooth=False, asynchronous=True)
+
+        self.compare_sww_files('test_sww_sync.sww', 'test_sww_async.sww')
+
+        for name in ['test_sww_sync', 'test_sww_async']:
+            os.remove(name + '.sww')
+
+    def test_netcdf4_sww_format(self):
+        """Check that chunked and compressed netcdf4 sww files hold the
+        same values as classic files and are read in the same way
+        """
+
+        from anuga.abstract_2d_finite_volumes.util import file_function
+
+        self.run_dam_break('test_sww_classic')
+        self.run_dam_break('test_sww_frames',
+                           sww_format={'format': 'netcdf4'})
+        domain = self.run_dam_break('test_sww_timeseries', persistent=True,
+                                    sww_format={'format': 'netcdf4',
+                                                'chunking': (4, 16),
+                                                'zlib_level': 6})
+        self.run_dam_break('test_sww_quantised',
+                           sww_format={'format': 'netcdf4',
+                                       'least_significant_digit': 3})
+
+        assert domain.get_sww_format() == 'netcdf4'
+
+        fid = NetCDFFile('test_sww_timeseries.sww')
+        assert fid.file_format == 'NETCDF4'
+        assert fid.variables['stage'].chunking() == [4, 16]
+        assert fid.variables['stage_c'].chunking() == [4, 16]
+        assert fid.variables['stage'].filters()['zlib']
+        fid.close()
+
+        fid = NetCDFFile('test_sww_frames.sww')
+        points = fid.variables['stage'].shape[1]
+        assert fid.variables['stage'].chunking() == [1, points]
+        fid.close()
+
+        self.compare_sww_files('test_sww_classic.sww', 'test_sww_frames.sww')
+        self.compare_sww_files('test_sww_classic.sww',
+                               'test_sww_timeseries.sww')
+
+        fid1 = NetCDFFile('test_sww_classic.sww')
+        fid2 = NetCDFFile('test_sww_quantised.sww')
+        assert num.allclose(fid1.variables['stage'][:],
+                            fid2.variables['stage'][:], atol=1.0e-3)
+        fid1.close()
+        fid2.close()
+
+        # Time series at points, reading only the needed vertices from the
+        # timeseries chunked file
+        points = [[0.25, 0.5], [0.6, 0.3], [0.9, 0.85]]
+        f1 = file_function('test_sww_classic.sww', quantities='stage',
+                           interpolation_points=points)
+        f2 = file_function('test_sww_timeseries.sww', quantities='stage',
+                           interpolation_points=points)
+        for t in f1.get_time():
+            for i in range(len(points)):
+                assert num.allclose(f1(t, point_id=i), f2(t, point_id=i))
+
+        # The range is over the vertices read
+        min1, max1 = f1.quantities_range['stage']
+        min2, max2 = f2.quantities_range['stage']
+        assert min1 <= min2 <= max2 <= max1
+
+        for name in ['classic', 'frames', 'timeseries', 'quantised']:
+            os.remove('test_sww_%s.sww' % name)
+
 #################################################################################
 
 if __name__ == "__main__":
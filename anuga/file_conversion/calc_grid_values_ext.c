@@ -406,6 +406,90 @@ void _calc_grid_values( double *x, double *y, double *norms,
 
 }
 
+// As _calc_grid_values, but store the triangle containing each grid
+// point and the weights of its vertices instead of the interpolated
+// value, so that many quantities can be gridded with the same mapping.
+// Only the window of nrow x ncol grid points starting at row0, col0 of the
+// grid is evaluated, so that a large grid can be mapped tile by tile
+void _calc_grid_weights( double *x, double *y, double *norms,
+				 long *volumes,
+				 int num_tri,
+				 double cell_size,
+				 int row0,
+				 int col0,
+				 int nrow,
+				 int ncol,
+				 long *grid_tri,
+				 double *grid_weights )
+{
+	int i, j, k;
+	int x_min, x_max, y_min, y_max, point_index;
+	double fraction, intpart;
+	double triangle[6], point[2];
+	double v1[2], v2[2], v3[2];
+	double n1[2], n2[2], n3[2];
+	double val1, val2, res[2];
+	EXTENT extent[1];
+
+	for ( i = 0; i < num_tri; i++ ) {
+
+		get_tri_vertices( x,y, volumes, i, triangle, v1, v2, v3);
+		get_tri_norms( norms, i, n1, n2, n3 );
+		get_tri_extent( triangle, extent );
+
+		fraction = modf( extent->x_min/cell_size, &intpart );
+		x_min = intpart;
+		x_min = (x_min < col0) ? col0 : x_min; 
+
+		fraction = modf( ABS(extent->x_max)/cell_size, &intpart );
+		x_max = intpart;
+		x_max = (x_max > (col0+ncol-1)) ? (col0+ncol-1) : x_max;
+
+		fraction = modf( extent->y_min/cell_size, &intpart );
+		y_min = intpart;
+		y_min = (y_min < row0) ? row0 : y_min;
+
+		fraction = modf( ABS(extent->y_max)/cell_size, &intpart );
+		y_max = intpart;
+		y_max = (y_max > (row0+nrow-1)) ? (row0+nrow-1) : y_max;
+		
+		if ( x_max >= 0 && y_max >= 0 ) {
+		for ( j = y_min; j <= y_max; j++ ) {
+			for ( k = x_min; k <= x_max; k++ ) {
+				point_index = (j-row0)*ncol+(k-col0);
+
+				point[0] = k*cell_size;
+				point[1] = j*cell_size;
+
+				if ( _is_inside_triangle( point, triangle, \
+							  1, 1.0e-12, 1.0e-12 ) ) {
+					point_sub( point, v2, res);
+					val1 = point_dot( res, n1 );
+					point_sub( v1, v2 , res);
+					val2 = point_dot( res, n1 );
+					grid_weights[3*point_index] = val2 ? val1/val2 : 0;
+
+					point_sub( point, v3, res);
+					val1 = point_dot( res, n2 );
+					point_sub( v2, v3, res);
+					val2 = point_dot( res, n2 );
+					grid_weights[3*point_index+1] = val2 ? val1/val2 : 0;
+
+					point_sub( point, v1, res);
+					val1 = point_dot( res, n3 );
+					point_sub( v3, v1, res);
+					val2 = point_dot( res, n3 );
+					grid_weights[3*point_index+2] = val2 ? val1/val2 : 0;
+
+					grid_tri[point_index] = i;
+				}
+			}
+		}
+		}
+	}
+
+}
+
 static PyObject *calc_grid_values( PyObject *self, PyObject *args )
 {
 	int i, ok, num_tri, num_vert, ncol, nrow, num_norms, num_grid_val;
@@ -479,8 +563,70 @@ static PyObject *calc_grid_values( PyObject *self, PyObject *args )
 	return Py_BuildValue("");
 }
 
+static PyObject *calc_grid_weights( PyObject *self, PyObject *args )
+{
+	int i, ok, num_tri, ncol, nrow;
+	int row0 = 0, col0 = 0;
+	long *volumes; 
+	double cell_size;
+	double *x, *y;
+	double *norms;
+	long *grid_tri;
+	double *grid_weights;
+	PyObject *pyobj_x;
+	PyObject *pyobj_y;
+	PyObject *pyobj_norms;
+	PyObject *pyobj_volumes;
+	PyObject *pyobj_grid_tri;
+	PyObject *pyobj_grid_weights;
+
+	ok = PyArg_ParseTuple( args, "iidOOOOOO|ii",
+				&nrow,
+				&ncol,
+				&cell_size,
+				&pyobj_x,
+				&pyobj_y,
+				&pyobj_norms,
+				&pyobj_volumes, 
+				&pyobj_grid_tri,
+				&pyobj_grid_weights,
+				&row0,
+				&col0 );
+
+	if( !ok ){
+		fprintf( stderr, "calc_grid_weights: argument parsing error\n" );
+		exit(1);
+	}
+
+	x = DDATA( pyobj_x );
+	y = DDATA( pyobj_y );
+	norms = DDATA( pyobj_norms );
+	volumes = IDATA( pyobj_volumes );
+	grid_tri = IDATA( pyobj_grid_tri );
+	grid_weights = DDATA( pyobj_grid_weights );
+
+	num_tri = ((PyArrayObject*)pyobj_volumes)->dimensions[0];
+
+	init_norms( x,y, norms, volumes, num_tri );
+
+	// Grid points outside the mesh have no triangle
+	for ( i = 0 ; i < nrow*ncol; i++ ) {
+		grid_tri[i] = -1;
+		grid_weights[3*i] = 0.0;
+		grid_weights[3*i+1] = 0.0;
+		grid_weights[3*i+2] = 0.0;
+	}
+
+	_calc_grid_weights( x,y, norms, volumes, num_tri, \
+			    cell_size, row0, col0, nrow, ncol, \
+			    grid_tri, grid_weights );
+
+	return Py_BuildValue("");
+}
+
 static PyMethodDef calc_grid_values_ext_methods[] = {
 	{"calc_grid_values", calc_grid_values, METH_VARARGS},
+	{"calc_grid_weights", calc_grid_weights, METH_VARARGS},
 	{NULL, NULL}
 };
 
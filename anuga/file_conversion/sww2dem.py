@@ -12,6 +12,8 @@ from anuga.coordinate_transforms.geo_reference import Geo_reference
 from anuga.utilities.system_tools import get_vars_in_expression
 import anuga.utilities.log as log
 from anuga.utilities.file_utils import get_all_swwfiles
+from anuga.file_conversion.tiled_raster import write_raster_tiled, \
+     DEFAULT_TILE_SIZE
 
 
 ######
@@ -41,7 +43,10 @@ def sww2dem(name_in, name_out,
             verbose=False,
             origin=None,
             datum='WGS84',
-            block_size=None):
+            block_size=None,
+            mapping_cache=False,
+            tile_size=None,
+            processes=1):
     """Read SWW file and convert to Digitial Elevation model format
     (.asc or .ers)
 
@@ -83,9 +88,17 @@ def sww2dem(name_in, name_out,
 
     datum
 
-    format can be either 'asc' or 'ers'
+    format can be either 'asc', 'ers' or 'tif' (GeoTIFF, needs gdal)
     block_size - sets the number of slices along the non-time axis to
                  process in one block.
+    mapping_cache - if True the mapping of the grid to the mesh is saved
+                 next to the sww file and reused by later calls with the
+                 same mesh and grid (see Raster_mapping).
+    tile_size - if given (always for tif), the grid is computed and
+                 written in tiles of tile_size x tile_size points, so
+                 that large grids need not fit in memory (see
+                 write_raster_tiled). Not available for ers.
+    processes - number of processes computing the tiles, all cpus if None.
     """
 
     import sys
@@ -102,11 +115,16 @@ def sww2dem(name_in, name_out,
     if in_ext != '.sww':
         raise IOError('Input format for %s must be .sww' % name_in)
 
-    if out_ext not in ['.asc', '.ers']:
-        raise IOError('Format for %s must be either asc or ers.' % name_out)
+    if out_ext not in ['.asc', '.ers', '.tif']:
+        raise IOError('Format for %s must be either asc, ers or tif.'
+                      % name_out)
 
-    false_easting = 500000
-    false_northing = 10000000
+    if out_ext == '.tif' and tile_size is None:
+        tile_size = DEFAULT_TILE_SIZE
+
+    if out_ext == '.ers' and tile_size is not None:
+        raise IOError('Tiled output for %s must be either asc or tif.'
+                      % name_out)
 
     if quantity is None:
         quantity = 'elevation'
@@ -151,21 +169,7 @@ def sww2dem(name_in, name_out,
 
 
 
-    if origin is None:
-        # Get geo_reference
-        # sww files don't have to have a geo_ref
-        try:
-            geo_reference = Geo_reference(NetCDFObject=fid)
-        except AttributeError, e:
-            geo_reference = Geo_reference() # Default georef object
-
-        xllcorner = geo_reference.get_xllcorner()
-        yllcorner = geo_reference.get_yllcorner()
-        zone = geo_reference.get_zone()
-    else:
-        zone = origin[0]
-        xllcorner = origin[1]
-        yllcorner = origin[2]
+    zone, xllcorner, yllcorner = _get_reference(fid, origin)
 
     # FIXME: Refactor using code from Interpolation_function.statistics
     # (in interpolate.py)
@@ -266,6 +270,79 @@ def sww2dem(name_in, name_out,
                      % (quantity, min(result), max(result)))
 
     # Create grid and update xll/yll corner and x,y
+    nrows, ncols, newxllcorner, newyllcorner, x, y = \
+           _get_grid(x, y, xllcorner, yllcorner, cellsize,
+                     easting_min, easting_max, northing_min, northing_max,
+                     verbose)
+
+    if tile_size is not None:
+        write_raster_tiled(name_out, x, y, volumes, result,
+                           nrows, ncols, cellsize, newxllcorner, newyllcorner,
+                           NODATA_value, zone, datum,
+                           number_of_decimal_places,
+                           tile_size=tile_size, processes=processes,
+                           verbose=verbose)
+        fid.close()
+
+        if out_ext == '.asc':
+            return basename_out
+        return
+
+    if mapping_cache:
+        cache_name = basename_in
+    else:
+        cache_name = None
+
+    mapping = Raster_mapping(x, y, volumes, nrows, ncols, cellsize,
+                             cache_name=cache_name, verbose=verbose)
+    grid_values = mapping.interpolate(result, NODATA_value)
+
+    if verbose:
+        log.critical('Interpolated values are in [%f, %f]'
+                     % (num.min(grid_values), num.max(grid_values)))
+
+    _write_raster(name_out, grid_values, nrows, ncols, cellsize,
+                  newxllcorner, newyllcorner, NODATA_value, zone, datum,
+                  quantity, number_of_decimal_places, verbose)
+
+    fid.close()
+
+    if out_ext == '.asc':
+        return basename_out
+
+
+
+def _get_reference(fid, origin=None):
+    """Return zone, xllcorner and yllcorner of the open sww file fid, or
+    of origin (zone, xllcorner, yllcorner) if given
+    """
+
+    if origin is None:
+        # Get geo_reference
+        # sww files don't have to have a geo_ref
+        try:
+            geo_reference = Geo_reference(NetCDFObject=fid)
+        except AttributeError, e:
+            geo_reference = Geo_reference() # Default georef object
+
+        xllcorner = geo_reference.get_xllcorner()
+        yllcorner = geo_reference.get_yllcorner()
+        zone = geo_reference.get_zone()
+    else:
+        zone = origin[0]
+        xllcorner = origin[1]
+        yllcorner = origin[2]
+
+    return zone, xllcorner, yllcorner
+
+
+def _get_grid(x, y, xllcorner, yllcorner, cellsize,
+              easting_min=None, easting_max=None,
+              northing_min=None, northing_max=None, verbose=False):
+    """Return nrows, ncols, the absolute lower left corner of the grid
+    and x, y relative to it
+    """
+
     # Relative extent
     if easting_min is None:
         xmin = min(x)
@@ -306,78 +383,138 @@ def sww2dem(name_in, name_out,
     x = x + xllcorner - newxllcorner
     y = y + yllcorner - newyllcorner
 
+    return nrows, ncols, newxllcorner, newyllcorner, x, y
 
-    grid_values = num.zeros( (nrows*ncols, ), num.float)
-    #print '---',grid_values.shape
 
-    #-------------------------------------------------------
-    # Calculate grid values using the "standard" interpolation
-    # method (ie quad trees and such)
-    #-------------------------------------------------------
-    def calc_grid_values(nrows, ncols, cellsize, NODATA_value,
-                         x,y, norms, volumes, result, grid_values):
+class Raster_mapping:
+    """Mapping of the points of a grid to the triangles of a mesh.
 
-        grid_points = num.zeros ((ncols*nrows, 2), num.float)
-        vertex_points = num.concatenate ((x[:,num.newaxis], y[:,num.newaxis]), axis=1)
-        assert len(vertex_points.shape) == 2
+    Holds the triangle containing each grid point and the weights of its
+    vertices, so that any quantity given at the vertices can be gridded
+    without searching the mesh again. The grid has nrows x ncols points
+    cellsize apart, the first one at the origin of the coordinates x, y
+    of the mesh.
 
-        for i in xrange(nrows):
-            yg = i * cellsize
-#            if out_ext == '.asc':
-#                yg = i * cellsize
-#            else:
-#                # this will flip the order of the y values for ers
-#                yg = (nrows-i) * cellsize
+    If cache_name is given, the mapping is saved to the file
+    <cache_name>_raster_<key>.npz, where key is a hash of the mesh and the
+    grid, and read back from it when the same mesh and grid are mapped
+    again.
+    """
 
-            for j in xrange(ncols):
-                xg = j * cellsize
-                k = i*ncols + j
+    def __init__(self, x, y, volumes, nrows, ncols, cellsize,
+                 cache_name=None, verbose=False):
 
-                grid_points[k, 0] = xg
-                grid_points[k, 1] = yg
+        import hashlib
 
-        # Interpolate
-        from anuga.fit_interpolate.interpolate import Interpolate
+        x = num.array(x, num.float)
+        y = num.array(y, num.float)
+        volumes = num.array(volumes, num.int)
 
-        # Remove loners from vertex_points, volumes here
-        vertex_points, volumes = remove_lone_verts(vertex_points, volumes)
-        # export_mesh_file('monkey.tsh',{'vertices':vertex_points, 'triangles':volumes})
+        key = hashlib.sha1()
+        for A in [x, y, volumes]:
+            key.update(A.tostring())
+        key.update(repr((nrows, ncols, float(cellsize))))
+        self.key = key.hexdigest()
 
+        self.nrows = nrows
+        self.ncols = ncols
+        self.volumes = volumes
 
-        interp = Interpolate(vertex_points, volumes, verbose = verbose)
+        self.filename = None
+        if cache_name is not None:
+            self.filename = '%s_raster_%s.npz' % (cache_name, self.key[:16])
 
-        # Interpolate using quantity values
-        if verbose: log.critical('Interpolating')
-        grid_values[:] = interp.interpolate(result, grid_points,
-                                         NODATA_value= NODATA_value,
-                                         verbose=verbose).flatten()
-        #print grid_values.shape
+        if self.filename is not None and os.path.exists(self.filename):
+            if verbose: log.critical('Reading grid mapping from %s'
+                                     % self.filename)
+            data = num.load(self.filename)
+            if str(data['key']) == self.key:
+                self.set_mapping(data['triangles'], data['weights'])
+                return
 
-        return
+        from calc_grid_values_ext import calc_grid_weights
 
-    num_tri =  len(volumes)
-    norms = num.zeros(6*num_tri, num.float)
+        norms = num.zeros(6*len(volumes), num.float)
+        triangles = num.zeros(nrows*ncols, num.int)
+        weights = num.zeros((nrows*ncols, 3), num.float)
 
-    #print norms
-    from calc_grid_values_ext import calc_grid_values
+        calc_grid_weights(nrows, ncols, cellsize, x, y, norms, volumes,
+                          triangles, weights)
 
-    calc_grid_values(nrows, ncols, cellsize, NODATA_value,
-                     x,y, norms, volumes, result, grid_values)
+        self.set_mapping(triangles, weights)
 
+        if self.filename is not None:
+            if verbose: log.critical('Writing grid mapping to %s'
+                                     % self.filename)
+            num.savez(self.filename, key=self.key,
+                      triangles=triangles, weights=weights)
 
+    def set_mapping(self, triangles, weights):
 
-    #print outside_indices
+        self.inside = num.nonzero(triangles >= 0)[0]
+        self.weights = weights[self.inside]
+        self.vertices = self.volumes[triangles[self.inside]]
 
-    if verbose:
-        log.critical('Interpolated values are in [%f, %f]'
-                     % (num.min(grid_values), num.max(grid_values)))
+    def interpolate(self, values, NODATA_value=-9999.0):
+        """Return the grid values (nrows*ncols array, NODATA_value outside
+        the mesh) of the vertex values
+        """
 
-    # Assign NODATA_value to all points outside bounding polygon (from interpolation mesh)
-    
-#    P = interp.mesh.get_boundary_polygon()
-#    outside_indices = outside_polygon(grid_points, P, closed=True)
+        values = num.array(values, num.float)
+
+        grid_values = num.zeros(self.nrows*self.ncols, num.float)
+        grid_values[:] = NODATA_value
+        grid_values[self.inside] = \
+            self.weights[:,0]*values[self.vertices[:,0]] + \
+            self.weights[:,1]*values[self.vertices[:,1]] + \
+            self.weights[:,2]*values[self.vertices[:,2]]
+
+        return grid_values
+
+
+def _write_prj(prjfile, zone, datum, verbose=False):
+    """Write the projection file of an asc raster
+    """
+
+    false_easting = 500000
+    false_northing = 10000000
+
+    if verbose: log.critical('Writing %s' % prjfile)
+    prjid = open(prjfile, 'w')
+    prjid.write('Projection    %s\n' %'UTM')
+    prjid.write('Zone          %d\n' %zone)
+    prjid.write('Datum         %s\n' %datum)
+    prjid.write('Zunits        NO\n')
+    prjid.write('Units         METERS\n')
+    prjid.write('Spheroid      %s\n' %datum)
+    prjid.write('Xshift        %d\n' %false_easting)
+    prjid.write('Yshift        %d\n' %false_northing)
+    prjid.write('Parameters\n')
+    prjid.close()
+
+
+def _write_asc_header(ascid, nrows, ncols, cellsize, xllcorner, yllcorner,
+                      NODATA_value):
+    """Write the header of an asc raster to the open file ascid
+    """
+
+    ascid.write('ncols         %d\n' %ncols)
+    ascid.write('nrows         %d\n' %nrows)
+    ascid.write('xllcorner     %d\n' %xllcorner)
+    ascid.write('yllcorner     %d\n' %yllcorner)
+    ascid.write('cellsize      %f\n' %cellsize)
+    ascid.write('NODATA_value  %d\n' %NODATA_value)
 
 
+def _write_raster(name_out, grid_values, nrows, ncols, cellsize,
+                  xllcorner, yllcorner, NODATA_value, zone, datum,
+                  quantity, number_of_decimal_places, verbose=False):
+    """Write grid values to name_out in asc (with a prj file) or ers
+    format
+    """
+
+    basename_out, out_ext = os.path.splitext(name_out)
+    out_ext = out_ext.lower()
 
     if out_ext == '.ers':
         # setup ERS header information
@@ -389,11 +526,11 @@ def sww2dem(name_in, name_out,
         header['projection'] = '"UTM-' + str(zone) + '"'
         header['coordinatetype'] = 'EN'
         if header['coordinatetype'] == 'LL':
-            header['longitude'] = str(newxllcorner)
-            header['latitude'] = str(newyllcorner)
+            header['longitude'] = str(xllcorner)
+            header['latitude'] = str(yllcorner)
         elif header['coordinatetype'] == 'EN':
-            header['eastings'] = str(newxllcorner)
-            header['northings'] = str(newyllcorner)
+            header['eastings'] = str(xllcorner)
+            header['northings'] = str(yllcorner)
         header['nullcellvalue'] = str(NODATA_value)
         header['xdimension'] = str(cellsize)
         header['ydimension'] = str(cellsize)
@@ -410,45 +547,16 @@ def sww2dem(name_in, name_out,
         reordered_grid_values = grid_values[::-1,:]
 
         ermapper_grids.write_ermapper_grid(name_out, reordered_grid_values, header)
-
-        fid.close()
     else:
         #Write to Ascii format
-        #Write prj file
-        prjfile = basename_out + '.prj'
-
-        if verbose: log.critical('Writing %s' % prjfile)
-        prjid = open(prjfile, 'w')
-        prjid.write('Projection    %s\n' %'UTM')
-        prjid.write('Zone          %d\n' %zone)
-        prjid.write('Datum         %s\n' %datum)
-        prjid.write('Zunits        NO\n')
-        prjid.write('Units         METERS\n')
-        prjid.write('Spheroid      %s\n' %datum)
-        prjid.write('Xshift        %d\n' %false_easting)
-        prjid.write('Yshift        %d\n' %false_northing)
-        prjid.write('Parameters\n')
-        prjid.close()
+        _write_prj(basename_out + '.prj', zone, datum, verbose)
 
         if verbose: log.critical('Writing %s' % name_out)
 
         ascid = open(name_out, 'w')
 
-        ascid.write('ncols         %d\n' %ncols)
-        ascid.write('nrows         %d\n' %nrows)
-        ascid.write('xllcorner     %d\n' %newxllcorner)
-        ascid.write('yllcorner     %d\n' %newyllcorner)
-        ascid.write('cellsize      %f\n' %cellsize)
-        ascid.write('NODATA_value  %d\n' %NODATA_value)
-
-        #Get bounding polygon from mesh
-        #P = interp.mesh.get_boundary_polygon()
-        #inside_indices = inside_polygon(grid_points, P)
-
-        # change printoptions so that a long string of zeros in not
-        # summarized as [0.0, 0.0, 0.0, ... 0.0, 0.0, 0.0]
-        #printoptions = num.get_printoptions()
-        #num.set_printoptions(threshold=sys.maxint)
+        _write_asc_header(ascid, nrows, ncols, cellsize, xllcorner, yllcorner,
+                          NODATA_value)
 
         format = '%.'+'%g' % number_of_decimal_places +'e'
         for i in range(nrows):
@@ -460,14 +568,312 @@ def sww2dem(name_in, name_out,
             slice = grid_values[base_index:base_index+ncols]
 
             num.savetxt(ascid, slice.reshape(1,ncols), format, ' ' )
-            
-        
+
         #Close
         ascid.close()
-        fid.close()
 
-        return basename_out
 
+def sww2dem_multi(name_in, basename_out,
+                  quantities=None,
+                  timesteps=None,
+                  reductions=None,
+                  cellsize=10,
+                  number_of_decimal_places=None,
+                  NODATA_value=-9999.0,
+                  easting_min=None,
+                  easting_max=None,
+                  northing_min=None,
+                  northing_max=None,
+                  verbose=False,
+                  origin=None,
+                  datum='WGS84',
+                  format='asc',
+                  mapping_cache=False):
+    """Write rasters of several quantities at several timesteps and
+    reduced over all timesteps, mapping the grid to the mesh once and
+    reading the sww file once, one timestep after the other.
+
+    quantities is a list of quantities or expressions as in sww2dem
+    (default ['elevation']), or a dictionary of expressions by name.
+
+    timesteps is a list of time indices. The raster of each quantity at
+    each of them is written to <basename_out>_<quantity>_<index>.<format>.
+
+    reductions is a list of reductions over all timesteps: 'mean' or a
+    function of the time series of a point (eg max, min or sum) as in
+    sww2dem. The raster of each quantity and reduction is written to
+    <basename_out>_<quantity>_<reduction>.<format>. If neither timesteps
+    nor reductions are given the maximum is written, as by sww2dem.
+
+    With mapping_cache the mapping of the grid to the mesh is saved next
+    to the sww file for later calls (see Raster_mapping).
+
+    See sww2dem for the other arguments. Return the names of the files
+    written.
+
+    Example, hourly depth and speed and maximal hazard of a run stored
+    every 10 minutes:
+
+        sww2dem_multi('model.sww', 'model', ['depth', 'speed'],
+                      timesteps=range(0, 289, 6), reductions=[max])
+    """
+
+    if quantities is None:
+        quantities = ['elevation']
+
+    if isinstance(quantities, dict):
+        expressions = quantities.items()
+    else:
+        expressions = [(quantity, quantity) for quantity in quantities]
+
+    if timesteps is None:
+        timesteps = []
+
+    if reductions is None:
+        reductions = []
+        if len(timesteps) == 0:
+            reductions = [max]
+
+    outputs = []
+    for name, quantity in expressions:
+        for timestep in timesteps:
+            name_out = '%s_%s_%d.%s' % (basename_out, name, timestep, format)
+            outputs.append((name_out, quantity, timestep))
+        for reduction in reductions:
+            name_out = '%s_%s_%s.%s' % (basename_out, name,
+                                        _get_reduction_name(reduction),
+                                        format)
+            outputs.append((name_out, quantity, reduction))
+
+    return _sww2dem_outputs(name_in, outputs,
+                            cellsize=cellsize,
+                            number_of_decimal_places=number_of_decimal_places,
+                            NODATA_value=NODATA_value,
+                            easting_min=easting_min,
+                            easting_max=easting_max,
+                            northing_min=northing_min,
+                            northing_max=northing_max,
+                            verbose=verbose,
+                            origin=origin,
+                            datum=datum,
+                            mapping_cache=mapping_cache)
+
+
+# Reductions over all timesteps computed timestep by timestep
+incremental_reductions = {max: 'max', min: 'min', sum: 'sum',
+                          num.max: 'max', num.min: 'min', num.sum: 'sum',
+                          num.mean: 'mean'}
+
+
+def _get_reduction_name(reduction):
+
+    if isinstance(reduction, str):
+        return reduction
+
+    return reduction.__name__
+
+
+def _sww2dem_outputs(name_in, outputs,
+                     cellsize=10,
+                     number_of_decimal_places=None,
+                     NODATA_value=-9999.0,
+                     easting_min=None,
+                     easting_max=None,
+                     northing_min=None,
+                     northing_max=None,
+                     verbose=False,
+                     origin=None,
+                     datum='WGS84',
+                     mapping_cache=False,
+                     max_series_size=10**8):
+    """Write the rasters outputs, a list of (name_out, quantity,
+    reduction) where reduction is a time index or a reduction over all
+    timesteps ('mean' or a function of the time series of a point), in
+    one pass over the sww file. Return the names of the files written.
+
+    The max, min, sum and mean (builtin or numpy) are computed timestep
+    by timestep. Other functions are applied to the time series of each
+    point at the end, which are then all held in memory: 8 bytes per
+    timestep and point for each such output. A warning is logged when
+    this exceeds max_series_size values.
+    """
+
+    from anuga.file.netcdf import NetCDFFile
+    from anuga.file.sww import set_chunk_cache
+    from anuga.abstract_2d_finite_volumes.util import \
+         apply_expression_to_dictionary
+
+    basename_in, in_ext = os.path.splitext(name_in)
+    if in_ext != '.sww':
+        raise IOError('Input format for %s must be .sww' % name_in)
+
+    for name_out, quantity, reduction in outputs:
+        if os.path.splitext(name_out)[1].lower() not in ['.asc', '.ers']:
+            raise IOError('Format for %s must be either asc or ers.'
+                          % name_out)
+        if not isinstance(reduction, (int, long)) and \
+               not callable(reduction) and \
+               reduction not in ['max', 'min', 'mean']:
+            msg = 'Reduction must be a time index, a function or mean, '
+            msg += 'I got %s' % str(reduction)
+            raise Exception(msg)
+
+    if number_of_decimal_places is None:
+        number_of_decimal_places = 3
+
+    if verbose:
+        log.critical('Reading from %s' % name_in)
+
+    fid = NetCDFFile(name_in)
+
+    x = num.array(fid.variables['x'][:], num.float)
+    y = num.array(fid.variables['y'][:], num.float)
+    volumes = num.array(fid.variables['volumes'][:], num.int)
+    number_of_timesteps = len(fid.variables['time'][:])
+
+    zone, xllcorner, yllcorner = _get_reference(fid, origin)
+
+    # Expressions of the quantities and the variables they need
+    expressions = []
+    for name_out, quantity, reduction in outputs:
+        if quantity_formula.has_key(quantity):
+            quantity = quantity_formula[quantity]
+        if quantity not in expressions:
+            expressions.append(quantity)
+
+    var_list = {}
+    dynamic = {}
+    for quantity in expressions:
+        var_list[quantity] = get_vars_in_expression(quantity)
+
+        missing_vars = [name for name in var_list[quantity]
+                        if name not in fid.variables]
+        if missing_vars:
+            msg = ("In expression '%s', variables %s are not in the SWW file '%s'"
+                   % (quantity, str(missing_vars), name_in))
+            raise Exception, msg
+
+        dynamic[quantity] = max([len(fid.variables[name].shape) == 2
+                                 for name in var_list[quantity]])
+
+    # Map the grid to the mesh once for all rasters
+    nrows, ncols, newxllcorner, newyllcorner, x, y = \
+           _get_grid(x, y, xllcorner, yllcorner, cellsize,
+                     easting_min, easting_max, northing_min, northing_max,
+                     verbose)
+
+    if mapping_cache:
+        cache_name = basename_in
+    else:
+        cache_name = None
+
+    mapping = Raster_mapping(x, y, volumes, nrows, ncols, cellsize,
+                             cache_name=cache_name, verbose=verbose)
+
+    files_out = []
+
+    def write(name_out, quantity, values):
+        _write_raster(name_out, mapping.interpolate(values, NODATA_value),
+                      nrows, ncols, cellsize, newxllcorner, newyllcorner,
+                      NODATA_value, zone, datum, quantity,
+                      number_of_decimal_places, verbose)
+        files_out.append(name_out)
+
+    # Timesteps to read, and the rasters of each
+    rasters = {}
+    reduced = []
+    static = []
+    for name_out, quantity, reduction in outputs:
+        if quantity_formula.has_key(quantity):
+            quantity = quantity_formula[quantity]
+
+        if not dynamic[quantity]:
+            static.append((name_out, quantity))
+        elif isinstance(reduction, (int, long)):
+            timestep = range(number_of_timesteps)[reduction]
+            rasters.setdefault(timestep, []).append((name_out, quantity))
+        elif callable(reduction) and reduction in incremental_reductions:
+            reduced.append((name_out, quantity,
+                            incremental_reductions[reduction]))
+        else:
+            reduced.append((name_out, quantity, reduction))
+
+    if len(reduced) > 0:
+        timesteps = range(number_of_timesteps)
+    else:
+        timesteps = sorted(rasters.keys())
+
+    # Static variables are read once
+    q_dict = {}
+    for quantity in expressions:
+        for name in var_list[quantity]:
+            var = fid.variables[name]
+            if len(var.shape) == 1:
+                q_dict[name] = var[:]
+            else:
+                set_chunk_cache(var)
+
+    for name_out, quantity in static:
+        write(name_out, quantity,
+              apply_expression_to_dictionary(quantity, q_dict))
+
+    accumulators = {}
+    for timestep in timesteps:
+        if verbose:
+            log.critical('Reading timestep %d of %d'
+                         % (timestep, number_of_timesteps))
+
+        for quantity in expressions:
+            for name in var_list[quantity]:
+                if len(fid.variables[name].shape) == 2:
+                    q_dict[name] = fid.variables[name][timestep]
+
+        values = {}
+        for quantity in expressions:
+            if dynamic[quantity]:
+                values[quantity] = \
+                    apply_expression_to_dictionary(quantity, q_dict)
+
+        for name_out, quantity in rasters.get(timestep, []):
+            write(name_out, quantity, values[quantity])
+
+        for name_out, quantity, reduction in reduced:
+            A = num.array(values[quantity], num.float)
+            if callable(reduction):
+                # Keep the time series for the reduction at the end
+                if name_out not in accumulators:
+                    size = number_of_timesteps*len(A)
+                    if size > max_series_size:
+                        msg = 'WARNING: Reduction %s of %s holds %d values ' \
+                              % (_get_reduction_name(reduction), quantity, size)
+                        msg += 'in memory, use max, min, sum or mean to '
+                        msg += 'reduce timestep by timestep'
+                        log.critical(msg)
+                    accumulators[name_out] = \
+                        num.empty((number_of_timesteps, len(A)), num.float)
+                accumulators[name_out][timestep] = A
+            elif name_out not in accumulators:
+                accumulators[name_out] = A
+            elif reduction == 'max':
+                accumulators[name_out] = num.maximum(accumulators[name_out], A)
+            elif reduction == 'min':
+                accumulators[name_out] = num.minimum(accumulators[name_out], A)
+            else:
+                # sum or mean
+                accumulators[name_out] += A
+
+    for name_out, quantity, reduction in reduced:
+        A = accumulators[name_out]
+        if callable(reduction):
+            A = num.array([reduction(A[:,k]) for k in xrange(A.shape[1])],
+                          num.float)
+        elif reduction == 'mean':
+            A = A/number_of_timesteps
+        write(name_out, quantity, A)
+
+    fid.close()
+
+    return files_out
 
 
 def sww2dem_batch(basename_in, extra_name_out=None,
@@ -516,35 +922,45 @@ def sww2dem_batch(basename_in, extra_name_out=None,
     if dir == "":
         dir = "." # Unix compatibility
 
+    if reduction is None:
+        reduction = max
+
     files_out = []
     for sww_file in iterate_over:
+        swwin = dir+os.sep+sww_file+'.sww'
+
+        # All quantities of a file are gridded in one pass over it
+        outputs = []
         for quantity in quantities:
             if extra_name_out is None:
                 basename_out = sww_file + '_' + quantity
             else:
                 basename_out = sww_file + '_' + quantity + '_' + extra_name_out
 
-            swwin = dir+os.sep+sww_file+'.sww'
             demout = dir+os.sep+basename_out+'.'+format
 
             if verbose:
                 log.critical('sww2dem: %s => %s' % (swwin, demout))
 
-            file_out = sww2dem(swwin,
-                               demout,
-                               quantity,
-                               reduction,
-                               cellsize,
-                               number_of_decimal_places,
-                               NODATA_value,
-                               easting_min,
-                               easting_max,
-                               northing_min,
-                               northing_max,
-                               verbose,
-                               origin,
-                               datum)
-                               
-            files_out.append(file_out)
-    return files_out
+            outputs.append((demout, quantity, reduction))
+
+        _sww2dem_outputs(swwin,
+                         outputs,
+                         cellsize=cellsize,
+                         number_of_decimal_places=number_of_decimal_places,
+                         NODATA_value=NODATA_value,
+                         easting_min=easting_min,
+                         easting_max=easting_max,
+                         northing_min=northing_min,
+                         northing_max=northing_max,
+                         verbose=verbose,
+                         origin=origin,
+                         datum=datum)
+
+        for demout, quantity, _ in outputs:
+            if format == 'asc':
+                files_out.append(os.path.splitext(demout)[0])
+            else:
+                files_out.append(None)
 
+    return files_out
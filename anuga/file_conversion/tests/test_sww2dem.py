@@ -20,7 +20,8 @@ from anuga.abstract_2d_finite_volumes.generic_boundary_conditions\
             Time_boundary, File_boundary, AWI_boundary
 
 # local modules
-from anuga.file_conversion.sww2dem import sww2dem, sww2dem_batch
+from anuga.file_conversion.sww2dem import sww2dem, sww2dem_batch, \
+     sww2dem_multi, Raster_mapping
 
 from pprint import pprint
 
@@ -2155,6 +2156,152 @@ class Test_Sww2Dem(unittest.TestCase):
         os.remove(ascfile)
         os.remove(swwfile)
 
+    def test_raster_mapping(self):
+        """Test that the precomputed mapping grids as calc_grid_values and
+        is cached next to the sww file
+        """
+
+        from anuga.file_conversion.calc_grid_values_ext import calc_grid_values
+        from anuga import rectangular_cross_domain
+
+        domain = rectangular_cross_domain(5, 4, len1=5.0, len2=4.0)
+        x = domain.get_nodes()[:,0] + 0.3
+        y = domain.get_nodes()[:,1] + 0.2
+        volumes = domain.get_triangles()
+        values = x**2 - 3*y
+
+        nrows, ncols, cellsize = 11, 15, 0.37
+        grid_values = num.zeros(nrows*ncols, num.float)
+        norms = num.zeros(6*len(volumes), num.float)
+        calc_grid_values(nrows, ncols, cellsize, -9999.0, x, y, norms,
+                         volumes, values, grid_values)
+
+        mapping = Raster_mapping(x, y, volumes, nrows, ncols, cellsize,
+                                 cache_name='test_raster_mapping')
+        assert os.path.exists(mapping.filename)
+        assert num.sum(grid_values == -9999.0) > 0
+        assert num.allclose(mapping.interpolate(values, -9999.0), grid_values)
+
+        # A second mapping of the same mesh and grid is read from the file
+        mtime = os.path.getmtime(mapping.filename)
+        cached = Raster_mapping(x, y, volumes, nrows, ncols, cellsize,
+                                cache_name='test_raster_mapping')
+        assert cached.filename == mapping.filename
+        assert os.path.getmtime(cached.filename) == mtime
+        assert num.all(cached.interpolate(values) == mapping.interpolate(values))
+
+        # Another grid is mapped again
+        other = Raster_mapping(x, y, volumes, nrows, ncols, 0.5,
+                               cache_name='test_raster_mapping')
+        assert other.filename != mapping.filename
+
+        os.remove(mapping.filename)
+        os.remove(other.filename)
+
+    def test_sww2dem_multi(self):
+        """Test that the rasters of several quantities and timesteps written
+        in one pass are those of sww2dem
+        """
+
+        from anuga import rectangular_cross_domain
+
+        domain = rectangular_cross_domain(6, 4, len1=6.0, len2=4.0)
+        domain.set_name('test_sww2dem_multi')
+        domain.set_quantity('elevation', lambda x, y: -x/6.0)
+        domain.set_quantity('stage', lambda x, y: num.where(x < 2.0, 0.5, -x/6.0))
+        B = Reflective_boundary(domain)
+        domain.set_boundary({'left': B, 'right': B, 'top': B, 'bottom': B})
+        for t in domain.evolve(yieldstep=0.1, finaltime=0.5):
+            pass
+
+        # Applied to the time series of each point at the end, instead of
+        # timestep by timestep as sum
+        def series_sum(series):
+            return sum(series)
+
+        files = sww2dem_multi('test_sww2dem_multi.sww', 'test_multi',
+                              quantities={'depth': 'stage-elevation',
+                                          'elevation': 'elevation'},
+                              timesteps=[0, 3, -1],
+                              reductions=[max, min, sum, 'mean', series_sum],
+                              cellsize=0.3, mapping_cache=True)
+
+        assert len(files) == 16
+        for label, quantity in [('depth', 'stage-elevation'),
+                                ('elevation', 'elevation')]:
+            for reduction, suffix in [(0, '0'), (3, '3'), (-1, '-1'),
+                                      (max, 'max'), (min, 'min'),
+                                      (sum, 'sum')]:
+                name_out = 'test_multi_%s_%s.asc' % (label, suffix)
+                assert name_out in files
+                sww2dem('test_sww2dem_multi.sww', 'test_single.asc',
+                        quantity=quantity, reduction=reduction, cellsize=0.3)
+                assert open(name_out).read() == \
+                       open('test_single.asc').read(), name_out
+
+            name_out = 'test_multi_%s_series_sum.asc' % label
+            assert open(name_out).read() == \
+                   open('test_multi_%s_sum.asc' % label).read(), name_out
+
+        # The mean over all timesteps
+        fid = NetCDFFile('test_sww2dem_multi.sww')
+        depth = fid.variables['stage'][:] - fid.variables['elevation'][:]
+        fid.close()
+        grid = num.loadtxt('test_multi_depth_mean.asc', skiprows=6)
+        grid_max = num.loadtxt('test_multi_depth_max.asc', skiprows=6)
+        assert grid.shape == grid_max.shape
+        assert num.all(grid <= grid_max + 1.0e-3)
+        assert num.max(grid) <= num.max(depth) + 1.0e-3
+        assert num.min(grid[grid > -9999]) >= num.min(depth) - 1.0e-3
+
+        # The mapping is cached next to the sww file
+        assert len([f for f in os.listdir('.')
+                    if f.startswith('test_sww2dem_multi_raster_')]) == 1
+
+        for f in os.listdir('.'):
+            if f.startswith('test_multi') or f.startswith('test_single') or \
+                   f.startswith('test_sww2dem_multi'):
+                os.remove(f)
+
+    def test_sww2dem_tiled(self):
+        """Test that the rasters computed tile by tile, by one or several
+        processes, are those computed in one go
+        """
+
+        from anuga import rectangular_cross_domain
+
+        domain = rectangular_cross_domain(9, 7, len1=9.0, len2=7.0)
+        domain.set_name('test_sww2dem_tiled')
+        domain.set_quantity('elevation', lambda x, y: -x/6.0 + y/10.0)
+        domain.set_quantity('stage', lambda x, y: num.where(x < 2.0, 0.5, -x/6.0))
+        B = Reflective_boundary(domain)
+        domain.set_boundary({'left': B, 'right': B, 'top': B, 'bottom': B})
+        for t in domain.evolve(yieldstep=0.1, finaltime=0.3):
+            pass
+
+        sww2dem('test_sww2dem_tiled.sww', 'test_whole.asc',
+                quantity='stage', cellsize=0.23,
+                easting_min=-1.0, northing_max=5.5)
+
+        for tile_size, processes in [(1000, 1), (7, 1), (5, 3)]:
+            sww2dem('test_sww2dem_tiled.sww', 'test_tiled.asc',
+                    quantity='stage', cellsize=0.23,
+                    easting_min=-1.0, northing_max=5.5,
+                    tile_size=tile_size, processes=processes)
+
+            assert open('test_tiled.asc').read() == \
+                   open('test_whole.asc').read()
+            assert open('test_tiled.prj').read() == \
+                   open('test_whole.prj').read()
+
+        self.assertRaises(IOError, sww2dem, 'test_sww2dem_tiled.sww',
+                          'test_tiled.ers', tile_size=10)
+
+        for f in os.listdir('.'):
+            if f.startswith('test_whole') or f.startswith('test_tiled') or \
+                   f.startswith('test_sww2dem_tiled'):
+                os.remove(f)
+
     def test_export_grid_bad(self):
         """Test that Bad input throws exception error
         """
@@ -0,0 +1,251 @@
+"""
+    Tiled rasterisation of values at the vertices of a mesh.
+
+The grid is split into tiles of at most tile_size x tile_size points. Each
+tile is mapped to the mesh using only the triangles whose extent overlaps
+it, found from an index of the triangles by tile built once. Tiles are
+gridded by a pool of processes and written as they are computed, a band of
+tiles at a time for asc files and a tile at a time for GeoTIFF files, so
+that the memory needed scales with the size of the tiles rather than with
+the size of the grid.
+"""
+
+import numpy as num
+
+import anuga.utilities.log as log
+
+
+# Default number of grid rows and columns of a tile
+DEFAULT_TILE_SIZE = 1024
+
+# Mesh and values gridded by a worker process, see _init_worker
+_mesh = {}
+
+
+def get_tiles(nrows, ncols, tile_size=DEFAULT_TILE_SIZE):
+    """Return the tiles (row0, col0, nrow, ncol) of a grid of nrows x ncols
+    points, band by band from the top band of the grid and from left to
+    right within a band
+    """
+
+    tiles = []
+    for row0 in reversed(range(0, nrows, tile_size)):
+        nrow = min(tile_size, nrows - row0)
+        for col0 in range(0, ncols, tile_size):
+            tiles.append((row0, col0, nrow, min(tile_size, ncols - col0)))
+
+    return tiles
+
+
+def get_tile_index(x, y, volumes, nrows, ncols, cellsize,
+                   tile_size=DEFAULT_TILE_SIZE):
+    """Return the triangles overlapping each tile of a grid of nrows x ncols
+    points cellsize apart, the first one at the origin of x, y.
+
+    The triangles of the tile of grid point (tile_size*i, tile_size*j) are
+    ids[starts[k]:starts[k+1]], where k = i*ntile_cols + j, in increasing
+    order so that gridding them gives the values of the whole grid.
+    """
+
+    ntile_rows = (nrows + tile_size - 1)/tile_size
+    ntile_cols = (ncols + tile_size - 1)/tile_size
+
+    X = x[volumes]
+    Y = y[volumes]
+
+    # First and last grid column and row of each triangle, truncated as
+    # by calc_grid_weights
+    col_min = num.maximum(num.min(X, axis=1)/cellsize, 0).astype(num.int)
+    col_max = (num.abs(num.max(X, axis=1))/cellsize).astype(num.int)
+    row_min = num.maximum(num.min(Y, axis=1)/cellsize, 0).astype(num.int)
+    row_max = (num.abs(num.max(Y, axis=1))/cellsize).astype(num.int)
+
+    ids = num.nonzero((col_min <= ncols - 1) & (row_min <= nrows - 1) &
+                      (col_min <= col_max) & (row_min <= row_max))[0]
+
+    c0 = col_min[ids]/tile_size
+    c1 = num.minimum(col_max[ids]/tile_size, ntile_cols - 1)
+    r0 = row_min[ids]/tile_size
+    r1 = num.minimum(row_max[ids]/tile_size, ntile_rows - 1)
+
+    # One entry for each tile overlapped by each triangle
+    width = c1 - c0 + 1
+    counts = (r1 - r0 + 1)*width
+    ids = num.repeat(ids, counts)
+    offsets = num.arange(len(ids)) - num.repeat(num.cumsum(counts) - counts,
+                                                counts)
+    width = num.repeat(width, counts)
+    keys = (num.repeat(r0, counts) + offsets/width)*ntile_cols + \
+           num.repeat(c0, counts) + offsets % width
+
+    # A stable sort keeps the triangles of each tile in increasing order
+    order = num.argsort(keys, kind='mergesort')
+    starts = num.searchsorted(keys[order],
+                              num.arange(ntile_rows*ntile_cols + 1))
+
+    return ids[order], starts
+
+
+def _init_worker(x, y, volumes, values, ids, starts, ncols, cellsize,
+                 tile_size, NODATA_value):
+
+    _mesh.clear()
+    _mesh.update({'x': x, 'y': y, 'volumes': volumes, 'values': values,
+                  'ids': ids, 'starts': starts, 'cellsize': cellsize,
+                  'ntile_cols': (ncols + tile_size - 1)/tile_size,
+                  'tile_size': tile_size, 'NODATA_value': NODATA_value})
+
+
+def grid_tile(tile):
+    """Return the tile (row0, col0, nrow, ncol) and its nrow x ncol grid
+    values, from the mesh and values given to _init_worker
+    """
+
+    from anuga.file_conversion.calc_grid_values_ext import calc_grid_weights
+
+    row0, col0, nrow, ncol = tile
+
+    tile_size = _mesh['tile_size']
+    starts = _mesh['starts']
+    k = (row0/tile_size)*_mesh['ntile_cols'] + col0/tile_size
+    volumes = _mesh['volumes'][_mesh['ids'][starts[k]:starts[k+1]]]
+
+    norms = num.zeros(6*len(volumes), num.float)
+    triangles = num.zeros(nrow*ncol, num.int)
+    weights = num.zeros((nrow*ncol, 3), num.float)
+
+    calc_grid_weights(nrow, ncol, _mesh['cellsize'], _mesh['x'], _mesh['y'],
+                      norms, volumes, triangles, weights, row0, col0)
+
+    values = _mesh['values']
+    inside = num.nonzero(triangles >= 0)[0]
+    vertices = volumes[triangles[inside]]
+    weights = weights[inside]
+
+    grid_values = num.zeros(nrow*ncol, num.float)
+    grid_values[:] = _mesh['NODATA_value']
+    grid_values[inside] = weights[:,0]*values[vertices[:,0]] + \
+                          weights[:,1]*values[vertices[:,1]] + \
+                          weights[:,2]*values[vertices[:,2]]
+
+    return tile, grid_values.reshape(nrow, ncol)
+
+
+def write_raster_tiled(name_out, x, y, volumes, values,
+                       nrows, ncols, cellsize,
+                       xllcorner, yllcorner,
+                       NODATA_value=-9999.0,
+                       zone=None,
+                       datum='WGS84',
+                       number_of_decimal_places=3,
+                       tile_size=DEFAULT_TILE_SIZE,
+                       processes=1,
+                       verbose=False):
+    """Grid the values at the vertices x, y of the triangles volumes on a
+    grid of nrows x ncols points cellsize apart, tile by tile, and write
+    them to name_out in asc (with a prj file) or GeoTIFF (.tif) format.
+
+    x and y are relative to the lower left grid point, at xllcorner,
+    yllcorner. The grid values are those written by sww2dem.
+
+    Tiles of tile_size x tile_size points are gridded by a pool of
+    processes processes (by this process if processes is 1, by as many
+    processes as cpus if None). GeoTIFF output needs the gdal python
+    interface.
+    """
+
+    import os
+    import itertools
+
+    from anuga.file_conversion.sww2dem import _write_prj, _write_asc_header
+
+    basename_out, out_ext = os.path.splitext(name_out)
+    out_ext = out_ext.lower()
+
+    if out_ext not in ['.asc', '.tif']:
+        raise IOError('Format for %s must be either asc or tif.' % name_out)
+
+    x = num.array(x, num.float)
+    y = num.array(y, num.float)
+    volumes = num.array(volumes, num.int)
+    values = num.array(values, num.float)
+
+    if verbose: log.critical('Indexing triangles by tile')
+    ids, starts = get_tile_index(x, y, volumes, nrows, ncols, cellsize,
+                                 tile_size)
+
+    tiles = get_tiles(nrows, ncols, tile_size)
+    initargs = (x, y, volumes, values, ids, starts, ncols, cellsize,
+                tile_size, NODATA_value)
+
+    if processes == 1:
+        pool = None
+        _init_worker(*initargs)
+        results = itertools.imap(grid_tile, tiles)
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes, _init_worker, initargs)
+        results = pool.imap(grid_tile, tiles)
+
+    if verbose:
+        log.critical('Writing %s in %d tiles' % (name_out, len(tiles)))
+
+    try:
+        if out_ext == '.asc':
+            _write_prj(basename_out + '.prj', zone, datum, verbose)
+
+            ascid = open(name_out, 'w')
+            _write_asc_header(ascid, nrows, ncols, cellsize,
+                              xllcorner, yllcorner, NODATA_value)
+
+            format = '%.'+'%g' % number_of_decimal_places +'e'
+
+            # Tiles come band by band from the top of the grid
+            band = None
+            for (row0, col0, nrow, ncol), grid_values in results:
+                if col0 == 0:
+                    band = num.zeros((nrow, ncols), num.float)
+                band[:, col0:col0+ncol] = grid_values
+
+                if col0 + ncol == ncols:
+                    for i in reversed(range(nrow)):
+                        num.savetxt(ascid, band[i].reshape(1, ncols),
+                                    format, ' ')
+
+            ascid.close()
+        else:
+            try:
+                import osgeo.gdal as gdal
+                import osgeo.osr as osr
+            except ImportError, e:
+                msg = 'Failed to import gdal/ogr modules --'\
+                + 'perhaps gdal python interface is not installed.'
+                raise ImportError, msg
+
+            driver = gdal.GetDriverByName('GTiff')
+            dataset = driver.Create(name_out, ncols, nrows, 1,
+                                    gdal.GDT_Float64,
+                                    ['TILED=YES', 'BIGTIFF=IF_SAFER'])
+            dataset.SetGeoTransform([xllcorner, cellsize, 0,
+                                     yllcorner + nrows*cellsize, 0,
+                                     -cellsize])
+            if zone is not None:
+                srs = osr.SpatialReference()
+                srs.SetWellKnownGeogCS(datum)
+                srs.SetUTM(zone, False)
+                dataset.SetProjection(srs.ExportToWkt())
+
+            band = dataset.GetRasterBand(1)
+            band.SetNoDataValue(NODATA_value)
+
+            # GeoTIFF rows go from the top of the grid
+            for (row0, col0, nrow, ncol), grid_values in results:
+                band.WriteArray(grid_values[::-1], col0, nrows - row0 - nrow)
+
+            band.FlushCache()
+            dataset = None
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _mesh.clear()
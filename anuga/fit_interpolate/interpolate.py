@@ -672,6 +672,10 @@ class Interpolation_function:
         triangles:            nx3 array of indices into vertex_coordinates (int)
         interpolation_points: Nx2 array of coordinates to be interpolated to
         verbose:              Level of reporting
+        vertex_ids:           Indices of the vertices whose values are given
+                              in quantities, if these only hold the columns
+                              of the vertices needed to interpolate at
+                              interpolation_points
 
     The quantities returned by the callable object are specified by
     the list quantities which must contain the names of the
@@ -702,7 +706,8 @@ class Interpolation_function:
                  time_thinning=1,
                  verbose=False,
                  gauge_neighbour_id=None,
-                 output_centroids=False):
+                 output_centroids=False,
+                 vertex_ids=None):
         """Initialise object and build spatial interpolation if required
 
         Time_thinning_number controls how many timesteps to use. Only timesteps
@@ -766,7 +771,10 @@ class Interpolation_function:
         self.quantities_range = {}
         for name in quantity_names:
             q = quantities[name][:].flatten()
-            self.quantities_range[name] = [min(q), max(q)]
+            if len(q) > 0:
+                self.quantities_range[name] = [min(q), max(q)]
+            else:
+                self.quantities_range[name] = [num.nan, num.nan]
 
         self.quantity_names = quantity_names
         self.vertex_coordinates = vertex_coordinates
@@ -870,6 +878,11 @@ class Interpolation_function:
             for name in quantity_names:
                 self.precomputed_values[name] = num.zeros((p, m), num.float)
 
+            if vertex_ids is not None:
+                # Buffer for the values of all vertices at one timestep,
+                # only those in vertex_ids are used by the interpolation
+                Q_vertices = num.zeros(len(vertex_coordinates), num.float)
+
             if verbose is True:
                 log.critical('Build interpolator')
 
@@ -916,6 +929,10 @@ class Interpolation_function:
                     else:
                         Q = quantities[name][:]   # No time dependency
 
+                    if vertex_ids is not None:
+                        Q_vertices[vertex_ids] = Q
+                        Q = Q_vertices
+
                     #if verbose and i%((p+10)/10) == 0:
                     if verbose:
                         log.critical('    quantity %s, size=%d' % (name, len(Q)))
@@ -955,7 +972,9 @@ class Interpolation_function:
 
         Inputs:
           t:        time - Model time. Must lie within existing timesteps
-          point_id: index of one of the preprocessed points.
+          point_id: index of one of the preprocessed points, or an array
+                    of indices in which case one row of values per
+                    quantity is returned.
 
           If spatial info is present and all of point_id
           are None an exception is raised
@@ -1004,7 +1023,10 @@ class Interpolation_function:
                          (self.time[self.index+1] - self.time[self.index]))
 
         # Compute interpolated values
-        q = num.zeros(len(self.quantity_names), num.float)
+        if self.spatial is True and isinstance(point_id, num.ndarray):
+            q = num.zeros((len(self.quantity_names), len(point_id)), num.float)
+        else:
+            q = num.zeros(len(self.quantity_names), num.float)
         for i, name in enumerate(self.quantity_names):
             Q = self.precomputed_values[name]
 
@@ -1025,7 +1047,9 @@ class Interpolation_function:
                         Q1 = Q[self.index+1, point_id]
 
             # Linear temporal interpolation
-            if ratio > 0:
+            if ratio > 0 and len(q.shape) > 1:
+                q[i] = Q0 + ratio*(Q1 - Q0)
+            elif ratio > 0:
                 if Q0 == NAN and Q1 == NAN:
                     q[i] = Q0
                 else:
@@ -70,6 +70,49 @@ class Operator:
         """
         return False
 
+    def get_changed_indices(self):
+        """Return the indices of the triangles whose centroid values the
+        operator may change, or None if it may change any triangle. Used to
+        keep the active cells of the domain up to date (see
+        Domain.set_use_active_cells).
+
+        By default an operator acting on a Region changes its triangles.
+        """
+        return getattr(self, 'indices', None)
+
+    def rebalance_safe(self):
+        """By default an operator can not be moved to a new partition of a
+        parallel domain during a run (see Parallel_domain.set_rebalancing).
+
+        An operator which can be moved has its per triangle data in the
+        arrays of get_state with one value per triangle, or in the indices
+        of its Region, and updates what is derived from them in
+        update_partition.
+        """
+        return False
+
+    def update_partition(self):
+        """Update the operator after its domain has been repartitioned,
+        once the arrays of get_state and the indices of its region have
+        been moved to the new triangles. By default nothing is derived
+        from them.
+        """
+        pass
+
+    def get_state(self):
+        """Return a dictionary of the numbers and arrays which change
+        during a run, stored in binary checkpoints. By default an
+        operator has no such state.
+        """
+        return {}
+
+    def set_state(self, state):
+        """Restore the state returned by get_state from a checkpoint
+        """
+
+        for name in state:
+            setattr(self, name, state[name])
+
     def statistics(self):
 
         message = 'You need to implement operator statistics for your operator'
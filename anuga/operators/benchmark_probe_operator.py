@@ -0,0 +1,82 @@
+"""Measure the overhead of a probe operator on the evolve loop.
+
+   Times the steps of a dam break on a rectangular cross mesh with and
+   without a Probe_operator sampling 10000 probes at every step, and the
+   time taken to locate the probes.
+
+   Usage:
+
+       python benchmark_probe_operator.py
+
+   The table reports the mean time per step with and without the probes
+   and the overhead per step of sampling them.
+"""
+
+import os
+import time
+
+import numpy as num
+
+from anuga import rectangular_cross_domain, Reflective_boundary
+from anuga.operators.probe_operator import Probe_operator
+
+
+def setup_domain(m, n):
+
+    domain = rectangular_cross_domain(m, n, len1=float(m), len2=float(n))
+    domain.set_name('benchmark_probe_operator')
+    domain.set_store(False)
+
+    domain.set_quantity('elevation', lambda x, y: -x/float(m))
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage',
+                        lambda x, y: num.where(x < m/3.0, 0.5, -x/float(m)))
+
+    Br = Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+def time_steps(domain, duration):
+    """Return the mean time of the steps of evolving domain for duration
+    seconds of model time
+    """
+
+    steps = 0
+    t0 = time.time()
+    for t in domain.evolve(yieldstep=duration/10.0, duration=duration):
+        steps += domain.number_of_steps
+
+    return (time.time() - t0)/steps
+
+
+def benchmark(sizes=((100, 50), (200, 100)), number_of_probes=10000,
+              duration=1.0):
+
+    print '%10s %8s %12s %14s %14s %14s' % ('triangles', 'probes',
+                                            'locate [s]', 'step [s]',
+                                            'probes [s]', 'overhead [s]')
+
+    for m, n in sizes:
+        domain = setup_domain(m, n)
+        base_time = time_steps(domain, duration)
+
+        domain = setup_domain(m, n)
+        points = num.random.uniform(size=(number_of_probes, 2))*[m, n]
+
+        t0 = time.time()
+        probe = Probe_operator(domain, points, buffer_size=100)
+        locate_time = time.time() - t0
+
+        probe_time = time_steps(domain, duration)
+
+        print '%10d %8d %12.4f %14.6f %14.6f %14.6f' \
+              % (len(domain), len(probe.probe_ids), locate_time, base_time,
+                 probe_time, probe_time - base_time)
+
+        os.remove(probe.filename)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -67,6 +67,20 @@ class boundary_flux_integral_operator(Operator):
         """
         return True
 
+    def get_changed_indices(self):
+        """The operator does not change the quantities
+        """
+        return []
+
+    def rebalance_safe(self):
+        """The integral does not depend on the triangles of the domain
+        """
+        return True
+
+    def get_state(self):
+
+        return {'boundary_flux_integral': self.boundary_flux_integral}
+
     def statistics(self):
 
         message = self.label + ': Boundary_flux_integral operator'
@@ -112,6 +112,24 @@ class collect_max_quantities_operator(Operator):
         """
         return True
 
+    def get_changed_indices(self):
+        """The operator does not change the quantities
+        """
+        return []
+
+    def rebalance_safe(self):
+        """The values collected on each triangle move with it
+        """
+        return True
+
+    def get_state(self):
+
+        return {'max_stage': self.max_stage,
+                'max_depth': self.max_depth,
+                'max_speed': self.max_speed,
+                'max_speedDepth': self.max_speedDepth,
+                'counter': self.counter}
+
     def statistics(self):
 
         message = self.label + ': Collect_max_quantity operator'
@@ -58,6 +58,24 @@ class Collect_max_stage_operator(Operator):
         """
         return True
 
+    def get_changed_indices(self):
+        """The operator does not change the quantities
+        """
+        return []
+
+    def rebalance_safe(self):
+        """The values collected on each triangle move with it
+        """
+        return True
+
+    def get_state(self):
+
+        return {'max_stage': self.max_stage.centroid_values}
+
+    def set_state(self, state):
+
+        self.max_stage.centroid_values[:] = state['max_stage']
+
     def statistics(self):
 
         message = self.label + ': Collect_max_stage operator'
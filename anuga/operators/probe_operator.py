@@ -0,0 +1,270 @@
+"""
+Sample the flow at a set of points during a run
+
+
+"""
+
+import numpy as num
+
+from anuga.operators.base_operator import Operator
+from anuga.config import netcdf_mode_w, netcdf_mode_a, netcdf_float, \
+     netcdf_float32, netcdf_int
+from anuga.file.netcdf import NetCDFFile
+from anuga.utilities.file_utils import create_filename
+
+
+class Probe_operator(Operator):
+    """
+    Operator to record the stage, depth, momentum and velocity at a set
+    of points (probes) every update_frequency timesteps, or every
+    update_interval seconds of model time if given.
+
+    The probes are located once: the triangle containing each point and
+    its barycentric weights. A sample is the linear reconstruction within
+    the triangle, shifted to the current centroid value. In parallel each
+    probe is recorded by the processor owning (full, not ghost) the
+    triangle containing it; probes outside the mesh are not recorded.
+
+    Samples are buffered in memory and appended buffer_size samples at a
+    time to the NetCDF file <name>_probes.nc (<name> is the domain name)
+    in the data directory, with variables time, x, y, probe_id (index into
+    points) and one variable of samples x probes for each quantity. The
+    remaining samples are written when the final time is reached or when
+    flush is called.
+
+    Velocities are zero where the depth is less than velocity_zero_height
+    (defaults to minimum_allowed_height).
+    """
+
+    quantity_names = ['stage', 'depth', 'xmomentum', 'ymomentum',
+                      'xvelocity', 'yvelocity']
+
+    def __init__(self,
+                 domain,
+                 points,
+                 update_frequency=1,
+                 update_interval=None,
+                 buffer_size=1000,
+                 filename=None,
+                 velocity_zero_height=None,
+                 description = None,
+                 label = None,
+                 logging = False,
+                 verbose = False):
+
+
+        Operator.__init__(self, domain, description, label, logging, verbose)
+
+        #------------------------------------------
+        # Locate the probes (absolute coordinates)
+        #------------------------------------------
+        points = num.array(points, num.float).reshape(-1, 2)
+
+        from anuga.pmesh.mesh_quadtree import MeshQuadtree
+        root = MeshQuadtree(domain.mesh)
+
+        full = domain.tri_full_flag
+        probe_ids = []
+        triangles = []
+        weights = []
+        for i, point in enumerate(points):
+            found, sigma0, sigma1, sigma2, k = root.search_fast(point)
+            if found and full[k] == 1:
+                probe_ids.append(i)
+                triangles.append(k)
+                weights.append([sigma0, sigma1, sigma2])
+
+        self.probe_ids = num.array(probe_ids, num.int)
+        self.points = points[self.probe_ids]
+        self.triangles = num.array(triangles, num.int)
+        self.weights = num.array(weights, num.float).reshape(-1, 3)
+
+        #------------------------------------------
+        # Aliases for quantities
+        #------------------------------------------
+        self.stage = domain.quantities['stage']
+        self.elev  = domain.quantities['elevation']
+        self.xmom  = domain.quantities['xmomentum']
+        self.ymom  = domain.quantities['ymomentum']
+
+        if velocity_zero_height is not None:
+            self.velocity_zero_height = velocity_zero_height
+        else:
+            self.velocity_zero_height = domain.minimum_allowed_height
+
+        #------------------------------------------
+        # Sampling schedule
+        #------------------------------------------
+        assert update_frequency > 0, 'Update frequency must be >=1'
+        self.update_frequency = update_frequency
+        self.update_interval = update_interval
+        self.counter = 0
+        self.next_sample_time = None
+
+        #------------------------------------------
+        # Buffers, flushed to file when full
+        #------------------------------------------
+        assert buffer_size > 0, 'Buffer size must be >=1'
+        self.buffer_size = buffer_size
+        self.buffer_time = num.zeros(buffer_size, num.float)
+        self.buffers = {}
+        for name in self.quantity_names:
+            self.buffers[name] = num.zeros((buffer_size, len(self.probe_ids)),
+                                           num.float)
+        self.buffer_count = 0
+        self.number_of_samples = 0
+
+        if filename is None:
+            filename = create_filename(domain.get_datadir(),
+                                       domain.get_name() + '_probes', 'nc')
+        self.filename = filename
+
+        self._create_file()
+
+
+    def _create_file(self):
+
+        domain = self.domain
+
+        fid = NetCDFFile(self.filename, netcdf_mode_w)
+        fid.institution = 'Geoscience Australia'
+        fid.description = 'Probe time series of %s' % domain.get_name()
+        fid.starttime = domain.get_starttime()
+
+        fid.createDimension('number_of_probes', len(self.probe_ids))
+        fid.createDimension('number_of_samples', None)
+
+        fid.createVariable('x', netcdf_float, ('number_of_probes',))
+        fid.createVariable('y', netcdf_float, ('number_of_probes',))
+        fid.createVariable('probe_id', netcdf_int, ('number_of_probes',))
+        fid.createVariable('time', netcdf_float, ('number_of_samples',))
+        for name in self.quantity_names:
+            fid.createVariable(name, netcdf_float32,
+                               ('number_of_samples', 'number_of_probes'))
+
+        fid.variables['x'][:] = self.points[:,0]
+        fid.variables['y'][:] = self.points[:,1]
+        fid.variables['probe_id'][:] = self.probe_ids
+
+        fid.close()
+
+
+    def __call__(self):
+        """
+        Sample the probes at every 'update_frequency' timesteps or every
+        'update_interval' seconds
+        """
+
+        # The time at the end of the current timestep. The rk2 and rk3
+        # steps have already updated the time, the euler step leaves it
+        # to evolve after the fractional steps
+        time = self.domain.get_time()
+        if self.domain.get_timestepping_method() == 'euler':
+            time += self.domain.get_timestep()
+
+        if self.update_interval is None:
+            self.counter += 1
+            sample = self.counter == self.update_frequency
+            if sample:
+                self.counter = 0
+        else:
+            if self.next_sample_time is None:
+                self.next_sample_time = time
+            sample = time >= self.next_sample_time
+            if sample:
+                n = num.floor((time - self.next_sample_time)/self.update_interval)
+                self.next_sample_time += (n + 1)*self.update_interval
+
+        if sample:
+            self.sample(time)
+
+        finaltime = self.domain.finaltime
+        if finaltime is not None and time >= finaltime - 1.0e-10:
+            self.flush()
+
+
+    def get_values(self, quantity):
+        """
+        Return the values of quantity at the probes
+        """
+
+        tris = self.triangles
+        V = quantity.vertex_values[tris]
+
+        return quantity.centroid_values[tris] + \
+               num.sum(self.weights*V, axis=1) - num.sum(V, axis=1)/3.0
+
+
+    def sample(self, time):
+        """
+        Record the quantities at the probes at time in the buffers
+        """
+
+        stage = self.get_values(self.stage)
+        elevation = self.get_values(self.elev)
+        xmomentum = self.get_values(self.xmom)
+        ymomentum = self.get_values(self.ymom)
+
+        depth = num.maximum(stage - elevation, 0.0)
+        wet = depth > self.velocity_zero_height
+        inverse_depth = num.where(wet, 1.0/num.where(wet, depth, 1.0), 0.0)
+
+        i = self.buffer_count
+        self.buffer_time[i] = time
+        self.buffers['stage'][i] = stage
+        self.buffers['depth'][i] = depth
+        self.buffers['xmomentum'][i] = xmomentum
+        self.buffers['ymomentum'][i] = ymomentum
+        self.buffers['xvelocity'][i] = xmomentum*inverse_depth
+        self.buffers['yvelocity'][i] = ymomentum*inverse_depth
+
+        self.buffer_count += 1
+        if self.buffer_count == self.buffer_size:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Append the buffered samples to the file
+        """
+
+        n = self.buffer_count
+        if n == 0:
+            return
+
+        start = self.number_of_samples
+
+        fid = NetCDFFile(self.filename, netcdf_mode_a)
+        fid.variables['time'][start:start+n] = self.buffer_time[:n]
+        for name in self.quantity_names:
+            fid.variables[name][start:start+n] = self.buffers[name][:n]
+        fid.close()
+
+        self.number_of_samples += n
+        self.buffer_count = 0
+
+
+    def parallel_safe(self):
+        """Each probe is recorded by the processor owning it, from local
+        values only, so the operator is parallel safe.
+        """
+        return True
+
+    def get_changed_indices(self):
+        """The operator does not change the quantities
+        """
+        return []
+
+    def statistics(self):
+
+        message = self.label + ': Probe operator with %d probes' \
+                  % len(self.probe_ids)
+        return message
+
+
+    def timestepping_statistics(self):
+        from anuga import indent
+
+        message  = indent + self.label + ': Recorded %d samples' \
+                   % (self.number_of_samples + self.buffer_count)
+        return message
@@ -336,6 +336,17 @@ class Rate_operator(Operator,Region):
         """
         return True
 
+    def rebalance_safe(self):
+        """The region of the operator can be moved to a new partition,
+        unless the rate is a quantity (not moved with the domain)
+        """
+        return self.rate_type != 'quantity'
+
+    def update_partition(self):
+
+        self.set_areas()
+        self.set_full_indices()
+
     def statistics(self):
 
         message = 'You need to implement operator statistics for your operator'
@@ -0,0 +1,162 @@
+"""  Test probe operator.
+"""
+
+import unittest, os
+import anuga
+from anuga import Reflective_boundary
+from anuga import rectangular_cross_domain
+from anuga.file.netcdf import NetCDFFile
+
+from anuga.operators.probe_operator import Probe_operator
+
+import numpy as num
+
+
+class Test_probe_operator(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['test_probes_probes.nc']:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def create_domain(self):
+
+        domain = rectangular_cross_domain(6, 4, len1=6.0, len2=4.0)
+        domain.set_name('test_probes')
+        domain.set_store(False)
+
+        domain.set_quantity('elevation', lambda x, y: -x/6.0)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', lambda x, y: num.where(x < 2.0, 0.5, -x/6.0))
+
+        Br = Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        return domain
+
+    def test_probe_values(self):
+
+        domain = self.create_domain()
+
+        points = [[0.3, 0.2], [2.55, 1.7], [7.0, 1.0], [5.9, 3.95]]
+        probe = Probe_operator(domain, points)
+
+        # Points outside the mesh are not probed
+        assert num.all(probe.probe_ids == [0, 1, 3])
+
+        # Linear quantities are sampled exactly
+        domain.set_quantity('stage', lambda x, y: 1.0 + x - 2*y)
+        domain.set_quantity('xmomentum', lambda x, y: 0.5*x)
+        domain.set_quantity('ymomentum', 0.25)
+
+        probe.sample(3.0)
+        probe.flush()
+
+        x = num.array([0.3, 2.55, 5.9])
+        y = num.array([0.2, 1.7, 3.95])
+        depth = 1.0 + x - 2*y + x/6.0
+        wet = depth > domain.minimum_allowed_height
+
+        fid = NetCDFFile(probe.filename)
+        assert num.allclose(fid.variables['x'][:], x)
+        assert num.all(fid.variables['probe_id'][:] == [0, 1, 3])
+        assert num.allclose(fid.variables['time'][:], [3.0])
+        assert num.allclose(fid.variables['stage'][0], 1.0 + x - 2*y)
+        assert num.allclose(fid.variables['depth'][0], num.maximum(depth, 0.0))
+        assert num.allclose(fid.variables['xmomentum'][0], 0.5*x)
+        assert num.allclose(fid.variables['yvelocity'][0],
+                            num.where(wet, 0.25/num.where(wet, depth, 1.0), 0.0))
+        fid.close()
+
+    def test_probe_schedule(self):
+
+        for update_frequency, update_interval in [(3, None), (1, 0.05)]:
+            domain = self.create_domain()
+
+            probe = Probe_operator(domain, [[1.0, 1.0], [3.2, 2.1]],
+                                   update_frequency=update_frequency,
+                                   update_interval=update_interval,
+                                   buffer_size=4)
+
+            # A probe sampling every step
+            every_step = Probe_operator(domain, [[1.0, 1.0]],
+                                        filename='test_probes_every_step.nc')
+
+            for t in domain.evolve(yieldstep=0.25, finaltime=0.5):
+                pass
+
+            fid = NetCDFFile(probe.filename)
+            time = fid.variables['time'][:]
+            stage = fid.variables['stage'][:]
+            fid.close()
+
+            # All samples are written at the final time
+            assert probe.buffer_count == 0
+            assert len(time) == probe.number_of_samples
+            assert stage.shape == (len(time), 2)
+            assert num.all(time[1:] > time[:-1])
+            assert time[-1] <= 0.5 + 1.0e-10
+
+            fid = NetCDFFile('test_probes_every_step.nc')
+            all_times = fid.variables['time'][:]
+            fid.close()
+            os.remove('test_probes_every_step.nc')
+
+            if update_interval is None:
+                assert len(time) == len(all_times)/3
+                assert num.allclose(time, all_times[2::3][:len(time)])
+            else:
+                # At most one sample in each interval
+                assert num.all(num.diff(num.floor(time/0.05 + 1.0e-10)) >= 1)
+
+            if time[-1] == all_times[-1]:
+                # The last sample is the state at the final time
+                assert num.allclose(stage[-1],
+                                    probe.get_values(domain.quantities['stage']),
+                                    atol=1.0e-2)
+
+            os.remove(probe.filename)
+
+    def test_probe_times(self):
+        """Samples are stamped with the time at the end of the step for
+        the euler (DE0) and rk2 (DE1) timestepping methods
+        """
+
+        for flow_algorithm in ['DE0', 'DE1']:
+            domain = self.create_domain()
+            domain.set_flow_algorithm(flow_algorithm)
+
+            probe = Probe_operator(domain, [[1.0, 1.0], [3.2, 2.1]])
+
+            yield_times = []
+            for t in domain.evolve(yieldstep=0.25, finaltime=0.5):
+                yield_times.append(t)
+
+            # Flushed at the final time
+            assert probe.buffer_count == 0
+
+            fid = NetCDFFile(probe.filename)
+            time = fid.variables['time'][:]
+            stage = fid.variables['stage'][:]
+            fid.close()
+
+            assert time[0] > 0.0
+            assert num.all(time[1:] > time[:-1])
+            for t in yield_times[1:]:
+                assert num.min(num.abs(time - t)) < 1.0e-10
+            assert abs(time[-1] - 0.5) < 1.0e-10
+
+            # The last sample is the state at the final time
+            assert num.allclose(stage[-1],
+                                probe.get_values(domain.quantities['stage']),
+                                atol=1.0e-2)
+
+            os.remove(probe.filename)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_probe_operator, 'test')
+    runner = unittest.TextTestRunner(verbosity=1)
+    runner.run(suite)
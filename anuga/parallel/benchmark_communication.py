@@ -0,0 +1,98 @@
+"""Compare the per step communication cost of the parallel backends.
+
+   Times the ghost cell update (update_ghosts) and the timestep reduction
+   of a distributed rectangular cross domain with the pypar backend and,
+   if mpi4py is installed, the mpi4py backend with persistent requests
+   (see Parallel_domain.set_communication_backend).
+
+   Usage:
+
+       mpirun -np 4 python benchmark_communication.py
+
+   The table reports, for each backend, the mean time per call of the
+   slowest processor.
+"""
+
+import time
+
+import numpy as num
+
+from anuga import rectangular_cross_domain
+from anuga import distribute, myid, numprocs, send, receive, barrier, finalize
+from anuga.parallel import mpi4py_communications
+import anuga.parallel.parallel_generic_communications as generic_comms
+
+
+def setup_domain(m):
+
+    domain = rectangular_cross_domain(m, m, len1=float(m), len2=float(m))
+    domain.set_quantity('elevation', lambda x, y: -x/float(m))
+    domain.set_quantity('stage', 0.1)
+
+    return distribute(domain)
+
+
+def time_call(function, repeats):
+
+    function()
+    barrier()
+    t0 = time.time()
+    for i in xrange(repeats):
+        function()
+
+    return (time.time() - t0)/repeats
+
+
+def get_maximum(value):
+    """Return the maximum of value over all processors on processor 0
+    """
+
+    if myid != 0:
+        send(value, 0)
+        return None
+
+    for p in range(1, numprocs):
+        value = max(value, receive(p))
+
+    return value
+
+
+def benchmark(sizes=(100, 400), repeats=100):
+
+    backends = ['pypar']
+    if mpi4py_communications.mpi4py_available:
+        backends.append('mpi4py')
+
+    flux_timestep_functions = {
+        'pypar': generic_comms.communicate_flux_timestep,
+        'mpi4py': mpi4py_communications.communicate_flux_timestep}
+
+    if myid == 0:
+        print '%d processors' % numprocs
+        print '%10s %8s %18s %18s' % ('triangles', 'backend',
+                                      'update_ghosts [s]', 'timestep [s]')
+
+    for m in sizes:
+        domain = setup_domain(m)
+        domain.flux_timestep = 1.0
+
+        for backend in backends:
+            domain.set_communication_backend(backend)
+            communicate_flux_timestep = flux_timestep_functions[backend]
+
+            ghost_time = time_call(domain.update_ghosts, repeats)
+            timestep_time = time_call(lambda: communicate_flux_timestep(domain,
+                                                                        1.0, 1.0),
+                                      repeats)
+
+            ghost_time = get_maximum(ghost_time)
+            timestep_time = get_maximum(timestep_time)
+
+            if myid == 0:
+                print '%10d %8s %18.8f %18.8f' % (4*m*m, backend, ghost_time,
+                                                  timestep_time)
+
+
+if __name__ == '__main__':
+    benchmark()
+    finalize()
@@ -0,0 +1,290 @@
+"""Collective output of a parallel run to a single sww file.
+
+Each processor extracts the values of its full (non ghost) triangles and
+sends them, with their global ids from the tri_l2g and node_l2g maps of
+distribute_mesh, to an aggregator processor which writes them into one
+sww file of the global mesh. The file is the one sww_merge_parallel would
+produce from the sww files of the processors, without writing these files
+and merging them after the run.
+"""
+
+import numpy as num
+
+import anuga.utilities.parallel_abstraction as pypar
+
+from anuga.config import netcdf_mode_w, netcdf_mode_a
+from anuga.file.netcdf import NetCDFFile
+from anuga.file.sww import SWW_file
+from anuga.utilities.file_utils import create_filename
+
+
+def get_full_maps(domain, smooth):
+    """Return the local and global ids (l_vids, g_vids) of the stored
+    vertex values and (f_ids, f_gids) of the full triangles of a
+    Parallel_domain.
+
+    smooth is True for one value per node and False for three values per
+    triangle. With one value per node only the nodes of full triangles are
+    included, those of the other nodes are stored by the processor owning
+    them.
+    """
+
+    f_ids = num.argwhere(domain.tri_full_flag == 1).reshape(-1,)
+    f_gids = num.array(domain.tri_l2g, num.int)[f_ids]
+
+    if smooth:
+        triangles = domain.get_triangles()
+        l_vids = num.unique(triangles[f_ids])
+        g_vids = num.array(domain.node_l2g, num.int)[l_vids]
+    else:
+        l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
+        g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
+
+    return l_vids, g_vids, f_ids, f_gids
+
+
+class Collective_SWW_file(SWW_file):
+    """Write the sww file of the global mesh of a parallel run, see
+    Domain.set_sww_collective.
+
+    Every processor creates a Collective_SWW_file and calls
+    store_connectivity and store_timestep collectively. The aggregator
+    creates the file <global name>.sww and writes the values received from
+    all processors; the other processors write nothing.
+
+    Persistent and asynchronous storage (see set_sww_persistent and
+    set_sww_asynchronous) apply to the aggregator, which then writes a
+    timestep while the values of the next one are computed. The file is
+    not split when it exceeds max_size.
+    """
+
+    def __init__(self, domain, mode=netcdf_mode_w, max_size=200000000000,
+                 recursion=False, aggregator=0):
+
+        self.aggregator = aggregator
+        self.processor = domain.processor
+        self.numproc = domain.numproc
+
+        self.l_vids, self.g_vids, self.f_ids, self.f_gids = \
+                     get_full_maps(domain, domain.smooth)
+
+        # Local to global maps of all processors, on the aggregator
+        self.global_maps = None
+
+        SWW_file.__init__(self, domain, mode, max_size, recursion)
+
+        # Splitting the file would need all processors to agree
+        self.max_size = num.inf
+
+        # Appending to an existing file only needs the maps
+        if mode[0] == 'a':
+            contributions = self._gather({'g_vids': self.g_vids,
+                                          'f_gids': self.f_gids})
+            if self.is_aggregator():
+                self.global_maps = [(c['g_vids'], c['f_gids'])
+                                    for c in contributions]
+
+    def _create_file(self, mode):
+        """Create the global file on the aggregator, named after the global
+        name of the domain and sized for the global mesh
+        """
+
+        domain = self.domain
+
+        self.filename = create_filename(domain.get_datadir(),
+                                        domain.get_global_name(), 'sww')
+        self.number_of_volumes = domain.number_of_global_triangles
+        self.number_of_nodes = domain.number_of_global_nodes
+
+        if self.processor == self.aggregator:
+            SWW_file._create_file(self, mode)
+
+    def is_aggregator(self):
+
+        return self.processor == self.aggregator
+
+    def _gather(self, local):
+        """Return the list of the local values of all processors on the
+        aggregator and None on the other processors
+        """
+
+        if not self.is_aggregator():
+            pypar.send(local, self.aggregator)
+            return None
+
+        contributions = []
+        for p in range(self.numproc):
+            if p == self.processor:
+                contributions.append(local)
+            else:
+                contributions.append(pypar.receive(p))
+
+        return contributions
+
+    def get_local_connectivity(self):
+        """Return the coordinates, the triangles and the static quantities
+        of the full triangles of this processor with their global ids
+        """
+
+        domain = self.domain
+
+        Q = domain.quantities.values()[0]
+        X, Y, _, V = Q.get_vertex_values(xy=True, precision=self.precision)
+
+        if domain.smooth:
+            volumes = num.array(domain.node_l2g, num.int)[V[self.f_ids]]
+        else:
+            volumes = None
+
+        static_quantities = {}
+        for name in self.writer.static_quantities:
+            A, _ = domain.quantities[name].get_vertex_values(xy=False,
+                                                  precision=self.precision)
+            static_quantities[name] = A[self.l_vids]
+
+        static_quantities_centroid = {}
+        for name in self.writer.static_c_quantities:
+            Q = domain.quantities[name[:-2]]  # rip off _c from name
+            static_quantities_centroid[name] = Q.centroid_values[self.f_ids]
+
+        return {'g_vids': self.g_vids,
+                'f_gids': self.f_gids,
+                'x': X[self.l_vids],
+                'y': Y[self.l_vids],
+                'volumes': volumes,
+                'static_quantities': static_quantities,
+                'static_quantities_centroid': static_quantities_centroid}
+
+    def store_global_connectivity(self, contributions):
+        """Write the mesh and static quantities of the global mesh from the
+        local connectivity of all processors (on the aggregator)
+        """
+
+        self.global_maps = [(c['g_vids'], c['f_gids']) for c in contributions]
+
+        number_of_points = self._get_number_of_points()
+
+        points = num.zeros((number_of_points, 2), self.precision)
+        if self.domain.smooth:
+            volumes = num.zeros((self.number_of_volumes, 3), num.int)
+        else:
+            volumes = num.arange(3*self.number_of_volumes).reshape(-1,3)
+
+        static_quantities = {}
+        for name in self.writer.static_quantities:
+            static_quantities[name] = num.zeros(number_of_points,
+                                                self.precision)
+        static_quantities_centroid = {}
+        for name in self.writer.static_c_quantities:
+            static_quantities_centroid[name] = \
+                num.zeros(self.number_of_volumes, self.precision)
+
+        for c in contributions:
+            g_vids = c['g_vids']
+            f_gids = c['f_gids']
+
+            points[g_vids,0] = c['x']
+            points[g_vids,1] = c['y']
+            if c['volumes'] is not None:
+                volumes[f_gids] = c['volumes']
+
+            for name, A in c['static_quantities'].items():
+                static_quantities[name][g_vids] = A
+            for name, A in c['static_quantities_centroid'].items():
+                static_quantities_centroid[name][f_gids] = A
+
+        fid = NetCDFFile(self.filename, netcdf_mode_a)
+
+        self.writer.store_triangulation(fid,
+                                        points,
+                                        volumes.astype(num.float32),
+                                        points_georeference=\
+                                        self.domain.geo_reference)
+        self.writer.store_static_quantities(fid, **static_quantities)
+        self.writer.store_static_quantities_centroid(fid,
+                                          **static_quantities_centroid)
+
+        fid.close()
+
+    def store_connectivity(self):
+        """Store the global mesh and static quantities (collective)
+        """
+
+        contributions = self._gather(self.get_local_connectivity())
+
+        if self.is_aggregator():
+            self.store_global_connectivity(contributions)
+
+    def get_local_timestep(self):
+        """Return the dynamic quantities of the full triangles of this
+        processor for the current timestep
+        """
+
+        dynamic_quantities, dynamic_quantities_centroid = \
+                            SWW_file._get_dynamic_quantities(self)
+
+        for name, A in dynamic_quantities.items():
+            dynamic_quantities[name] = A[self.l_vids]
+        for name, A in dynamic_quantities_centroid.items():
+            dynamic_quantities_centroid[name] = A[self.f_ids]
+
+        return dynamic_quantities, dynamic_quantities_centroid
+
+    def store_global_timestep(self, contributions):
+        """Write the current timestep from the local timesteps of all
+        processors (on the aggregator)
+        """
+
+        self.contributions = contributions
+        try:
+            SWW_file.store_timestep(self)
+        finally:
+            self.contributions = None
+
+    def store_timestep(self):
+        """Store time and time dependent quantities (collective)
+        """
+
+        contributions = self._gather(self.get_local_timestep())
+
+        if self.is_aggregator():
+            self.store_global_timestep(contributions)
+
+    def _get_dynamic_quantities(self):
+        """Return the dynamic quantities of the global mesh assembled from
+        the contributions of all processors
+        """
+
+        number_of_points = self._get_number_of_points()
+
+        dynamic_quantities = {}
+        for name in self.writer.dynamic_quantities:
+            dynamic_quantities[name] = num.zeros(number_of_points,
+                                                 self.precision)
+        dynamic_quantities_centroid = {}
+        for name in self.writer.dynamic_c_quantities:
+            dynamic_quantities_centroid[name] = \
+                num.zeros(self.number_of_volumes, self.precision)
+
+        for (g_vids, f_gids), (values, values_centroid) in \
+                zip(self.global_maps, self.contributions):
+            for name, A in values.items():
+                dynamic_quantities[name][g_vids] = A
+            for name, A in values_centroid.items():
+                dynamic_quantities_centroid[name][f_gids] = A
+
+        return dynamic_quantities, dynamic_quantities_centroid
+
+    def _get_number_of_points(self):
+
+        if self.domain.smooth:
+            return self.number_of_nodes
+        else:
+            return 3*self.number_of_volumes
+
+    def _original_centroid_values(self, A):
+        # The global numbering is the original numbering
+        return A
+
+    def _original_vertex_values(self, A):
+        return A
@@ -122,7 +122,7 @@ def reorder_new(quantities, epart_order, proc_sum):
 #path.append('..' + sep + 'pymetis')
 
 try:
-    from anuga.pymetis.metis_ext import partMeshNodal
+    from anuga.pymetis.metis_ext import partMeshNodal, partGraphKway
 except ImportError:
     print "***************************************************"
     print "         Metis is probably not compiled."
@@ -136,11 +136,34 @@ def pmesh_divide_metis(domain, n_procs):
 
     return nodes, ttriangles, boundary, triangles_per_proc, quantities
 
-def pmesh_divide_metis_with_map(domain, n_procs):
+def pmesh_divide_metis_with_map(domain, n_procs, weights=None):
 
-    return pmesh_divide_metis_helper(domain, n_procs)
+    return pmesh_divide_metis_helper(domain, n_procs, weights)
 
-def pmesh_divide_metis_helper(domain, n_procs):
+def get_dual_graph(domain):
+    """Return the adjacency structure (xadj, adjncy) of the dual graph of
+    the mesh of domain, with one vertex per triangle and one edge per pair
+    of neighbouring triangles, in the compressed format used by metis.
+    """
+
+    neighbours = domain.neighbours
+    adjacent = neighbours >= 0
+
+    xadj = num.zeros(len(neighbours)+1, num.int)
+    xadj[1:] = num.cumsum(num.sum(adjacent, axis=1))
+    adjncy = neighbours[adjacent]
+
+    return xadj, adjncy
+
+def pmesh_divide_metis_helper(domain, n_procs, weights=None):
+    """Partition the triangles of domain with metis.
+
+    Without weights the mesh is partitioned with METIS_PartMeshNodal. With
+    weights, an integer cost for each triangle (e.g. higher for wet
+    triangles), the dual graph of the mesh is partitioned with
+    METIS_PartGraphKway so that the total weight of each part is
+    balanced.
+    """
     
     # Initialise the lists
     # List, indexed by processor of # triangles.
@@ -164,14 +187,22 @@ def pmesh_divide_metis_helper(domain, n_procs):
         t_list = domain.triangles.copy()
         t_list = num.reshape(t_list, (-1,))
     
-        # The 1 here is for triangular mesh elements.
-        # FIXME: Should update to Metis 5
-        edgecut, epart, npart = partMeshNodal(n_tri, n_vert, t_list, 1, n_procs)
-        # print edgecut
-        # print npart
-        #print epart
+        if weights is None:
+            # The 1 here is for triangular mesh elements.
+            # FIXME: Should update to Metis 5
+            edgecut, epart, npart = partMeshNodal(n_tri, n_vert, t_list, 1, n_procs)
+            # print edgecut
+            # print npart
+            #print epart
+            del npart
+        else:
+            weights = num.array(weights, num.int)
+            assert len(weights) == n_tri
+            assert num.all(weights > 0), 'Metis needs positive weights'
+
+            xadj, adjncy = get_dual_graph(domain)
+            edgecut, epart = partGraphKway(n_tri, xadj, adjncy, weights, n_procs)
         del edgecut
-        del npart
 
         # Sometimes (usu. on x86_64), partMeshNodal returns an array of zero
         # dimensional arrays. Correct this.
@@ -1161,6 +1192,54 @@ def build_local_commun(tri_map, ghostc, fullc, nproc):
     return ghost_recv, full_send
 
 
+#########################################################
+# Classify the local triangles by their distance from the
+# ghost triangles, so that the update of the ghost triangles
+# can be overlapped with the computation on the triangles
+# away from them (see Parallel_domain.set_overlap_communication)
+#
+# *) The ghost triangles are on level 0. A full triangle
+# sharing a vertex with a triangle on level l-1 is on level
+# l, up to the interior triangles on level halo_levels.
+# A triangle on level l is at least l triangles (across
+# edges) away from the ghost triangles.
+#
+# *) The full triangles are numbered before the ghost
+# triangles
+#
+# -------------------------------------------------------
+#
+# *) The level of each triangle is returned
+#
+#########################################################
+
+halo_levels = 4
+
+def build_local_halo_levels(triangles, number_of_full_triangles,
+                            levels=halo_levels):
+
+    Ntriangles = len(triangles)
+
+    tri_halo_level = levels*num.ones(Ntriangles, num.int)
+    tri_halo_level[number_of_full_triangles:] = 0
+
+    if Ntriangles == 0:
+        return tri_halo_level
+
+    Nnodes = num.max(triangles)+1
+    for level in range(1, levels):
+
+        # Nodes of the triangles on the previous level
+        marked = num.zeros(Nnodes, num.bool)
+        marked[triangles[tri_halo_level == level-1].flat] = True
+
+        next_level = num.any(marked[triangles], axis=1) & \
+                     (tri_halo_level == levels)
+        tri_halo_level[next_level] = level
+
+    return tri_halo_level
+
+
 #########################################################
 # Convert the format of the data to that used by ANUGA
 #
@@ -1242,9 +1321,15 @@ def build_local_mesh(submesh, lower_t, upper_t, nproc):
 
     tri_l2g  = extract_l2g_map(tri_map)
     node_l2g = extract_l2g_map(node_map)
+
+    # Classify the triangles as interior or next to the ghost triangles
+
+    tri_halo_level = build_local_halo_levels(GAtriangles,
+                                             len(submesh["full_triangles"]))
      
     return GAnodes, GAtriangles, GAboundary, quantities, ghost_rec, \
-           full_send, tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width
+           full_send, tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width, \
+           tri_halo_level
 
 
 #########################################################
@@ -1582,13 +1667,13 @@ def rec_submesh(p, verbose=True):
     [GAnodes, GAtriangles, boundary, quantities, \
      ghost_rec, full_send, \
      tri_map, node_map, tri_l2g, node_l2g, \
-     ghost_layer_width] = \
+     ghost_layer_width, tri_halo_level] = \
      build_local_mesh(submesh_cell, lower_t, upper_t, numproc)
     
     return GAnodes, GAtriangles, boundary, quantities,\
            ghost_rec, full_send,\
            number_of_full_nodes, number_of_full_triangles, tri_map, node_map,\
-           tri_l2g, node_l2g, ghost_layer_width
+           tri_l2g, node_l2g, ghost_layer_width, tri_halo_level
 
 
 
@@ -1637,7 +1722,7 @@ def extract_submesh(submesh, triangles_per_proc, p2s_map=None, p=0):
     numprocs = len(triangles_per_proc)
     points, vertices, boundary, quantities, ghost_recv_dict, \
             full_send_dict, tri_map, node_map, tri_l2g, node_l2g, \
-            ghost_layer_width = \
+            ghost_layer_width, tri_halo_level = \
             build_local_mesh(submesh_cell, lower_t, upper_t, numprocs)
 
 
@@ -1650,7 +1735,8 @@ def extract_submesh(submesh, triangles_per_proc, p2s_map=None, p=0):
             tri_l2g = p2s_map
 
     return  points, vertices, boundary, quantities, ghost_recv_dict, \
-           full_send_dict, tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width
+           full_send_dict, tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width, \
+           tri_halo_level
            
 
 
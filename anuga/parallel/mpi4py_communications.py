@@ -0,0 +1,137 @@
+"""
+Implementation of update_timestep and update_ghosts for parallel domains
+using mpi4py, see Parallel_domain.set_communication_backend.
+
+The ghost cells are updated with persistent requests bound once to the
+send and receive buffers of full_send_dict and ghost_recv_dict, which hold
+all the conserved quantities of the cells exchanged with a neighbour in one
+contiguous array. Each update packs the buffers, starts all the requests
+and waits for them, instead of setting up isend/irecv every step. The
+update can also be started and finished separately (see
+Parallel_domain.set_overlap_communication). The timestep is reduced by an
+Allreduce with MIN.
+"""
+
+import time
+
+import parallel_generic_communications as generic_comms
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    mpi4py_available = False
+else:
+    mpi4py_available = True
+
+
+# Tag of the ghost cell messages (as used by mpiextras)
+ghost_tag = 123
+
+
+def setup_persistent_requests(domain):
+    """Create the persistent requests receiving the ghost_recv_dict
+    buffers and sending the full_send_dict buffers of domain
+    """
+
+    comm = MPI.COMM_WORLD
+
+    requests = []
+    for recv_proc in domain.ghost_recv_dict:
+        X = domain.ghost_recv_dict[recv_proc][2]
+        requests.append(comm.Recv_init([X, MPI.DOUBLE], source=int(recv_proc),
+                                       tag=ghost_tag))
+
+    for send_proc in domain.full_send_dict:
+        Xout = domain.full_send_dict[send_proc][2]
+        requests.append(comm.Send_init([Xout, MPI.DOUBLE], dest=int(send_proc),
+                                       tag=ghost_tag))
+
+    domain.persistent_requests = requests
+
+
+def free_persistent_requests(domain):
+
+    requests = getattr(domain, 'persistent_requests', None)
+    if requests is not None:
+        for request in requests:
+            request.Free()
+    domain.persistent_requests = None
+
+
+def communicate_flux_timestep(domain, yieldstep, finaltime):
+    """Set the flux timestep of domain to the minimum over all processors
+    """
+
+    domain.local_timestep[0] = domain.flux_timestep
+    t0 = time.time()
+
+    MPI.COMM_WORLD.Allreduce([domain.local_timestep, MPI.DOUBLE],
+                             [domain.global_timestep, MPI.DOUBLE],
+                             op=MPI.MIN)
+
+    domain.communication_reduce_time += time.time()-t0
+
+    domain.flux_timestep = domain.global_timestep[0]
+
+
+def communicate_ghosts_persistent(domain, quantities=None):
+    """Update the centroid values of quantities (the conserved quantities
+    by default) in the ghost cells from the full cells of the other
+    processors
+    """
+
+    t0 = time.time()
+
+    if quantities is None:
+        quantities = domain.conserved_quantities
+
+    if getattr(domain, 'persistent_requests', None) is None:
+        setup_persistent_requests(domain)
+
+    # With contiguous quantity storage pack and unpack all the quantities
+    # at once
+    block = domain.get_quantity_block('centroid_values', quantities)
+
+    generic_comms.pack_send_buffers(domain, quantities, block)
+
+    requests = domain.persistent_requests
+    MPI.Prequest.Startall(requests)
+    MPI.Request.Waitall(requests)
+
+    generic_comms.unpack_recv_buffers(domain, quantities, block)
+
+    domain.communication_time += time.time()-t0
+
+
+def start_ghosts_persistent(domain):
+    """Start the update of the conserved quantities in the ghost cells,
+    completed by finish_ghosts_persistent
+    """
+
+    t0 = time.time()
+
+    if getattr(domain, 'persistent_requests', None) is None:
+        setup_persistent_requests(domain)
+
+    block = domain.get_quantity_block('centroid_values')
+    generic_comms.pack_send_buffers(domain, domain.conserved_quantities, block)
+
+    MPI.Prequest.Startall(domain.persistent_requests)
+
+    domain.communication_time += time.time()-t0
+
+
+def finish_ghosts_persistent(domain):
+    """Wait for the update started by start_ghosts_persistent and copy
+    the received values into the ghost cells
+    """
+
+    t0 = time.time()
+
+    MPI.Request.Waitall(domain.persistent_requests)
+
+    block = domain.get_quantity_block('centroid_values')
+    generic_comms.unpack_recv_buffers(domain, domain.conserved_quantities,
+                                      block)
+
+    domain.communication_time += time.time()-t0
@@ -598,6 +598,129 @@ static PyObject *send_recv_via_dicts(PyObject *self, PyObject *args) {
 }
 
 
+/* Post the receives of the ghost_recv_dict buffers and the sends of the
+   full_send_dict buffers. Returns the number of requests, -1 on error */
+static int post_send_recv_via_dicts(PyObject *send_dict, PyObject *recv_dict,
+                                    MPI_Request *requests) {
+
+  PyArrayObject *X;
+  int k, lenx;
+  int num_recv=0;
+  int num_send=0;
+
+  int ierr;
+
+  Py_ssize_t pos = 0;
+
+  PyObject *key, *value;
+
+  //----------------------------------------------------------------------------
+  // Do the recv first
+  //----------------------------------------------------------------------------
+  num_recv = PyDict_Size(recv_dict);
+  if (num_recv>20) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c; Number of recv communication buffers > 10");
+    return -1;
+  }
+
+  pos = 0;
+  k = 0;
+  while (PyDict_Next(recv_dict, &pos, &key, &value)) {
+    int i = PyInt_AS_LONG(key);
+
+    X   = (PyArrayObject *) PyList_GetItem(value, 2);
+
+    lenx = X->dimensions[0]*X->dimensions[1];
+
+    ierr = MPI_Irecv(X->data, lenx, MPI_DOUBLE, i, 123, MPI_COMM_WORLD, &requests[k]);
+    if (ierr>0) {
+        PyErr_SetString(PyExc_RuntimeError,
+    		    "mpiextras.c; error from MPI_Irecv");
+        return -1;
+      }
+    k++;
+  }
+
+  //----------------------------------------------------------------------------
+  // Do the sends second
+  //----------------------------------------------------------------------------
+  num_send = PyDict_Size(send_dict);
+  if (num_send>20) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c; Number of send communication buffers > 10");
+    return -1;
+  }
+
+  pos = 0;
+  while (PyDict_Next(send_dict, &pos, &key, &value)) {
+    int i = PyInt_AS_LONG(key);
+
+    X   = (PyArrayObject *) PyList_GetItem(value, 2);
+
+    lenx = X->dimensions[0]*X->dimensions[1];
+
+    ierr = MPI_Isend(X->data, lenx, MPI_DOUBLE, i, 123, MPI_COMM_WORLD, &requests[k]);
+    if (ierr>0) {
+        PyErr_SetString(PyExc_RuntimeError,
+    		    "mpiextras.c; error from MPI_Isend");
+        return -1;
+      }
+    k++;
+  }
+
+  return k;
+}
+
+
+/* The communication started by start_send_recv_via_dicts and completed by
+   wait_send_recv_via_dicts, so that computation can be put between them */
+static MPI_Request pending_requests[40];
+static int number_of_pending_requests = 0;
+
+static PyObject *start_send_recv_via_dicts(PyObject *self, PyObject *args) {
+
+  PyObject *send_dict;
+  PyObject *recv_dict;
+
+  int k;
+
+  /* process the parameters */
+  if (!PyArg_ParseTuple(args, "OO", &send_dict, &recv_dict)) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (start_send_recv_via_dicts): could not parse input");
+    return NULL;
+  }
+
+  if (number_of_pending_requests > 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "mpiextras.c (start_send_recv_via_dicts): communication already started");
+    return NULL;
+  }
+
+  k = post_send_recv_via_dicts(send_dict, recv_dict, pending_requests);
+  if (k < 0) {
+    return NULL;
+  }
+  number_of_pending_requests = k;
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
+static PyObject *wait_send_recv_via_dicts(PyObject *self, PyObject *args) {
+
+  MPI_Status statuses[40];
+
+  MPI_Waitall(number_of_pending_requests, pending_requests, statuses);
+  number_of_pending_requests = 0;
+
+  Py_INCREF(Py_None);
+  return (Py_None);
+}
+
+
  
 /**********************************/
 /* Method table for python module */
@@ -608,6 +731,8 @@ static struct PyMethodDef MethodTable[] = {
   {"allreduce_array", allreduce_array, METH_VARARGS},
   {"sendrecv_array", sendrecv_array, METH_VARARGS},
   {"send_recv_via_dicts", send_recv_via_dicts, METH_VARARGS},
+  {"start_send_recv_via_dicts", start_send_recv_via_dicts, METH_VARARGS},
+  {"wait_send_recv_via_dicts", wait_send_recv_via_dicts, METH_VARARGS},
   {NULL, NULL}
 };
 
@@ -240,7 +240,7 @@ def old_distribute(domain, verbose=False, debug=False, parameters = None):
                 ghost_recv_dict, full_send_dict,\
                 number_of_full_nodes, number_of_full_triangles,\
                 s2p_map, p2s_map, tri_map, node_map, tri_l2g, node_l2g, \
-                ghost_layer_width =\
+                ghost_layer_width, tri_halo_level =\
                 distribute_mesh(domain, verbose=verbose, debug=debug, parameters=parameters)
             
         # Extract l2g maps
@@ -299,7 +299,8 @@ def old_distribute(domain, verbose=False, debug=False, parameters = None):
         points, vertices, boundary, quantities,\
                 ghost_recv_dict, full_send_dict,\
                 number_of_full_nodes, number_of_full_triangles, \
-                tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width =\
+                tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width, \
+                tri_halo_level =\
                 rec_submesh(0, verbose)
 
 
@@ -341,7 +342,8 @@ def old_distribute(domain, verbose=False, debug=False, parameters = None):
                              p2s_map = p2s_map, ## jj added this
                              tri_l2g = tri_l2g, ## SR added this
                              node_l2g = node_l2g,
-                             ghost_layer_width = ghost_layer_width)
+                             ghost_layer_width = ghost_layer_width,
+                             tri_halo_level = tri_halo_level)
 
     #------------------------------------------------------------------------
     # Transfer initial conditions to each subdomain
@@ -430,7 +432,8 @@ def distribute_mesh(domain, verbose=False, debug=False, parameters=None):
     # Build the local mesh for processor 0
     points, vertices, boundary, quantities, \
             ghost_recv_dict, full_send_dict, \
-            tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width =\
+            tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width, \
+            tri_halo_level =\
               extract_submesh(submesh, triangles_per_proc, p2s_map, 0)
 
 
@@ -470,7 +473,7 @@ def distribute_mesh(domain, verbose=False, debug=False, parameters=None):
            ghost_recv_dict, full_send_dict,\
            number_of_full_nodes, number_of_full_triangles, \
            s2p_map, p2s_map, tri_map, node_map, tri_l2g, node_l2g, \
-           ghost_layer_width
+           ghost_layer_width, tri_halo_level
     
 
 
@@ -80,6 +80,10 @@ def communicate_ghosts_blocking(domain):
     import time
     t0 = time.time()
 
+    # With contiguous quantity storage pack and unpack all the conserved
+    # quantities at once
+    block = domain.get_quantity_block('centroid_values')
+
     # update of non-local ghost cells
     for iproc in range(domain.numproc):
         if iproc == domain.processor:
@@ -90,10 +94,13 @@ def communicate_ghosts_blocking(domain):
                     Idf  = domain.full_send_dict[send_proc][0]
                     Xout = domain.full_send_dict[send_proc][2]
 
-                    for i, q in enumerate(domain.conserved_quantities):
-                        #print 'Send',i,q
-                        Q_cv =  domain.quantities[q].centroid_values
-                        Xout[:,i] = num.take(Q_cv, Idf)
+                    if block is not None:
+                        Xout[:] = block[:,Idf].T
+                    else:
+                        for i, q in enumerate(domain.conserved_quantities):
+                            #print 'Send',i,q
+                            Q_cv =  domain.quantities[q].centroid_values
+                            Xout[:,i] = num.take(Q_cv, Idf)
 
                     pypar.send(Xout, int(send_proc), use_buffer=True, bypass=True)
 
@@ -107,10 +114,13 @@ def communicate_ghosts_blocking(domain):
 
                 X = pypar.receive(int(iproc), buffer=X, bypass=True)
 
-                for i, q in enumerate(domain.conserved_quantities):
-                    #print 'Receive',i,q
-                    Q_cv =  domain.quantities[q].centroid_values
-                    num.put(Q_cv, Idg, X[:,i])
+                if block is not None:
+                    block[:,Idg] = X.T
+                else:
+                    for i, q in enumerate(domain.conserved_quantities):
+                        #print 'Receive',i,q
+                        Q_cv =  domain.quantities[q].centroid_values
+                        num.put(Q_cv, Idg, X[:,i])
 
     #local update of ghost cells
     iproc = domain.processor
@@ -124,15 +134,57 @@ def communicate_ghosts_blocking(domain):
         # now store ghost as local id, global id, value
         Idg = domain.ghost_recv_dict[iproc][0]
 
-        for i, q in enumerate(domain.conserved_quantities):
-            #print 'LOCAL SEND RECEIVE',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            num.put(Q_cv, Idg, num.take(Q_cv, Idf))
+        if block is not None:
+            block[:,Idg] = block[:,Idf]
+        else:
+            for i, q in enumerate(domain.conserved_quantities):
+                #print 'LOCAL SEND RECEIVE',i,q
+                Q_cv =  domain.quantities[q].centroid_values
+                num.put(Q_cv, Idg, num.take(Q_cv, Idf))
 
     domain.communication_time += time.time()-t0
 
 
 
+def pack_send_buffers(domain, quantities, block=None):
+    """Copy the centroid values of quantities in the full cells sent to
+    other processors into the send buffers of full_send_dict. block is
+    the contiguous storage of quantities if any (see get_quantity_block)
+    """
+
+    for send_proc in domain.full_send_dict:
+        Idf  = domain.full_send_dict[send_proc][0]
+        Xout = domain.full_send_dict[send_proc][2]
+
+        if block is not None:
+            Xout[:,:len(block)] = block[:,Idf].T
+            continue
+
+        for i, q in enumerate(quantities):
+            #print 'Store send data',i,q
+            Q_cv =  domain.quantities[q].centroid_values
+            Xout[:,i] = num.take(Q_cv, Idf)
+
+
+def unpack_recv_buffers(domain, quantities, block=None):
+    """Copy the receive buffers of ghost_recv_dict into the centroid values
+    of quantities in the ghost cells
+    """
+
+    for recv_proc in domain.ghost_recv_dict:
+        Idg  = domain.ghost_recv_dict[recv_proc][0]
+        X    = domain.ghost_recv_dict[recv_proc][2]
+
+        if block is not None:
+            block[:,Idg] = X[:,:len(block)].T
+            continue
+
+        for i, q in enumerate(quantities):
+            #print 'Read receive data',i,q
+            Q_cv =  domain.quantities[q].centroid_values
+            num.put(Q_cv, Idg, X[:,i])
+
+
 def communicate_ghosts_asynchronous(domain, quantities=None):
 
     # We must send the information from the full cells and
@@ -141,62 +193,65 @@ def communicate_ghosts_asynchronous(domain, quantities=None):
     # the separate processors
     # Using isend and irecv
 
-    import numpy as num
     import time
     t0 = time.time()
     
     if quantities is None:
         quantities = domain.conserved_quantities
 
+    # With contiguous quantity storage pack and unpack all the quantities
+    # at once
+    block = domain.get_quantity_block('centroid_values', quantities)
+
     # update of non-local ghost cells by copying full cell data into the
     # Xout buffer arrays
+    pack_send_buffers(domain, quantities, block)
 
-    #iproc == domain.processor
+    # Do all the comuunication using isend/irecv via the buffers in the
+    # full_send_dict and ghost_recv_dict
+    from anuga.parallel import mpiextras
 
-    #Setup send buffer arrays for sending full data to other processors
-    for send_proc in domain.full_send_dict:
-        Idf  = domain.full_send_dict[send_proc][0]
-        Xout = domain.full_send_dict[send_proc][2]
+    mpiextras.send_recv_via_dicts(domain.full_send_dict,domain.ghost_recv_dict)
 
-        for i, q in enumerate(quantities):
-            #print 'Store send data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            Xout[:,i] = num.take(Q_cv, Idf)
+    # Now copy data from receive buffers to the domain
+    unpack_recv_buffers(domain, quantities, block)
 
+    domain.communication_time += time.time()-t0
 
 
+def start_ghosts_asynchronous(domain):
+    """Start the update of the conserved quantities in the ghost cells,
+    completed by finish_ghosts_asynchronous. The full cells may be changed
+    in between, but the ghost cells must not be used.
+    """
 
+    import time
+    t0 = time.time()
 
+    block = domain.get_quantity_block('centroid_values')
+    pack_send_buffers(domain, domain.conserved_quantities, block)
 
-    # Do all the comuunication using isend/irecv via the buffers in the
-    # full_send_dict and ghost_recv_dict
     from anuga.parallel import mpiextras
 
-    mpiextras.send_recv_via_dicts(domain.full_send_dict,domain.ghost_recv_dict)
+    mpiextras.start_send_recv_via_dicts(domain.full_send_dict,
+                                        domain.ghost_recv_dict)
 
-#
-#    if pypar.rank() == 0:
-#        print 'After commun 0'
-#        pprint(domain.ghost_recv_dict)
-#
-#    if pypar.rank() == 1:
-#        print 'After commun 1'
-#        pprint(domain.ghost_recv_dict)
+    domain.communication_time += time.time()-t0
 
-    # Now copy data from receive buffers to the domain
-    for recv_proc in domain.ghost_recv_dict:
-        Idg  = domain.ghost_recv_dict[recv_proc][0]
-        X    = domain.ghost_recv_dict[recv_proc][2]
 
-        #print recv_proc
-        #print X
+def finish_ghosts_asynchronous(domain):
+    """Wait for the update started by start_ghosts_asynchronous and copy
+    the received values into the ghost cells
+    """
 
-        for i, q in enumerate(quantities):
-            #print 'Read receive data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            num.put(Q_cv, Idg, X[:,i])
+    import time
+    t0 = time.time()
 
+    from anuga.parallel import mpiextras
 
-    domain.communication_time += time.time()-t0
+    mpiextras.wait_send_recv_via_dicts()
 
+    block = domain.get_quantity_block('centroid_values')
+    unpack_recv_buffers(domain, domain.conserved_quantities, block)
 
+    domain.communication_time += time.time()-t0
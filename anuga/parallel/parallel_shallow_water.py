@@ -20,7 +20,9 @@ import anuga.utilities.parallel_abstraction as pypar
 #from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
 
 import numpy as num
+import time
 from os.path import join
+from anuga.config import netcdf_mode_w
 
 
 #Import matplotlib
@@ -29,6 +31,18 @@ from os.path import join
 
 class Parallel_domain(Domain):
 
+    # Attributes, besides the arrays, describing the partition of the mesh.
+    # They are replaced when the domain is rebalanced (see set_rebalancing).
+    partition_attributes = ['mesh', 'boundary', 'boundary_enumeration',
+                            'boundary_length', 'tag_boundary_cells',
+                            'number_of_triangles', 'number_of_nodes',
+                            'number_of_elements', 'number_of_full_nodes',
+                            'number_of_full_triangles',
+                            'number_of_full_nodes_tmp',
+                            'number_of_full_triangles_tmp',
+                            'full_send_dict', 'ghost_recv_dict',
+                            'overlap_triangles', 'persistent_requests']
+
     def __init__(self, coordinates, vertices,
                  boundary=None,
                  full_send_dict=None,
@@ -44,7 +58,8 @@ class Parallel_domain(Domain):
                  p2s_map=None, #jj added this
                  tri_l2g = None, ## SR added this
                  node_l2g = None, #): ## SR added this
-                 ghost_layer_width = 2): ## SR added this
+                 ghost_layer_width = 2, ## SR added this
+                 tri_halo_level = None):
 
 
 
@@ -106,6 +121,27 @@ class Parallel_domain(Domain):
 
         self.ghost_counter = 0
 
+        # Communication of ghost cells and timesteps
+        # (see set_communication_backend)
+        self.communication_backend = 'pypar'
+        self.persistent_requests = None
+
+        # Overlap of the ghost cell update with the computation
+        # (see set_overlap_communication)
+        self.tri_halo_level = tri_halo_level
+        self.overlap_communication = False
+        self.overlap_triangles = None
+        self.ghost_update_pending = False
+
+        # Repartitioning when the work becomes unbalanced
+        # (see set_rebalancing)
+        self.rebalancing = False
+        self.rebalance_threshold = 1.2
+        self.rebalance_step = 1
+        self.rebalance_wet_weight = None
+        self.compute_time = 0.0
+        self.number_of_rebalances = 0
+
 
     def set_name(self, name):
         """Assign name based on processor number 
@@ -125,11 +161,233 @@ class Parallel_domain(Domain):
         return self.global_name
 
 
+    def set_communication_backend(self, backend='pypar'):
+        """Set how ghost cells and timesteps are communicated.
+
+        'pypar' uses isend/irecv set up at each step by mpiextras and the
+        pypar allreduce. 'mpi4py' uses persistent requests bound to the
+        communication buffers and an mpi4py Allreduce, and needs mpi4py.
+        All processors must use the same backend.
+        """
+
+        msg = "Communication backend must be either 'pypar' or 'mpi4py'"
+        assert backend in ['pypar', 'mpi4py'], msg
+
+        if backend == 'mpi4py':
+            from anuga.parallel import mpi4py_communications
+            if not mpi4py_communications.mpi4py_available:
+                raise Exception('The mpi4py communication backend needs mpi4py')
+
+        if self.persistent_requests is not None:
+            from anuga.parallel import mpi4py_communications
+            mpi4py_communications.free_persistent_requests(self)
+
+        self.communication_backend = backend
+
+    def get_communication_backend(self):
+        """Get how ghost cells and timesteps are communicated.
+        """
+
+        return self.communication_backend
+
+    def set_overlap_communication(self, flag=True):
+        """Overlap the update of the ghost cells at the end of each
+        timestep with the computation of the next timestep.
+
+        The exchange of the ghost values is started, the triangles away
+        from the ghost triangles (see build_local_halo_levels in
+        distribute_mesh) are extrapolated and the fluxes across their
+        edges computed, and then the exchange is completed and the
+        triangles next to the ghost triangles are processed. The results
+        are identical to those of the standard evolve.
+
+        Only supported for the discontinuous flow algorithms with euler or
+        rk2 timestepping, and neither fused timestepping nor active cells.
+        """
+
+        if flag and self.compute_fluxes_method != 'DE':
+            msg = 'Overlapped communication only supported for discontinuous flow algorithms'
+            raise Exception(msg)
+
+        if flag and (self.fused_timestepping or self.use_active_cells):
+            msg = 'Overlapped communication not supported with fused timestepping or active cells'
+            raise Exception(msg)
+
+        self.overlap_communication = flag
+
+    def get_overlap_communication(self):
+        """Get flag showing whether the ghost cell update is overlapped
+        with the computation.
+        """
+
+        return self.overlap_communication
+
+    def set_rebalancing(self, flag=True, threshold=1.2, rebalance_step=1,
+                        wet_weight=None):
+        """Repartition the domain during evolve when the work of the
+        processors becomes unbalanced.
+
+        Every rebalance_step yieldsteps the compute time of the processors
+        (the wall time of the timesteps less the time spent communicating)
+        is compared. If the largest is more than threshold times the mean,
+        the global mesh is partitioned again with the wet triangles
+        weighted wet_weight times the dry ones, and the triangles are moved
+        to their new processors (see anuga.parallel.rebalance).
+
+        The sww file must be a single file (see set_sww_collective), and
+        the fractional step operators must support rebalancing (see
+        Operator.rebalance_safe).
+        """
+
+        from anuga.parallel import rebalance
+
+        if flag:
+            rebalance.check_rebalance_safe(self)
+
+        if wet_weight is None:
+            wet_weight = rebalance.wet_weight
+
+        assert threshold >= 1.0, 'The threshold must be at least 1'
+        assert rebalance_step >= 1, 'The rebalance step must be at least 1'
+
+        self.rebalancing = flag
+        self.rebalance_threshold = threshold
+        self.rebalance_step = rebalance_step
+        self.rebalance_wet_weight = wet_weight
+
+    def get_rebalancing(self):
+        """Get flag showing whether the domain is repartitioned during
+        evolve.
+        """
+
+        return self.rebalancing
+
+    def get_compute_imbalance(self):
+        """Return the ratio of the largest to the mean compute time of
+        the processors since the last call, on all processors.
+        """
+
+        # The compute times of all processors by one allreduce
+        times = num.zeros(self.numproc, num.float)
+        times[self.processor] = self.compute_time
+
+        if self.numproc > 1:
+            import anuga.parallel.pypar_ext as par_exts
+
+            local_times = times
+            times = num.zeros_like(local_times)
+            par_exts.allreduce(local_times, pypar.SUM, buffer=times,
+                               bypass=True)
+
+        if num.mean(times) > 0.0:
+            imbalance = num.max(times)/num.mean(times)
+        else:
+            imbalance = 1.0
+
+        self.compute_time = 0.0
+
+        return imbalance
+
+    def rebalance(self, weights=None, verbose=False):
+        """Repartition the domain with the weights of the triangles (by
+        default from the wet triangles) and move the triangles to their
+        new processors. Must be called on all processors.
+        """
+
+        from anuga.parallel import rebalance
+
+        if weights is None and self.rebalance_wet_weight is not None:
+            weights = rebalance.get_triangle_weights(self,
+                                                     self.rebalance_wet_weight)
+
+        rebalance.rebalance(self, weights, verbose)
+
+        self.number_of_rebalances += 1
+
+    def evolve(self, yieldstep=None, finaltime=None, duration=None,
+               skip_initial_step=False):
+        """Evolve as Domain.evolve, measuring the compute time of the
+        timesteps and rebalancing the domain at yieldsteps if requested
+        (see set_rebalancing). The update of the ghost cells is complete
+        at each yield and when evolve returns.
+        """
+
+        from anuga.config import epsilon
+
+        yieldsteps = 0
+
+        t0 = time.time()
+        c0 = self.communication_time + self.communication_reduce_time
+
+        try:
+            for t in Domain.evolve(self, yieldstep=yieldstep,
+                                   finaltime=finaltime, duration=duration,
+                                   skip_initial_step=skip_initial_step):
+
+                self.finish_update_ghosts()
+
+                c1 = self.communication_time + self.communication_reduce_time
+                self.compute_time += (time.time() - t0) - (c1 - c0)
+
+                yield(t)
+
+                # Not at the initial and final yields
+                if self.rebalancing and self.number_of_steps > 0 and \
+                       (self.finaltime is None or
+                        self.get_time() < self.finaltime - epsilon):
+                    yieldsteps += 1
+                    if yieldsteps % self.rebalance_step == 0 and \
+                           self.get_compute_imbalance() > self.rebalance_threshold:
+                        self.rebalance()
+
+                t0 = time.time()
+                c0 = self.communication_time + self.communication_reduce_time
+        finally:
+            # No communication is left pending (eg before finalize)
+            self.finish_update_ghosts()
+
+    def get_overlap_triangles(self):
+        """Return the flags of the interior triangles, whose fluxes are
+        computed before the ghost values are received, and the triangles
+        converted, checked and extrapolated before and after the ghost
+        values are received (see extrapolate_second_order_edge_sw).
+        """
+
+        if self.overlap_triangles is not None:
+            return self.overlap_triangles
+
+        from anuga.parallel.distribute_mesh import build_local_halo_levels
+        from anuga.parallel.distribute_mesh import halo_levels
+
+        if self.tri_halo_level is None:
+            self.tri_halo_level = build_local_halo_levels(self.triangles,
+                                        self.number_of_full_triangles_tmp)
+
+        level = self.tri_halo_level
+
+        # The interior triangles must not have boundary edges, as their
+        # fluxes are computed before the boundary values are updated
+        interior = (level == halo_levels) & num.all(self.neighbours >= 0, axis=1)
+
+        def ids(flags):
+            return num.flatnonzero(flags).astype(num.int)
+
+        self.overlap_triangles = [interior.astype(num.int),
+                                  [ids(level >= 1), ids(level >= 2), ids(level >= 3)],
+                                  [ids(level <= 3), ids(level <= 1), ids(level <= 2)]]
+
+        return self.overlap_triangles
+
     def update_timestep(self, yieldstep, finaltime):
         """Calculate local timestep
         """
 
-        generic_comms.communicate_flux_timestep(self, yieldstep, finaltime)
+        if self.communication_backend == 'mpi4py':
+            from anuga.parallel import mpi4py_communications
+            mpi4py_communications.communicate_flux_timestep(self, yieldstep,
+                                                            finaltime)
+        else:
+            generic_comms.communicate_flux_timestep(self, yieldstep, finaltime)
 
         Domain.update_timestep(self, yieldstep, finaltime)
 
@@ -139,14 +397,177 @@ class Parallel_domain(Domain):
         """We must send the information from the full cells and
         receive the information for the ghost cells
         """
+
+        self.finish_update_ghosts()
             
-        generic_comms.communicate_ghosts_asynchronous(self, quantities)
+        if self.communication_backend == 'mpi4py':
+            from anuga.parallel import mpi4py_communications
+            mpi4py_communications.communicate_ghosts_persistent(self,
+                                                                quantities)
+        else:
+            generic_comms.communicate_ghosts_asynchronous(self, quantities)
         #generic_comms.communicate_ghosts_blocking(self)
 
+    def start_update_ghosts(self):
+        """Start the update of the ghost cells at the end of a timestep.
+        With overlapped communication it is completed in the next timestep
+        (or by distribute_to_vertices_and_edges or update_ghosts).
+        """
+
+        if not (self.overlap_communication and
+                self.compute_fluxes_method == 'DE' and
+                not self.fused_timestepping and
+                not self.use_active_cells and
+                self.get_timestepping_method() in ['euler', 'rk2']):
+            self.update_ghosts()
+            return
+
+        if self.communication_backend == 'mpi4py':
+            from anuga.parallel import mpi4py_communications
+            mpi4py_communications.start_ghosts_persistent(self)
+        else:
+            generic_comms.start_ghosts_asynchronous(self)
+
+        self.ghost_update_pending = True
+
+    def finish_update_ghosts(self):
+        """Complete the update of the ghost cells started by
+        start_update_ghosts, if any
+        """
+
+        if not self.ghost_update_pending:
+            return
+
+        if self.communication_backend == 'mpi4py':
+            from anuga.parallel import mpi4py_communications
+            mpi4py_communications.finish_ghosts_persistent(self)
+        else:
+            generic_comms.finish_ghosts_asynchronous(self)
+
+        self.ghost_update_pending = False
+
+    def distribute_to_vertices_and_edges(self):
+
+        self.finish_update_ghosts()
+
+        Domain.distribute_to_vertices_and_edges(self)
+
+    def update_extrema(self):
+
+        if self.quantities_to_be_monitored is not None:
+            self.finish_update_ghosts()
+
+        Domain.update_extrema(self)
+
+    def distribute_and_compute_fluxes_overlapped(self):
+        """Extrapolate, update the boundary values and compute the fluxes
+        (as distribute_to_vertices_and_edges, update_boundary and
+        compute_fluxes) while the ghost values are received.
+        """
+
+        from anuga.shallow_water.swDE1_domain_ext import protect_new
+        from anuga.shallow_water.swDE1_domain_ext import \
+             extrapolate_second_order_edge_sw as extrapol2
+        from anuga.shallow_water.swDE1_domain_ext import \
+             compute_fluxes_ext_central as compute_fluxes_ext
+
+        interior, before, after = self.get_overlap_triangles()
+
+        N = len(self)
+        Nfull = self.number_of_full_triangles_tmp
+        timestep = self.evolve_max_timestep
+
+        # Triangles away from the ghost triangles
+        protect_new(self, 0, Nfull)
+        extrapol2(self, *before)
+        compute_fluxes_ext(self, timestep, interior, 1)
+
+        self.finish_update_ghosts()
+
+        # Triangles next to the ghost triangles
+        protect_new(self, Nfull, N)
+        extrapol2(self, *after)
+        self.update_boundary()
+        self.flux_timestep = compute_fluxes_ext(self, timestep, interior, 2)
+
+    def evolve_one_euler_step(self, yieldstep, finaltime):
+        """One Euler Time Step
+
+        Overlapped with the update of the ghost cells if started by
+        start_update_ghosts.
+        """
+
+        if not self.ghost_update_pending:
+            Domain.evolve_one_euler_step(self, yieldstep, finaltime)
+            return
+
+        self.distribute_and_compute_fluxes_overlapped()
+
+        self.compute_forcing_terms()
+
+        self.update_timestep(yieldstep, finaltime)
+
+        if self.max_flux_update_frequency is not 1:
+            self.compute_flux_update_frequency()
+
+        self.update_conserved_quantities()
+
+    def evolve_one_rk2_step(self, yieldstep, finaltime):
+        """One 2nd order RK timestep
+
+        Both substeps are overlapped with the update of the ghost cells if
+        started by start_update_ghosts.
+        """
+
+        if not self.ghost_update_pending:
+            Domain.evolve_one_rk2_step(self, yieldstep, finaltime)
+            return
+
+        self.backup_conserved_quantities()
+
+        # First euler step
+        self.distribute_and_compute_fluxes_overlapped()
+
+        self.compute_forcing_terms()
+
+        self.update_timestep(yieldstep, finaltime)
+
+        self.update_conserved_quantities()
+
+        self.set_time(self.get_time() + self.timestep)
+
+        # Second euler step using the same timestep
+        if self.ghost_layer_width < 4:
+            self.start_update_ghosts()
+            self.distribute_and_compute_fluxes_overlapped()
+        else:
+            self.distribute_to_vertices_and_edges()
+            self.update_boundary()
+            self.compute_fluxes()
+
+        self.compute_forcing_terms()
+
+        self.update_conserved_quantities()
+
+        # Combine steps
+        self.saxpy_conserved_quantities(0.5, 0.5)
+
+        if self.max_flux_update_frequency is not 1:
+            self.compute_flux_update_frequency()
+
+    def __getstate__(self):
+        """Do not pickle the persistent requests, which are set up again
+        for the unpickled buffers
+        """
+
+        state = Domain.__getstate__(self)
+        state['persistent_requests'] = None
+
+        return state
+
     def apply_fractional_steps(self):
 
-        for operator in self.fractional_step_operators:
-            operator()
+        Domain.apply_fractional_steps(self)
 
         # PETE: Make sure that there are no deadlocks here
 
@@ -154,7 +575,30 @@ class Parallel_domain(Domain):
 
 
 
-    def sww_merge(self, verbose=False, delete_old=False):
+    def initialise_storage(self, mode=netcdf_mode_w):
+        """Create and initialise self.writer, storing a single sww file
+        of the global mesh if requested (see set_sww_collective)
+        """
+
+        if self.get_sww_collective():
+            from anuga.parallel.collective_sww import Collective_SWW_file
+
+            self.writer = Collective_SWW_file(self, mode=mode)
+            if mode[0] == 'w':
+                self.writer.store_connectivity()
+        else:
+            Domain.initialise_storage(self, mode)
+
+    def sww_merge(self, verbose=False, delete_old=False, processes=1,
+                  block_size=None):
+        """Merge the sww files of all processors on processor 0, see
+        anuga.utilities.sww_merge.sww_merge_parallel for processes and
+        block_size. Nothing to merge if a single sww file is stored
+        (see set_sww_collective).
+        """
+
+        if self.get_sww_collective():
+            return
 
         # make sure all the computations have finished
 
@@ -166,7 +610,8 @@ class Parallel_domain(Domain):
 
             global_name = join(self.get_datadir(),self.get_global_name())
             
-            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old)
+            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old,
+                                     processes, block_size)
 
         # make sure all the merge completes on processor 0 before other
         # processors complete (like when finalize is forgotten in main script)
@@ -178,6 +623,42 @@ class Parallel_domain(Domain):
         if self.processor == 0:
             Domain.write_time(self)
 
+    def get_profile(self):
+        """Return the evolve profile combined over all processors (see
+        evolve_profiler.aggregate_profiles) on processor 0, and the local
+        profile on the other processors. Must be called by all processors.
+        """
+
+        from anuga.abstract_2d_finite_volumes.evolve_profiler \
+             import aggregate_profiles
+
+        profile = Domain.get_profile(self)
+
+        if self.numproc == 1:
+            return profile
+
+        if self.processor == 0:
+            profiles = [profile]
+            for p in range(1, self.numproc):
+                profiles.append(pypar.receive(p))
+            return aggregate_profiles(profiles)
+        else:
+            pypar.send(profile, 0)
+            return profile
+
+    def write_profile(self, filename):
+        """Write the evolve profile combined over all processors to
+        filename from processor 0. Must be called by all processors.
+        """
+
+        from anuga.abstract_2d_finite_volumes.evolve_profiler \
+             import write_profile
+
+        profile = self.get_profile()
+
+        if self.processor == 0:
+            write_profile(profile, filename)
+
 
 # =======================================================================
 # PETE: NEW METHODS FOR FOR PARALLEL STRUCTURES. Note that we assume the 
@@ -707,6 +707,20 @@ class Parallel_Structure_operator(anuga.Operator):
         return message
 
 
+    def get_state(self):
+        """Return the statistics of the structure, stored in binary
+        checkpoints
+        """
+
+        return {'accumulated_flow': self.accumulated_flow,
+                'discharge': self.discharge,
+                'discharge_abs_timemean': self.discharge_abs_timemean,
+                'velocity': self.velocity,
+                'outlet_depth': self.outlet_depth,
+                'delta_total_energy': self.delta_total_energy,
+                'driving_energy': self.driving_energy}
+
+
     def get_inlets(self):
         return self.inlets
         
@@ -0,0 +1,392 @@
+"""Rebalancing of the partition of a parallel domain during a run.
+
+METIS partitions the mesh once, before the run, giving each processor the
+same number of triangles. During a flood most of the work is in the wet
+triangles, so the processors holding the flooded part of the domain
+become the slowest and the others wait for them in the timestep
+reduction. rebalance repartitions the global mesh with the wet triangles
+weighted more than the dry ones (see get_triangle_weights) and moves the
+triangles, with the values of the quantities, the ghost cell
+communication pattern, the boundary conditions and the fractional step
+operators, to their new processors. The Parallel_domain objects are
+updated in place, so the run continues as if it had been distributed
+that way (see Parallel_domain.set_rebalancing).
+
+The repartitioning is done on processor 0, which gathers the full
+triangles of all processors in the global numbering of tri_l2g and
+node_l2g, partitions them with Sequential_distribute and sends each
+processor its new submesh and the values of its new triangles.
+"""
+
+import numpy as num
+
+import anuga.utilities.parallel_abstraction as pypar
+
+from anuga.abstract_2d_finite_volumes.region import Region
+
+
+# Default weight of a wet triangle relative to a dry one
+wet_weight = 10
+
+
+def get_triangle_weights(domain, wet_weight=wet_weight):
+    """Return the (integer) cost of each triangle of domain, 1 for dry and
+    wet_weight for wet triangles
+    """
+
+    stage = domain.quantities['stage'].centroid_values
+    elevation = domain.quantities['elevation'].centroid_values
+
+    wet = (stage - elevation) > domain.minimum_allowed_height
+
+    return num.where(wet, wet_weight, 1).astype(num.int)
+
+
+def check_rebalance_safe(domain):
+    """Raise an exception if domain uses a feature which cannot be moved
+    to a new partition during a run
+    """
+
+    from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+         import File_boundary
+    from anuga.shallow_water.boundaries import Field_boundary
+
+    if domain.store and not domain.get_sww_collective():
+        msg = 'Rebalancing changes the mesh of each processor and needs '
+        msg += 'a single sww file (see set_sww_collective)'
+        raise Exception(msg)
+
+    if domain.checkpoint and domain.checkpoint_format == 'binary':
+        msg = 'Binary checkpoints can not be restored after rebalancing, '
+        msg += 'use pickle checkpoints'
+        raise Exception(msg)
+
+    if len(domain.riverwallData.names) > 0:
+        msg = 'Rebalancing is not implemented for riverwalls'
+        raise Exception(msg)
+
+    for operator in domain.fractional_step_operators:
+        if not operator.rebalance_safe():
+            msg = 'Operator %s can not be moved to a new partition' \
+                  % operator.__class__.__name__
+            raise Exception(msg)
+
+    for B in domain.boundary_map.values():
+        if isinstance(B, (File_boundary, Field_boundary)):
+            msg = 'Rebalancing is not implemented for %s' \
+                  % B.__class__.__name__
+            raise Exception(msg)
+
+
+def _get_quantity_fields(Q):
+    """Return the names of the arrays of quantity Q moved with its
+    triangles. The vertex and edge values only if they are allocated.
+    """
+
+    fields = ['centroid_values']
+    for field in ['vertex_values', 'edge_values']:
+        if field in Q.__dict__:
+            fields.append(field)
+
+    return fields
+
+
+def get_partition_contribution(domain, weights):
+    """Return the full triangles of domain in the global numbering, with
+    their weights, the values of the quantities and the triangle data of
+    the fractional step operators
+    """
+
+    Nfull = domain.number_of_full_triangles_tmp
+
+    tri_l2g = num.array(domain.tri_l2g, num.int)
+    node_l2g = num.array(domain.node_l2g, num.int)
+
+    contribution = {}
+    contribution['tri_gids'] = tri_l2g[:Nfull]
+    contribution['triangles'] = node_l2g[domain.triangles[:Nfull]]
+    contribution['node_gids'] = node_l2g
+    contribution['nodes'] = domain.nodes
+    contribution['weights'] = num.array(weights, num.int)[:Nfull]
+
+    boundary = {}
+    for (vol_id, edge_id), tag in domain.boundary.items():
+        if vol_id < Nfull and tag != 'ghost':
+            boundary[(tri_l2g[vol_id], edge_id)] = tag
+    contribution['boundary'] = boundary
+
+    values = contribution['values'] = {}
+    for name, Q in domain.quantities.items():
+        values[name] = {}
+        for field in _get_quantity_fields(Q):
+            values[name][field] = getattr(Q, field)[:Nfull]
+
+    operators = contribution['operators'] = []
+    for operator in domain.fractional_step_operators:
+        indices = None
+        if isinstance(operator, Region) and operator.indices is not None:
+            indices = num.array(operator.indices, num.int)
+            indices = tri_l2g[indices[indices < Nfull]]
+
+        state = {}
+        for key, value in operator.get_state().items():
+            if isinstance(value, num.ndarray) and len(value) == len(domain):
+                state[key] = value[:Nfull]
+
+        operators.append({'indices': indices, 'state': state})
+
+    return contribution
+
+
+def repartition(contributions, numprocs, parameters=None):
+    """Partition the global mesh assembled from the contributions of all
+    processors with their weights, and return the submesh and the values
+    to send to each processor
+    """
+
+    from anuga import Domain
+    from anuga.parallel.sequential_distribute import Sequential_distribute
+
+    number_of_triangles = sum([len(c['tri_gids']) for c in contributions])
+    number_of_nodes = max([num.max(c['node_gids']) for c in contributions]) + 1
+
+    #------------------------------------------------------------------------
+    # Global mesh, in the numbering of tri_l2g and node_l2g
+    #------------------------------------------------------------------------
+    triangles = num.zeros((number_of_triangles, 3), num.int)
+    nodes = num.zeros((number_of_nodes, 2), num.float)
+    weights = num.zeros(number_of_triangles, num.int)
+    boundary = {}
+    for c in contributions:
+        triangles[c['tri_gids']] = c['triangles']
+        nodes[c['node_gids']] = c['nodes']
+        weights[c['tri_gids']] = c['weights']
+        boundary.update(c['boundary'])
+
+    domain = Domain(nodes, triangles, boundary)
+
+    partition = Sequential_distribute(domain, parameters=parameters)
+    partition.distribute(numprocs, weights=weights)
+
+    #------------------------------------------------------------------------
+    # Global values of the quantities and of the operators
+    #------------------------------------------------------------------------
+    values = {}
+    for c in contributions:
+        for name in c['values']:
+            for field, value in c['values'][name].items():
+                if (name, field) not in values:
+                    shape = (number_of_triangles,) + value.shape[1:]
+                    values[name, field] = num.zeros(shape, num.float)
+                values[name, field][c['tri_gids']] = value
+
+    number_of_operators = len(contributions[0]['operators'])
+    msg = 'All processors must have the same fractional step operators'
+    for c in contributions:
+        assert len(c['operators']) == number_of_operators, msg
+
+    operators = []
+    for i in range(number_of_operators):
+        indices = None
+        state = {}
+        for c in contributions:
+            operator = c['operators'][i]
+            if operator['indices'] is not None:
+                if indices is None:
+                    indices = operator['indices']
+                else:
+                    indices = num.concatenate((indices, operator['indices']))
+            for key, value in operator['state'].items():
+                if key not in state:
+                    state[key] = num.zeros((number_of_triangles,) +
+                                           value.shape[1:], value.dtype)
+                state[key][c['tri_gids']] = value
+        operators.append((indices, state))
+
+    #------------------------------------------------------------------------
+    # The submesh and the values of its triangles for each processor
+    #------------------------------------------------------------------------
+    payloads = []
+    for p in range(numprocs):
+        submesh = partition.extract_submesh(p)
+        tri_l2g = submesh[0]['tri_l2g']
+
+        payload_values = {}
+        for (name, field), value in values.items():
+            payload_values.setdefault(name, {})[field] = value[tri_l2g]
+
+        payload_operators = []
+        for indices, state in operators:
+            if indices is not None:
+                indices = num.flatnonzero(num.in1d(tri_l2g, indices))
+                if len(indices) == 0:
+                    indices = []
+            payload_state = {}
+            for key, value in state.items():
+                payload_state[key] = value[tri_l2g]
+            payload_operators.append({'indices': indices,
+                                      'state': payload_state})
+
+        payloads.append({'submesh': submesh,
+                         'values': payload_values,
+                         'operators': payload_operators})
+
+    return payloads
+
+
+def migrate(domain, payload):
+    """Replace the partition of the Parallel_domain domain by the new
+    submesh of payload (from repartition) and set the values of the
+    quantities and operators on its triangles
+    """
+
+    from anuga import Quantity
+    from anuga.parallel.parallel_shallow_water import Parallel_domain
+
+    kwargs, points, vertices, boundary = payload['submesh'][:4]
+
+    # The global mesh of repartition has no geo reference
+    kwargs = dict(kwargs, geo_reference=domain.geo_reference)
+
+    new_domain = Parallel_domain(points, vertices, boundary, **kwargs)
+
+    # Arrays of the old partition, to find the objects referring to them
+    old_arrays = {}
+    for key, value in domain.__dict__.items():
+        if isinstance(value, num.ndarray):
+            old_arrays[id(value)] = (value, None, key)
+    for name, Q in domain.quantities.items():
+        for key, value in Q.__dict__.items():
+            if isinstance(value, num.ndarray):
+                old_arrays[id(value)] = (value, name, key)
+
+    contiguous = domain.get_contiguous_quantity_storage()
+    domain.quantity_storage = None
+
+    #------------------------------------------------------------------------
+    # Mesh, communication pattern and work arrays of the new partition.
+    # The quantity objects are kept, with the arrays of the new partition.
+    #------------------------------------------------------------------------
+    for key, value in new_domain.__dict__.items():
+        if isinstance(value, num.ndarray) or \
+               key in Parallel_domain.partition_attributes:
+            domain.__dict__[key] = value
+
+    for name, Q in domain.quantities.items():
+        if name in new_domain.quantities:
+            new_Q = new_domain.quantities[name]
+        else:
+            new_Q = Quantity(new_domain, name=name, register=True)
+
+        for key, value in Q.__dict__.items():
+            if isinstance(value, num.ndarray):
+                del Q.__dict__[key]
+        for key, value in new_Q.__dict__.items():
+            if isinstance(value, num.ndarray):
+                Q.__dict__[key] = value
+        Q.boundary_length = new_Q.boundary_length
+
+        for field, value in payload['values'][name].items():
+            getattr(Q, field)[:] = value
+
+    if contiguous:
+        domain.set_contiguous_quantity_storage()
+
+    if domain.monitor_polygon is not None:
+        from anuga.geometry.polygon import inside_polygon
+        points = domain.get_centroid_coordinates(absolute=True)
+        domain.monitor_indices = inside_polygon(points, domain.monitor_polygon)
+
+    #------------------------------------------------------------------------
+    # Boundary conditions and operators refer to the new arrays
+    #------------------------------------------------------------------------
+    def rebind(obj):
+        for key, value in obj.__dict__.items():
+            if isinstance(value, num.ndarray) and id(value) in old_arrays:
+                _, name, array_key = old_arrays[id(value)]
+                if name is None:
+                    obj.__dict__[key] = getattr(domain, array_key)
+                else:
+                    obj.__dict__[key] = getattr(domain.quantities[name],
+                                                array_key)
+
+    for B in domain.boundary_map.values():
+        if B is not None:
+            rebind(B)
+    domain.set_boundary(domain.boundary_map)
+
+    for operator, values in zip(domain.fractional_step_operators,
+                                payload['operators']):
+        rebind(operator)
+
+        if isinstance(operator, Region):
+            if operator.indices is not None:
+                operator.indices = values['indices']
+            if operator.indices is None:
+                operator.full_indices = num.where(domain.tri_full_flag == 1)[0]
+            elif len(operator.indices) == 0:
+                operator.full_indices = []
+            else:
+                operator.full_indices = operator.indices[
+                    domain.tri_full_flag[operator.indices] == 1]
+
+        if values['state']:
+            operator.set_state(values['state'])
+
+        operator.update_partition()
+
+
+def rebalance(domain, weights=None, verbose=False):
+    """Repartition the Parallel_domain domain over all processors with
+    the weights of its triangles (by default from get_triangle_weights)
+    and move the triangles to their new processors. Collective: must be
+    called on all processors, between timesteps.
+    """
+
+    from anuga.config import netcdf_mode_a
+
+    check_rebalance_safe(domain)
+
+    if weights is None:
+        weights = get_triangle_weights(domain)
+
+    domain.finish_update_ghosts()
+
+    if domain.communication_backend == 'mpi4py':
+        from anuga.parallel import mpi4py_communications
+        mpi4py_communications.free_persistent_requests(domain)
+
+    myid = domain.processor
+    numprocs = domain.numproc
+
+    contribution = get_partition_contribution(domain, weights)
+
+    if myid == 0:
+        contributions = [contribution]
+        for p in range(1, numprocs):
+            contributions.append(pypar.receive(p))
+
+        parameters = {'ghost_layer_width': domain.ghost_layer_width}
+        payloads = repartition(contributions, numprocs, parameters)
+
+        if verbose:
+            print 'Rebalanced triangles per processor:',
+            print [payload['submesh'][0]['number_of_full_triangles']
+                   for payload in payloads]
+
+        for p in range(1, numprocs):
+            pypar.send(payloads[p], p)
+        payload = payloads[0]
+    else:
+        pypar.send(contribution, 0)
+        payload = pypar.receive(0)
+
+    # The sww file is continued with the maps of the new partition
+    writer = getattr(domain, 'writer', None)
+    if domain.store and writer is not None:
+        writer.close()
+
+    migrate(domain, payload)
+
+    if domain.store and writer is not None:
+        domain.initialise_storage(mode=netcdf_mode_a)
@@ -33,7 +33,10 @@ class Sequential_distribute(object):
         self.parameters = parameters
 
 
-    def distribute(self, numprocs=1):
+    def distribute(self, numprocs=1, weights=None):
+        """Partition the domain into numprocs submeshes, balancing the
+        weights of the triangles if given (see pmesh_divide_metis_helper)
+        """
 
         self.numprocs = numprocs
         
@@ -71,7 +74,7 @@ class Sequential_distribute(object):
 
         new_nodes, new_triangles, new_boundary, triangles_per_proc, quantities, \
                s2p_map, p2s_map = \
-               pmesh_divide_metis_with_map(domain, numprocs)
+               pmesh_divide_metis_with_map(domain, numprocs, weights)
 
 
         # Build the mesh that should be assigned to each processor,
@@ -111,7 +114,8 @@ class Sequential_distribute(object):
         
         points, vertices, boundary, quantities, \
             ghost_recv_dict, full_send_dict, \
-            tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width =\
+            tri_map, node_map, tri_l2g, node_l2g, ghost_layer_width, \
+            tri_halo_level =\
               extract_submesh(submesh, triangles_per_proc, p2s_map, p)
               
 
@@ -182,7 +186,8 @@ class Sequential_distribute(object):
                 'p2s_map':  p2s_map, ## jj added this
                 'tri_l2g':  tri_l2g, ## SR added this
                 'node_l2g':  node_l2g,
-                'ghost_layer_width':  ghost_layer_width}
+                'ghost_layer_width':  ghost_layer_width,
+                'tri_halo_level':  tri_halo_level}
 
 
         boundary_map = self.boundary_map
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+
+import numpy as num
+
+from anuga import rectangular_cross_domain
+from anuga.file.sww import SWW_file
+from anuga.file.netcdf import NetCDFFile
+from anuga.parallel.sequential_distribute import \
+     sequential_distribute_dump, sequential_distribute_load_pickle_file
+from anuga.parallel.collective_sww import Collective_SWW_file, get_full_maps
+from anuga.utilities.sww_merge import sww_merge_parallel
+
+
+class Test_Collective_SWW(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['test_collective.sww', 'test_collective_single.sww']:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def create_domains(self, name, numprocs):
+        """Return the Parallel_domains of the partitions of a domain
+        """
+
+        domain = rectangular_cross_domain(6, 5)
+        domain.set_name(name)
+        sequential_distribute_dump(domain, numprocs)
+
+        domains = []
+        for p in range(numprocs):
+            pickle_name = '%s_P%d_%d.pickle' % (name, numprocs, p)
+            domains.append(sequential_distribute_load_pickle_file(pickle_name,
+                                                                  numprocs))
+            os.remove(pickle_name)
+
+        return domains
+
+    def test_get_full_maps(self):
+
+        domains = self.create_domains('test_collective', 3)
+
+        for smooth in [True, False]:
+            f_gids = []
+            g_vids = []
+            for domain in domains:
+                maps = get_full_maps(domain, smooth)
+                assert len(maps[0]) == len(maps[1])
+                assert len(maps[2]) == len(maps[3])
+                g_vids.append(maps[1])
+                f_gids.append(maps[3])
+
+            # Every global triangle is full on exactly one processor
+            f_gids = num.sort(num.concatenate(f_gids))
+            assert num.all(f_gids == num.arange(120))
+
+            g_vids = num.unique(num.concatenate(g_vids))
+            if smooth:
+                assert num.all(g_vids == num.arange(72))
+            else:
+                assert num.all(g_vids == num.arange(360))
+
+    def test_collective_sww(self):
+        """Check that the single file written from the contributions of all
+        processors is the merge of the sww files of the processors, writing
+        a timestep at a time or keeping the file open
+        """
+
+        for smooth in [True, False]:
+            domains = self.create_domains('test_collective', 3)
+
+            writers = []
+            for domain in domains:
+                if not smooth:
+                    domain.set_store_vertices_uniquely()
+                domain.set_store_centroids(True)
+                domain.set_sww_collective()
+                domain.set_sww_persistent(not smooth, flush_step=2)
+                domain.set_quantity('elevation', lambda x, y: -x)
+
+                writers.append(Collective_SWW_file(domain))
+
+            assert os.path.exists('test_collective.sww')
+            assert not writers[1].is_aggregator()
+
+            for i in range(5):
+                t = 0.5*i
+                for domain in domains:
+                    domain.set_time(t)
+                    domain.set_quantity('stage', lambda x, y: x + 2*y + t)
+                    domain.set_quantity('xmomentum', lambda x, y: x - y*t)
+
+                if i == 0:
+                    writers[0].store_global_connectivity(
+                        [w.get_local_connectivity() for w in writers])
+                    for domain in domains:
+                        domain.writer = SWW_file(domain)
+                        domain.writer.store_connectivity()
+
+                writers[0].store_global_timestep(
+                    [w.get_local_timestep() for w in writers])
+                for domain in domains:
+                    domain.writer.store_timestep()
+
+            writers[0].close()
+            for domain in domains:
+                domain.writer.close()
+
+            os.rename('test_collective.sww', 'test_collective_single.sww')
+            sww_merge_parallel('test_collective', 3, delete_old=True)
+
+            fid = NetCDFFile('test_collective_single.sww')
+            fid_merged = NetCDFFile('test_collective.sww')
+
+            assert len(fid.variables['volumes']) == 120
+            assert num.allclose(fid.variables['time'][:],
+                                [0.0, 0.5, 1.0, 1.5, 2.0])
+
+            for name in ['x', 'y', 'volumes', 'time', 'elevation',
+                         'elevation_c', 'stage', 'stage_c', 'stage_range',
+                         'xmomentum', 'xmomentum_c', 'ymomentum']:
+                assert num.all(fid.variables[name][:] ==
+                               fid_merged.variables[name][:]), name
+
+            for name in ['xllcorner', 'yllcorner', 'zone']:
+                assert getattr(fid, name) == getattr(fid_merged, name)
+
+            fid.close()
+            fid_merged.close()
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_Collective_SWW,'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
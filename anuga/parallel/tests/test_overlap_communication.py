@@ -0,0 +1,195 @@
+"""Test the overlap of the ghost cell update with the computation, on the
+partitions of a domain in a single process.
+"""
+
+import os
+import unittest
+import numpy as num
+
+from anuga import Domain, rectangular_cross_domain
+from anuga import Reflective_boundary, Dirichlet_boundary
+from anuga.parallel.sequential_distribute import sequential_distribute_dump
+from anuga.parallel.sequential_distribute import \
+     sequential_distribute_load_pickle_file
+from anuga.parallel.distribute_mesh import build_local_halo_levels, halo_levels
+
+
+class Test_overlap_communication(unittest.TestCase):
+    def setUp(self):
+        domain = rectangular_cross_domain(16, 12, len1=16.0, len2=12.0)
+        domain.set_name('test_overlap')
+        sequential_distribute_dump(domain, 2)
+
+    def tearDown(self):
+        for p in range(2):
+            os.remove('test_overlap_P2_%d.pickle' % p)
+
+    def create_domain(self, p=0):
+        """Return the Parallel_domain of partition p with a dam break
+        """
+
+        domain = sequential_distribute_load_pickle_file(
+                          'test_overlap_P2_%d.pickle' % p, 2)
+
+        domain.set_quantity('elevation', lambda x, y: -x/16.0 + 0.1*num.sin(y))
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', lambda x, y: num.where(x < 5.0, 0.5, -x/16.0))
+        domain.set_quantity('xmomentum', lambda x, y: num.where(x < 6.0, 0.1*y, 0.0))
+
+        Br = Reflective_boundary(domain)
+        Bd = Dirichlet_boundary([0.6, 0.1, 0.0])
+        domain.set_boundary({'left': Bd, 'right': Br, 'top': Br,
+                             'bottom': Br, 'ghost': None})
+
+        # Without the other processor the ghost cells are updated with
+        # their initial values and the timestep is the local one
+        ghosts = num.arange(domain.number_of_full_triangles_tmp, len(domain))
+        ghost_values = {}
+        for name in domain.conserved_quantities:
+            ghost_values[name] = domain.quantities[name].centroid_values[ghosts]
+
+        def update_ghosts(quantities=None):
+            domain.finish_update_ghosts()
+            for name in domain.conserved_quantities:
+                domain.quantities[name].centroid_values[ghosts] = \
+                                                         ghost_values[name]
+
+        domain.ghost_values = ghost_values
+        domain.update_ghosts = update_ghosts
+        domain.update_timestep = lambda yieldstep, finaltime: \
+                                 Domain.update_timestep(domain, yieldstep,
+                                                        finaltime)
+
+        return domain
+
+    def overlap_ghost_update(self, domain):
+        """Make the ghost cells of domain unusable from the start of the
+        ghost update until it is finished
+        """
+
+        ghosts = num.arange(domain.number_of_full_triangles_tmp, len(domain))
+
+        def start_update_ghosts():
+            for name in domain.conserved_quantities:
+                domain.quantities[name].centroid_values[ghosts] = num.nan
+            domain.ghost_update_pending = True
+
+        def finish_update_ghosts():
+            if domain.ghost_update_pending:
+                for name in domain.conserved_quantities:
+                    domain.quantities[name].centroid_values[ghosts] = \
+                                                  domain.ghost_values[name]
+                domain.ghost_update_pending = False
+
+        domain.start_update_ghosts = start_update_ghosts
+        domain.finish_update_ghosts = finish_update_ghosts
+
+        domain.set_overlap_communication()
+
+    def test_halo_levels(self):
+
+        for p in range(2):
+            domain = self.create_domain(p)
+            level = domain.tri_halo_level
+            Nfull = domain.number_of_full_triangles_tmp
+
+            assert num.all(level == build_local_halo_levels(domain.triangles,
+                                                            Nfull))
+            assert num.all(level[Nfull:] == 0)
+            assert num.all(level[:Nfull] > 0)
+            assert num.any(level == halo_levels)
+
+            # A triangle on level l is at least l triangles away from
+            # the ghost triangles
+            for k in range(Nfull):
+                for n in domain.neighbours[k]:
+                    if n >= 0:
+                        assert level[n] >= level[k] - 1
+
+            # and next to a triangle on level l-1
+            for k in num.flatnonzero((level > 0) & (level < halo_levels)):
+                nodes = domain.triangles[k]
+                lower = level[num.any(num.in1d(domain.triangles, nodes).
+                                      reshape(-1, 3), axis=1)]
+                assert num.min(lower) == level[k] - 1
+
+    def test_overlapped_flux_computation(self):
+        """The split computation gives the same values as the standard one
+        """
+
+        domain = self.create_domain()
+        overlapped = self.create_domain()
+        self.overlap_ghost_update(overlapped)
+
+        for step in range(3):
+            domain.update_ghosts()
+            domain.distribute_to_vertices_and_edges()
+            domain.update_boundary()
+            domain.compute_fluxes()
+
+            overlapped.start_update_ghosts()
+            overlapped.distribute_and_compute_fluxes_overlapped()
+
+            assert overlapped.flux_timestep == domain.flux_timestep
+            assert num.all(overlapped.max_speed == domain.max_speed)
+            for name in ['stage', 'xmomentum', 'ymomentum', 'height']:
+                Q = domain.quantities[name]
+                Q_overlapped = overlapped.quantities[name]
+                assert num.all(Q_overlapped.edge_values == Q.edge_values)
+                assert num.all(Q_overlapped.vertex_values == Q.vertex_values)
+                assert num.all(Q_overlapped.explicit_update ==
+                               Q.explicit_update)
+
+            domain.timestep = overlapped.timestep = 0.01
+            domain.update_conserved_quantities()
+            overlapped.update_conserved_quantities()
+
+    def test_overlapped_evolve(self):
+
+        for timestepping_method in ['euler', 'rk2']:
+            domain = self.create_domain()
+            domain.set_timestepping_method(timestepping_method)
+            for t in domain.evolve(yieldstep=0.1, finaltime=0.3):
+                pass
+
+            overlapped = self.create_domain()
+            overlapped.set_timestepping_method(timestepping_method)
+            self.overlap_ghost_update(overlapped)
+            for t in overlapped.evolve(yieldstep=0.1, finaltime=0.3):
+                # The ghost cells are updated at each yield
+                assert not overlapped.ghost_update_pending
+            assert not overlapped.ghost_update_pending
+
+            Nfull = domain.number_of_full_triangles_tmp
+            assert overlapped.number_of_steps == domain.number_of_steps
+            for name in ['stage', 'xmomentum', 'ymomentum']:
+                assert num.all(overlapped.quantities[name].centroid_values[:Nfull]
+                               == domain.quantities[name].centroid_values[:Nfull])
+
+        # A failure during a timestep does not leave the update pending
+        overlapped = self.create_domain()
+        self.overlap_ghost_update(overlapped)
+
+        def update_extrema():
+            if overlapped.ghost_update_pending:
+                raise Exception('Failure during evolve')
+
+        overlapped.update_extrema = update_extrema
+
+        def evolve():
+            for t in overlapped.evolve(yieldstep=0.1, finaltime=0.3):
+                pass
+
+        self.assertRaises(Exception, evolve)
+        assert not overlapped.ghost_update_pending
+
+        domain.set_flow_algorithm('1_5')
+        self.assertRaises(Exception, domain.set_overlap_communication)
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_overlap_communication, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -201,7 +201,7 @@ def distibute_three_processors():
         #----------------------------------------------------------------------------------
         points, vertices, boundary, quantities, \
                 ghost_recv_dict, full_send_dict, tri_map, node_map, tri_l2g, node_l2g, \
-                ghost_layer_width =\
+                ghost_layer_width, tri_halo_level =\
         extract_submesh(submesh, triangles_per_proc)
 
 
@@ -232,7 +232,7 @@ def distibute_three_processors():
         points, vertices, boundary, quantities, \
                 ghost_recv_dict, full_send_dict, \
                 no_full_nodes, no_full_trigs, tri_map, node_map, tri_l2g, node_l2g, \
-                ghost_layer_width  = \
+                ghost_layer_width, tri_halo_level  = \
                 rec_submesh(0, verbose=False)    
 
         if myid == 1:
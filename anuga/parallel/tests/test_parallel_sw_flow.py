@@ -47,7 +47,8 @@ def topography(x,y):
 ###########################################################################
 # Setup Test
 ##########################################################################
-def run_simulation(parallel=False, G = None, seq_interpolation_points=None, verbose=False):
+def run_simulation(parallel=False, G = None, seq_interpolation_points=None, verbose=False,
+                   backend='pypar'):
 
     #--------------------------------------------------------------------------
     # Setup computational domain and quantities
@@ -63,6 +64,7 @@ def run_simulation(parallel=False, G = None, seq_interpolation_points=None, verb
     if parallel:
         if myid == 0 and verbose : print 'DISTRIBUTING PARALLEL DOMAIN'
         domain = distribute(domain, verbose=False)
+        domain.set_communication_backend(backend)
 
     #--------------------------------------------------------------------------
     # Setup domain parameters
@@ -214,6 +216,16 @@ if __name__=="__main__":
         if myid ==0 and verbose: print 'PARALLEL START'
 
         run_simulation(parallel=True, G=G, seq_interpolation_points = interpolation_points, verbose= verbose)
+
+        #------------------------------------------
+        # Again communicating with mpi4py
+        #------------------------------------------
+        from anuga.parallel.mpi4py_communications import mpi4py_available
+        if mpi4py_available:
+            if myid ==0 and verbose: print 'PARALLEL START (mpi4py)'
+
+            run_simulation(parallel=True, G=G, seq_interpolation_points = interpolation_points, verbose= verbose,
+                           backend='mpi4py')
         
         finalize()
 
@@ -0,0 +1,301 @@
+"""Test the repartitioning of parallel domains during a run, on the
+partitions of a domain in a single process.
+"""
+
+import os
+import threading
+import unittest
+import numpy as num
+
+from anuga import Domain, rectangular_cross_domain
+from anuga import Reflective_boundary, Dirichlet_boundary
+from anuga import Rate_operator, Set_stage_operator
+from anuga.abstract_2d_finite_volumes.region import Region
+from anuga.operators.collect_max_quantities_operator import \
+     collect_max_quantities_operator
+from anuga.parallel.sequential_distribute import Sequential_distribute
+from anuga.parallel.sequential_distribute import sequential_distribute_dump
+from anuga.parallel.sequential_distribute import \
+     sequential_distribute_load_pickle_file
+from anuga.parallel.rebalance import get_triangle_weights
+from anuga.parallel.rebalance import get_partition_contribution
+from anuga.parallel.rebalance import repartition, migrate
+
+
+polygon = [[2.0, 2.0], [14.0, 2.0], [14.0, 4.0], [2.0, 4.0]]
+
+
+class Exchange:
+    """Exchange values between the domains of the partitions, evolved by
+    separate threads in place of the processors
+    """
+
+    def __init__(self, numprocs):
+
+        self.numprocs = numprocs
+        self.condition = threading.Condition()
+        self.values = {}
+        self.generation = 0
+        self.result = None
+
+    def allgather(self, p, value):
+        """Return the list of the values given by each domain
+        """
+
+        self.condition.acquire()
+        try:
+            generation = self.generation
+            self.values[p] = value
+            if len(self.values) == self.numprocs:
+                self.result = [self.values[q] for q in range(self.numprocs)]
+                self.values = {}
+                self.generation += 1
+                self.condition.notify_all()
+            while self.generation == generation:
+                self.condition.wait(60)
+                if self.generation == generation:
+                    raise Exception('Timeout waiting for the other domains')
+            return self.result
+        finally:
+            self.condition.release()
+
+
+class Test_rebalance(unittest.TestCase):
+    def setUp(self):
+        self.domain = rectangular_cross_domain(16, 12, len1=16.0, len2=12.0)
+        self.domain.set_name('test_rebalance')
+        sequential_distribute_dump(self.domain, 2)
+
+    def tearDown(self):
+        for p in range(2):
+            os.remove('test_rebalance_P2_%d.pickle' % p)
+
+    def create_domain(self, p):
+        """Return the Parallel_domain of partition p, flooded on the left,
+        with operators
+        """
+
+        domain = sequential_distribute_load_pickle_file(
+                          'test_rebalance_P2_%d.pickle' % p, 2)
+        domain.set_store(False)
+
+        domain.set_quantity('elevation', lambda x, y: -x/16.0 + 0.1*num.sin(y))
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', lambda x, y: num.where(x < 5.0, 0.5, -x/16.0))
+
+        Br = Reflective_boundary(domain)
+        Bd = Dirichlet_boundary([0.6, 0.1, 0.0])
+        domain.set_boundary({'left': Bd, 'right': Br, 'top': Br,
+                             'bottom': Br, 'ghost': None})
+
+        domain.distribute_to_vertices_and_edges()
+
+        Rate_operator(domain, rate=1.0, polygon=polygon)
+        max_operator = collect_max_quantities_operator(domain)
+        max_operator()
+
+        return domain
+
+    def get_values(self, domain, values):
+        """Return the global arrays of the values of the full triangles
+        of domain
+        """
+
+        Nfull = domain.number_of_full_triangles_tmp
+        gids = domain.tri_l2g[:Nfull]
+
+        stage = domain.quantities['stage']
+        elevation = domain.quantities['elevation']
+        max_operator = domain.fractional_step_operators[-1]
+
+        values['stage'][gids] = stage.centroid_values[:Nfull]
+        values['stage_edges'][gids] = stage.edge_values[:Nfull]
+        values['elevation_vertices'][gids] = elevation.vertex_values[:Nfull]
+        values['max_depth'][gids] = max_operator.max_depth[:Nfull]
+
+        return values
+
+    def evolve(self, domains, finaltime):
+        """Evolve the domains of all partitions together, each by a thread,
+        exchanging the timesteps and the ghost values between them
+        """
+
+        N = len(self.domain)
+        exchange = Exchange(len(domains))
+
+        def setup(p, domain):
+
+            def update_timestep(yieldstep, finaltime):
+                timesteps = exchange.allgather(p, domain.flux_timestep)
+                domain.flux_timestep = min(timesteps)
+                Domain.update_timestep(domain, yieldstep, finaltime)
+
+            def update_ghosts(quantities=None):
+                Nfull = domain.number_of_full_triangles_tmp
+                full = [domain.quantities[name].centroid_values[:Nfull].copy()
+                        for name in domain.conserved_quantities]
+                values = exchange.allgather(p, (domain.tri_l2g[:Nfull], full))
+
+                ghosts = domain.tri_l2g[Nfull:]
+                for j, name in enumerate(domain.conserved_quantities):
+                    Q = num.zeros(N)
+                    for gids, full in values:
+                        Q[gids] = full[j]
+                    domain.quantities[name].centroid_values[Nfull:] = Q[ghosts]
+
+            domain.update_timestep = update_timestep
+            domain.update_ghosts = update_ghosts
+
+        errors = []
+
+        def run(domain):
+            try:
+                for t in domain.evolve(yieldstep=0.1, finaltime=finaltime):
+                    pass
+            except Exception, e:
+                errors.append(e)
+
+        threads = []
+        for p, domain in enumerate(domains):
+            setup(p, domain)
+            threads.append(threading.Thread(target=run, args=(domain,)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(errors) == 0, errors
+
+    def test_rebalance(self):
+
+        domains = [self.create_domain(p) for p in range(2)]
+
+        N = len(self.domain)
+        before = {'stage': num.zeros(N), 'stage_edges': num.zeros((N, 3)),
+                  'elevation_vertices': num.zeros((N, 3)),
+                  'max_depth': num.zeros(N)}
+        for domain in domains:
+            self.get_values(domain, before)
+
+        # The flooded triangles are 5 times more expensive
+        weights = [get_triangle_weights(domain, 5) for domain in domains]
+        global_weights = num.zeros(N, num.int)
+        for domain, w in zip(domains, weights):
+            Nfull = domain.number_of_full_triangles_tmp
+            global_weights[domain.tri_l2g[:Nfull]] = w[:Nfull]
+
+        def imbalance(domains):
+            work = [num.sum(global_weights[d.tri_l2g[:d.number_of_full_triangles_tmp]])
+                    for d in domains]
+            return max(work)/num.mean(work)
+
+        stage = domains[0].quantities['stage']
+        boundary_objects = dict(domains[0].boundary_map)
+
+        contributions = [get_partition_contribution(domain, w)
+                         for domain, w in zip(domains, weights)]
+        payloads = repartition(contributions, 2, {'ghost_layer_width': 2})
+
+        unbalanced = imbalance(domains)
+        for domain, payload in zip(domains, payloads):
+            migrate(domain, payload)
+
+        assert imbalance(domains) < unbalanced
+        assert imbalance(domains) < 1.05
+
+        # Each triangle is full on exactly one processor
+        gids = num.concatenate([d.tri_l2g[:d.number_of_full_triangles_tmp]
+                                for d in domains])
+        assert num.all(num.sort(gids) == num.arange(N))
+
+        # The values moved with their triangles
+        after = {}
+        for key in before:
+            after[key] = num.zeros_like(before[key])
+        for domain in domains:
+            self.get_values(domain, after)
+        for key in before:
+            assert num.all(after[key] == before[key])
+
+        # including the ghost triangles
+        for domain in domains:
+            ghosts = domain.tri_l2g[domain.number_of_full_triangles_tmp:]
+            assert num.all(domain.quantities['stage'].centroid_values[
+                domain.number_of_full_triangles_tmp:] == before['stage'][ghosts])
+
+        # The domain and its boundaries refer to the new arrays
+        domain = domains[0]
+        assert domain.quantities['stage'] is stage
+        assert len(stage.centroid_values) == len(domain)
+        assert domain.boundary_map['right'] is boundary_objects['right']
+        assert domain.boundary_map['right'].stage is stage.edge_values
+        assert domain.boundary_map['right'].normals is domain.normals
+
+        # The partition is the one of the weighted global mesh
+        partition = Sequential_distribute(self.domain)
+        partition.distribute(2, weights=global_weights)
+        for p, domain in enumerate(domains):
+            kwargs, points, vertices = partition.extract_submesh(p)[:3]
+            assert num.all(domain.tri_l2g == kwargs['tri_l2g'])
+            assert num.all(domain.triangles == vertices)
+            assert num.allclose(domain.nodes, points)
+            assert domain.full_send_dict.keys() == kwargs['full_send_dict'].keys()
+            for q in domain.full_send_dict:
+                assert num.all(domain.full_send_dict[q][0] ==
+                               kwargs['full_send_dict'][q][0])
+                assert num.all(domain.ghost_recv_dict[q][0] ==
+                               kwargs['ghost_recv_dict'][q][0])
+
+            # The region of the operator is the one on the new partition
+            rate_operator = domain.fractional_step_operators[-2]
+            region = Region(domain, polygon=polygon)
+            assert num.all(rate_operator.indices == region.indices)
+            assert num.all(rate_operator.areas == domain.areas[region.indices])
+            assert rate_operator.coord_c is domain.centroid_coordinates
+
+            max_operator = domain.fractional_step_operators[-1]
+            assert max_operator.stage is domain.quantities['stage']
+            assert len(max_operator.max_speed) == len(domain)
+
+        # Evolving the rebalanced domains gives the same values as
+        # evolving the original partitions
+        unmigrated = [self.create_domain(p) for p in range(2)]
+        self.evolve(domains, 0.3)
+        self.evolve(unmigrated, 0.3)
+
+        values = {}
+        values_unmigrated = {}
+        for key in before:
+            values[key] = num.zeros_like(before[key])
+            values_unmigrated[key] = num.zeros_like(before[key])
+        for domain, other in zip(domains, unmigrated):
+            self.get_values(domain, values)
+            self.get_values(other, values_unmigrated)
+            assert domain.get_time() == other.get_time() == 0.3
+
+        for key in values:
+            assert num.allclose(values[key], values_unmigrated[key],
+                                rtol=1.0e-12, atol=1.0e-12), key
+        assert num.any(values['stage'] != before['stage'])
+
+    def test_rebalance_safe(self):
+
+        domain = self.create_domain(0)
+        domain.set_rebalancing(threshold=1.5, rebalance_step=2)
+        assert domain.get_rebalancing()
+
+        domain.set_store(True)
+        self.assertRaises(Exception, domain.set_rebalancing)
+        domain.set_sww_collective()
+        domain.set_rebalancing()
+
+        Set_stage_operator(domain, stage=1.0, polygon=polygon)
+        self.assertRaises(Exception, domain.set_rebalancing)
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_rebalance, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -1 +1,2 @@
 void bridge_partMeshNodal(int *, int *, idxtype *, int *, int *, int *, int *, idxtype *, idxtype *);
+void bridge_partGraphKway(int *, idxtype *, idxtype *, idxtype *, int *, int *, int *, idxtype *);
@@ -4,6 +4,8 @@
 
 //#include <metis.h>
 
+#include <stddef.h>
+
 #include <defs.h>
 #include <struct.h>
 #include <macros.h>
@@ -14,3 +16,10 @@
 void bridge_partMeshNodal(int * ne, int * nn, idxtype * elmnts, int * etype, int * numflag, int * nparts, int * edgecut, idxtype * epart, idxtype * npart){
   METIS_PartMeshNodal(ne, nn, elmnts, etype, numflag, nparts, edgecut, epart, npart);
 }
+
+void bridge_partGraphKway(int * nvtxs, idxtype * xadj, idxtype * adjncy, idxtype * vwgt, int * numflag, int * nparts, int * edgecut, idxtype * part){
+  int wgtflag = 2; /* Weights on the vertices only */
+  int options[5] = {0, 0, 0, 0, 0}; /* Default options */
+
+  METIS_PartGraphKway(nvtxs, xadj, adjncy, vwgt, NULL, &wgtflag, numflag, nparts, options, edgecut, part);
+}
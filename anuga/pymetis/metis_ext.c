@@ -7,9 +7,11 @@ typedef int idxtype;
 #include "bridge.h"
 
 static PyObject * metis_partMeshNodal(PyObject *, PyObject *);
+static PyObject * metis_partGraphKway(PyObject *, PyObject *);
 
 static PyMethodDef methods[] = {
   {"partMeshNodal", metis_partMeshNodal, METH_VARARGS, "METIS_PartMeshNodal"},
+  {"partGraphKway", metis_partGraphKway, METH_VARARGS, "METIS_PartGraphKway"},
   {NULL, NULL, 0, NULL}
 };
 
@@ -115,3 +117,79 @@ static PyObject * metis_partMeshNodal(PyObject * self, PyObject * args){
 
   return Py_BuildValue("iOO", edgecut, (PyObject *)epart_pyarr, (PyObject *)npart_pyarr);
 }
+
+/* Run the metis METIS_PartGraphKway function with vertex weights
+ * expected args:
+ * nvtxs: number of vertices of the graph
+ * xadj: start of the adjacency list of each vertex in adjncy (nvtxs+1)
+ * adjncy: adjacency lists of the vertices
+ * vwgt: (integer) weights of the vertices
+ * nparts: number of partitions
+ * returns:
+ * edgecut: number of cut edges
+ * part: partitioning of the vertices
+ *
+ * Used to partition the dual graph of a mesh (one vertex per element)
+ * with weighted elements, which METIS_PartMeshNodal does not support.
+ */
+static PyObject * metis_partGraphKway(PyObject * self, PyObject * args){
+  int nvtxs;
+  int nparts;
+  int edgecut;
+  int numflag = 0;
+  npy_intp dims[1];
+
+  PyObject * xadj;
+  PyObject * adjncy;
+  PyObject * vwgt;
+  PyArrayObject * xadj_arr;
+  PyArrayObject * adjncy_arr;
+  PyArrayObject * vwgt_arr;
+  PyArrayObject * part_pyarr;
+
+  idxtype * part;
+
+  if(!PyArg_ParseTuple(args, "iOOOi", &nvtxs, &xadj, &adjncy, &vwgt, &nparts))
+    return NULL;
+
+  /* Copies as C ints, the metis idxtype (cast from longs on x86_64) */
+  xadj_arr = (PyArrayObject *) PyArray_FROMANY(xadj, PyArray_INT, 1, 1, NPY_CARRAY | NPY_FORCECAST);
+  adjncy_arr = (PyArrayObject *) PyArray_FROMANY(adjncy, PyArray_INT, 1, 1, NPY_CARRAY | NPY_FORCECAST);
+  vwgt_arr = (PyArrayObject *) PyArray_FROMANY(vwgt, PyArray_INT, 1, 1, NPY_CARRAY | NPY_FORCECAST);
+
+  if(!xadj_arr || !adjncy_arr || !vwgt_arr){
+    Py_XDECREF(xadj_arr);
+    Py_XDECREF(adjncy_arr);
+    Py_XDECREF(vwgt_arr);
+    return NULL;
+  }
+
+  if(xadj_arr->dimensions[0] != nvtxs+1 || vwgt_arr->dimensions[0] != nvtxs){
+    PyErr_SetString(PyExc_ValueError,
+                    "partGraphKway: xadj must have nvtxs+1 and vwgt nvtxs entries");
+    Py_DECREF(xadj_arr);
+    Py_DECREF(adjncy_arr);
+    Py_DECREF(vwgt_arr);
+    return NULL;
+  }
+
+  /* The partition is written straight into the returned array */
+  dims[0] = nvtxs;
+  part_pyarr = (PyArrayObject *)PyArray_SimpleNew(1, dims, PyArray_INT);
+  if(part_pyarr == NULL){
+    Py_DECREF(xadj_arr);
+    Py_DECREF(adjncy_arr);
+    Py_DECREF(vwgt_arr);
+    return NULL;
+  }
+  part = (idxtype *)part_pyarr->data;
+
+  bridge_partGraphKway(&nvtxs, (idxtype *)xadj_arr->data, (idxtype *)adjncy_arr->data,
+                       (idxtype *)vwgt_arr->data, &numflag, &nparts, &edgecut, part);
+
+  Py_DECREF(xadj_arr);
+  Py_DECREF(adjncy_arr);
+  Py_DECREF(vwgt_arr);
+
+  return Py_BuildValue("iN", edgecut, (PyObject *)part_pyarr);
+}
@@ -146,6 +146,22 @@ class TestMetis(unittest.TestCase):
             assert allclose(npart, npart_expected)
                 
 
+    def test_partGraphKway_weights(self):
+        # A path of 6 vertices, the last two 4 times as heavy
+        xadj = array([0, 1, 3, 5, 7, 9, 10])
+        adjncy = array([1, 0, 2, 1, 3, 2, 4, 3, 5, 4])
+        vwgt = array([1, 1, 1, 1, 4, 4])
+
+        edgecut, part = metis.partGraphKway(6, xadj, adjncy, vwgt, 2)
+
+        weights = [sum(vwgt[part == p]) for p in range(2)]
+        assert sorted(weights) == [4, 8] or sorted(weights) == [6, 6]
+        assert edgecut >= 1
+
+        self.assertRaises(ValueError, metis.partGraphKway, 6, xadj,
+                          adjncy, vwgt[:5], 2)
+
+
 if __name__ == "__main__":
     suite = unittest.makeSuite(TestMetis,'test_')
     runner = unittest.TextTestRunner()
@@ -0,0 +1,90 @@
+"""Compare per edge and vectorised evaluation of boundary conditions.
+
+   Times the generic evaluate_segment of Boundary, which calls evaluate
+   for each edge, against the vectorised evaluate_segment of each boundary
+   class on the left boundary segment of rectangular cross meshes of
+   increasing size.
+
+   Usage:
+
+       python benchmark_boundary_segments.py
+
+   The table reports the mean time per call of both versions and the
+   speedup for each boundary class and segment length.
+"""
+
+import time
+
+import numpy as num
+
+from anuga import rectangular_cross_domain
+from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+     import Boundary, Time_space_boundary
+from anuga.shallow_water.boundaries import \
+     Transmissive_stage_zero_momentum_boundary, \
+     Transmissive_momentum_set_stage_boundary, \
+     Dirichlet_discharge_boundary, Inflow_boundary
+
+
+def setup_domain(m):
+    """Create a domain with m triangle pairs along the left boundary
+    """
+
+    domain = rectangular_cross_domain(4, m, len1=1.0, len2=float(m))
+    domain.set_store(False)
+
+    domain.set_quantity('elevation', lambda x, y: -x/10.0)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', 0.1)
+
+    return domain
+
+
+def get_boundaries(domain):
+
+    def wave(t, x, y):
+        return [0.1*num.sin(t + y), 0.0, 0.0]
+
+    return [('Time_space', Time_space_boundary(domain, wave)),
+            ('Transmissive_stage_zero_momentum',
+             Transmissive_stage_zero_momentum_boundary(domain)),
+            ('Transmissive_momentum_set_stage',
+             Transmissive_momentum_set_stage_boundary(domain, lambda t: 0.2)),
+            ('Dirichlet_discharge',
+             Dirichlet_discharge_boundary(domain, 0.2, 1.0)),
+            ('Inflow', Inflow_boundary(domain, rate=1.0))]
+
+
+def time_call(function, repeats):
+
+    function()
+    t0 = time.time()
+    for i in xrange(repeats):
+        function()
+
+    return (time.time() - t0)/repeats
+
+
+def benchmark(sizes=(250, 2500, 25000), repeats=5):
+
+    print '%-34s %8s %14s %14s %8s' % ('boundary', 'edges', 'per edge [s]',
+                                       'segment [s]', 'speedup')
+
+    for m in sizes:
+        domain = setup_domain(m)
+        ids = num.array(domain.tag_boundary_cells['left'])
+
+        for name, B in get_boundaries(domain):
+            edge_time = time_call(lambda: Boundary.evaluate_segment(B, domain, ids),
+                                  repeats)
+            segment_time = time_call(lambda: B.evaluate_segment(domain, ids),
+                                     repeats)
+
+            print '%-34s %8d %14.6f %14.6f %8.1f' % \
+                  (name, len(ids), edge_time, segment_time,
+                   edge_time/segment_time)
+
+
+if __name__ == '__main__':
+
+    benchmark()
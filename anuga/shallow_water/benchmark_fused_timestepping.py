@@ -0,0 +1,100 @@
+"""Measure the speedup of the fused DE timestep.
+
+   Evolves a dam break with the standard and the fused (see
+   Domain.set_fused_timestepping) euler (DE0) and rk2 (DE1) timesteps on
+   rectangular cross meshes of 50k to 200k triangles, with reflective and
+   Dirichlet boundaries and Manning friction.
+
+   Usage:
+
+       python benchmark_fused_timestepping.py [omp_num_threads]
+
+   The table reports the mean time per timestep and the speedup of the
+   fused timestep for each mesh size. The results of the two are checked
+   to be identical.
+"""
+
+import sys
+import time
+
+import numpy as num
+
+from anuga import rectangular_cross_domain
+from anuga import Reflective_boundary
+from anuga import Dirichlet_boundary
+
+
+def setup_domain(m, n, flow_algorithm, fused, omp_num_threads):
+    """Create a domain with a partially wet dam break initial condition
+    """
+
+    domain = rectangular_cross_domain(m, n, len1=1.0, len2=1.0)
+    domain.set_flow_algorithm(flow_algorithm)
+    domain.set_store(False)
+    domain.set_omp_num_threads(omp_num_threads)
+    domain.set_fused_timestepping(fused)
+
+    domain.set_quantity('elevation', lambda x, y: -x/10.0)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', lambda x, y: num.where(x < 0.5, 0.1, -x/10.0))
+
+    Br = Reflective_boundary(domain)
+    Bd = Dirichlet_boundary([-0.1, 0.0, 0.0])
+    domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+def time_evolve(domain, duration):
+    """Evolve for duration more seconds and return the time per step
+    """
+
+    steps = 0
+    t0 = time.time()
+    for t in domain.evolve(yieldstep=duration, duration=duration,
+                           skip_initial_step=True):
+        steps += domain.number_of_steps
+
+    return (time.time() - t0)/steps
+
+
+def benchmark(sizes=(112, 158, 224), omp_num_threads=1,
+              duration=0.005, repeats=3):
+
+    print '%10s %10s %14s %12s %8s' % ('triangles', 'algorithm',
+                                       'standard [s]', 'fused [s]',
+                                       'speedup')
+
+    for m in sizes:
+        for flow_algorithm in ['DE0', 'DE1']:
+            domains = [setup_domain(m, m, flow_algorithm, fused,
+                                    omp_num_threads)
+                       for fused in [False, True]]
+
+            # Take the fastest of the repeats, alternating between the
+            # standard and fused domains, after a first untimed evolve
+            times = [[], []]
+            for i in range(repeats + 1):
+                for domain, domain_times in zip(domains, times):
+                    domain_times.append(time_evolve(domain, duration))
+            step_time, fused_time = [min(t[1:]) for t in times]
+
+            domain, domain_fused = domains
+            for name in ['stage', 'xmomentum', 'ymomentum']:
+                q = domain.quantities[name].centroid_values
+                q_fused = domain_fused.quantities[name].centroid_values
+                assert num.all(q == q_fused)
+
+            print '%10d %10s %14.6f %12.6f %8.2f' % \
+                  (domain.number_of_elements, flow_algorithm,
+                   step_time, fused_time, step_time/fused_time)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        omp_num_threads = int(sys.argv[1])
+    else:
+        omp_num_threads = 1
+
+    benchmark(omp_num_threads=omp_num_threads)
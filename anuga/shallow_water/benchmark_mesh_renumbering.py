@@ -0,0 +1,96 @@
+"""Measure the effect of triangle renumbering on the DE kernels.
+
+   Creates unstructured meshes of increasing size with
+   create_domain_from_regions, once in the order produced by the mesh
+   generator and once for each renumbering method, and times
+   compute_fluxes and distribute_to_vertices_and_edges for the DE1
+   algorithm.
+
+   Usage:
+
+       python benchmark_mesh_renumbering.py
+
+   The table reports the mean time per call and the speedup relative to
+   the original ordering for each mesh size.
+"""
+
+import os
+import time
+
+import numpy as num
+
+from anuga import create_domain_from_regions
+from anuga import Reflective_boundary
+from anuga.abstract_2d_finite_volumes.mesh_renumbering import \
+     renumbering_methods
+
+
+def setup_domain(maximum_triangle_area, renumbering):
+    """Create a DE1 domain on an unstructured mesh of the unit square
+    with a partially wet dam break initial condition
+    """
+
+    mesh_filename = 'benchmark_renumbering.msh'
+    domain = create_domain_from_regions([[0,0], [1,0], [1,1], [0,1]],
+                                        {'bottom': [0], 'right': [1],
+                                         'top': [2], 'left': [3]},
+                                        maximum_triangle_area=maximum_triangle_area,
+                                        mesh_filename=mesh_filename,
+                                        renumbering=renumbering)
+    os.remove(mesh_filename)
+
+    domain.set_flow_algorithm('DE1')
+    domain.set_store(False)
+
+    domain.set_quantity('elevation', lambda x, y: -x/10.0)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', lambda x, y: num.where(x < 0.5, 0.1, -x/10.0))
+
+    Br = Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    # Take a few steps so the flow is not trivial
+    for t in domain.evolve(yieldstep=0.01, finaltime=0.01):
+        pass
+
+    return domain
+
+
+def time_kernel(kernel, repeats):
+
+    kernel()
+    t0 = time.time()
+    for i in xrange(repeats):
+        kernel()
+
+    return (time.time() - t0)/repeats
+
+
+def benchmark(areas=(1.0e-4, 2.0e-5, 5.0e-6, 1.0e-6), repeats=20):
+
+    print '%10s %10s %12s %8s %12s %8s' % ('triangles', 'ordering',
+                                          'fluxes [s]', 'speedup',
+                                          'extrap [s]', 'speedup')
+
+    for area in areas:
+        flux_original = extrap_original = None
+        for renumbering in [None] + renumbering_methods:
+            domain = setup_domain(area, renumbering)
+
+            flux_time = time_kernel(domain.compute_fluxes, repeats)
+            extrap_time = time_kernel(domain.distribute_to_vertices_and_edges,
+                                      repeats)
+
+            if flux_original is None:
+                flux_original = flux_time
+                extrap_original = extrap_time
+
+            print '%10d %10s %12.6f %8.2f %12.6f %8.2f' % \
+                  (domain.number_of_elements, renumbering,
+                   flux_time, flux_original/flux_time,
+                   extrap_time, extrap_original/extrap_time)
+
+
+if __name__ == '__main__':
+
+    benchmark()
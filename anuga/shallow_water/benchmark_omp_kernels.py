@@ -0,0 +1,94 @@
+"""Measure the speedup of the threaded DE kernels.
+
+   Times compute_fluxes and distribute_to_vertices_and_edges (protect and
+   second order extrapolation) for the DE1 algorithm on rectangular cross
+   meshes of increasing size, using different numbers of OpenMP threads.
+
+   Usage:
+
+       python benchmark_omp_kernels.py [max_threads]
+
+   The table reports the mean time per call and the speedup relative to
+   one thread for each mesh size.
+"""
+
+import sys
+import time
+
+import numpy as num
+
+from anuga import rectangular_cross_domain
+from anuga import Reflective_boundary
+
+
+def setup_domain(m, n):
+    """Create a DE1 domain with a partially wet dam break initial condition
+    """
+
+    domain = rectangular_cross_domain(m, n, len1=1.0, len2=1.0)
+    domain.set_flow_algorithm('DE1')
+    domain.set_store(False)
+
+    domain.set_quantity('elevation', lambda x, y: -x/10.0)
+    domain.set_quantity('friction', 0.03)
+    domain.set_quantity('stage', lambda x, y: num.where(x < 0.5, 0.1, -x/10.0))
+
+    Br = Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    # Take a few steps so the flow is not trivial
+    for t in domain.evolve(yieldstep=0.01, finaltime=0.01):
+        pass
+
+    return domain
+
+
+def time_kernel(kernel, repeats):
+
+    kernel()
+    t0 = time.time()
+    for i in xrange(repeats):
+        kernel()
+
+    return (time.time() - t0)/repeats
+
+
+def benchmark(sizes=(50, 100, 200, 400), threads=(1, 2, 4), repeats=20):
+
+    print '%10s %8s %12s %8s %12s %8s' % ('triangles', 'threads',
+                                         'fluxes [s]', 'speedup',
+                                         'extrap [s]', 'speedup')
+
+    for m in sizes:
+        domain = setup_domain(m, m)
+
+        flux_serial = extrap_serial = None
+        for nt in threads:
+            domain.set_omp_num_threads(nt)
+
+            flux_time = time_kernel(domain.compute_fluxes, repeats)
+            extrap_time = time_kernel(domain.distribute_to_vertices_and_edges,
+                                      repeats)
+
+            if flux_serial is None:
+                flux_serial = flux_time
+                extrap_serial = extrap_time
+
+            print '%10d %8d %12.6f %8.2f %12.6f %8.2f' % \
+                  (domain.number_of_elements, nt,
+                   flux_time, flux_serial/flux_time,
+                   extrap_time, extrap_serial/extrap_time)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        max_threads = int(sys.argv[1])
+    else:
+        max_threads = 4
+
+    threads = [1]
+    while 2*threads[-1] <= max_threads:
+        threads.append(2*threads[-1])
+
+    benchmark(threads=threads)
@@ -207,6 +207,23 @@ class Transmissive_momentum_set_stage_boundary(Boundary):
         """
 
         q = self.domain.get_conserved_quantities(vol_id, edge = edge_id)
+
+        q[0] = self.get_stage()
+           
+        return q
+
+        # FIXME: Consider this (taken from File_boundary) to allow
+        # spatial variation
+        # if vol_id is not None and edge_id is not None:
+        #     i = self.boundary_indices[ vol_id, edge_id ]
+        #     return self.F(t, point_id = i)
+        # else:
+        #     return self.F(t)
+
+    def get_stage(self):
+        """Return the stage given by function at the current time
+        """
+
         t = self.domain.get_time()
 
         if hasattr(self.function, 'time'):
@@ -225,17 +242,28 @@ class Transmissive_momentum_set_stage_boundary(Boundary):
         except:
             x = float(value[0])
 
-        q[0] = x
-           
-        return q
+        return x
 
-        # FIXME: Consider this (taken from File_boundary) to allow
-        # spatial variation
-        # if vol_id is not None and edge_id is not None:
-        #     i = self.boundary_indices[ vol_id, edge_id ]
-        #     return self.F(t, point_id = i)
-        # else:
-        #     return self.F(t)
+    def evaluate_segment(self, domain, segment_edges):
+        """Set stage from function and copy the momentum edge values
+        for all edges in segment_edges
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+
+        q = [domain.quantities[name].edge_values[vol_ids, edge_ids]
+             for name in domain.conserved_quantities]
+
+        q[0] = self.get_stage()
+
+        self.set_segment_values(domain, segment_edges, q)
 
 
 class Transmissive_n_momentum_zero_t_momentum_set_stage_boundary(Boundary):
@@ -397,6 +425,27 @@ class Transmissive_stage_zero_momentum_boundary(Boundary):
         q[1] = q[2] = 0.0
         return q
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Copy the stage edge values and set the momentum to zero for all
+        edges in segment_edges
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+
+        q = [domain.quantities[name].edge_values[vol_ids, edge_ids]
+             for name in domain.conserved_quantities]
+
+        q[1] = q[2] = 0.0
+
+        self.set_segment_values(domain, segment_edges, q)
+
 
 
 class Time_stage_zero_momentum_boundary(Boundary):
@@ -693,6 +742,27 @@ class Dirichlet_discharge_boundary(Boundary):
         # else:
         #     return self.F(t)
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Set discharge in the (inward) normal direction for all edges
+        in segment_edges
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+
+        n1 = domain.normals[vol_ids, 2*edge_ids]
+        n2 = domain.normals[vol_ids, 2*edge_ids+1]
+
+        q = [self.stage0, -self.wh0*n1, -self.wh0*n2]
+
+        self.set_segment_values(domain, segment_edges, q)
+
 
 class Inflow_boundary(Boundary):
     """Apply given flow in m^3/s to boundary segment.
@@ -728,17 +798,7 @@ class Inflow_boundary(Boundary):
         # First find all segments having the same tag is vol_id, edge_id
         # This will be done the first time evaluate is called.
         if self.tag is None:
-            boundary = self.domain.boundary
-            self.tag = boundary[(vol_id, edge_id)]        
-            
-            # Find total length of boundary with this tag
-            length = 0.0
-            for v_id, e_id in boundary:
-                if self.tag == boundary[(v_id, e_id)]:
-                    length += self.domain.mesh.get_edgelength(v_id, e_id)            
-
-            self.length = length
-            self.average_momentum = self.rate/length
+            self.set_tag(vol_id, edge_id)
             
             
         # Average momentum has now been established across this boundary
@@ -780,6 +840,64 @@ class Inflow_boundary(Boundary):
         q = num.array([elevation + depth, xmomentum, ymomentum], num.float)
         return q
 
+    def set_tag(self, vol_id, edge_id):
+        """Record the tag of edge (vol_id, edge_id) and the average
+        momentum over the boundary segments with this tag
+        """
+
+        boundary = self.domain.boundary
+        self.tag = boundary[(vol_id, edge_id)]        
+
+        # Find total length of boundary with this tag
+        length = 0.0
+        for v_id, e_id in boundary:
+            if self.tag == boundary[(v_id, e_id)]:
+                length += self.domain.mesh.get_edgelength(v_id, e_id)            
+
+        self.length = length
+        self.average_momentum = self.rate/length
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Apply inflow rate at all edges in segment_edges, see evaluate
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = segment_edges
+
+        if len(ids) == 0:
+            return
+
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+
+        if self.tag is None:
+            self.set_tag(vol_ids[0], edge_ids[0])
+
+        # Momentum in the inward normal direction
+        xmomentum = -self.average_momentum*domain.normals[vol_ids, 2*edge_ids]
+        ymomentum = -self.average_momentum*domain.normals[vol_ids, 2*edge_ids+1]
+
+        # Depth from Manning's formula
+        slope = 0 # get gradient for this triangle dot normal
+        epsilon = 1.0e-12
+
+        mannings_n = domain.quantities['friction'].edge_values[vol_ids, edge_ids]
+
+        depth = num.ones(len(ids), num.float)
+        if slope > epsilon:
+            mask = mannings_n > epsilon
+            depth[mask] = (self.average_momentum * mannings_n[mask]/
+                           num.sqrt(slope))**(3.0/5)
+
+        elevation = domain.quantities['elevation'].edge_values[vol_ids, edge_ids]
+
+        self.set_segment_values(domain, segment_edges,
+                                [elevation + depth, xmomentum, ymomentum])
+
 
         
     
@@ -881,6 +999,28 @@ class Field_boundary(Boundary):
                 q[j] += self.mean_stage
         return q
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Set the boundary values of all edges in segment_edges from
+        the file boundary, adjusting stage by mean_stage
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        if len(segment_edges) == 0:
+            return
+
+        q = self.file_boundary.get_segment_values(domain, segment_edges)
+
+        # Adjust stage
+        for j, name in enumerate(self.domain.conserved_quantities):
+            if name == 'stage':
+                q[j] += self.mean_stage
+
+        self.set_segment_values(domain, segment_edges, q)
+
 
 
 
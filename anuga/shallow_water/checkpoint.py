@@ -14,6 +14,28 @@ read in the last stored domain. Do that via
 
 domain = load_last_checkpoint_file(domain_name, checkpoint_dir)
 
+
+Pickling the whole domain is slow and large for big models, and the pickle
+breaks when the code changes. With
+
+domain.set_checkpointing(..., checkpoint_format='binary')
+
+only the time varying state is stored, in a NetCDF file per processor
+<name>_<time>.nc: the time, the yieldstep counter, the centroid values of
+the evolved quantities and elevation (and the vertex values of elevation),
+the extrema of the monitored quantities and the state of the fractional
+step operators (see Operator.get_state). To restart, rebuild the domain
+as in the original setup (boundaries, operators and all) and then load
+the last state with
+
+load_checkpoint_state(domain, checkpoint_dir)
+
+Checkpoints are written by a Checkpoint_writer, in the background if
+checkpoint_asynchronous is set, and published in the manifest
+<name>_checkpoints.txt once every processor has written them. Both
+loaders restart from the last published checkpoint. Older checkpoints can
+be pruned with checkpoint_keep and checkpoint_keep_interval.
+
 """
 
 from anuga import send, receive, myid, numprocs, barrier
@@ -25,12 +47,17 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
 
     from os.path import join
 
+    # Published checkpoints, if checkpoints were published
+    published = read_manifest(domain_name, checkpoint_dir)
+
     if numprocs > 1:
         domain_name = domain_name+'_P{}_{}'.format(numprocs,myid)
 
-    if time is None:
+    if time is None and published is not None:
+        times = published
+    elif time is None:
         # will pull out the last available time
-        times = _get_checkpoint_times(domain_name, checkpoint_dir)
+        times = _get_checkpoint_times(domain_name, checkpoint_dir, '.pickle')
 
         times = list(times)
         times.sort()
@@ -73,6 +100,10 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
 
     if not overall: raise Exception, "Unable to open checkpoint file"
 
+    # Continue the manifest of the published checkpoints
+    if getattr(domain, 'checkpoint_writer', None) is not None:
+        domain.checkpoint_writer.restart(published, time)
+
     domain.last_walltime = walltime()
     domain.communication_time = 0.0
     domain.communication_reduce_time = 0.0
@@ -81,7 +112,599 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
     return domain
 
 
-def _get_checkpoint_times(domain_name, checkpoint_dir):
+def _get_state_quantities(domain):
+    """Return the names of the quantities whose centroid values are stored
+    in binary checkpoints
+    """
+
+    names = []
+    for name in domain.conserved_quantities + domain.evolved_quantities + \
+            ['elevation']:
+        if name not in names:
+            names.append(name)
+
+    return names
+
+
+def _store_value(fid, name, value):
+    """Store the number or array value as the variable name of fid
+    """
+
+    from anuga.config import netcdf_float, netcdf_int
+    import numpy as num
+
+    value = num.array(value)
+    if value.dtype.kind in 'biu':
+        precision = netcdf_int
+    else:
+        precision = netcdf_float
+
+    dimensions = []
+    for axis, length in enumerate(value.shape):
+        dimension = '%s_%d' % (name, axis)
+        fid.createDimension(dimension, length)
+        dimensions.append(dimension)
+
+    fid.createVariable(name, precision, tuple(dimensions))
+    if value.shape == ():
+        fid.variables[name].assignValue(value)
+    else:
+        fid.variables[name][:] = value
+
+
+def _get_value(fid, name):
+    """Return the number or array stored by _store_value
+    """
+
+    import numpy as num
+
+    variable = fid.variables[name]
+    if len(variable.shape) == 0:
+        return num.array(variable.getValue()).item()
+    else:
+        return num.array(variable[:])
+
+
+def get_checkpoint_state(domain):
+    """Return a copy of the time varying state of domain stored in binary
+    checkpoints, see save_checkpoint_state
+    """
+
+    import numpy as num
+
+    operators = domain.fractional_step_operators
+
+    state = {}
+    state['attributes'] = {
+        'description': 'Checkpoint of the state of %s' % domain.get_name(),
+        'time': domain.get_time(),
+        'starttime': domain.get_starttime(),
+        'yieldstep_id': domain.yieldstep_id,
+        'operators': ' '.join([op.__class__.__name__ for op in operators])}
+
+    state['quantities'] = {}
+    for name in _get_state_quantities(domain):
+        state['quantities'][name] = \
+                    domain.quantities[name].centroid_values.copy()
+
+    state['elevation_vertices'] = \
+                    domain.quantities['elevation'].vertex_values.copy()
+
+    # Extrema of the monitored quantities, if any, and operator states
+    values = state['values'] = {}
+    if domain.quantities_to_be_monitored is not None:
+        for name, info_block in domain.quantities_to_be_monitored.items():
+            for key, value in info_block.items():
+                if value is not None:
+                    values['extrema.%s.%s' % (name, key)] = num.array(value)
+
+    for i, operator in enumerate(operators):
+        for key, value in operator.get_state().items():
+            values['operator_%d.%s' % (i, key)] = num.array(value)
+
+    return state
+
+
+def write_checkpoint_state(state, filename):
+    """Write the state returned by get_checkpoint_state to the NetCDF file
+    filename
+    """
+
+    import os
+    from anuga.config import netcdf_mode_w, netcdf_float
+    from anuga.file.netcdf import NetCDFFile
+
+    # Write to a temporary file so that an interrupted write does not
+    # leave a partial checkpoint
+    tmp_filename = filename + '.tmp'
+
+    fid = NetCDFFile(tmp_filename, netcdf_mode_w)
+    for name, value in state['attributes'].items():
+        setattr(fid, name, value)
+
+    number_of_volumes = len(state['elevation_vertices'])
+    fid.createDimension('number_of_volumes', number_of_volumes)
+    fid.createDimension('number_of_vertices', 3)
+
+    for name, A in state['quantities'].items():
+        fid.createVariable(name, netcdf_float, ('number_of_volumes',))
+        fid.variables[name][:] = A
+
+    fid.createVariable('elevation_vertices', netcdf_float,
+                       ('number_of_volumes', 'number_of_vertices'))
+    fid.variables['elevation_vertices'][:] = state['elevation_vertices']
+
+    for name, value in state['values'].items():
+        _store_value(fid, name, value)
+
+    fid.close()
+
+    os.rename(tmp_filename, filename)
+
+
+def save_checkpoint_state(domain, filename):
+    """Store the time varying state of domain in the NetCDF file filename,
+    see load_checkpoint_state
+    """
+
+    write_checkpoint_state(get_checkpoint_state(domain), filename)
+
+
+def _allreduce_max(values):
+    """Return the maxima over all processors of the array values
+    """
+
+    import numpy as num
+
+    if numprocs == 1:
+        return values
+
+    import anuga.utilities.parallel_abstraction as pypar
+    import anuga.parallel.pypar_ext as par_exts
+
+    result = num.zeros_like(values)
+    par_exts.allreduce(values, pypar.MAX, buffer=result, bypass=True)
+
+    return result
+
+
+def get_manifest_filename(domain_name, checkpoint_dir='.'):
+    """Return the name of the manifest of the published checkpoints of
+    the (global) domain_name
+    """
+
+    from os.path import join
+
+    return join(checkpoint_dir, domain_name) + '_checkpoints.txt'
+
+
+def read_manifest(domain_name, checkpoint_dir='.'):
+    """Return the times of the checkpoints published in the manifest of
+    domain_name, None if there is no manifest
+    """
+
+    import os
+
+    filename = get_manifest_filename(domain_name, checkpoint_dir)
+    if not os.path.exists(filename):
+        return None
+
+    fid = open(filename)
+    times = [float(line) for line in fid if line.strip() != '']
+    fid.close()
+
+    return times
+
+
+class Checkpoint_writer:
+    """Write the checkpoints of a domain, see Domain.set_checkpointing.
+
+    checkpoint is called by every processor at every yieldstep. The
+    processors agree (by an allreduce) whether a checkpoint is due, from
+    the checkpoint_step yieldsteps or checkpoint_time seconds of walltime
+    of the domain, and which checkpoints every processor has written.
+
+    Each processor writes its checkpoint <name>_<time>.pickle (pickle
+    format) or <name>_<time>.nc (binary format), by a separate thread if
+    asynchronous: the domain is pickled or its state copied in memory and
+    evolve continues while the thread writes it, blocking only if the
+    previous checkpoint is still being written. A checkpoint is published
+    once all processors have written it, by processor 0 rewriting the
+    manifest <global name>_checkpoints.txt which lists the times of the
+    published checkpoints.
+
+    Published checkpoints are deleted unless they are among the keep
+    last ones or the first in an interval of keep_interval seconds of
+    model time (all are kept if both are None).
+    """
+
+    def __init__(self, domain, checkpoint_dir, format='pickle',
+                 asynchronous=False, keep=None, keep_interval=None):
+
+        msg = "Checkpoint format must be either 'pickle' or 'binary'"
+        assert format in ['pickle', 'binary'], msg
+
+        self.domain = domain
+        self.checkpoint_dir = checkpoint_dir
+        self.format = format
+        self.asynchronous = asynchronous
+        self.keep = keep
+        self.keep_interval = keep_interval
+
+        # Times of the checkpoints saved so far, the number of them
+        # written by this processor and published, and the times of the
+        # published checkpoints retained
+        self.times = []
+        self.number_written = 0
+        self.number_published = 0
+        self.retained = []
+
+        self.worker = None
+        self.worker_error = None
+
+    def get_filename(self, time):
+
+        from os.path import join
+
+        if self.format == 'binary':
+            extension = '.nc'
+        else:
+            extension = '.pickle'
+
+        return join(self.checkpoint_dir,
+                    self.domain.get_name()) + '_' + str(time) + extension
+
+    def get_manifest_filename(self):
+
+        domain = self.domain
+        if hasattr(domain, 'get_global_name'):
+            name = domain.get_global_name()
+        else:
+            name = domain.get_name()
+
+        return get_manifest_filename(name, self.checkpoint_dir)
+
+    def checkpoint(self):
+        """Save a checkpoint if one is due and publish those written by all
+        processors (collective)
+        """
+
+        import numpy as num
+
+        domain = self.domain
+
+        if domain.checkpoint_step == 0:
+            due = walltime() - domain.walltime_prev > domain.checkpoint_time
+        else:
+            due = domain.yieldstep_id % domain.checkpoint_step == 0
+
+        self._check_worker_error()
+
+        flags = _allreduce_max(num.array([float(due),
+                                          -float(self.number_written)]))
+
+        self.publish(int(-flags[1]))
+
+        if flags[0] > 0:
+            self.save()
+            domain.walltime_prev = walltime()
+
+    def save(self):
+        """Save a checkpoint of the domain at the current time
+        """
+
+        time = self.domain.get_time()
+
+        if self.format == 'binary':
+            data = get_checkpoint_state(self.domain)
+        else:
+            try:
+                import dill as cPickle
+            except:
+                import cPickle
+            data = cPickle.dumps(self.domain, -1)
+
+        self.times.append(time)
+
+        if self.asynchronous:
+            if self.worker is None:
+                self._start_worker()
+            self.queue.put((time, data))
+        else:
+            self._write(time, data)
+
+    def _write(self, time, data):
+
+        import os
+
+        filename = self.get_filename(time)
+
+        if self.format == 'binary':
+            write_checkpoint_state(data, filename)
+        else:
+            fid = open(filename + '.tmp', 'wb')
+            fid.write(data)
+            fid.close()
+            os.rename(filename + '.tmp', filename)
+
+        self.number_written += 1
+
+    def _start_worker(self):
+
+        import threading
+        import Queue
+
+        # At most one checkpoint waits while another is written
+        self.queue = Queue.Queue(1)
+
+        self.worker = threading.Thread(target=self._worker_loop)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def _worker_loop(self):
+        """Write the queued checkpoints until None is queued
+        """
+
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+
+                if self.worker_error is None:
+                    try:
+                        self._write(*item)
+                    except Exception, e:
+                        self.worker_error = e
+            finally:
+                self.queue.task_done()
+
+    def _check_worker_error(self):
+
+        if self.worker_error is not None:
+            msg = 'Asynchronous checkpoint writing failed: %s' \
+                  % self.worker_error
+            raise Exception(msg)
+
+    def restart(self, published, time):
+        """Continue publishing from the checkpoint at time, loaded on
+        restart, given the times of the published checkpoints (None if
+        there is no manifest). Checkpoints published after time are
+        dropped from the manifest.
+        """
+
+        if published is None:
+            published = []
+
+        retained = [t for t in published if t <= time]
+        if time not in retained:
+            retained.append(time)
+
+        self.times = []
+        self.number_written = 0
+        self.number_published = 0
+        self.retained = retained
+
+    def get_retained(self, times):
+        """Return the times of the checkpoints retained from times
+        """
+
+        if self.keep is None and self.keep_interval is None:
+            return list(times)
+
+        retained = set()
+        if self.keep is not None and self.keep > 0:
+            retained.update(times[-self.keep:])
+
+        if self.keep_interval is not None:
+            interval = None
+            for time in times:
+                k = int(time/self.keep_interval + 1.0e-10)
+                if k != interval:
+                    retained.add(time)
+                    interval = k
+
+        return [time for time in times if time in retained]
+
+    def publish(self, number_written):
+        """Publish the first number_written checkpoints, written by every
+        processor, and delete those not retained
+        """
+
+        import os
+
+        if number_written <= self.number_published:
+            return
+
+        times = self.retained + self.times[self.number_published:
+                                           number_written]
+        retained = self.get_retained(times)
+
+        if myid == 0:
+            filename = self.get_manifest_filename()
+            fid = open(filename + '.tmp', 'w')
+            for time in retained:
+                fid.write(str(time) + '\n')
+            fid.close()
+            os.rename(filename + '.tmp', filename)
+
+        for time in times:
+            if time not in retained:
+                try:
+                    os.remove(self.get_filename(time))
+                except OSError:
+                    pass
+
+        self.number_published = number_written
+        self.retained = retained
+
+    def drain(self):
+        """Wait until all queued checkpoints are written
+        """
+
+        if self.worker is not None:
+            self.queue.join()
+        self._check_worker_error()
+
+    def finish(self):
+        """Write and publish all checkpoints (collective)
+        """
+
+        import numpy as num
+
+        self.drain()
+
+        flags = _allreduce_max(num.array([-float(self.number_written)]))
+        self.publish(int(-flags[0]))
+
+    def close(self):
+        """Stop the writer thread, after writing the queued checkpoints
+        """
+
+        if self.worker is not None:
+            self.queue.put(None)
+            self.worker.join()
+            self.worker = None
+
+    def __getstate__(self):
+        """Do not pickle the writer thread (the domain is pickled with
+        its checkpoint writer)
+        """
+
+        state = self.__dict__.copy()
+        state.pop('queue', None)
+        state['worker'] = None
+
+        return state
+
+
+def load_checkpoint_state(domain, checkpoint_dir='.', time=None):
+    """Restore the state stored by checkpointing with checkpoint_format
+    'binary' into domain, which must be set up as for the run which was
+    checkpointed (same mesh, partition, boundaries and operators).
+
+    The last published checkpoint (see Checkpoint_writer) is loaded, or
+    the last one available on all processors if none was published, or
+    that at time if given. If the domain stores an sww file, timesteps
+    are appended to the existing file. If checkpointing is set up (before
+    loading), the checkpoints published up to the loaded one stay in the
+    manifest and are pruned as the run continues.
+    """
+
+    from os.path import join
+    from anuga.config import netcdf_mode_a
+    from anuga.file.netcdf import NetCDFFile
+
+    domain_name = domain.get_name()
+
+    # Published checkpoints, if checkpoints were published
+    if hasattr(domain, 'get_global_name'):
+        published = read_manifest(domain.get_global_name(), checkpoint_dir)
+    else:
+        published = read_manifest(domain_name, checkpoint_dir)
+
+    if time is None and published is not None:
+        times = published
+    elif time is None:
+        # will pull out the last available time
+        times = _get_checkpoint_times(domain_name, checkpoint_dir, '.nc')
+
+        times = list(times)
+        times.sort()
+    else:
+        times = [float(time)]
+
+    if len(times) == 0: raise Exception, "Unable to open checkpoint file"
+
+    for time in reversed(times):
+
+        filename = join(checkpoint_dir,domain_name)+'_'+str(time)+'.nc'
+
+        try:
+            fid = NetCDFFile(filename)
+            success = True
+        except:
+            success = False
+
+        overall = success
+        for cpu in range(numprocs):
+            if cpu != myid:
+                send(success,cpu)
+
+        for cpu in range(numprocs):
+            if cpu != myid:
+                overall = overall & receive(cpu)
+
+        barrier()
+
+        if overall: break
+
+        if success: fid.close()
+
+    if not overall: raise Exception, "Unable to open checkpoint file"
+
+    try:
+        try: # works with netcdf4
+            number_of_volumes = len(fid.dimensions['number_of_volumes'])
+        except: # works with Scientific.IO.NetCDF
+            number_of_volumes = fid.dimensions['number_of_volumes']
+
+        msg = 'Checkpoint %s has %d triangles but the domain has %d' \
+              % (filename, number_of_volumes, len(domain))
+        if number_of_volumes != len(domain): raise Exception, msg
+
+        operators = domain.fractional_step_operators
+        names = ' '.join([op.__class__.__name__ for op in operators])
+        msg = 'Checkpoint %s has operators "%s" but the domain has "%s"' \
+              % (filename, fid.operators, names)
+        if str(fid.operators) != names: raise Exception, msg
+
+        domain.set_time(float(fid.time))
+        domain.starttime = float(fid.starttime)
+        domain.yieldstep_id = int(fid.yieldstep_id)
+
+        for name in _get_state_quantities(domain):
+            domain.quantities[name].centroid_values[:] = \
+                                  fid.variables[name][:]
+
+        domain.quantities['elevation'].vertex_values[:] = \
+                                  fid.variables['elevation_vertices'][:]
+
+        if domain.quantities_to_be_monitored is not None:
+            for name, info_block in domain.quantities_to_be_monitored.items():
+                for key in info_block:
+                    variable = 'extrema.%s.%s' % (name, key)
+                    if variable in fid.variables:
+                        info_block[key] = _get_value(fid, variable)
+
+        for i, operator in enumerate(operators):
+            prefix = 'operator_%d.' % i
+            state = {}
+            for variable in fid.variables:
+                if variable.startswith(prefix):
+                    state[variable[len(prefix):]] = _get_value(fid, variable)
+            if len(state) > 0:
+                operator.set_state(state)
+    finally:
+        fid.close()
+
+    domain.distribute_to_vertices_and_edges()
+
+    # Continue the manifest of the published checkpoints
+    if domain.checkpoint_writer is not None:
+        domain.checkpoint_writer.restart(published, time)
+
+    # Continue the existing sww file
+    if domain.store is True:
+        domain.initialise_storage(netcdf_mode_a)
+
+    domain.last_walltime = walltime()
+    domain.communication_time = 0.0
+    domain.communication_reduce_time = 0.0
+    domain.communication_broadcast_time = 0.0
+
+
+def _get_checkpoint_times(domain_name, checkpoint_dir, extension=None):
 
     import os
     times = set()
@@ -94,7 +717,10 @@ def _get_checkpoint_times(domain_name, checkpoint_dir):
             return None
         else:
             for filename in filenames:
-                filebase = os.path.splitext(filename)[0].rpartition("_")
+                filebase, ext = os.path.splitext(filename)
+                if extension is not None and ext != extension:
+                    continue
+                filebase = filebase.rpartition("_")
                 time = filebase[-1]
                 domain_name_base = filebase[0]
                 if domain_name_base == domain_name :
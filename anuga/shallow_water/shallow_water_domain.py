@@ -104,6 +104,7 @@ from anuga.abstract_2d_finite_volumes.generic_domain \
 from anuga.shallow_water.forcing import Cross_section
 from anuga.utilities.numerical_tools import mean
 from anuga.file.sww import SWW_file
+from anuga.config import netcdf_mode_w
 
 import anuga.utilities.log as log
 
@@ -174,6 +175,7 @@ class Domain(Generic_Domain):
                  number_of_full_nodes=None,
                  number_of_full_triangles=None,
                  ghost_layer_width=2,
+                 renumbering=None,
                  **kwargs):
 
         """
@@ -219,7 +221,8 @@ class Domain(Generic_Domain):
                             numproc,
                             number_of_full_nodes=number_of_full_nodes,
                             number_of_full_triangles=number_of_full_triangles,
-                            ghost_layer_width=ghost_layer_width)
+                            ghost_layer_width=ghost_layer_width,
+                            renumbering=renumbering)
 
         #-------------------------------
         # Operator Data Structures
@@ -250,6 +253,11 @@ class Domain(Generic_Domain):
         self.set_store(True)
         self.set_store_centroids(True)
         self.set_store_vertices_uniquely(False)
+        self.set_store_original_order(False)
+        self.set_sww_persistent(False)
+        self.set_sww_asynchronous(False)
+        self.set_sww_format('netcdf3')
+        self.set_sww_collective(False)
         self.quantities_to_be_stored = {'elevation': 1,
                                         'friction':1,
                                         'stage': 2,
@@ -263,6 +271,8 @@ class Domain(Generic_Domain):
         self.checkpoint = False
         self.yieldstep_id = 1
         self.checkpoint_step = 10
+        self.checkpoint_format = 'pickle'
+        self.checkpoint_writer = None
 
         #-------------------------------
         # Useful auxiliary quantity
@@ -280,6 +290,9 @@ class Domain(Generic_Domain):
         #                   2 == ?
         #                   etc
         self.edge_flux_type=num.zeros(len(self.edge_coordinates[:,0])).astype(int)
+        # Running count of riverwall edges [edge_river_wall_counter[ki]-1 is
+        # the index of edge ki in riverwallData.riverwall_elevation]
+        self.edge_river_wall_counter=num.zeros(len(self.edge_coordinates[:,0])).astype(int)
 
         # Riverwalls -- initialise with dummy values
         # Presently only works with DE algorithms, will fail otherwise
@@ -302,6 +315,9 @@ class Domain(Generic_Domain):
         # Work arrays [avoid allocate statements in compute_fluxes or extrapolate_second_order]
         self.edge_flux_work=num.zeros(len(self.edge_coordinates[:,0])*3) # Advective fluxes
         self.pressuregrad_work=num.zeros(len(self.edge_coordinates[:,0])) # Gravity related terms
+        # Substep averages of the above, used by local timestepping with rk2/rk3
+        self.edge_flux_work_average=num.zeros(len(self.edge_coordinates[:,0])*3)
+        self.pressuregrad_work_average=num.zeros(len(self.edge_coordinates[:,0]))
         self.x_centroid_work=num.zeros(len(self.edge_coordinates[:,0])/3)
         self.y_centroid_work=num.zeros(len(self.edge_coordinates[:,0])/3)
 
@@ -330,6 +346,49 @@ class Domain(Generic_Domain):
         # extrapolation/flux updating is used)
         self.allow_timestep_increase=num.zeros(1).astype(int)+1
 
+        # Position of the current timestep in the cycle of
+        # max_flux_update_frequency timesteps
+        self.cyclic_number_of_steps=num.zeros(1).astype(int)-1
+
+        ############################################################################
+        ## Active cells (see set_use_active_cells)
+        #
+        # Bit flags describing each triangle [set on all triangles initially
+        # so the first list contains every triangle]
+        self.active_cells_flag=num.zeros(self.number_of_elements).astype(int)+2
+        # Triangles visited by the extrapolation and flux computation
+        self.active_cells=num.zeros(self.number_of_elements).astype(int)
+        # Neighbours of active triangles which are not active themselves
+        self.active_halo_cells=num.zeros(self.number_of_elements).astype(int)
+        # Lengths of active_cells, active_halo_cells and active_cells_marked,
+        # and whether all triangles are checked on the next update
+        self.number_of_active_cells=num.array([0, 0, 0, 1]).astype(int)
+        # Triangles changed by operators since the last update
+        self.active_cells_marked=num.zeros(self.number_of_elements).astype(int)
+        # Work array of the triangles checked by the update
+        self.active_cells_candidates=num.zeros(self.number_of_elements).astype(int)
+        # Stage when each triangle was last extrapolated
+        self.active_cells_stage=num.zeros(self.number_of_elements)
+        self.use_active_cells=False
+
+        # Counts of edge flux evaluations and of wet triangles visited by
+        # the DE flux computation (reported by the evolve profiler)
+        self.kernel_counters=num.zeros(2).astype(int)
+
+        #-------------------------------
+        # Number of OpenMP threads used by
+        # the DE C kernels
+        #-------------------------------
+        from anuga.config import omp_num_threads
+        self.set_omp_num_threads(omp_num_threads)
+
+        #-------------------------------
+        # Run each DE timestep with a
+        # single C call (opt in)
+        #-------------------------------
+        self.fused_timestepping = False
+        self.fused_step = None
+
     def _set_config_defaults(self):
         """Set the default values in this routine. That way we can inherit class
         and just redefine the defaults for the new class
@@ -1032,6 +1091,8 @@ class Domain(Generic_Domain):
 
         Generic_Domain.set_quantity(self, name, *args, **kwargs)
 
+        self.mark_active_cells()
+
 
     def set_store(self, flag=True):
         """Set whether data saved to sww file.
@@ -1058,7 +1119,128 @@ class Domain(Generic_Domain):
 
         return self.store_centroids
 
-    def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None):
+    def set_store_original_order(self, flag=True):
+        """Set whether data is saved to sww file in the original numbering
+        of triangles and nodes, if the domain was created with renumbering.
+        """
+
+        self.store_original_order = flag
+
+    def get_store_original_order(self):
+        """Get whether data is saved to sww file in the original numbering.
+        """
+
+        return self.store_original_order
+
+    def set_sww_persistent(self, flag=True, flush_step=10):
+        """Set whether the sww file is kept open during evolve instead of
+        being reopened at every yieldstep.
+
+        The slice index and the ranges of the stored quantities are then
+        tracked in memory, and the file is flushed to disk every flush_step
+        yieldsteps and closed at the end of evolve (also on an exception).
+        Readers of the sww file may not see the last flush_step-1
+        yieldsteps during the run.
+        """
+
+        msg = 'flush_step must be a positive integer'
+        assert flush_step >= 1, msg
+
+        self.sww_persistent = flag
+        self.sww_flush_step = int(flush_step)
+
+    def get_sww_persistent(self):
+        """Get whether the sww file is kept open during evolve.
+        """
+
+        return self.sww_persistent
+
+    def set_sww_asynchronous(self, flag=True):
+        """Set whether the sww file is written by a separate thread.
+
+        At each yieldstep the stored values are copied into one of two
+        buffers and evolve continues while the writer thread stores them,
+        blocking only if the previous write from that buffer is unfinished.
+        The writes are completed at the end of evolve and before the
+        domain is pickled for a checkpoint. Implies a persistent sww file,
+        see set_sww_persistent for the flushing.
+        """
+
+        self.sww_asynchronous = flag
+
+    def get_sww_asynchronous(self):
+        """Get whether the sww file is written by a separate thread.
+        """
+
+        return self.sww_asynchronous
+
+    def set_sww_format(self, format='netcdf4', chunking='frames',
+                       zlib_level=4, least_significant_digit=None):
+        """Set the file format of the sww file.
+
+        format: 'netcdf3' (default) writes the classic 64 bit offset
+            format, 'netcdf4' the HDF5 based format with chunked and
+            compressed time dependent quantities.
+        chunking: Layout of the time dependent quantities of netcdf4 files.
+            'frames' stores each timestep in one chunk, suited to reading
+            whole timesteps (eg sww2dem, plotting).
+            'timeseries' stores blocks of consecutive timesteps of a range
+            of points, suited to extracting the time series of a few points
+            (eg gauges, file_function). A tuple (timesteps, points) gives
+            the chunk shape explicitly. Timeseries chunks are best combined
+            with set_sww_persistent, with a flush_step that is a multiple
+            of the timesteps of a chunk, as each timestep written to a
+            closed or flushed file compresses the incomplete chunks again.
+        zlib_level: Deflate level 0 to 9, 0 or None for no compression.
+        least_significant_digit: If not None the stored values are
+            quantised to this number of decimal digits (lossy) before
+            compression, eg 3 for millimetres.
+        """
+
+        if format not in ['netcdf3', 'netcdf4']:
+            msg = 'sww format must be netcdf3 or netcdf4, I got %s' % format
+            raise Exception(msg)
+
+        if chunking not in ['frames', 'timeseries'] and \
+               not (isinstance(chunking, (list, tuple)) and len(chunking) == 2):
+            msg = 'sww chunking must be frames, timeseries or a tuple '
+            msg += '(timesteps, points), I got %s' % str(chunking)
+            raise Exception(msg)
+
+        self.sww_format = format
+        self.sww_chunking = chunking
+        self.sww_zlib_level = zlib_level
+        self.sww_least_significant_digit = least_significant_digit
+
+    def get_sww_format(self):
+        """Get the file format of the sww file, see set_sww_format.
+        """
+
+        return self.sww_format
+
+    def set_sww_collective(self, flag=True):
+        """Set whether a parallel domain stores its output in a single sww
+        file of the global mesh instead of one file per processor.
+
+        The values of the full triangles of each processor are sent to
+        processor 0 at each yieldstep, which writes them into
+        <global name>.sww, so the files need not be merged after the run
+        (sww_merge does nothing). Must be set on all processors. Has no
+        effect on sequential domains.
+        """
+
+        self.sww_collective = flag
+
+    def get_sww_collective(self):
+        """Get whether a parallel domain stores a single sww file, see
+        set_sww_collective.
+        """
+
+        return self.sww_collective
+
+    def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None,
+                          checkpoint_format = 'pickle', checkpoint_asynchronous = False,
+                          checkpoint_keep = None, checkpoint_keep_interval = None):
         """
         Set up checkpointing.
 
@@ -1067,8 +1249,23 @@ class Domain(Generic_Domain):
         @param checkpoint_step: Save checkpoint files after this many yieldsteps
         @param checkpoint_time: If set, over-rides checkpoint_step. save checkpoint files
                         after this amount of walltime
+        @param checkpoint_format: 'pickle' to pickle the whole domain (restored
+                        with load_checkpoint_file) or 'binary' to store only the
+                        time varying state (restored into a domain rebuilt from
+                        the original setup with load_checkpoint_state)
+        @param checkpoint_asynchronous: If True checkpoint files are written by a
+                        separate thread while evolve continues
+        @param checkpoint_keep: If set, only keep this many of the last checkpoints
+        @param checkpoint_keep_interval: If set, also keep the first checkpoint in
+                        each interval of this many seconds of model time
+
+        Checkpoints are published in the manifest <name>_checkpoints.txt
+        once written by every processor, see Checkpoint_writer.
         """
 
+        msg = "checkpoint_format must be either 'pickle' or 'binary'"
+        assert checkpoint_format in ['pickle', 'binary'], msg
+
 
 
         if checkpoint:
@@ -1085,7 +1282,17 @@ class Domain(Generic_Domain):
                 self.checkpoint_step = 0
             else:
                 self.checkpoint_step = checkpoint_step
+            self.checkpoint_format = checkpoint_format
             self.checkpoint = True
+
+            from anuga.shallow_water.checkpoint import Checkpoint_writer
+            if self.checkpoint_writer is not None:
+                self.checkpoint_writer.close()
+            self.checkpoint_writer = Checkpoint_writer(self, checkpoint_dir,
+                                                       checkpoint_format,
+                                                       checkpoint_asynchronous,
+                                                       checkpoint_keep,
+                                                       checkpoint_keep_interval)
             #print self.checkpoint_dir, self.checkpoint_step
         else:
             self.checkpoint = False
@@ -1136,15 +1343,257 @@ class Domain(Generic_Domain):
                     domain.set_local_extrapolation_and_flux_updating(nlevels=3)
 
                    (since 2**3==8)
+
+            Works with euler, rk2 and rk3 timestepping, so with all the
+            DE flow algorithms. With rk2 and rk3 an edge flux is updated on
+            every substep of the steps where it is updated, and its
+            substep average is applied on the following steps. Both
+            triangles sharing an edge always use the same flux, so mass
+            is conserved.
         """
 
+        if nlevels != 0:
+            if self.use_active_cells:
+                raise Exception, 'Local extrapolation and flux updating not supported with active cells'
+            if self.compute_fluxes_method != 'DE':
+                raise Exception, 'Local extrapolation and flux updating only supported for discontinuous flow algorithms'
+
         self.max_flux_update_frequency=2**nlevels
+        self.cyclic_number_of_steps[:]=-1
 
-        if(self.max_flux_update_frequency is not 1):
-            if self.timestepping_method is not 'euler':
-                raise Exception, 'Local extrapolation and flux updating only supported with euler timestepping'
-            if self.compute_fluxes_method is not 'DE':
-                raise Exception, 'Local extrapolation and flux updating only supported for discontinuous flow algorithms'
+
+    def set_omp_num_threads(self, n=1):
+        """Set number of OpenMP threads used by the DE flux computation
+        and by the DE second order extrapolation in
+        distribute_to_vertices_and_edges.
+
+        Each MPI process uses this many threads, so when running in parallel
+        choose n so that n*numprocs does not exceed the number of cores.
+        Results are reproducible for a fixed number of threads. Has no
+        effect if the extensions were compiled without OpenMP support.
+        """
+
+        n = int(n)
+        if n < 1:
+            msg = 'Number of OpenMP threads must be at least 1, got %d' % n
+            raise Exception(msg)
+
+        self.omp_num_threads = n
+
+    def get_omp_num_threads(self):
+        """Get number of OpenMP threads used by the DE kernels.
+        """
+
+        return self.omp_num_threads
+
+
+    def set_fused_timestepping(self, flag=True):
+        """Run each euler or rk2 timestep of the DE flow algorithms with a
+        single call to the C extension.
+
+        The domain attributes are extracted once per yieldstep and shared
+        by the protection, extrapolation, flux computation and update of
+        the conserved quantities. Reflective boundaries, Dirichlet
+        boundaries, implicit Manning friction and the update of the
+        timestep are evaluated in C too. Python is only called back for
+        other boundaries and forcing terms and the overrides of the
+        parallel domain, so these behave as before. The results are
+        identical to the standard evolve.
+
+        Reduces the per step overhead, see benchmark_fused_timestepping.py.
+        rk3 timestepping is not fused.
+        """
+
+        if flag and self.compute_fluxes_method != 'DE':
+            msg = 'Fused timestepping only supported for discontinuous flow algorithms'
+            raise Exception(msg)
+
+        self.fused_timestepping = flag
+        self.fused_step = None
+
+    def get_fused_timestepping(self):
+        """Get flag showing whether fused timestepping is used.
+        """
+
+        return self.fused_timestepping
+
+    def _get_fused_step(self):
+        """Return the data of the fused C timestep.
+
+        It is set up again at the first step after the start of evolve
+        and after each yield, as the boundaries, forcing terms and arrays
+        of the domain may have been changed in between.
+        """
+
+        if self.fused_step is not None and self.number_of_steps > 0:
+            return self.fused_step
+
+        from swDE1_domain_ext import fused_step_setup
+        from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+             import Dirichlet_boundary
+        from anuga.shallow_water.boundaries import Reflective_boundary
+
+        def overridden(name, base):
+            method = getattr(self.__class__, name).im_func
+            return name in self.__dict__ or method is not getattr(base, name).im_func
+
+        # Boundaries evaluated in C, the others by evaluate_segment
+        reflective_ids = [num.zeros(0, num.int)]
+        dirichlet_ids = [num.zeros(0, num.int)]
+        dirichlet_values = [num.zeros((0, 3), num.float)]
+        python_boundaries = []
+        for tag in self.tag_boundary_cells:
+            B = self.boundary_map[tag]
+            ids = self.tag_boundary_cells[tag]
+
+            if B is None:
+                continue
+
+            if 'evaluate_segment' in B.__dict__:
+                python_boundaries.append((B, ids))
+            elif B.__class__ is Reflective_boundary:
+                reflective_ids.append(num.array(ids, num.int))
+            elif B.__class__ is Dirichlet_boundary and \
+                     len(B.dirichlet_values) == len(self.evolved_quantities):
+                dirichlet_ids.append(num.array(ids, num.int))
+                dirichlet_values.append(num.repeat([B.dirichlet_values], len(ids), axis=0))
+            else:
+                python_boundaries.append((B, ids))
+
+        if overridden('update_boundary', Generic_Domain):
+            python_boundaries = None
+
+        # Forcing terms: 0 none, 1 and 2 flat and sloped implicit Manning
+        # friction, 3 compute_forcing_terms
+        if overridden('compute_forcing_terms', Domain):
+            forcing = 3
+        elif self.forcing_terms == []:
+            forcing = 0
+        elif self.forcing_terms == [manning_friction_implicit]:
+            forcing = 2 if self.use_sloped_mannings else 1
+        else:
+            forcing = 3
+
+        python_timestep = overridden('update_timestep', Generic_Domain) or \
+            self.protect_against_isolated_degenerate_timesteps is not False
+        python_ghosts = overridden('update_ghosts', Generic_Domain) or \
+            self.processor in self.full_send_dict
+
+        self.fused_step = fused_step_setup(self,
+                                           num.concatenate(reflective_ids),
+                                           num.concatenate(dirichlet_ids),
+                                           num.concatenate(dirichlet_values),
+                                           python_boundaries, forcing,
+                                           python_timestep, python_ghosts)
+
+        return self.fused_step
+
+    def __getstate__(self):
+        """Do not pickle the data of the fused timestep, which is set up
+        again by the next step.
+        """
+
+        state = Generic_Domain.__getstate__(self)
+        state['fused_step'] = None
+
+        return state
+
+
+    def set_use_active_cells(self, flag=True):
+        """Restrict the DE extrapolation and flux computation to the
+        active triangles.
+
+        A triangle is active if it or one of its neighbours is wet, has
+        moving water, has a boundary edge or changed stage since the last
+        extrapolation. The list is rebuilt on every extrapolation (after
+        update_ghosts, so ghost triangles are handled like the others) and
+        fluxes across the edges between active triangles and their
+        inactive neighbours are still computed, so mass is conserved and
+        the results are identical to those of the full computation.
+
+        The list is kept up to date incrementally: protection, the update
+        of the conserved quantities and the next update of the list only
+        visit the listed triangles, the ghost triangles and the triangles
+        changed by the fractional step operators (see mark_active_cells),
+        so the cost of each timestep follows the wet area. All triangles
+        are checked again after set_quantity, at each yieldstep, after rk3
+        steps (whose final combination is not exact for unchanged values)
+        and on the steps where forcing terms other than friction are used.
+        Code changing the quantities in other ways should call
+        mark_active_cells. Not supported with local extrapolation and flux
+        updating.
+        """
+
+        if flag and self.compute_fluxes_method != 'DE':
+            msg = 'Active cells only supported for discontinuous flow algorithms'
+            raise Exception(msg)
+
+        if flag and self.max_flux_update_frequency != 1:
+            msg = 'Active cells not supported with local extrapolation and flux updating'
+            raise Exception(msg)
+
+        # Rebuild the lists from scratch
+        self.active_cells_flag[:] = 2
+        self.number_of_active_cells[:] = [0, 0, 0, 1]
+
+        self.use_active_cells = flag
+
+    def mark_active_cells(self, indices=None):
+        """Mark the triangles whose centroid values were changed outside the
+        DE kernels, so that the next update of the active cells checks them.
+
+        With indices None all the triangles are checked.
+        """
+
+        # (Quantities set while the generic domain is initialised are
+        # checked by the first update anyway)
+        if not getattr(self, 'use_active_cells', False):
+            return
+
+        number_of_active_cells = self.number_of_active_cells
+        if indices is None:
+            number_of_active_cells[3] = 1
+            return
+
+        if number_of_active_cells[3]:
+            return
+
+        indices = num.asarray(indices, dtype=int).ravel()
+        first = number_of_active_cells[2]
+        last = first + len(indices)
+        if last > len(self.active_cells_marked):
+            # Cheaper to check all triangles
+            number_of_active_cells[3] = 1
+            return
+
+        self.active_cells_marked[first:last] = indices
+        number_of_active_cells[2] = last
+
+    def get_use_active_cells(self):
+        """Get flag showing whether the DE kernels are restricted to the
+        active triangles.
+        """
+
+        return self.use_active_cells
+
+    def get_number_of_active_cells(self):
+        """Return the number of active triangles and the number of
+        triangles in their halo, as found by the last extrapolation.
+        """
+
+        if not self.use_active_cells:
+            return self.number_of_elements, 0
+
+        return int(self.number_of_active_cells[0]), \
+               int(self.number_of_active_cells[1])
+
+    def get_profile_counters(self):
+        """Return the number of edge flux evaluations and of wet triangles
+        visited by the DE flux computation, for the evolve profiler
+        """
+
+        return {'flux_evaluations': int(self.kernel_counters[0]),
+                'wet_cells': int(self.kernel_counters[1])}
 
 
     def get_compute_fluxes_method(self):
@@ -1792,6 +2241,72 @@ class Domain(Generic_Domain):
         extrapol2(self)
 
     #@profile
+    def evolve_one_euler_step(self, yieldstep, finaltime):
+        """One Euler Time Step
+
+        Uses the fused C step if set_fused_timestepping has been called.
+        """
+
+        if self.fused_timestepping and self.compute_fluxes_method == 'DE':
+            from swDE1_domain_ext import evolve_one_euler_step as evolve_one_euler_step_ext
+            evolve_one_euler_step_ext(self, self._get_fused_step(), yieldstep, finaltime)
+        else:
+            Generic_Domain.evolve_one_euler_step(self, yieldstep, finaltime)
+
+    def evolve_one_rk2_step(self, yieldstep, finaltime):
+        """One 2nd order RK timestep
+
+        Uses the fused C step if set_fused_timestepping has been called.
+        """
+
+        if self.fused_timestepping and self.compute_fluxes_method == 'DE':
+            from swDE1_domain_ext import evolve_one_rk2_step as evolve_one_rk2_step_ext
+            evolve_one_rk2_step_ext(self, self._get_fused_step(), yieldstep, finaltime)
+        else:
+            Generic_Domain.evolve_one_rk2_step(self, yieldstep, finaltime)
+
+    def evolve_one_rk3_step(self, yieldstep, finaltime):
+        """One 3rd order RK timestep
+
+        The final combination of the substeps can change the centroid
+        values of unchanged triangles by a rounding error, so the active
+        cells are then checked again.
+        """
+
+        Generic_Domain.evolve_one_rk3_step(self, yieldstep, finaltime)
+
+        self.mark_active_cells()
+
+    def compute_forcing_terms(self):
+        """Apply the forcing terms.
+
+        Forcing terms other than friction may change any triangle, so the
+        active cells are then checked again.
+        """
+
+        Generic_Domain.compute_forcing_terms(self)
+
+        if self.use_active_cells:
+            for f in self.forcing_terms:
+                if f not in [manning_friction_implicit, manning_friction_explicit]:
+                    self.mark_active_cells()
+                    break
+
+    def apply_fractional_steps(self):
+        """Apply the fractional step operators, marking the triangles they
+        may have changed for the update of the active cells.
+        """
+
+        Generic_Domain.apply_fractional_steps(self)
+
+        if self.use_active_cells:
+            for operator in self.fractional_step_operators:
+                get_changed_indices = getattr(operator, 'get_changed_indices', None)
+                if get_changed_indices is None:
+                    self.mark_active_cells()
+                else:
+                    self.mark_active_cells(get_changed_indices())
+
     def compute_fluxes(self):
         """Compute fluxes and timestep suitable for all volumes in domain.
 
@@ -1985,7 +2500,7 @@ class Domain(Generic_Domain):
 
             # Do protection step
             self.protect_against_infinitesimal_and_negative_heights()
-            # Do extrapolation step
+            # Do extrapolation step (threaded if self.omp_num_threads > 1)
             from swDE1_domain_ext import extrapolate_second_order_edge_sw as extrapol2
             extrapol2(self)
 
@@ -2199,6 +2714,11 @@ class Domain(Generic_Domain):
 
         timestep = self.timestep
 
+        if self.use_active_cells:
+            # Only update the active triangles
+            from swDE1_domain_ext import update_conserved_quantities as update_ext
+            update_ext(self, timestep)
+            return
 
         # Update conserved_quantities
         #for name in self.conserved_quantities:
@@ -2419,66 +2939,64 @@ class Domain(Generic_Domain):
         # and or visualisation.
         # This is done again in the initialisation of the Generic_Domain
         # evolve loop but we do it here to ensure the values are ok for storage.
+        self.mark_active_cells()
         self.distribute_to_vertices_and_edges()
 
         if self.store is True and self.get_time() == 0.0:
             self.initialise_storage()
 
 
-        # Call basic machinery from parent class
-        for t in self._evolve_base(yieldstep=yieldstep,
-                                   finaltime=finaltime, duration=duration,
-                                   skip_initial_step=skip_initial_step):
-
-            self.yieldstep_id += 1
-            walltime = time.time()
-
-            #print t , self.get_time()
-            # Store model data, e.g. for subsequent visualisation
-            if self.store is True:
-                self.store_timestep()
-
-            if self.checkpoint:
-
+        try:
+            # Call basic machinery from parent class
+            for t in self._evolve_base(yieldstep=yieldstep,
+                                       finaltime=finaltime, duration=duration,
+                                       skip_initial_step=skip_initial_step):
 
-                save_checkpoint=False
-                if self.checkpoint_step == 0:
-                    if rank() == 0:
-                        if walltime - self.walltime_prev > self.checkpoint_time:
+                self.yieldstep_id += 1
 
-                            save_checkpoint = True
-                        for cpu in range(size()):
-                            if cpu != rank():
-                                send(save_checkpoint, cpu)
-                    else:
-                        save_checkpoint = receive(0)
+                #print t , self.get_time()
+                # Store model data, e.g. for subsequent visualisation
+                if self.store is True:
+                    self.store_timestep()
 
-                elif self.yieldstep_id%self.checkpoint_step == 0:
-                        save_checkpoint = True
+                if self.checkpoint:
+                    self.checkpoint_writer.checkpoint()
 
-                if save_checkpoint:
-                    pickle_name = os.path.join(self.checkpoint_dir,self.get_name())+'_'+str(self.get_time())+'.pickle'
-                    cPickle.dump(self, open(pickle_name, 'wb'))
+                if self.profiler is not None:
+                    self.profiler.record(self)
 
-                    barrier()
-                    self.walltime_prev = time.time()
+                # Pass control on to outer loop for more specific actions
+                yield(t)
 
-                    #print 'Stored Checkpoint File '+pickle_name
+                # The quantities may have been changed while yielding
+                self.mark_active_cells()
 
-            # Pass control on to outer loop for more specific actions
-            yield(t)
+            # Publish the last checkpoints
+            if self.checkpoint:
+                self.checkpoint_writer.finish()
+        finally:
+            # Close a persistent sww file at the end of evolve or
+            # on an exception
+            if self.store is True and hasattr(self, 'writer'):
+                self.writer.close()
+            if self.checkpoint_writer is not None:
+                self.checkpoint_writer.close()
 
 
-    def initialise_storage(self):
+    def initialise_storage(self, mode=netcdf_mode_w):
         """Create and initialise self.writer object for storing data.
         Also, save x,y and bed elevation
+
+        With mode netcdf_mode_a timesteps are appended to the existing
+        sww file instead, e.g. when restoring a checkpoint
         """
 
         # Initialise writer
-        self.writer = SWW_file(self)
+        self.writer = SWW_file(self, mode=mode)
 
         # Store vertices and connectivity
-        self.writer.store_connectivity()
+        if mode[0] == 'w':
+            self.writer.store_connectivity()
 
 
     def store_timestep(self):
@@ -2512,6 +3030,14 @@ class Domain(Generic_Domain):
         msg = Generic_Domain.timestepping_statistics(self, track_speeds,
                                                      triangle_id, relative_time)
 
+        if self.use_active_cells:
+            # Report the active triangles on the first line
+            active, halo = self.get_number_of_active_cells()
+            lines = msg.split('\n', 1)
+            lines[0] += ', active cells=%d (halo %d) of %d' \
+                        % (active, halo, self.number_of_elements)
+            msg = '\n'.join(lines)
+
         if track_speeds is True:
             # qwidth determines the text field used for quantities
             qwidth = self.qwidth
@@ -21,6 +21,10 @@
 #include <stdio.h>
 //#include "numpy_shim.h"
 
+#if defined(_OPENMP)
+   #include "omp.h"
+#endif
+
 // Shared code snippets
 #include "util_ext.h"
 #include "sw_domain.h"
@@ -28,6 +32,21 @@
 
 const double pi = 3.14159265358979;
 
+// Bits of active_cells_flag (see _update_active_cells)
+#define CHANGING_CELL 1          // Wet, moving or next to a boundary
+#define CHANGING_NEIGHBOURHOOD 2 // Changing triangle or neighbour of one
+#define PREVIOUS_NEIGHBOURHOOD 4 // CHANGING_NEIGHBOURHOOD on the last call
+#define ACTIVE_CELL 8            // In active_cells
+#define HALO_CELL 16             // In active_halo_cells
+#define LISTED_CELL 32           // In either list on the last call
+#define CANDIDATE_CELL 64        // Checked by the current update
+
+// Entries of number_of_active_cells
+#define NUMBER_OF_ACTIVE 0       // Length of active_cells
+#define NUMBER_OF_HALO 1         // Length of active_halo_cells
+#define NUMBER_OF_MARKED 2       // Length of active_cells_marked
+#define RESCAN_ALL 3             // Check all the triangles on the next update
+
 // Trick to compute n modulo d (n%d in python) when d is a power of 2
 unsigned int Mod_of_power_2(unsigned int n, unsigned int d)
 {
@@ -138,8 +157,9 @@ water model for two-dimensional dam-break type. Journal of Computational Physics
   double u_m, h_m, soundspeed_m, s_m;
   double denom, inverse_denominator;
   double uint, t1, t2, t3, min_speed, tmp;
-  // Workspace (allocate once, use many)
-  static double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
+  // Workspace (not static, as the flux functions are called from several
+  // OpenMP threads)
+  double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
 
 
   // Copy conserved quantities to protect from modification
@@ -316,8 +336,9 @@ int _flux_function_central(double *q_left, double *q_right,
   double s_min, s_max, soundspeed_left, soundspeed_right;
   double denom, inverse_denominator;
   double uint, t1, t2, t3, min_speed, tmp;
-  // Workspace (allocate once, use many)
-  static double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
+  // Workspace (not static, as the flux functions are called from several
+  // OpenMP threads)
+  double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
 
   if(h_left==0. && h_right==0.){
     // Quick exit
@@ -468,21 +489,29 @@ int _compute_flux_update_frequency(struct domain *D, double timestep){
     //
     // Local variables
     int k, i, k3, ki, m, n, nm, ii, j, ii2;
-    long fuf;
+    long fuf, cyclic_number_of_steps;
     double notSoFast=1.0;
-    static int cyclic_number_of_steps=-1;
 
     // QUICK EXIT
     if(D->max_flux_update_frequency==1){
         return 0;
     }
-    
-    // Count the steps
-    cyclic_number_of_steps++;
-    if(cyclic_number_of_steps==D->max_flux_update_frequency){
+
+    // With rk2 and rk3 a frozen edge flux is the substep average from the
+    // last update, which is only accurate for a shorter time with the
+    // steeper reconstructions (beta=1) of those algorithms
+    if(D->timestep_fluxcalls>1){
+        notSoFast=0.5;
+    }
+
+    // Count the steps (kept with the domain, so several domains can use
+    // local timestepping in the same process)
+    cyclic_number_of_steps = D->cyclic_number_of_steps[0] + 1;
+    if(cyclic_number_of_steps>=D->max_flux_update_frequency){
         // The flux was just updated in every cell
         cyclic_number_of_steps=0;
     }
+    D->cyclic_number_of_steps[0] = cyclic_number_of_steps;
 
 
     // PART 1: ONLY OCCURS FOLLOWING FLUX UPDATE
@@ -709,33 +738,276 @@ double adjust_edgeflux_with_weir(double *edgeflux,
     return 0;
 }
 
-// Computational function for flux computation
-double _compute_fluxes_central(struct domain *D, double timestep){
+// Compute the flux across edge i of triangle kk, storing it (and the
+// pressure gradient terms) in the edge work arrays of both triangles
+// sharing the edge. Updates the timestep and maximal speed of triangle kk.
+static void _compute_edge_flux(struct domain *D, int kk, int i,
+                               long call, long substep_count,
+                               double limiting_threshold,
+                               double *thread_timestep,
+                               double *speed_max_last) {
 
-    // Local variables
-    double max_speed_local, length, inv_area, zl, zr;
+    double max_speed_local, length, zl, zr;
     double h_left, h_right, z_half ;  // For andusse scheme
-    // FIXME: limiting_threshold is not used for DE1
-    double limiting_threshold = 10*D->H0;
-    //
-    int k, i, m, n,j, ii;
-    int ki,k3, nm = 0, ki2,ki3, nm3; // Index shorthands
-    // Workspace (making them static actually made function slightly slower (Ole))
+    int m, n, ii;
+    int ki, nm = 0, ki2, ki3, nm3 = 0; // Index shorthands
     double ql[3], qr[3], edgeflux[3]; // Work array for summing up fluxes
-    double stage_edges[3];//Work array
     double bedslope_work;
-    static double local_timestep;
-    int neighbours_wet[3];//Work array
-    long RiverWall_count, substep_count;
-    double hle, hre, zc, zc_n, Qfactor, s1, s2, h1, h2; 
-    double stage_edge_lim, outgoing_mass_edges, pressure_flux, hc, hc_n, tmp, tmp2;
+    long RiverWall_count = 0;
+    double zc, zc_n, Qfactor, s1, s2, h1, h2;
+    double hle, hre, pressure_flux, hc, hc_n, tmp;
     double h_left_tmp, h_right_tmp;
+    double weir_height;
+
+    ki = kk * 3 + i; // Linear index to edge i of triangle kk
+    ki2 = 2 * ki; //kk*6 + i*2
+    ki3 = 3*ki;
+
+    n = D->neighbours[ki];
+    if (n >= 0) {
+        m = D->neighbour_edges[ki];
+        nm = n * 3 + m; // Linear index (triangle n, edge m)
+        nm3 = nm*3;
+    }
+
+    // Get left hand side values from triangle kk, edge i
+    ql[0] = D->stage_edge_values[ki];
+    ql[1] = D->xmom_edge_values[ki];
+    ql[2] = D->ymom_edge_values[ki];
+    zl = D->bed_edge_values[ki];
+    hc = D->height_centroid_values[kk];
+    zc = D->bed_centroid_values[kk];
+    hle= D->height_edge_values[ki];
+
+    // Get right hand side values either from neighbouring triangle
+    // or from boundary array (Quantities at neighbour on nearest face).
+    hc_n = hc;
+    zc_n = D->bed_centroid_values[kk];
+    if (n < 0) {
+        // Neighbour is a boundary condition
+        m = -n - 1; // Convert negative flag to boundary index
+
+        qr[0] = D->stage_boundary_values[m];
+        qr[1] = D->xmom_boundary_values[m];
+        qr[2] = D->ymom_boundary_values[m];
+        zr = zl; // Extend bed elevation to boundary
+        hre= max(qr[0]-zr,0.);//hle; 
+    } else {
+        // Neighbour is a real triangle
+        hc_n = D->height_centroid_values[n];
+        zc_n = D->bed_centroid_values[n];
+
+        qr[0] = D->stage_edge_values[nm];
+        qr[1] = D->xmom_edge_values[nm];
+        qr[2] = D->ymom_edge_values[nm];
+        zr = D->bed_edge_values[nm];
+        hre = D->height_edge_values[nm];
+    }
+  
+    // Audusse magic 
+    z_half = max(zl, zr);
+
+    //// Account for riverwalls
+    if(D->edge_flux_type[ki] == 1){
+        if( n>=0 && D->edge_flux_type[nm] != 1){
+            printf("Riverwall Error\n");
+        }
+        // Index of this edge in riverwall_elevation + riverwall_rowIndex
+        // (plus one), precomputed as a running count of riverwall edges
+        RiverWall_count = D->edge_river_wall_counter[ki];
+        
+        // Set central bed to riverwall elevation
+        z_half = max(D->riverwall_elevation[RiverWall_count-1], z_half) ;
+
+    }
+
+    // Define h left/right for Audusse flux method
+    h_left = max(hle+zl-z_half,0.);
+    h_right = max(hre+zr-z_half,0.);
+
+    // Edge flux computation (triangle kk, edge i)
+    _flux_function_central(ql, qr,
+    //_flux_function_toro(ql, qr,
+        h_left, h_right,
+        hle, hre,
+        D->normals[ki2],D->normals[ki2 + 1],
+        D->epsilon, z_half, limiting_threshold, D->g,
+        edgeflux, &max_speed_local, &pressure_flux, hc, hc_n);
+
+    // Force weir discharge to match weir theory
+    // FIXME: Switched off at the moment
+    if(D->edge_flux_type[ki]==1){
+        weir_height = max(D->riverwall_elevation[RiverWall_count-1] - min(zl, zr), 0.); // Reference weir height  
+
+        // If the weir is not higher than both neighbouring cells, then
+        // do not try to match the weir equation. If we do, it seems we
+        // can get mass conservation issues (caused by large weir
+        // fluxes in such situations)
+        if(D->riverwall_elevation[RiverWall_count-1] > max(zc, zc_n)){
+            ////////////////////////////////////////////////////////////////////////////////////
+            // Use first-order h's for weir -- as the 'upstream/downstream' heads are
+            //  measured away from the weir itself
+            h_left_tmp = max(D->stage_centroid_values[kk] - z_half, 0.);
+            if(n >= 0){
+                h_right_tmp = max(D->stage_centroid_values[n] - z_half, 0.);
+            }else{
+                h_right_tmp = max(hc_n + zr - z_half, 0.);
+            }
+
+            if( (h_left_tmp > 0.) || (h_right_tmp > 0.)){
+
+                //////////////////////////////////////////////////////////////////////////////////
+                // Get Qfactor index - multiply the idealised weir discharge by this constant factor
+                ii = D->riverwall_rowIndex[RiverWall_count-1] * D->ncol_riverwall_hydraulic_properties;
+                Qfactor = D->riverwall_hydraulic_properties[ii];
+
+                // Get s1, submergence ratio at which we start blending with the shallow water solution 
+                ii+=1;
+                s1 = D->riverwall_hydraulic_properties[ii];
+
+                // Get s2, submergence ratio at which we entirely use the shallow water solution 
+                ii+=1;
+                s2 = D->riverwall_hydraulic_properties[ii];
+
+                // Get h1, tailwater head / weir height at which we start blending with the shallow water solution
+                ii+=1;
+                h1 = D->riverwall_hydraulic_properties[ii];
+
+                // Get h2, tailwater head / weir height at which we entirely use the shallow water solution 
+                ii+=1;
+                h2 = D->riverwall_hydraulic_properties[ii];
+                
+                // Weir flux adjustment 
+                // FIXME
+                adjust_edgeflux_with_weir(edgeflux, h_left_tmp, h_right_tmp, D->g, 
+                                          weir_height, Qfactor, 
+                                          s1, s2, h1, h2, &max_speed_local);
+            }
+        }
+    }
+    
+    // Multiply edgeflux by edgelength
+    length = D->edgelengths[ki];
+    edgeflux[0] *= length;
+    edgeflux[1] *= length;
+    edgeflux[2] *= length;
+
+    D->edge_flux_work[ki3 + 0 ] = -edgeflux[0];
+    D->edge_flux_work[ki3 + 1 ] = -edgeflux[1];
+    D->edge_flux_work[ki3 + 2 ] = -edgeflux[2];
+
+    // bedslope_work contains all gravity related terms
+    bedslope_work = length*(- D->g *0.5*(h_left*h_left - hle*hle -(hle+hc)*(zl-zc))+pressure_flux);
+
+    D->pressuregrad_work[ki] = bedslope_work;
+    
+    D->already_computed_flux[ki] = call; // #kk Done
+
+    // Update neighbour n with same flux but reversed sign
+    if (n >= 0) {
+
+        D->edge_flux_work[nm3 + 0 ] = edgeflux[0];
+        D->edge_flux_work[nm3 + 1 ] = edgeflux[1];
+        D->edge_flux_work[nm3 + 2 ] = edgeflux[2];
+        bedslope_work = length*(-D->g * 0.5 *( h_right*h_right - hre*hre- (hre+hc_n)*(zr-zc_n)) + pressure_flux);
+        D->pressuregrad_work[nm] = bedslope_work;
+
+        D->already_computed_flux[nm] = call; // #n Done
+    }
+
+    // Update timestep based on edge i and possibly neighbour n
+    // NOTE: We should only change the timestep on the 'first substep'
+    //  of the timestepping method [substep_count==0]
+    if(substep_count==0){
+
+        // Compute the 'edge-timesteps' (useful for setting flux_update_frequency)
+        tmp = 1.0 / max(max_speed_local, D->epsilon);
+        D->edge_timestep[ki] = D->radii[kk] * tmp ;
+        if (n >= 0) {
+            D->edge_timestep[nm] = D->radii[n] * tmp;
+        }
+
+        // Update the timestep
+        if ((D->tri_full_flag[kk] == 1)) {
+
+            *speed_max_last = max(*speed_max_last, max_speed_local);
+
+            if (max_speed_local > D->epsilon) {
+                // Apply CFL condition for triangles joining this edge (triangle kk and triangle n)
+
+                // CFL for triangle kk
+                *thread_timestep = min(*thread_timestep, D->edge_timestep[ki]);
+
+                if (n >= 0) {
+                    // Apply CFL condition for neigbour n (which is on the ith edge of triangle kk)
+                    *thread_timestep = min(*thread_timestep, D->edge_timestep[nm]);
+                }
+            }
+        }
+    }
+}
+
+// Computational function for flux computation
+//
+// Every edge is owned by the triangle with the smaller index (boundary edges
+// by their only triangle). The owner computes the edge flux and writes it to
+// the edge_flux_work slots of both triangles, so each slot is written by a
+// single thread and the triangle loops can be shared between OpenMP threads
+// without locks or atomics. The timestep and boundary flux reductions are
+// accumulated per thread and combined in thread order, so results are
+// bitwise reproducible for a given number of threads.
+//
+// With active cells only the listed triangles are visited. An edge between
+// an active triangle and an inactive owner is computed by the active
+// triangle on behalf of the owner, so each edge is still computed once and
+// in the same way as by the full loop.
+//
+// The computation can also be split in two parts (part 0 computes all the
+// fluxes at once). Part 1 visits the interior triangles (interior[k] == 1),
+// which must not have boundary edges, and computes all their edges, on
+// behalf of the owner if need be. Part 2 visits the other triangles and
+// computes the remaining edges. Part 1 only reads the edge values of the
+// interior triangles and their neighbours, so a parallel domain can run it
+// while the ghost values are received. The timestep is returned by part 2.
+
+// Is triangle k visited by the triangle loops?
+static int _visits_triangle(struct domain *D, long *interior, int part, int k) {
+
+    if (D->use_active_cells) {
+        return (D->active_cells_flag[k] & ACTIVE_CELL) != 0;
+    }
+    if (part == 1) {
+        return interior[k] == 1;
+    }
+    if (part == 2) {
+        return interior[k] != 1;
+    }
+    return 1;
+}
+
+double _compute_fluxes_central_part(struct domain *D, double timestep,
+                                    long *interior, int part){
+
+    // FIXME: limiting_threshold is not used for DE1
+    double limiting_threshold = 10*D->H0;
+    int j, t, nthreads, number_of_active, number_of_halo, average_edge_fluxes;
+    static double local_timestep;
+    long substep_count;
     static long call = 0; // Static local variable flagging already computed flux
     static long timestep_fluxcalls=1;
     static long base_call = 1;
-    double speed_max_last, vol, weir_height;
+    double *partial_timestep, *partial_boundary_flux;
+    double substep_weight = 1.0;
 
-    call++; // Flag 'id' of flux calculation for this timestep
+    if (part != 0 && D->use_active_cells) {
+        report_python_error(AT, "the flux computation can not be split with active cells");
+        return -1.0;
+    }
+
+    // Part 2 continues the flux calculation started by part 1
+    if (part != 2) {
+        call++; // Flag 'id' of flux calculation for this timestep
+    }
 
     if (D->timestep_fluxcalls != timestep_fluxcalls) {
     	timestep_fluxcalls = D->timestep_fluxcalls;
@@ -744,345 +1016,266 @@ double _compute_fluxes_central(struct domain *D, double timestep){
 
     // Set explicit_update to zero for all conserved_quantities.
     // This assumes compute_fluxes called before forcing terms
-    memset((char*) D->stage_explicit_update, 0, D->number_of_elements * sizeof (double));
-    memset((char*) D->xmom_explicit_update, 0, D->number_of_elements * sizeof (double));
-    memset((char*) D->ymom_explicit_update, 0, D->number_of_elements * sizeof (double));
-
+    if (part != 2) {
+        memset((char*) D->stage_explicit_update, 0, D->number_of_elements * sizeof (double));
+        memset((char*) D->xmom_explicit_update, 0, D->number_of_elements * sizeof (double));
+        memset((char*) D->ymom_explicit_update, 0, D->number_of_elements * sizeof (double));
+    }
 
-    // Counter for riverwall edges
-    RiverWall_count=0;
     // Which substep of the timestepping method are we on?
     substep_count=(call-base_call)%D->timestep_fluxcalls;
     
     //printf("call = %d substep_count = %d base_call = %d \n",call,substep_count, base_call);
 
+    // With local timestepping and a multistep method an edge flux which is
+    // updated on this step is replaced after the last substep by its
+    // average over the substeps, weighted as in the final combination of
+    // the substeps. Steps which do not update the flux then apply this
+    // average on every substep, so over one step they move the same amount
+    // across the edge, in both directions
+    average_edge_fluxes = (D->max_flux_update_frequency != 1 && D->timestep_fluxcalls > 1);
+    if (average_edge_fluxes) {
+        if (D->timestep_fluxcalls == 2) {
+            // rk2: Q^{n+1} = Q^n + dt*(L_0 + L_1)/2
+            substep_weight = 0.5;
+        } else if (D->timestep_fluxcalls == 3) {
+            // rk3: Q^{n+1} = Q^n + dt*(L_0 + L_1 + 4*L_2)/6
+            substep_weight = (substep_count < 2) ? 1.0/6.0 : 2.0/3.0;
+        } else {
+            report_python_error(AT, "local timestepping only supports euler, rk2 and rk3");
+            return -1.0;
+        }
+    }
+
     // Fluxes are not updated every timestep,
     // but all fluxes ARE updated when the following condition holds
-    if(D->allow_timestep_increase[0]==1){
+    // (The timestep is only computed on the first substep of rk2/rk3)
+    if(D->allow_timestep_increase[0]==1 && substep_count==0 && part != 2){
         // We can only increase the timestep if all fluxes are allowed to be updated
         // If this is not done the timestep can't increase (since local_timestep is static)
         local_timestep=1.0e+100;
     }
 
-    // For all triangles
-    for (k = 0; k < D->number_of_elements; k++) {
+    // Work arrays for the per thread reductions
+    nthreads = (D->omp_num_threads > 1) ? D->omp_num_threads : 1;
+    partial_timestep = malloc(nthreads*sizeof(double));
+    partial_boundary_flux = malloc(nthreads*sizeof(double));
+    if (partial_timestep == NULL || partial_boundary_flux == NULL) {
+        free(partial_timestep);
+        free(partial_boundary_flux);
+        report_python_error(AT, "could not allocate reduction work arrays");
+        return -1.0;
+    }
+    for (t = 0; t < nthreads; t++) {
+        partial_timestep[t] = local_timestep;
+        partial_boundary_flux[t] = 0.0;
+    }
+
+    // Triangles in the halo of the active list are not visited, but still
+    // collect the fluxes across their edges to active triangles
+    if (D->use_active_cells) {
+        number_of_active = D->number_of_active_cells[NUMBER_OF_ACTIVE];
+        number_of_halo = D->number_of_active_cells[NUMBER_OF_HALO];
+        if (substep_count == 0) {
+            for (j = 0; j < number_of_halo; j++) {
+                D->max_speed[D->active_halo_cells[j]] = 0.0;
+            }
+        }
+    } else {
+        number_of_active = D->number_of_elements;
+        number_of_halo = 0;
+    }
+
+    // The maximal speeds of the triangles visited by part 2 also collect
+    // the edges computed on their behalf by part 1
+    if (part == 1 && substep_count == 0) {
+        for (j = 0; j < D->number_of_elements; j++) {
+            if (interior[j] != 1) D->max_speed[j] = 0.0;
+        }
+    }
+
+    #pragma omp parallel num_threads(nthreads)
+    {
+    // Thread private variables
+    double inv_area;
+    int kk, i, j, n, tid;
+    int ki, ki2, ki3; // Index shorthands
+    double speed_max_last, speed_max_inactive;
+    double thread_timestep, thread_boundary_flux;
+    long thread_flux_evaluations, thread_wet_cells;
+
+    tid = 0;
+#if defined(_OPENMP)
+    tid = omp_get_thread_num();
+#endif
+    thread_timestep = partial_timestep[tid];
+    thread_boundary_flux = 0.0;
+    thread_flux_evaluations = 0;
+    thread_wet_cells = 0;
+
+    // For all (active) triangles
+    #pragma omp for schedule(static)
+    for (j = 0; j < number_of_active; j++) {
+        kk = D->use_active_cells ? D->active_cells[j] : j;
+        if (part != 0 && !_visits_triangle(D, interior, part, kk)) {
+            continue;
+        }
         speed_max_last = 0.0;
 
+        if (D->height_centroid_values[kk] > D->minimum_allowed_height) {
+            thread_wet_cells++;
+        }
+
         // Loop through neighbours and compute edge flux for each
         for (i = 0; i < 3; i++) {
-            ki = k * 3 + i; // Linear index to edge i of triangle k
-            ki2 = 2 * ki; //k*6 + i*2
-            ki3 = 3*ki; 
-
-            if ((D->already_computed_flux[ki] == call) || (D->update_next_flux[ki]!=1)) {
-                // We've already computed the flux across this edge
-                // Check if it is a riverwall
-                if(D->edge_flux_type[ki] == 1){
-                    // Update counter of riverwall edges == index of
-                    // riverwall_elevation + riverwall_rowIndex
-                    RiverWall_count += 1;
-                }
-                continue;
-            }
-
-            // Get left hand side values from triangle k, edge i
-            ql[0] = D->stage_edge_values[ki];
-            ql[1] = D->xmom_edge_values[ki];
-            ql[2] = D->ymom_edge_values[ki];
-            zl = D->bed_edge_values[ki];
-            hc = D->height_centroid_values[k];
-            zc = D->bed_centroid_values[k];
-            hle= D->height_edge_values[ki];
-
-            // Get right hand side values either from neighbouring triangle
-            // or from boundary array (Quantities at neighbour on nearest face).
+            ki = kk * 3 + i; // Linear index to edge i of triangle kk
             n = D->neighbours[ki];
-            hc_n = hc;
-            zc_n = D->bed_centroid_values[k];
-            if (n < 0) {
-                // Neighbour is a boundary condition
-                m = -n - 1; // Convert negative flag to boundary index
-
-                qr[0] = D->stage_boundary_values[m];
-                qr[1] = D->xmom_boundary_values[m];
-                qr[2] = D->ymom_boundary_values[m];
-                zr = zl; // Extend bed elevation to boundary
-                hre= max(qr[0]-zr,0.);//hle; 
-            } else {
-                // Neighbour is a real triangle
-                hc_n = D->height_centroid_values[n];
-                zc_n = D->bed_centroid_values[n];
-                m = D->neighbour_edges[ki];
-                nm = n * 3 + m; // Linear index (triangle n, edge m)
-                nm3 = nm*3;
 
-                qr[0] = D->stage_edge_values[nm];
-                qr[1] = D->xmom_edge_values[nm];
-                qr[2] = D->ymom_edge_values[nm];
-                zr = D->bed_edge_values[nm];
-                hre = D->height_edge_values[nm];
+            // The flux across this edge is computed by the neighbour
+            if (n >= 0 && n < kk && _visits_triangle(D, interior, part, n)) {
+                continue;
             }
-          
-            // Audusse magic 
-            z_half = max(zl, zr);
-
-            //// Account for riverwalls
-            if(D->edge_flux_type[ki] == 1){
-                if( n>=0 && D->edge_flux_type[nm] != 1){
-                    printf("Riverwall Error\n");
-                }
-                // Update counter of riverwall edges == index of
-                // riverwall_elevation + riverwall_rowIndex
-                RiverWall_count += 1;
-                
-                // Set central bed to riverwall elevation
-                z_half = max(D->riverwall_elevation[RiverWall_count-1], z_half) ;
 
+            // The flux across this edge was computed by part 1
+            if (part == 2 && n >= 0 && interior[n] == 1) {
+                continue;
             }
 
-            // Define h left/right for Audusse flux method
-            h_left = max(hle+zl-z_half,0.);
-            h_right = max(hre+zr-z_half,0.);
-
-            // Edge flux computation (triangle k, edge i)
-            _flux_function_central(ql, qr,
-            //_flux_function_toro(ql, qr,
-                h_left, h_right,
-                hle, hre,
-                D->normals[ki2],D->normals[ki2 + 1],
-                D->epsilon, z_half, limiting_threshold, D->g,
-                edgeflux, &max_speed_local, &pressure_flux, hc, hc_n);
-
-            // Force weir discharge to match weir theory
-            // FIXME: Switched off at the moment
-            if(D->edge_flux_type[ki]==1){
-                weir_height = max(D->riverwall_elevation[RiverWall_count-1] - min(zl, zr), 0.); // Reference weir height  
-
-                // If the weir is not higher than both neighbouring cells, then
-                // do not try to match the weir equation. If we do, it seems we
-                // can get mass conservation issues (caused by large weir
-                // fluxes in such situations)
-                if(D->riverwall_elevation[RiverWall_count-1] > max(zc, zc_n)){
-                    ////////////////////////////////////////////////////////////////////////////////////
-                    // Use first-order h's for weir -- as the 'upstream/downstream' heads are
-                    //  measured away from the weir itself
-                    h_left_tmp = max(D->stage_centroid_values[k] - z_half, 0.);
-                    if(n >= 0){
-                        h_right_tmp = max(D->stage_centroid_values[n] - z_half, 0.);
-                    }else{
-                        h_right_tmp = max(hc_n + zr - z_half, 0.);
-                    }
+            // Flux on this edge does not need to be updated on this step
+            if ((D->update_next_flux[ki]!=1) &&
+                (n < 0 || D->update_next_flux[n*3 + D->neighbour_edges[ki]]!=1)) {
+                continue;
+            }
 
-                    if( (h_left_tmp > 0.) || (h_right_tmp > 0.)){
-
-                        //////////////////////////////////////////////////////////////////////////////////
-                        // Get Qfactor index - multiply the idealised weir discharge by this constant factor
-                        ii = D->riverwall_rowIndex[RiverWall_count-1] * D->ncol_riverwall_hydraulic_properties;
-                        Qfactor = D->riverwall_hydraulic_properties[ii];
-
-                        // Get s1, submergence ratio at which we start blending with the shallow water solution 
-                        ii+=1;
-                        s1 = D->riverwall_hydraulic_properties[ii];
-
-                        // Get s2, submergence ratio at which we entirely use the shallow water solution 
-                        ii+=1;
-                        s2 = D->riverwall_hydraulic_properties[ii];
-
-                        // Get h1, tailwater head / weir height at which we start blending with the shallow water solution
-                        ii+=1;
-                        h1 = D->riverwall_hydraulic_properties[ii];
-
-                        // Get h2, tailwater head / weir height at which we entirely use the shallow water solution 
-                        ii+=1;
-                        h2 = D->riverwall_hydraulic_properties[ii];
-                        
-                        // Weir flux adjustment 
-                        // FIXME
-                        adjust_edgeflux_with_weir(edgeflux, h_left_tmp, h_right_tmp, D->g, 
-                                                  weir_height, Qfactor, 
-                                                  s1, s2, h1, h2, &max_speed_local);
-                    }
+            if (n >= 0 && n < kk) {
+                // The owner n of this edge is not active, compute the
+                // flux on its behalf so the result is the same
+                speed_max_inactive = 0.0;
+                _compute_edge_flux(D, n, D->neighbour_edges[ki], call,
+                                   substep_count, limiting_threshold,
+                                   &thread_timestep, &speed_max_inactive);
+                thread_flux_evaluations++;
+                if (speed_max_inactive > 0.0) {
+                    #pragma omp critical
+                    D->max_speed[n] = max(D->max_speed[n], speed_max_inactive);
                 }
+            } else {
+                _compute_edge_flux(D, kk, i, call,
+                                   substep_count, limiting_threshold,
+                                   &thread_timestep, &speed_max_last);
+                thread_flux_evaluations++;
             }
-            
-            // Multiply edgeflux by edgelength
-            length = D->edgelengths[ki];
-            edgeflux[0] *= length;
-            edgeflux[1] *= length;
-            edgeflux[2] *= length;
-
-            //// Don't allow an outward advective flux if the cell centroid
-            ////   stage is < the edge value. Is this important (??). Seems not
-            ////   to be with DE algorithms
-            //if((hc<H0) && edgeflux[0] > 0.){
-            //    edgeflux[0] = 0.;
-            //    edgeflux[1] = 0.;
-            //    edgeflux[2] = 0.;
-            //    //max_speed_local=0.;
-            //    //pressure_flux=0.;
-            //}
-            ////
-            //if((hc_n<H0) && edgeflux[0] < 0.){
-            //    edgeflux[0] = 0.;
-            //    edgeflux[1] = 0.;
-            //    edgeflux[2] = 0.;
-            //    //max_speed_local=0.;
-            //    //pressure_flux=0.;
-            //}
-
-            D->edge_flux_work[ki3 + 0 ] = -edgeflux[0];
-            D->edge_flux_work[ki3 + 1 ] = -edgeflux[1];
-            D->edge_flux_work[ki3 + 2 ] = -edgeflux[2];
-
-            // bedslope_work contains all gravity related terms
-            bedslope_work = length*(- D->g *0.5*(h_left*h_left - hle*hle -(hle+hc)*(zl-zc))+pressure_flux);
-
-            D->pressuregrad_work[ki] = bedslope_work;
-            
-            D->already_computed_flux[ki] = call; // #k Done
 
-            // Update neighbour n with same flux but reversed sign
-            if (n >= 0) {
-
-                D->edge_flux_work[nm3 + 0 ] = edgeflux[0];
-                D->edge_flux_work[nm3 + 1 ] = edgeflux[1];
-                D->edge_flux_work[nm3 + 2 ] = edgeflux[2];
-                bedslope_work = length*(-D->g * 0.5 *( h_right*h_right - hre*hre- (hre+hc_n)*(zr-zc_n)) + pressure_flux);
-                D->pressuregrad_work[nm] = bedslope_work;
-
-                D->already_computed_flux[nm] = call; // #n Done
+        } // End edge i (and neighbour n)
+        // Keep track of maximal speeds
+        if(substep_count==0) {
+            if (part == 2) {
+                D->max_speed[kk] = max(D->max_speed[kk], speed_max_last);
+            } else {
+                D->max_speed[kk] = speed_max_last; //max_speed;
             }
+        }
 
-            // Update timestep based on edge i and possibly neighbour n
-            // NOTE: We should only change the timestep on the 'first substep'
-            //  of the timestepping method [substep_count==0]
-            if(substep_count==0){
-
-                // Compute the 'edge-timesteps' (useful for setting flux_update_frequency)
-                tmp = 1.0 / max(max_speed_local, D->epsilon);
-                D->edge_timestep[ki] = D->radii[k] * tmp ;
-                if (n >= 0) {
-                    D->edge_timestep[nm] = D->radii[n] * tmp;
-                }
-
-                // Update the timestep
-                if ((D->tri_full_flag[k] == 1)) {
-
-                    speed_max_last = max(speed_max_last, max_speed_local);
-
-                    if (max_speed_local > D->epsilon) {
-                        // Apply CFL condition for triangles joining this edge (triangle k and triangle n)
 
-                        // CFL for triangle k
-                        local_timestep = min(local_timestep, D->edge_timestep[ki]);
+    } // End triangle kk (implicit barrier, all edge fluxes are now available)
 
-                        if (n >= 0) {
-                            // Apply CFL condition for neigbour n (which is on the ith edge of triangle k)
-                            local_timestep = min(local_timestep, D->edge_timestep[nm]);
-                        }
-                    }
-                }
-            }
+    partial_timestep[tid] = thread_timestep;
 
-        } // End edge i (and neighbour n)
-        // Keep track of maximal speeds
-        if(substep_count==0) D->max_speed[k] = speed_max_last; //max_speed;
-
-
-    } // End triangle k
-
-    //// Limit edgefluxes, for mass conservation near wet/dry cells
-    //// This doesn't seem to be needed anymore
-    //for(k=0; k< number_of_elements; k++){
-    //    //continue;
-    //    hc = height_centroid_values[k]; 
-    //    // Loop over every edge
-    //    for(i = 0; i<3; i++){
-    //        if(i==0){
-    //            // Add up the outgoing flux through the cell -- only do this once (i==0)
-    //            outgoing_mass_edges=0.0;
-    //            for(useint=0; useint<3; useint++){
-    //                if(edge_flux_work[3*(3*k+useint)]< 0.){
-    //                    //outgoing_mass_edges+=1.0;
-    //                    outgoing_mass_edges+=(edge_flux_work[3*(3*k+useint)]);
-    //                }
-    //            }
-    //            outgoing_mass_edges*=local_timestep;
-    //        }
-
-    //        ki=3*k+i;   
-    //        ki2=ki*2;
-    //        ki3 = ki*3;
-    //        
-    //        // Prevent outflow from 'seriously' dry cells
-    //        // Idea: The cell will not go dry if:
-    //        // total_outgoing_flux <= cell volume = Area_triangle*hc
-    //        vol=areas[k]*hc;
-    //        if((edge_flux_work[ki3]< 0.0) && (-outgoing_mass_edges> vol)){
-    //            
-    //            // This bound could be improved (e.g. we could actually sum the
-    //            // + and - fluxes and check if they are too large).  However,
-    //            // the advantage of this method is that we don't have to worry
-    //            // about subsequent changes to the + edgeflux caused by
-    //            // constraints associated with neighbouring triangles.
-    //            tmp = vol/(-(outgoing_mass_edges)) ;
-    //            if(tmp< 1.0){
-    //                edge_flux_work[ki3+0]*=tmp;
-    //                edge_flux_work[ki3+1]*=tmp;
-    //                edge_flux_work[ki3+2]*=tmp;
-
-    //                // Compute neighbour edge index
-    //                n = neighbours[ki];
-    //                if(n>=0){
-    //                    nm = 3*n + neighbour_edges[ki];
-    //                    nm3 = nm*3;
-    //                    edge_flux_work[nm3+0]*=tmp;
-    //                    edge_flux_work[nm3+1]*=tmp;
-    //                    edge_flux_work[nm3+2]*=tmp;
-    //                }
-    //            }
-    //        }
-    //    }
-    // }
+    // Counters for the evolve profiler
+    #pragma omp atomic
+    D->kernel_counters[0] += thread_flux_evaluations;
+    #pragma omp atomic
+    D->kernel_counters[1] += thread_wet_cells;
 
     // Now add up stage, xmom, ymom explicit updates
-    for(k=0; k < D->number_of_elements; k++){
-        hc = max(D->stage_centroid_values[k] - D->bed_centroid_values[k],0.);
+    #pragma omp for schedule(static)
+    for (j = 0; j < number_of_active + number_of_halo; j++) {
+        if (j < number_of_active) {
+            kk = D->use_active_cells ? D->active_cells[j] : j;
+        } else {
+            kk = D->active_halo_cells[j - number_of_active];
+        }
+        if (part != 0 && !_visits_triangle(D, interior, part, kk)) {
+            continue;
+        }
 
         for(i=0;i<3;i++){
             // FIXME: Make use of neighbours to efficiently set things
-            ki=3*k+i;   
+            ki=3*kk+i;   
             ki2=ki*2;
             ki3 = ki*3;
             n=D->neighbours[ki];
 
-            D->stage_explicit_update[k] += D->edge_flux_work[ki3+0];
-            D->xmom_explicit_update[k] += D->edge_flux_work[ki3+1];
-            D->ymom_explicit_update[k] += D->edge_flux_work[ki3+2];
+            // Edges of halo triangles are only computed next to active
+            // triangles, the flux across the others is zero
+            if (j >= number_of_active &&
+                (n < 0 || !(D->active_cells_flag[n] & ACTIVE_CELL))) {
+                continue;
+            }
+
+            D->stage_explicit_update[kk] += D->edge_flux_work[ki3+0];
+            D->xmom_explicit_update[kk] += D->edge_flux_work[ki3+1];
+            D->ymom_explicit_update[kk] += D->edge_flux_work[ki3+2];
 
             // If this cell is not a ghost, and the neighbour is a boundary
             // condition OR a ghost cell, then add the flux to the
             // boundary_flux_integral
-            if( (n<0 & D->tri_full_flag[k]==1) | ( n>=0 && (D->tri_full_flag[k]==1 & D->tri_full_flag[n]==0)) ){ 
+            if( (n<0 & D->tri_full_flag[kk]==1) | ( n>=0 && (D->tri_full_flag[kk]==1 & D->tri_full_flag[n]==0)) ){ 
                 // boundary_flux_sum is an array with length = timestep_fluxcalls
                 // For each sub-step, we put the boundary flux sum in.
-                D->boundary_flux_sum[substep_count] += D->edge_flux_work[ki3];
+                thread_boundary_flux += D->edge_flux_work[ki3];
             }
     
-            D->xmom_explicit_update[k] -= D->normals[ki2]*D->pressuregrad_work[ki];
-            D->ymom_explicit_update[k] -= D->normals[ki2+1]*D->pressuregrad_work[ki];
+            D->xmom_explicit_update[kk] -= D->normals[ki2]*D->pressuregrad_work[ki];
+            D->ymom_explicit_update[kk] -= D->normals[ki2+1]*D->pressuregrad_work[ki];
+
+            if (average_edge_fluxes &&
+                ((D->update_next_flux[ki]==1) ||
+                 (n >= 0 && D->update_next_flux[3*n + D->neighbour_edges[ki]]==1))) {
+                // Accumulate the substep average of the updated edge flux
+                if (substep_count == 0) {
+                    D->edge_flux_work_average[ki3+0] = 0.0;
+                    D->edge_flux_work_average[ki3+1] = 0.0;
+                    D->edge_flux_work_average[ki3+2] = 0.0;
+                    D->pressuregrad_work_average[ki] = 0.0;
+                }
+                D->edge_flux_work_average[ki3+0] += substep_weight*D->edge_flux_work[ki3+0];
+                D->edge_flux_work_average[ki3+1] += substep_weight*D->edge_flux_work[ki3+1];
+                D->edge_flux_work_average[ki3+2] += substep_weight*D->edge_flux_work[ki3+2];
+                D->pressuregrad_work_average[ki] += substep_weight*D->pressuregrad_work[ki];
+
+                if (substep_count == D->timestep_fluxcalls - 1) {
+                    D->edge_flux_work[ki3+0] = D->edge_flux_work_average[ki3+0];
+                    D->edge_flux_work[ki3+1] = D->edge_flux_work_average[ki3+1];
+                    D->edge_flux_work[ki3+2] = D->edge_flux_work_average[ki3+2];
+                    D->pressuregrad_work[ki] = D->pressuregrad_work_average[ki];
+                }
+            }
             
 
         } // end edge i
 
-        // Normalise triangle k by area and store for when all conserved
+        // Normalise triangle kk by area and store for when all conserved
         // quantities get updated
-        inv_area = 1.0 / D->areas[k];
-        D->stage_explicit_update[k] *= inv_area;
-        D->xmom_explicit_update[k] *= inv_area;
-        D->ymom_explicit_update[k] *= inv_area;
+        inv_area = 1.0 / D->areas[kk];
+        D->stage_explicit_update[kk] *= inv_area;
+        D->xmom_explicit_update[kk] *= inv_area;
+        D->ymom_explicit_update[kk] *= inv_area;
    
-    }  // end cell k
+    }  // end cell kk
+
+    partial_boundary_flux[tid] = thread_boundary_flux;
+
+    } // End parallel region
+
+    // Combine the per thread reductions in thread order
+    for (t = 0; t < nthreads; t++) {
+        local_timestep = min(local_timestep, partial_timestep[t]);
+        D->boundary_flux_sum[substep_count] += partial_boundary_flux[t];
+    }
+
+    free(partial_timestep);
+    free(partial_boundary_flux);
 
     // Ensure we only update the timestep on the first call within each rk2/rk3 step
     if(substep_count == 0) timestep=local_timestep; 
@@ -1090,6 +1283,11 @@ double _compute_fluxes_central(struct domain *D, double timestep){
     return timestep;
 }
 
+double _compute_fluxes_central(struct domain *D, double timestep){
+
+    return _compute_fluxes_central_part(D, timestep, NULL, 0);
+}
+
 // Protect against the water elevation falling below the triangle bed
 double  _protect(int N,
          double minimum_allowed_height,
@@ -1154,9 +1352,13 @@ double  _protect(int N,
 }
 
 // Protect against the water elevation falling below the triangle bed
-double  _protect_new(struct domain *D) {
+// Protect the n triangles first, ..., first+n-1, or the n triangles listed
+// in triangles if it is not NULL (elementwise, so the triangles can be
+// protected in separate calls)
+double  _protect_new_triangles(struct domain *D, long n, long first,
+                               long *triangles) {
 
-  int k;
+  long j, k;
   double hc, bmin, bmax;
   double u, v, reduced_speed;
   double mass_error = 0.;
@@ -1191,7 +1393,8 @@ double  _protect_new(struct domain *D) {
 
   // Protect against inifintesimal and negative heights
   //if (maximum_allowed_speed < epsilon) {
-    for (k=0; k<D->number_of_elements; k++) {
+    for (j=0; j<n; j++) {
+      k = triangles ? triangles[j] : first + j;
       hc = wc[k] - zc[k];
       if (hc < minimum_allowed_height*1.0 ){
             // Set momentum to zero and ensure h is non negative
@@ -1227,6 +1430,34 @@ double  _protect_new(struct domain *D) {
   return mass_error;
 }
 
+double  _protect_new_range(struct domain *D, long first, long last) {
+
+  return _protect_new_triangles(D, last - first, first, NULL);
+}
+
+double  _protect_new(struct domain *D) {
+
+  long *number_of_active_cells = D->number_of_active_cells;
+  double mass_error;
+
+  if (!D->use_active_cells || number_of_active_cells[RESCAN_ALL]) {
+      return _protect_new_range(D, 0, D->number_of_elements);
+  }
+
+  // With active cells only the listed, marked and ghost triangles can
+  // have changed since the last extrapolation (see _update_active_cells)
+  mass_error = _protect_new_triangles(D, number_of_active_cells[NUMBER_OF_ACTIVE],
+                                      0, D->active_cells);
+  mass_error += _protect_new_triangles(D, number_of_active_cells[NUMBER_OF_HALO],
+                                       0, D->active_halo_cells);
+  mass_error += _protect_new_triangles(D, number_of_active_cells[NUMBER_OF_MARKED],
+                                       0, D->active_cells_marked);
+  mass_error += _protect_new_range(D, D->number_of_full_triangles,
+                                   D->number_of_elements);
+
+  return mass_error;
+}
+
 
 
 
@@ -1321,34 +1552,204 @@ int limit_gradient(double *dqv, double qmin, double qmax, double beta_w){
 //                                 double* x_centroid_work,
 //                                 double* y_centroid_work,
 //                                 long* update_extrapolation) {
-int _extrapolate_second_order_edge_sw(struct domain *D){
+// Update the list of active triangles used by the extrapolation and the
+// flux computation.
+//
+// A triangle is changing unless it is dry with zero momentum, has no
+// boundary edges and its stage has not changed since it was last
+// extrapolated. The edge values of a triangle only depend on itself and
+// its neighbours, so triangles away from changing ones keep valid dry
+// edge values and zero fluxes. The active triangles are the changing
+// ones and their neighbours, now or on the previous call (so that the
+// edge values of triangles leaving the list are refreshed once with dry
+// neighbours). The halo holds the neighbours of active triangles which
+// are not active themselves.
+//
+// The update is incremental. Between two calls the kernels only change
+// the triangles in the lists, so only these, the ghost triangles and the
+// triangles marked by domain.mark_active_cells (changed by operators) are
+// checked, and the triangles next to a changing one are added to them.
+// The other triangles are neither changing nor listed, and all their
+// flags are clear. All the triangles are checked on the first call and
+// after domain.mark_active_cells() without indices.
+
+static int _compare_long(const void *a, const void *b) {
+  long x = *(const long *) a;
+  long y = *(const long *) b;
+  return (x > y) - (x < y);
+}
+
+// Add triangle t to the triangles checked by _update_active_cells (once)
+#define ADD_CANDIDATE(t) \
+  if (!(active_cells_flag[t] & CANDIDATE_CELL)) { \
+      active_cells_flag[t] |= CANDIDATE_CELL; \
+      candidates[number_of_checked++] = (t); \
+  }
+
+int _update_active_cells(struct domain *D) {
+
+  long j, k, m, n, flag, number_of_checked, number_of_active, number_of_halo;
+  int i, rescan_all;
+  long *active_cells_flag = D->active_cells_flag;
+  long *candidates = D->active_cells_candidates;
+  long *number_of_active_cells = D->number_of_active_cells;
+
+  rescan_all = (number_of_active_cells[RESCAN_ALL] != 0);
+
+  // The triangles to check (all of them, in order, on a rescan)
+  number_of_checked = 0;
+  if (rescan_all) {
+      for (k = 0; k < D->number_of_elements; k++) {
+          candidates[number_of_checked++] = k;
+      }
+  } else {
+      for (j = 0; j < number_of_active_cells[NUMBER_OF_ACTIVE]; j++) {
+          ADD_CANDIDATE(D->active_cells[j]);
+      }
+      for (j = 0; j < number_of_active_cells[NUMBER_OF_HALO]; j++) {
+          ADD_CANDIDATE(D->active_halo_cells[j]);
+      }
+      for (j = 0; j < number_of_active_cells[NUMBER_OF_MARKED]; j++) {
+          ADD_CANDIDATE(D->active_cells_marked[j]);
+      }
+      for (k = D->number_of_full_triangles; k < D->number_of_elements; k++) {
+          ADD_CANDIDATE(k);
+      }
+  }
+
+  // Find changing triangles, remembering the previous neighbourhood
+  for (j = 0; j < number_of_checked; j++) {
+      k = candidates[j];
+      flag = active_cells_flag[k] & CANDIDATE_CELL;
+      if (active_cells_flag[k] & CHANGING_NEIGHBOURHOOD) flag |= PREVIOUS_NEIGHBOURHOOD;
+      if (active_cells_flag[k] & (ACTIVE_CELL | HALO_CELL)) flag |= LISTED_CELL;
+
+      if (D->stage_centroid_values[k] != D->bed_centroid_values[k] ||
+          D->xmom_centroid_values[k] != 0.0 ||
+          D->ymom_centroid_values[k] != 0.0 ||
+          D->stage_centroid_values[k] != D->active_cells_stage[k] ||
+          D->number_of_boundaries[k] > 0) {
+          flag |= CHANGING_CELL;
+      }
+      active_cells_flag[k] = flag;
+  }
+
+  // The neighbours of changing triangles which were not checked are not
+  // changing and not listed (all their flags are clear), check them too
+  n = number_of_checked;
+  for (j = 0; j < n; j++) {
+      k = candidates[j];
+      if (active_cells_flag[k] & CHANGING_CELL) {
+          active_cells_flag[k] |= CHANGING_NEIGHBOURHOOD;
+          for (i = 0; i < 3; i++) {
+              m = D->neighbours[3*k + i];
+              if (m < 0) continue;
+              if (!rescan_all) {
+                  ADD_CANDIDATE(m);
+              }
+              active_cells_flag[m] |= CHANGING_NEIGHBOURHOOD;
+          }
+      }
+  }
+
+  // Active triangles, in increasing order
+  number_of_active = 0;
+  for (j = 0; j < number_of_checked; j++) {
+      k = candidates[j];
+      flag = active_cells_flag[k];
+      if (flag & (CHANGING_NEIGHBOURHOOD | PREVIOUS_NEIGHBOURHOOD)) {
+          D->active_cells[number_of_active++] = k;
+          D->active_cells_stage[k] = D->stage_centroid_values[k];
+          active_cells_flag[k] = flag | ACTIVE_CELL;
+      }
+  }
+  if (!rescan_all) {
+      qsort(D->active_cells, number_of_active, sizeof(long), _compare_long);
+  }
+
+  // Halo of the active triangles
+  number_of_halo = 0;
+  for (j = 0; j < 3*number_of_active; j++) {
+      n = D->neighbours[3*D->active_cells[j/3] + j%3];
+      if (n >= 0 && !(active_cells_flag[n] & (ACTIVE_CELL | HALO_CELL))) {
+          active_cells_flag[n] |= HALO_CELL;
+          D->active_halo_cells[number_of_halo++] = n;
+      }
+  }
+
+  // Triangles leaving the lists only have edges with zero flux
+  for (j = 0; j < number_of_checked; j++) {
+      k = candidates[j];
+      flag = active_cells_flag[k];
+      if ((flag & LISTED_CELL) && !(flag & (ACTIVE_CELL | HALO_CELL))) {
+          D->max_speed[k] = 0.0;
+      }
+      active_cells_flag[k] = flag & ~(LISTED_CELL | CANDIDATE_CELL);
+  }
+
+  number_of_active_cells[NUMBER_OF_ACTIVE] = number_of_active;
+  number_of_active_cells[NUMBER_OF_HALO] = number_of_halo;
+  number_of_active_cells[NUMBER_OF_MARKED] = 0;
+  number_of_active_cells[RESCAN_ALL] = 0;
+
+  return 0;
+}
+
+// Extrapolate a subset of the triangles in three stages: the momenta of the
+// converted triangles are replaced by velocities (if extrapolating
+// velocities), the momenta of the checked triangles surrounded by dry
+// triangles are set to zero, and the edge and vertex values of the
+// extrapolated triangles are computed from their centroid values and those
+// of their neighbours. The neighbours of the extrapolated triangles must be
+// checked, and the neighbours of the checked triangles converted. A NULL
+// list stands for the first number_of_... triangles.
+//
+// Since each stage only reads the values set by the previous stage, a
+// parallel domain can extrapolate the triangles away from the ghost
+// triangles while the ghost values are received, and then the others.
+int _extrapolate_second_order_edge_sw_triangles(struct domain *D,
+        long number_of_converted, long *converted,
+        long number_of_checked, long *checked,
+        long number_of_extrapolated, long *extrapolated){
                   
   // Local variables
-  double a, b; // Gradient vector used to calculate edge values from centroids
-  int k, k0, k1, k2, k3, k6, coord_index, i, ii, ktmp, k_wetdry;
-  double x, y, x0, y0, x1, y1, x2, y2, xv0, yv0, xv1, yv1, xv2, yv2; // Vertices of the auxiliary triangle
-  double dx1, dx2, dy1, dy2, dxv0, dxv1, dxv2, dyv0, dyv1, dyv2, dq0, dq1, dq2, area2, inv_area2, dpth,momnorm;
-  double dqv[3], qmin, qmax, hmin, hmax, bedmax,bedmin, stagemin;
-  double hc, h0, h1, h2, beta_tmp, hfactor, xtmp, ytmp, weight, tmp;
-  double dk, dk_inv,dv0, dv1, dv2, de[3], demin, dcmax, r0scale, vel_norm, l1, l2, a_tmp, b_tmp, c_tmp,d_tmp;
+  int nthreads, error_flag;
+  double a_tmp, b_tmp, c_tmp, d_tmp;
   
-
-  memset((char*) D->x_centroid_work, 0, D->number_of_elements * sizeof (double));
-  memset((char*) D->y_centroid_work, 0, D->number_of_elements * sizeof (double));
- 
   // Parameters used to control how the limiter is forced to first-order near
   // wet-dry regions 
   a_tmp = 0.3; // Highest depth ratio with hfactor=1
   b_tmp = 0.1; // Highest depth ratio with hfactor=0
   c_tmp = 1.0/(a_tmp-b_tmp); 
   d_tmp = 1.0-(c_tmp*a_tmp);
+
+  // Each triangle only writes its own centroid, edge and vertex values, and
+  // neighbour centroid values are only read after the barrier at the end of
+  // the loop that modifies them, so the triangles can be shared between
+  // OpenMP threads
+  nthreads = (D->omp_num_threads > 1) ? D->omp_num_threads : 1;
+  error_flag = 0;
+
+  #pragma omp parallel num_threads(nthreads)
+  {
+  // Thread private variables
+  double a, b; // Gradient vector used to calculate edge values from centroids
+  long j;
+  int k, k0, k1, k2, k3, k6, coord_index, i;
+  double x, y, x0, y0, x1, y1, x2, y2, xv0, yv0, xv1, yv1, xv2, yv2; // Vertices of the auxiliary triangle
+  double dx1, dx2, dy1, dy2, dxv0, dxv1, dxv2, dyv0, dyv1, dyv2, dq0, dq1, dq2, area2, inv_area2;
+  double dqv[3], qmin, qmax, hmin, hmax;
+  double hc, h0, h1, h2, beta_tmp, hfactor;
+  double dk, dk_inv;
   
   if(D->extrapolate_velocity_second_order==1){
 
       // Replace momentum centroid with velocity centroid to allow velocity
       // extrapolation This will be changed back at the end of the routine
-      for (k=0; k< D->number_of_elements; k++){
-          
+      #pragma omp for schedule(static)
+      for (j=0; j< number_of_converted; j++){
+          k = converted ? converted[j] : j;
+
           D->height_centroid_values[k] = max(D->stage_centroid_values[k] - D->bed_centroid_values[k], 0.);
 
           dk = D->height_centroid_values[k]; 
@@ -1373,8 +1774,10 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
   // condition) set its momentum to zero too. This prevents 'pits' of
   // of water being trapped and unable to lose momentum, which can occur in
   // some situations
-  for (k=0; k< D->number_of_elements;k++){
-      
+  #pragma omp for schedule(static)
+  for (j=0; j< number_of_checked;j++){
+      k = checked ? checked[j] : j;
+
       k3=k*3;
       k0 = D->surrogate_neighbours[k3];
       k1 = D->surrogate_neighbours[k3 + 1];
@@ -1395,8 +1798,10 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
   }
 
   // Begin extrapolation routine
-  for (k = 0; k < D->number_of_elements; k++) 
+  #pragma omp for schedule(static)
+  for (j = 0; j < number_of_extrapolated; j++) 
   {
+    k = extrapolated ? extrapolated[j] : j;
 
     // Don't update the extrapolation if the flux will not be computed on the
     // next timestep
@@ -1775,8 +2180,10 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
       if ((k2 == k3 + 3)) 
       {
         // If we didn't find an internal neighbour
-        report_python_error(AT, "Internal neighbour not found");
-        return -1;
+        // (the error is reported once we are out of the parallel region)
+        #pragma omp critical
+        error_flag = 1;
+        continue;
       }
       
       k1 = D->surrogate_neighbours[k2];
@@ -1953,13 +2360,21 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
   } // for k=0 to number_of_elements-1
 
 
-  // Compute vertex values of quantities
-  for (k=0; k< D->number_of_elements; k++){
-      if(D->extrapolate_velocity_second_order==1){
-          //Convert velocity back to momenta at centroids
+  if(D->extrapolate_velocity_second_order==1){
+      //Convert velocity back to momenta at centroids
+      #pragma omp for schedule(static)
+      for (j=0; j< number_of_converted; j++){
+          k = converted ? converted[j] : j;
+
           D->xmom_centroid_values[k] = D->x_centroid_work[k];
           D->ymom_centroid_values[k] = D->y_centroid_work[k];
       }
+  }
+
+  // Compute vertex values of quantities
+  #pragma omp for schedule(static)
+  for (j=0; j< number_of_extrapolated; j++){
+      k = extrapolated ? extrapolated[j] : j;
      
       // Don't proceed if we didn't update the edge/vertex values
       if(D->update_extrapolation[k]==0){
@@ -2004,9 +2419,41 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
       D->bed_vertex_values[k3+2] =  D->bed_edge_values[k3] + D->bed_edge_values[k3+1] - D->bed_edge_values[k3+2]; 
   } 
 
+  } // End parallel region
+
+  if (error_flag) {
+    report_python_error(AT, "Internal neighbour not found");
+    return -1;
+  }
+
   return 0;
 }           
 
+int _extrapolate_second_order_edge_sw(struct domain *D){
+
+  long number_of_active;
+  long *active;
+
+  memset((char*) D->x_centroid_work, 0, D->number_of_elements * sizeof (double));
+  memset((char*) D->y_centroid_work, 0, D->number_of_elements * sizeof (double));
+
+  // Only extrapolate the active triangles, the others keep their (dry)
+  // edge and vertex values
+  if (D->use_active_cells) {
+      _update_active_cells(D);
+      number_of_active = D->number_of_active_cells[NUMBER_OF_ACTIVE];
+      active = D->active_cells;
+  } else {
+      number_of_active = D->number_of_elements;
+      active = NULL;
+  }
+
+  return _extrapolate_second_order_edge_sw_triangles(D,
+                number_of_active, active,
+                number_of_active, active,
+                number_of_active, active);
+}
+
 //=========================================================================
 // Python Glue
 //=========================================================================
@@ -2035,18 +2482,31 @@ PyObject *swde1_compute_fluxes_ext_central(PyObject *self, PyObject *args) {
   */
   struct domain D;
   PyObject *domain;
+  PyArrayObject *interior = NULL;
+  int part = 0;
 
    
   double timestep;
   
-  if (!PyArg_ParseTuple(args, "Od", &domain, &timestep)) {
+  // Optionally only compute part 1 or 2 of the fluxes, see
+  // _compute_fluxes_central_part
+  if (!PyArg_ParseTuple(args, "Od|Oi", &domain, &timestep, &interior, &part)) {
       report_python_error(AT, "could not parse input arguments");
       return NULL;
   }
     
   get_python_domain(&D,domain);
 
-  timestep=_compute_fluxes_central(&D,timestep);
+  if (part == 0) {
+      timestep=_compute_fluxes_central(&D,timestep);
+  } else {
+      CHECK_C_CONTIG(interior);
+      timestep=_compute_fluxes_central_part(&D,timestep,(long*) interior->data,part);
+  }
+  if (timestep < 0.0) {
+    // Use error string set inside computational routine
+    return NULL;
+  }
 
   // Return updated flux timestep
   return Py_BuildValue("d", timestep);
@@ -2215,10 +2675,14 @@ PyObject *swde1_extrapolate_second_order_edge_sw(PyObject *self, PyObject *args)
  
   struct domain D; 
   PyObject *domain;
+  PyArrayObject *converted = NULL, *checked = NULL, *extrapolated = NULL;
 
   int e;
   
-  if (!PyArg_ParseTuple(args, "O", &domain)) {
+  // Optionally only extrapolate a subset of the triangles, see
+  // _extrapolate_second_order_edge_sw_triangles
+  if (!PyArg_ParseTuple(args, "O|OOO", &domain,
+                        &converted, &checked, &extrapolated)) {
       report_python_error(AT, "could not parse input arguments");
       return NULL;
   }
@@ -2227,7 +2691,18 @@ PyObject *swde1_extrapolate_second_order_edge_sw(PyObject *self, PyObject *args)
 
   // Call underlying flux computation routine and update
   // the explicit update arrays
-  e = _extrapolate_second_order_edge_sw(&D);
+  if (extrapolated == NULL) {
+      e = _extrapolate_second_order_edge_sw(&D);
+  } else {
+      CHECK_C_CONTIG(converted);
+      CHECK_C_CONTIG(checked);
+      CHECK_C_CONTIG(extrapolated);
+
+      e = _extrapolate_second_order_edge_sw_triangles(&D,
+                (long) converted->dimensions[0], (long*) converted->data,
+                (long) checked->dimensions[0], (long*) checked->data,
+                (long) extrapolated->dimensions[0], (long*) extrapolated->data);
+  }
 
   if (e == -1) {
     // Use error string set inside computational routine
@@ -2307,16 +2782,23 @@ PyObject *swde1_protect_new(PyObject *self, PyObject *args) {
 	PyObject *domain;
 
 	double mass_error;
+	long first = 0, last = -1;
 
 	// Convert Python arguments to C
-	if (!PyArg_ParseTuple(args, "O", &domain)) {
+	// (optionally only protect the triangles first, ..., last-1)
+	if (!PyArg_ParseTuple(args, "O|ll", &domain, &first, &last)) {
 		report_python_error(AT, "could not parse input arguments");
 		return NULL;
 	}
 
 	get_python_domain(&D, domain);
 
-	mass_error = _protect_new(&D);
+	if (first == 0 && last < 0) {
+		mass_error = _protect_new(&D);
+	} else {
+		if (last < 0) last = D.number_of_elements;
+		mass_error = _protect_new_range(&D, first, last);
+	}
 
 	return Py_BuildValue("d", mass_error);
 }
@@ -2325,128 +2807,780 @@ PyObject *swde1_protect_new(PyObject *self, PyObject *args) {
 
 
 //========================================================================
-// swde1_evolve_one_euler_step
+// Fused timestepping
+//
+// A complete euler or rk2 step of the DE algorithms in a single call.
+// fused_step_setup extracts the domain struct and the other arrays of
+// the step once, into a capsule which the domain keeps until the next
+// yield. Reflective and Dirichlet boundaries, Manning friction and
+// update_timestep are then evaluated in C. Python is only called back
+// for the other boundaries and forcing terms, for an overridden
+// update_timestep or update_ghosts (as by the parallel domain), and to
+// handle a timestep below evolve_min_timestep.
 //========================================================================
 
-PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
-  /*
-   * Implement one Euler step in C
-  */
+#define FUSED_FORCING_NONE 0
+#define FUSED_FORCING_MANNING_FLAT 1
+#define FUSED_FORCING_MANNING_SLOPED 2
+#define FUSED_FORCING_PYTHON 3
+
+struct fused_step {
+  struct domain D;
 
+  double* stage_semi_implicit_update;
+  double* xmom_semi_implicit_update;
+  double* ymom_semi_implicit_update;
+  double* stage_backup_values;
+  double* xmom_backup_values;
+  double* ymom_backup_values;
+  double* friction_centroid_values;
+
+  double* height_boundary_values;
+  double* xvel_edge_values;
+  double* yvel_edge_values;
+  double* xvel_boundary_values;
+  double* yvel_boundary_values;
+  long*   boundary_cells;
+  long*   boundary_edges;
+
+  // Boundary edges evaluated in C, and the (boundary, ids) pairs
+  // evaluated by python (or None to call update_boundary)
+  long    number_of_reflective_edges;
+  long*   reflective_ids;
+  long    number_of_dirichlet_edges;
+  long*   dirichlet_ids;
+  double* dirichlet_values;
+  PyArrayObject *reflective_array;
+  PyArrayObject *dirichlet_array;
+  PyArrayObject *dirichlet_values_array;
+  PyObject *python_boundaries;
+
+  int forcing;
+  int python_timestep;
+  int python_ghosts;
+
+  int using_discontinuous_elevation;
+  int verbose;
+  int ghost_layer_width;
+
+  // Generic_Domain.update_timestep state
+  double CFL;
+  double evolve_min_timestep;
+  double yieldtime;
+  double recorded_max_timestep;
+  double recorded_min_timestep;
+  int reset_order;
+};
 
-  PyObject* domain;
-  PyObject* arglist;
-  PyObject* result;
+int _call_domain_method(PyObject *domain, char *name) {
+  // Call a domain method which takes no arguments
 
-  struct domain D;
+  PyObject *result;
 
-  double yieldstep;
-  double finaltime;
-  double flux_timestep;
+  result = PyObject_CallMethod(domain, name, NULL);
+  if (result == NULL) {
+    return -1;
+  }
+  Py_DECREF(result);
 
+  return 0;
+}
+
+
+int _set_domain_double(PyObject *domain, char *name, double value) {
+  // Set a float attribute of the domain
+
+  PyObject *result;
   int e;
+
+  result = PyFloat_FromDouble(value);
+  if (result == NULL) {
+    return -1;
+  }
+  e = PyObject_SetAttrString(domain, name, result);
+  Py_DECREF(result);
+
+  return e;
+}
+
+
+int _set_domain_integer(PyObject *domain, char *name, long value) {
+  // Set an integer attribute of the domain
+
+  PyObject *result;
+  int e;
+
+  result = PyInt_FromLong(value);
+  if (result == NULL) {
+    return -1;
+  }
+  e = PyObject_SetAttrString(domain, name, result);
+  Py_DECREF(result);
+
+  return e;
+}
+
+
+int _update_quantity(struct domain *D,
+                     double timestep,
+                     double *centroid_values,
+                     double *explicit_update,
+                     double *semi_implicit_update,
+                     long n,
+                     long *triangles) {
+  // Same as _update in quantity_ext.c, for the first n triangles or the
+  // n triangles listed in triangles if it is not NULL
+
+  long j, k;
+  int error_flag;
+  double denominator, x;
+
+  error_flag = 0;
+
+  #pragma omp parallel for private(k, denominator, x) schedule(static) num_threads(D->omp_num_threads)
+  for (j = 0; j < n; j++) {
+    k = triangles ? triangles[j] : j;
+    x = centroid_values[k];
+    if (x == 0.0) {
+      semi_implicit_update[k] = 0.0;
+    } else {
+      semi_implicit_update[k] /= x;
+    }
+
+    centroid_values[k] += timestep*explicit_update[k];
+
+    denominator = 1.0 - timestep*semi_implicit_update[k];
+    if (denominator <= 0.0) {
+      error_flag = 1;
+    } else {
+      centroid_values[k] /= denominator;
+    }
+
+    semi_implicit_update[k] = 0.0;
+  }
+
+  if (error_flag) {
+    report_python_error(AT, "division by zero in semi implicit update");
+    return -1;
+  }
+
+  return 0;
+}
+
+
+int _update_conserved_quantities(struct domain *D,
+                                 double timestep,
+                                 double *stage_semi_implicit_update,
+                                 double *xmom_semi_implicit_update,
+                                 double *ymom_semi_implicit_update,
+                                 int using_discontinuous_elevation) {
+  // Same as Domain.update_conserved_quantities
+  //
+  // With active cells only the triangles in the lists have fluxes, the
+  // others are dry and still so the update leaves them unchanged. All the
+  // triangles are updated when a rescan is pending, as forcing terms may
+  // then have changed any of them (see Domain.compute_forcing_terms)
+
+  long j, k, n[2];
+  long *triangles[2];
+  int l, number_of_lists, negative_count;
+
+  if (D->use_active_cells && !D->number_of_active_cells[RESCAN_ALL]) {
+    number_of_lists = 2;
+    n[0] = D->number_of_active_cells[NUMBER_OF_ACTIVE];
+    triangles[0] = D->active_cells;
+    n[1] = D->number_of_active_cells[NUMBER_OF_HALO];
+    triangles[1] = D->active_halo_cells;
+  } else {
+    number_of_lists = 1;
+    n[0] = D->number_of_elements;
+    triangles[0] = NULL;
+  }
+
+  for (l = 0; l < number_of_lists; l++) {
+    if (_update_quantity(D, timestep, D->stage_centroid_values,
+            D->stage_explicit_update, stage_semi_implicit_update,
+            n[l], triangles[l]) == -1) return -1;
+    if (_update_quantity(D, timestep, D->xmom_centroid_values,
+            D->xmom_explicit_update, xmom_semi_implicit_update,
+            n[l], triangles[l]) == -1) return -1;
+    if (_update_quantity(D, timestep, D->ymom_centroid_values,
+            D->ymom_explicit_update, ymom_semi_implicit_update,
+            n[l], triangles[l]) == -1) return -1;
+  }
+
+  if (!using_discontinuous_elevation) return 0;
+
+  negative_count = 0;
+  for (l = 0; l < number_of_lists; l++) {
+    for (j = 0; j < n[l]; j++) {
+      k = triangles[l] ? triangles[l][j] : j;
+      if ((D->stage_centroid_values[k] - D->bed_centroid_values[k]) < 0.0 &&
+          D->tri_full_flag[k] > 0) {
+        D->stage_centroid_values[k] = D->bed_centroid_values[k];
+        D->xmom_centroid_values[k] = 0.0;
+        D->ymom_centroid_values[k] = 0.0;
+        negative_count++;
+      }
+    }
+  }
+
+  if (negative_count > 0) {
+    return PyErr_WarnEx(PyExc_UserWarning,
+        "Negative cells being set to zero depth, possible loss of conservation. \n"
+        "Consider using domain.report_water_volume_statistics() to check the extent of the problem", 1);
+  }
+
+  return 0;
+}
+
+
+int _fused_update_boundary(struct fused_step *F, PyObject *domain) {
+  // Same as Generic_Domain.update_boundary, with the reflective and
+  // Dirichlet boundaries evaluated as in their evaluate_segment
+
+  struct domain *D = &F->D;
+  PyObject *pair, *result;
+  Py_ssize_t l;
+  long j, id, ki, k6;
+  double n1, n2, q1, q2, r1, r2;
+
+  if (F->python_boundaries == Py_None) {
+    return _call_domain_method(domain, "update_boundary");
+  }
+
+  for (j = 0; j < F->number_of_reflective_edges; j++) {
+    id = F->reflective_ids[j];
+    ki = 3*F->boundary_cells[id] + F->boundary_edges[id];
+    k6 = 6*F->boundary_cells[id] + 2*F->boundary_edges[id];
+
+    n1 = D->normals[k6];
+    n2 = D->normals[k6 + 1];
+
+    D->stage_boundary_values[id] = D->stage_edge_values[ki];
+    D->bed_boundary_values[id] = D->bed_edge_values[ki];
+    F->height_boundary_values[id] = D->height_edge_values[ki];
+
+    // Rotate and negate momentum
+    q1 = D->xmom_edge_values[ki];
+    q2 = D->ymom_edge_values[ki];
+
+    r1 = -q1*n1 - q2*n2;
+    r2 = -q1*n2 + q2*n1;
+
+    D->xmom_boundary_values[id] = n1*r1 - n2*r2;
+    D->ymom_boundary_values[id] = n2*r1 + n1*r2;
+
+    // Rotate and negate velocity
+    q1 = F->xvel_edge_values[ki];
+    q2 = F->yvel_edge_values[ki];
+
+    r1 = q1*n1 + q2*n2;
+    r2 = q1*n2 - q2*n1;
+
+    F->xvel_boundary_values[id] = n1*r1 - n2*r2;
+    F->yvel_boundary_values[id] = n2*r1 + n1*r2;
+  }
+
+  for (j = 0; j < F->number_of_dirichlet_edges; j++) {
+    id = F->dirichlet_ids[j];
+
+    D->stage_boundary_values[id] = F->dirichlet_values[3*j];
+    D->xmom_boundary_values[id] = F->dirichlet_values[3*j + 1];
+    D->ymom_boundary_values[id] = F->dirichlet_values[3*j + 2];
+  }
+
+  for (l = 0; l < PyList_GET_SIZE(F->python_boundaries); l++) {
+    pair = PyList_GET_ITEM(F->python_boundaries, l);
+    result = PyObject_CallMethod(PyTuple_GET_ITEM(pair, 0), "evaluate_segment", "OO",
+                                 domain, PyTuple_GET_ITEM(pair, 1));
+    if (result == NULL) {
+      return -1;
+    }
+    Py_DECREF(result);
+  }
+
+  return 0;
+}
+
+
+void _fused_manning_friction(struct fused_step *F) {
+  // Same as manning_friction_implicit, i.e. _manning_friction_flat and
+  // _manning_friction_sloped of shallow_water_ext.c
+
+  struct domain *D = &F->D;
+  long k, k3, k6;
+  double S, h, z, z0, z1, z2, zs, zx, zy;
+  double *w, *uh, *vh, *eta;
+  const double one_third = 1.0/3.0;
+  const double seven_thirds = 7.0/3.0;
+
+  w = D->stage_centroid_values;
+  uh = D->xmom_centroid_values;
+  vh = D->ymom_centroid_values;
+  eta = F->friction_centroid_values;
+
+  #pragma omp parallel for private(k3, k6, S, h, z, z0, z1, z2, zs, zx, zy) schedule(static) num_threads(D->omp_num_threads)
+  for (k = 0; k < D->number_of_elements; k++) {
+    if (eta[k] > D->minimum_allowed_height) {
+      k3 = 3*k;
+      z0 = D->bed_vertex_values[k3 + 0];
+      z1 = D->bed_vertex_values[k3 + 1];
+      z2 = D->bed_vertex_values[k3 + 2];
+
+      if (F->forcing == FUSED_FORCING_MANNING_SLOPED) {
+        k6 = 6*k;
+        _gradient(D->vertex_coordinates[k6 + 0], D->vertex_coordinates[k6 + 1],
+                  D->vertex_coordinates[k6 + 2], D->vertex_coordinates[k6 + 3],
+                  D->vertex_coordinates[k6 + 4], D->vertex_coordinates[k6 + 5],
+                  z0, z1, z2, &zx, &zy);
+        zs = sqrt(1.0 + zx * zx + zy * zy);
+      }
+
+      z = (z0 + z1 + z2) * one_third;
+      h = w[k] - z;
+      if (h >= D->minimum_allowed_height) {
+        if (F->forcing == FUSED_FORCING_MANNING_SLOPED) {
+          S = -D->g * eta[k] * eta[k] * zs * sqrt((uh[k] * uh[k] + vh[k] * vh[k]));
+        } else {
+          S = -D->g * eta[k] * eta[k] * sqrt((uh[k] * uh[k] + vh[k] * vh[k]));
+        }
+        S /= pow(h, seven_thirds);
+
+        F->xmom_semi_implicit_update[k] += S * uh[k];
+        F->ymom_semi_implicit_update[k] += S * vh[k];
+      }
+    }
+  }
+}
+
+
+int _fused_compute_fluxes_and_forcing(struct fused_step *F, PyObject *domain,
+                                      double *flux_timestep) {
+  // Protect, extrapolate, apply boundary conditions, then compute the
+  // fluxes (setting domain.flux_timestep) and the forcing terms
+
+  struct domain *D = &F->D;
   double mass_error;
 
+  mass_error = _protect_new(D);
+  if (mass_error > 0.0 && F->verbose) {
+    printf("Cumulative mass protection: %g m^3 \n", mass_error);
+  }
+
+  if (_extrapolate_second_order_edge_sw(D) == -1) {
+    // Use error string set inside computational routine
+    return -1;
+  }
+
+  if (_fused_update_boundary(F, domain) == -1) return -1;
+
+  *flux_timestep = _compute_fluxes_central(D, D->evolve_max_timestep);
+  if (*flux_timestep < 0.0) {
+    // Use error string set inside computational routine
+    return -1;
+  }
+  if (_set_domain_double(domain, "flux_timestep", *flux_timestep) == -1) return -1;
+
+  if (F->forcing == FUSED_FORCING_PYTHON) {
+    if (_call_domain_method(domain, "compute_forcing_terms") == -1) return -1;
+  } else if (F->forcing != FUSED_FORCING_NONE) {
+    _fused_manning_friction(F);
+  }
+
+  return 0;
+}
+
+
+int _fused_update_timestep(struct fused_step *F, PyObject *domain,
+                           PyObject *yieldstep, PyObject *finaltime,
+                           double flux_timestep, double *timestep) {
+  // Same as Generic_Domain.update_timestep, which is called instead if
+  // it is overridden or when the timestep is below evolve_min_timestep.
+  // Set domain.timestep and return it
+
+  PyObject *result;
+  double time, final_time;
 
-  if (!PyArg_ParseTuple(args, "Odd", &domain, &yieldstep, &finaltime)) {
+  *timestep = F->CFL*flux_timestep;
+  if (F->D.evolve_max_timestep < *timestep) {
+    *timestep = F->D.evolve_max_timestep;
+  }
+
+  if (F->python_timestep || *timestep < F->evolve_min_timestep) {
+    result = PyObject_CallMethod(domain, "update_timestep", "OO", yieldstep, finaltime);
+    if (result == NULL) {
+      return -1;
+    }
+    Py_DECREF(result);
+
+    *timestep = get_python_double(domain, "timestep");
+    F->recorded_max_timestep = get_python_double(domain, "recorded_max_timestep");
+    F->recorded_min_timestep = get_python_double(domain, "recorded_min_timestep");
+    if (PyErr_Occurred()) return -1;
+
+    // The small steps and order may have been changed
+    F->reset_order = 1;
+    return 0;
+  }
+
+  // Record maximal and minimal values of timestep for reporting
+  if (*timestep > F->recorded_max_timestep) {
+    F->recorded_max_timestep = *timestep;
+    if (_set_domain_double(domain, "recorded_max_timestep", *timestep) == -1) return -1;
+  }
+  if (*timestep < F->recorded_min_timestep) {
+    F->recorded_min_timestep = *timestep;
+    if (_set_domain_double(domain, "recorded_min_timestep", *timestep) == -1) return -1;
+  }
+
+  if (F->reset_order) {
+    if (_set_domain_integer(domain, "smallsteps", 0) == -1) return -1;
+    if (get_python_integer(domain, "_order_") == 1 &&
+        get_python_integer(domain, "default_order") == 2) {
+      if (_set_domain_integer(domain, "_order_", 2) == -1) return -1;
+    }
+    if (PyErr_Occurred()) return -1;
+    F->reset_order = 0;
+  }
+
+  // Ensure that final time is not exceeded and that model time is
+  // aligned with yieldsteps
+  time = get_python_double(domain, "time");
+  if (PyErr_Occurred()) return -1;
+
+  if (finaltime != Py_None) {
+    final_time = PyFloat_AsDouble(finaltime);
+    if (PyErr_Occurred()) return -1;
+    if (time + *timestep > final_time) {
+      *timestep = final_time - time;
+    }
+  }
+
+  if (time + *timestep > F->yieldtime) {
+    *timestep = F->yieldtime - time;
+  }
+
+  return _set_domain_double(domain, "timestep", *timestep);
+}
+
+
+//========================================================================
+// swde1_update_conserved_quantities
+//========================================================================
+
+PyObject *swde1_update_conserved_quantities(PyObject *self, PyObject *args) {
+  /*
+   * Domain.update_conserved_quantities for the DE algorithms, restricted
+   * to the active triangles if active cells are used
+  */
+
+  PyObject *domain, *quantities;
+
+  struct domain D;
+
+  double *stage_semi_implicit_update;
+  double *xmom_semi_implicit_update;
+  double *ymom_semi_implicit_update;
+  double timestep;
+  int using_discontinuous_elevation;
+
+  if (!PyArg_ParseTuple(args, "Od", &domain, &timestep)) {
       report_python_error(AT, "could not parse input arguments");
       return NULL;
   }
 
-
   get_python_domain(&D, domain);
 
-  //printf("In C_evolve %f %f \n", yieldstep, finaltime);
+  quantities = get_python_object(domain, "quantities");
+  if (quantities == NULL) return NULL;
+  stage_semi_implicit_update = get_python_array_data_from_dict(quantities, "stage", "semi_implicit_update");
+  xmom_semi_implicit_update = get_python_array_data_from_dict(quantities, "xmomentum", "semi_implicit_update");
+  ymom_semi_implicit_update = get_python_array_data_from_dict(quantities, "ymomentum", "semi_implicit_update");
+  Py_DECREF(quantities);
 
+  using_discontinuous_elevation = get_python_integer(domain, "using_discontinuous_elevation");
+  if (PyErr_Occurred()) return NULL;
 
-  // From centroid values calculate edge and vertex values
-  //printf("distribute_to_vertices_and_edges\n");
-//  result = PyObject_CallMethod(domain,"distribute_to_vertices_and_edges",NULL);
-//  if (result == NULL) {
-//     return NULL;
-//  }
-//  Py_DECREF(result);
+  if (_update_conserved_quantities(&D, timestep,
+                                   stage_semi_implicit_update,
+                                   xmom_semi_implicit_update,
+                                   ymom_semi_implicit_update,
+                                   using_discontinuous_elevation) == -1) return NULL;
 
-  mass_error = _protect_new(&D);
+  Py_RETURN_NONE;
 
-  e = _extrapolate_second_order_edge_sw(&D);
-  if (e == -1) {
-    // Use error string set inside computational routine
+}// swde1_update_conserved_quantities
+
+
+//========================================================================
+// swde1_fused_step_setup
+//========================================================================
+
+void _fused_step_destructor(PyObject *capsule) {
+
+  struct fused_step *F;
+
+  F = (struct fused_step *) PyCapsule_GetPointer(capsule, "fused_step");
+
+  Py_XDECREF(F->reflective_array);
+  Py_XDECREF(F->dirichlet_array);
+  Py_XDECREF(F->dirichlet_values_array);
+  Py_XDECREF(F->python_boundaries);
+  free(F);
+}
+
+
+struct fused_step *_get_fused_step(PyObject *capsule) {
+
+  return (struct fused_step *) PyCapsule_GetPointer(capsule, "fused_step");
+}
+
+
+PyObject *swde1_fused_step_setup(PyObject *self, PyObject *args) {
+  /*
+   * Extract the data of the fused timestep from the domain, see
+   * Domain._get_fused_step. Return a capsule for evolve_one_euler_step
+   * and evolve_one_rk2_step
+  */
+
+  PyObject *domain, *reflective_ids, *dirichlet_ids, *dirichlet_values;
+  PyObject *python_boundaries, *quantities, *capsule;
+  PyArrayObject *boundary_cells, *boundary_edges;
+
+  struct fused_step *F;
+
+  int forcing, python_timestep, python_ghosts;
+
+  if (!PyArg_ParseTuple(args, "OOOOOiii", &domain, &reflective_ids,
+                        &dirichlet_ids, &dirichlet_values, &python_boundaries,
+                        &forcing, &python_timestep, &python_ghosts)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
+  }
+
+  F = (struct fused_step *) calloc(1, sizeof(struct fused_step));
+  if (F == NULL) {
+    return PyErr_NoMemory();
+  }
+
+  capsule = PyCapsule_New((void *) F, "fused_step", _fused_step_destructor);
+  if (capsule == NULL) {
+    free(F);
     return NULL;
   }
 
+  get_python_domain(&F->D, domain);
 
-  // Apply boundary conditions
-  //printf("update_boundary\n");
-  result = PyObject_CallMethod(domain,"update_boundary",NULL);
-  if (result == NULL) {
-     return NULL;
+  quantities = get_python_object(domain, "quantities");
+  if (quantities == NULL) {
+    Py_DECREF(capsule);
+    return NULL;
+  }
+  F->stage_semi_implicit_update = get_python_array_data_from_dict(quantities, "stage", "semi_implicit_update");
+  F->xmom_semi_implicit_update = get_python_array_data_from_dict(quantities, "xmomentum", "semi_implicit_update");
+  F->ymom_semi_implicit_update = get_python_array_data_from_dict(quantities, "ymomentum", "semi_implicit_update");
+  F->stage_backup_values = get_python_array_data_from_dict(quantities, "stage", "centroid_backup_values");
+  F->xmom_backup_values = get_python_array_data_from_dict(quantities, "xmomentum", "centroid_backup_values");
+  F->ymom_backup_values = get_python_array_data_from_dict(quantities, "ymomentum", "centroid_backup_values");
+  F->friction_centroid_values = get_python_array_data_from_dict(quantities, "friction", "centroid_values");
+  F->height_boundary_values = get_python_array_data_from_dict(quantities, "height", "boundary_values");
+  F->xvel_edge_values = get_python_array_data_from_dict(quantities, "xvelocity", "edge_values");
+  F->yvel_edge_values = get_python_array_data_from_dict(quantities, "yvelocity", "edge_values");
+  F->xvel_boundary_values = get_python_array_data_from_dict(quantities, "xvelocity", "boundary_values");
+  F->yvel_boundary_values = get_python_array_data_from_dict(quantities, "yvelocity", "boundary_values");
+  Py_DECREF(quantities);
+
+  boundary_cells = get_consecutive_array(domain, "boundary_cells");
+  boundary_edges = get_consecutive_array(domain, "boundary_edges");
+  if (boundary_cells == NULL || boundary_edges == NULL) {
+    Py_XDECREF(boundary_cells);
+    Py_XDECREF(boundary_edges);
+    Py_DECREF(capsule);
+    return NULL;
+  }
+  F->boundary_cells = (long *) boundary_cells->data;
+  F->boundary_edges = (long *) boundary_edges->data;
+  Py_DECREF(boundary_cells);
+  Py_DECREF(boundary_edges);
+
+  F->reflective_array = (PyArrayObject *) PyArray_ContiguousFromObject(reflective_ids, PyArray_LONG, 1, 1);
+  F->dirichlet_array = (PyArrayObject *) PyArray_ContiguousFromObject(dirichlet_ids, PyArray_LONG, 1, 1);
+  F->dirichlet_values_array = (PyArrayObject *) PyArray_ContiguousFromObject(dirichlet_values, PyArray_DOUBLE, 2, 2);
+  if (F->reflective_array == NULL || F->dirichlet_array == NULL ||
+      F->dirichlet_values_array == NULL) {
+    Py_DECREF(capsule);
+    return NULL;
+  }
+  F->number_of_reflective_edges = F->reflective_array->dimensions[0];
+  F->reflective_ids = (long *) F->reflective_array->data;
+  F->number_of_dirichlet_edges = F->dirichlet_array->dimensions[0];
+  F->dirichlet_ids = (long *) F->dirichlet_array->data;
+  F->dirichlet_values = (double *) F->dirichlet_values_array->data;
+
+  if (F->dirichlet_values_array->dimensions[0] != F->number_of_dirichlet_edges ||
+      F->dirichlet_values_array->dimensions[1] != 3) {
+    Py_DECREF(capsule);
+    report_python_error(AT, "dirichlet_values must have 3 values for each edge");
+    return NULL;
   }
-  Py_DECREF(result);
 
+  if (python_boundaries != Py_None && !PyList_Check(python_boundaries)) {
+    Py_DECREF(capsule);
+    report_python_error(AT, "python_boundaries must be a list or None");
+    return NULL;
+  }
+  Py_INCREF(python_boundaries);
+  F->python_boundaries = python_boundaries;
+
+  F->forcing = forcing;
+  F->python_timestep = python_timestep;
+  F->python_ghosts = python_ghosts;
+
+  F->using_discontinuous_elevation = get_python_integer(domain, "using_discontinuous_elevation");
+  F->verbose = get_python_integer(domain, "verbose");
+  F->ghost_layer_width = get_python_integer(domain, "ghost_layer_width");
+
+  F->CFL = get_python_double(domain, "CFL");
+  F->evolve_min_timestep = get_python_double(domain, "evolve_min_timestep");
+  F->yieldtime = get_python_double(domain, "yieldtime");
+  F->recorded_max_timestep = get_python_double(domain, "recorded_max_timestep");
+  F->recorded_min_timestep = get_python_double(domain, "recorded_min_timestep");
+  F->reset_order = 1;
+
+  if (PyErr_Occurred()) {
+    Py_DECREF(capsule);
+    return NULL;
+  }
 
+  return capsule;
 
-  //Compute fluxes across each element edge
-  //printf("compute_fluxes\n");
-//  result = PyObject_CallMethod(domain,"compute_fluxes",NULL);
-//  if (result == NULL) {
-//     return NULL;
-//  }
-//  Py_DECREF(result);
+}// swde1_fused_step_setup
 
 
-  flux_timestep =_compute_fluxes_central(&D, D.evolve_max_timestep);
+//========================================================================
+// swde1_evolve_one_euler_step
+//========================================================================
 
+PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
+  /*
+   * One euler step, equivalent to Generic_Domain.evolve_one_euler_step
+   * for the DE algorithms
+  */
 
-  result = PyFloat_FromDouble(flux_timestep);
-  if (result == NULL) {
-     return NULL;
-  }
-  if (!PyFloat_Check(result)) {
-     return NULL;
+  PyObject *domain, *capsule, *yieldstep, *finaltime;
+
+  struct fused_step *F;
+
+  double flux_timestep, timestep;
+
+  if (!PyArg_ParseTuple(args, "OOOO", &domain, &capsule, &yieldstep, &finaltime)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
   }
-  e = PyObject_SetAttrString(domain, "flux_timestep", result);
-  if (e == -1) {
-    // Use error string set inside computational routine
-    return NULL;
+
+  F = _get_fused_step(capsule);
+  if (F == NULL) return NULL;
+
+  if (_fused_compute_fluxes_and_forcing(F, domain, &flux_timestep) == -1) return NULL;
+
+  if (_fused_update_timestep(F, domain, yieldstep, finaltime,
+                             flux_timestep, &timestep) == -1) return NULL;
+
+  if (F->D.max_flux_update_frequency != 1) {
+    // Update flux_update_frequency using the new timestep
+    _compute_flux_update_frequency(&F->D, timestep);
   }
-  Py_DECREF(result);
 
+  if (_update_conserved_quantities(&F->D, timestep,
+                                   F->stage_semi_implicit_update,
+                                   F->xmom_semi_implicit_update,
+                                   F->ymom_semi_implicit_update,
+                                   F->using_discontinuous_elevation) == -1) return NULL;
 
+  Py_RETURN_NONE;
 
+}// swde1_evolve_one_euler_step
 
 
-  //Compute forcing terms
-  //printf("compute_forcing_terms\n");
-  result = PyObject_CallMethod(domain,"compute_forcing_terms",NULL);
-  if (result == NULL) {
-     return NULL;
+//========================================================================
+// swde1_evolve_one_rk2_step
+//========================================================================
+
+PyObject *swde1_evolve_one_rk2_step(PyObject *self, PyObject *args) {
+  /*
+   * One rk2 step, equivalent to Generic_Domain.evolve_one_rk2_step
+   * for the DE algorithms
+  */
+
+  PyObject *domain, *capsule, *yieldstep, *finaltime;
+
+  struct fused_step *F;
+  struct domain *D;
+
+  double flux_timestep, timestep, time;
+  int k, N;
+
+  if (!PyArg_ParseTuple(args, "OOOO", &domain, &capsule, &yieldstep, &finaltime)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
   }
-  Py_DECREF(result);
 
-  //Update timestep to fit yieldstep and finaltime
-  //printf("update_timestep\n");
-  result = PyObject_CallMethod(domain,"update_timestep","dd",yieldstep,finaltime);
-  if (result == NULL) {
-     return NULL;
+  F = _get_fused_step(capsule);
+  if (F == NULL) return NULL;
+  D = &F->D;
+  N = D->number_of_elements;
+
+  // Save initial conserved quantities values
+  memcpy(F->stage_backup_values, D->stage_centroid_values, N*sizeof(double));
+  memcpy(F->xmom_backup_values, D->xmom_centroid_values, N*sizeof(double));
+  memcpy(F->ymom_backup_values, D->ymom_centroid_values, N*sizeof(double));
+
+  // First euler step
+  if (_fused_compute_fluxes_and_forcing(F, domain, &flux_timestep) == -1) return NULL;
+
+  if (_fused_update_timestep(F, domain, yieldstep, finaltime,
+                             flux_timestep, &timestep) == -1) return NULL;
+
+  if (_update_conserved_quantities(D, timestep,
+                                   F->stage_semi_implicit_update,
+                                   F->xmom_semi_implicit_update,
+                                   F->ymom_semi_implicit_update,
+                                   F->using_discontinuous_elevation) == -1) return NULL;
+
+  time = get_python_double(domain, "time");
+  if (PyErr_Occurred()) return NULL;
+  if (_set_domain_double(domain, "time", time + timestep) == -1) return NULL;
+
+  if (F->python_ghosts && F->ghost_layer_width < 4) {
+    if (_call_domain_method(domain, "update_ghosts") == -1) return NULL;
   }
-  Py_DECREF(result);
 
-  //if self.max_flux_update_frequency is not 1:
-  // Update flux_update_frequency using the new timestep
-  // self.compute_flux_update_frequency()
+  // Second euler step using the same timestep
+  if (_fused_compute_fluxes_and_forcing(F, domain, &flux_timestep) == -1) return NULL;
+
+  if (_update_conserved_quantities(D, timestep,
+                                   F->stage_semi_implicit_update,
+                                   F->xmom_semi_implicit_update,
+                                   F->ymom_semi_implicit_update,
+                                   F->using_discontinuous_elevation) == -1) return NULL;
+
+  // Combine initial and final values of conserved quantities
+  #pragma omp parallel for schedule(static) num_threads(D->omp_num_threads)
+  for (k = 0; k < N; k++) {
+    D->stage_centroid_values[k] = 0.5*D->stage_centroid_values[k] + 0.5*F->stage_backup_values[k];
+    D->xmom_centroid_values[k] = 0.5*D->xmom_centroid_values[k] + 0.5*F->xmom_backup_values[k];
+    D->ymom_centroid_values[k] = 0.5*D->ymom_centroid_values[k] + 0.5*F->ymom_backup_values[k];
+  }
 
-  // Update conserved quantities
-  //printf("update_conserved_quantities\n");
-  result = PyObject_CallMethod(domain,"update_conserved_quantities",NULL);
-  if (result == NULL) {
-     return NULL;
+  if (D->max_flux_update_frequency != 1) {
+    // Update flux_update_frequency for the next step
+    _compute_flux_update_frequency(D, timestep);
   }
-  Py_DECREF(result);
 
   Py_RETURN_NONE;
 
-}// swde1_evolve_one_euler_step
+}// swde1_evolve_one_rk2_step
 
 //========================================================================
 // Method table for python module
@@ -2465,7 +3599,10 @@ static struct PyMethodDef MethodTable[] = {
   {"compute_flux_update_frequency", swde1_compute_flux_update_frequency, METH_VARARGS, "Print out"},
   {"protect",          swde1_protect, METH_VARARGS | METH_KEYWORDS, "Print out"},
   {"protect_new",      swde1_protect_new, METH_VARARGS | METH_KEYWORDS, "Print out"},
+  {"update_conserved_quantities", swde1_update_conserved_quantities, METH_VARARGS, "Print out"},
+  {"fused_step_setup", swde1_fused_step_setup, METH_VARARGS, "Print out"},
   {"evolve_one_euler_step", swde1_evolve_one_euler_step, METH_VARARGS | METH_KEYWORDS, "Print out"},
+  {"evolve_one_rk2_step", swde1_evolve_one_rk2_step, METH_VARARGS | METH_KEYWORDS, "Print out"},
   {NULL, NULL, 0, NULL}
 };
 
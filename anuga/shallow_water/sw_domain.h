@@ -34,6 +34,10 @@ struct domain {
     long max_flux_update_frequency;
     long ncol_riverwall_hydraulic_properties;
 
+    long omp_num_threads;
+    long use_active_cells;
+    long number_of_full_triangles;
+
     // Changing values in these arrays will change the values in the python object
     long*   neighbours;
     long*   neighbour_edges;
@@ -88,12 +92,26 @@ struct domain {
     double* edge_timestep;
     double* edge_flux_work;
     double* pressuregrad_work;
+    double* edge_flux_work_average;
+    double* pressuregrad_work_average;
     double* x_centroid_work;
     double* y_centroid_work;
     double* boundary_flux_sum;
 
     long* allow_timestep_increase;
+    long* cyclic_number_of_steps;
+
+    long* active_cells_flag;
+    long* active_cells;
+    long* active_halo_cells;
+    long* number_of_active_cells;
+    long* active_cells_marked;
+    long* active_cells_candidates;
+    double* active_cells_stage;
 
+    long* kernel_counters;
+
+    long* edge_river_wall_counter;
     double* riverwall_elevation;
     long* riverwall_rowIndex;
     double* riverwall_hydraulic_properties;
@@ -189,12 +207,24 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
             *update_next_flux,
             *update_extrapolation,
             *allow_timestep_increase,
+            *cyclic_number_of_steps,
             *edge_timestep,
             *edge_flux_work,
             *pressuregrad_work,
+            *edge_flux_work_average,
+            *pressuregrad_work_average,
             *x_centroid_work,
             *y_centroid_work,
             *boundary_flux_sum,
+            *edge_river_wall_counter,
+            *active_cells_flag,
+            *active_cells,
+            *active_halo_cells,
+            *number_of_active_cells,
+            *active_cells_marked,
+            *active_cells_candidates,
+            *active_cells_stage,
+            *kernel_counters,
             *riverwall_elevation,
             *riverwall_rowIndex,
             *riverwall_hydraulic_properties;
@@ -223,6 +253,10 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     D->beta_vh_dry = get_python_double(domain, "beta_vh_dry");
 
     D->max_flux_update_frequency = get_python_integer(domain,"max_flux_update_frequency");
+
+    D->omp_num_threads = get_python_integer(domain, "omp_num_threads");
+    D->use_active_cells = get_python_integer(domain, "use_active_cells");
+    D->number_of_full_triangles = get_python_integer(domain, "number_of_full_triangles");
     
     neighbours = get_consecutive_array(domain, "neighbours");
     D->neighbours = (long *) neighbours->data;
@@ -283,6 +317,9 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     allow_timestep_increase = get_consecutive_array(domain, "allow_timestep_increase");
     D->allow_timestep_increase = (long*) allow_timestep_increase->data;
 
+    cyclic_number_of_steps = get_consecutive_array(domain, "cyclic_number_of_steps");
+    D->cyclic_number_of_steps = (long*) cyclic_number_of_steps->data;
+
     edge_timestep = get_consecutive_array(domain, "edge_timestep");
     D->edge_timestep = (double*) edge_timestep->data;
     
@@ -291,6 +328,12 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     
     pressuregrad_work = get_consecutive_array(domain, "pressuregrad_work");
     D->pressuregrad_work = (double*) pressuregrad_work->data;
+
+    edge_flux_work_average = get_consecutive_array(domain, "edge_flux_work_average");
+    D->edge_flux_work_average = (double*) edge_flux_work_average->data;
+
+    pressuregrad_work_average = get_consecutive_array(domain, "pressuregrad_work_average");
+    D->pressuregrad_work_average = (double*) pressuregrad_work_average->data;
     
     x_centroid_work = get_consecutive_array(domain, "x_centroid_work");
     D->x_centroid_work = (double*) x_centroid_work->data;
@@ -301,6 +344,33 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     boundary_flux_sum = get_consecutive_array(domain, "boundary_flux_sum");
     D->boundary_flux_sum = (double*) boundary_flux_sum->data;
 
+    edge_river_wall_counter = get_consecutive_array(domain, "edge_river_wall_counter");
+    D->edge_river_wall_counter = (long*) edge_river_wall_counter->data;
+
+    active_cells_flag = get_consecutive_array(domain, "active_cells_flag");
+    D->active_cells_flag = (long*) active_cells_flag->data;
+
+    active_cells = get_consecutive_array(domain, "active_cells");
+    D->active_cells = (long*) active_cells->data;
+
+    active_halo_cells = get_consecutive_array(domain, "active_halo_cells");
+    D->active_halo_cells = (long*) active_halo_cells->data;
+
+    number_of_active_cells = get_consecutive_array(domain, "number_of_active_cells");
+    D->number_of_active_cells = (long*) number_of_active_cells->data;
+
+    active_cells_marked = get_consecutive_array(domain, "active_cells_marked");
+    D->active_cells_marked = (long*) active_cells_marked->data;
+
+    active_cells_candidates = get_consecutive_array(domain, "active_cells_candidates");
+    D->active_cells_candidates = (long*) active_cells_candidates->data;
+
+    active_cells_stage = get_consecutive_array(domain, "active_cells_stage");
+    D->active_cells_stage = (double*) active_cells_stage->data;
+
+    kernel_counters = get_consecutive_array(domain, "kernel_counters");
+    D->kernel_counters = (long*) kernel_counters->data;
+
     quantities = get_python_object(domain, "quantities");
 
     D->stage_edge_values     = get_python_array_data_from_dict(quantities, "stage",     "edge_values");
@@ -368,10 +438,22 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     Py_DECREF(edge_timestep);
     Py_DECREF(edge_flux_work);
     Py_DECREF(pressuregrad_work);
+    Py_DECREF(edge_flux_work_average);
+    Py_DECREF(pressuregrad_work_average);
     Py_DECREF(x_centroid_work);
     Py_DECREF(y_centroid_work);
     Py_DECREF(boundary_flux_sum);
+    Py_DECREF(edge_river_wall_counter);
     Py_DECREF(allow_timestep_increase);
+    Py_DECREF(cyclic_number_of_steps);
+    Py_DECREF(active_cells_flag);
+    Py_DECREF(active_cells);
+    Py_DECREF(active_halo_cells);
+    Py_DECREF(number_of_active_cells);
+    Py_DECREF(active_cells_marked);
+    Py_DECREF(active_cells_candidates);
+    Py_DECREF(active_cells_stage);
+    Py_DECREF(kernel_counters);
 
     return D;
 }
@@ -396,6 +478,8 @@ int print_domain_struct(struct domain *D) {
     printf("D->beta_uh_dry            %g \n", D->beta_uh_dry);
     printf("D->beta_vh                %g \n", D->beta_vh);
     printf("D->beta_vh_dry            %g \n", D->beta_vh_dry);
+    printf("D->omp_num_threads        %ld \n", D->omp_num_threads);
+    printf("D->use_active_cells       %ld \n", D->use_active_cells);
 
 
 
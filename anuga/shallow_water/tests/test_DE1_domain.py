@@ -17,16 +17,68 @@ import warnings
 import time
 
 
+def run_dam_break(flow_algorithm='DE1', finaltime=0.3, flat=False,
+                  dirichlet=False, name=None, setup=None, **options):
+    """Evolve a 10x10 dam break with yieldsteps of 0.1 and return the
+    domain, or only set it up if finaltime is None.
+
+    The other keyword options call the setters of the domain, e.g.
+    fused_timestepping=True calls domain.set_fused_timestepping(True).
+    setup is called with the domain before evolving, e.g. to add
+    operators or forcing terms.
+    """
+
+    points, vertices, boundary = anuga.rectangular_cross(10, 10,
+                                                len1=1., len2=1.)
+
+    domain=Domain(points,vertices,boundary)
+    domain.set_flow_algorithm(flow_algorithm)
+    if name is None:
+        domain.set_store(False)
+    else:
+        domain.set_name(name)
+
+    for option, value in options.items():
+        getattr(domain, 'set_' + option)(value)
+
+    if flat:
+        domain.set_quantity('elevation',0.0)
+        domain.set_quantity('friction',0.0)
+    else:
+        domain.set_quantity('elevation',lambda x,y: -0.1*x)
+        domain.set_quantity('friction',0.03)
+    domain.set_quantity('stage', lambda x,y: 0.5*(x<0.5))
+
+    Br=anuga.Reflective_boundary(domain)
+    if dirichlet:
+        Bd=anuga.Dirichlet_boundary([0.2, 0.0, 0.0])
+        domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom':Br})
+    else:
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom':Br})
+
+    if setup is not None:
+        setup(domain)
+
+    if finaltime is None:
+        return domain
+
+    for t in domain.evolve(yieldstep=0.1,finaltime=finaltime):
+        pass
+
+    return domain
+
 
 class Test_DE1_domain(unittest.TestCase):
     def setUp(self):
         pass
 
     def tearDown(self):
-        try:
-            os.remove('runup_sinusoid_de1.sww')
-        except:
-            pass
+        for filename in ['runup_sinusoid_de1.sww', 'profile_de1.sww',
+                         'profile_de1.csv', 'profile_de1.json']:
+            try:
+                os.remove(filename)
+            except:
+                pass
 
 
     def test_runup_sinusoid(self):
@@ -103,7 +155,390 @@ class Test_DE1_domain(unittest.TestCase):
         assert num.all(vv<2.0e-02)
 
 
-            
+    def test_omp_num_threads(self):
+        """ Check that the threaded DE1 flux computation agrees with the
+        single threaded one, and is reproducible for a given thread count
+        """
+
+        domain1 = run_dam_break(finaltime=0.2, flat=True, omp_num_threads=1)
+        domain3 = run_dam_break(finaltime=0.2, flat=True, omp_num_threads=3)
+        domain3b = run_dam_break(finaltime=0.2, flat=True, omp_num_threads=3)
+
+        assert domain3.get_omp_num_threads() == 3
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            q1 = domain1.quantities[name].centroid_values
+            q3 = domain3.quantities[name].centroid_values
+            q3b = domain3b.quantities[name].centroid_values
+
+            assert num.allclose(q1, q3)
+            assert num.all(q3 == q3b)
+
+        try:
+            domain1.set_omp_num_threads(0)
+        except Exception:
+            pass
+        else:
+            raise Exception('Should have raised an exception')
+
+
+    def test_fused_timestepping(self):
+        """ Check that the fused C timestep gives the same results as the
+        standard evolve for DE0 (euler) and DE1 (rk2)
+        """
+
+        for flow_algorithm in ['DE0', 'DE1']:
+            domain = run_dam_break(flow_algorithm, dirichlet=True)
+            domain_fused = run_dam_break(flow_algorithm, dirichlet=True,
+                                         fused_timestepping=True)
+
+            assert domain_fused.get_fused_timestepping()
+
+            for name in ['stage', 'xmomentum', 'ymomentum']:
+                q = domain.quantities[name].centroid_values
+                q_fused = domain_fused.quantities[name].centroid_values
+
+                assert num.all(q == q_fused)
+
+        domain.set_flow_algorithm('1_5')
+        try:
+            domain.set_fused_timestepping(True)
+        except Exception:
+            pass
+        else:
+            raise Exception('Should have raised an exception')
+
+
+    def test_fused_timestepping_callbacks(self):
+        """ Check that the fused timestep only calls back python for the
+        boundaries and forcing terms not evaluated in C, with the same
+        results as the standard evolve
+        """
+
+        from anuga.shallow_water.boundaries import Reflective_boundary
+
+        calls = {'reflective': 0, 'boundary': 0, 'forcing': 0}
+
+        class Counted_boundary(anuga.Dirichlet_boundary):
+            def evaluate_segment(self, domain, segment_edges):
+                calls['boundary'] += 1
+                anuga.Dirichlet_boundary.evaluate_segment(self, domain,
+                                                          segment_edges)
+
+        def rain(domain):
+            calls['forcing'] += 1
+            domain.quantities['stage'].explicit_update[:] += 0.01
+
+        def sloped(domain):
+            domain.use_sloped_mannings = True
+
+        def frictionless(domain):
+            domain.forcing_terms = []
+
+        def python(domain):
+            Br=anuga.Reflective_boundary(domain)
+            Bc=Counted_boundary([0.2, 0.0, 0.0])
+            domain.set_boundary({'left': Br, 'right': Bc, 'top': Br, 'bottom':Br})
+            domain.forcing_terms.append(rain)
+
+        evaluate_segment = Reflective_boundary.evaluate_segment
+        def counted_evaluate_segment(self, domain, segment_edges):
+            calls['reflective'] += 1
+            evaluate_segment(self, domain, segment_edges)
+        Reflective_boundary.evaluate_segment = counted_evaluate_segment
+
+        try:
+            for flow_algorithm in ['DE0', 'DE1']:
+                for setup in [sloped, frictionless, python]:
+                    domain = run_dam_break(flow_algorithm, dirichlet=True,
+                                           setup=setup)
+                    standard_calls = calls.copy()
+                    domain_fused = run_dam_break(flow_algorithm, dirichlet=True,
+                                                 setup=setup,
+                                                 fused_timestepping=True)
+
+                    for name in ['stage', 'xmomentum', 'ymomentum']:
+                        q = domain.quantities[name].centroid_values
+                        q_fused = domain_fused.quantities[name].centroid_values
+
+                        assert num.all(q == q_fused)
+
+                    # Reflective boundaries are only evaluated by python
+                    # at the start and the 3 yields on the 3 boundary tags
+                    reflective = calls['reflective'] - standard_calls['reflective']
+                    assert standard_calls['reflective'] > 4*3
+                    assert reflective == 4*3
+
+                    # The others at every step too
+                    for name in ['boundary', 'forcing']:
+                        assert calls[name] == 2*standard_calls[name]
+                        if setup is python:
+                            assert calls[name] > 4
+
+                    for name in calls:
+                        calls[name] = 0
+        finally:
+            Reflective_boundary.evaluate_segment = evaluate_segment
+
+
+    def test_active_cells(self):
+        """ Check that restricting the DE kernels to the active cells gives
+        the same results as visiting every triangle, on a mostly dry domain
+        """
+
+        def run_wetting(flow_algorithm, active, omp_num_threads=1):
+            points, vertices, boundary = anuga.rectangular_cross(15, 15,
+                                                        len1=1., len2=1.)
+
+            domain=Domain(points,vertices,boundary)
+            domain.set_flow_algorithm(flow_algorithm)
+            domain.set_store(False)
+            domain.set_omp_num_threads(omp_num_threads)
+            domain.set_use_active_cells(active)
+
+            def topography(x,y):
+                return 0.2*x - 0.05*y
+
+            def stagefun(x,y):
+                return num.where((x<0.2)&(y<0.5), 0.15, topography(x,y))
+
+            domain.set_quantity('elevation',topography)
+            domain.set_quantity('friction',0.03)
+            domain.set_quantity('stage', stagefun)
+
+            Br=anuga.Reflective_boundary(domain)
+            Bd=anuga.Dirichlet_boundary([0.1, 0.0, 0.0])
+            domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom':Br})
+
+            counts = []
+            for t in domain.evolve(yieldstep=0.1,finaltime=0.3):
+                counts.append(domain.get_number_of_active_cells())
+
+            return domain, counts
+
+        for flow_algorithm, omp_num_threads in [('DE0', 1), ('DE1', 1), ('DE1', 3)]:
+            domain, counts = run_wetting(flow_algorithm, False, omp_num_threads)
+            domain_active, counts_active = run_wetting(flow_algorithm, True,
+                                                       omp_num_threads)
+
+            assert domain_active.get_use_active_cells()
+            assert counts[-1] == (domain.number_of_elements, 0)
+
+            # Only part of the domain is wet
+            active, halo = counts_active[-1]
+            assert 0 < active < domain.number_of_elements
+            assert halo > 0
+
+            for name in ['stage', 'xmomentum', 'ymomentum']:
+                q = domain.quantities[name].centroid_values
+                q_active = domain_active.quantities[name].centroid_values
+
+                assert num.all(q == q_active)
+
+            assert num.allclose(domain.get_water_volume(),
+                                domain_active.get_water_volume())
+            assert num.allclose(domain.get_boundary_flux_integral(),
+                                domain_active.get_boundary_flux_integral())
+
+        msg = domain_active.timestepping_statistics()
+        assert 'active cells=%d (halo %d)' % (active, halo) in msg
+
+        # Not supported with local timestepping
+        domain_active.set_flow_algorithm('DE0')
+        try:
+            domain_active.set_local_extrapolation_and_flux_updating()
+        except Exception:
+            pass
+        else:
+            raise Exception('Should have raised an exception')
+
+        domain.set_flow_algorithm('DE0')
+        domain.set_local_extrapolation_and_flux_updating()
+        try:
+            domain.set_use_active_cells(True)
+        except Exception:
+            pass
+        else:
+            raise Exception('Should have raised an exception')
+
+
+    def test_active_cells_incremental(self):
+        """ Check that the active cells kept up to date from the changed
+        triangles give the same results as visiting every triangle, with an
+        operator wetting a dry region, for rk2 and rk3 timestepping
+        """
+
+        polygon = [[0.7, 0.7], [0.9, 0.7], [0.9, 0.9], [0.7, 0.9]]
+
+        def run_rain(flow_algorithm, active):
+            points, vertices, boundary = anuga.rectangular_cross(15, 15,
+                                                        len1=1., len2=1.)
+
+            domain=Domain(points,vertices,boundary)
+            domain.set_flow_algorithm(flow_algorithm)
+            domain.set_store(False)
+            domain.set_use_active_cells(active)
+
+            def topography(x,y):
+                return 0.2*x - 0.05*y
+
+            def stagefun(x,y):
+                return num.where((x<0.2)&(y<0.5), 0.15, topography(x,y))
+
+            domain.set_quantity('elevation',topography)
+            domain.set_quantity('friction',0.03)
+            domain.set_quantity('stage', stagefun)
+
+            Br=anuga.Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom':Br})
+
+            operator = anuga.Rate_operator(domain, rate=0.5, polygon=polygon)
+
+            # Record the marked triangles and pending rescans seen by each
+            # update of the active cells
+            marks = []
+            distribute = domain.distribute_to_vertices_and_edges
+            def distribute_and_record():
+                marks.append(domain.number_of_active_cells[2:].copy())
+                distribute()
+            domain.distribute_to_vertices_and_edges = distribute_and_record
+
+            for t in domain.evolve(yieldstep=0.05,finaltime=0.2):
+                pass
+
+            if active and flow_algorithm == 'DE1':
+                # All the triangles are only checked at the start and after
+                # each of the 5 yields, otherwise the lists and the
+                # triangles of the operator
+                marks = num.array(marks)
+                assert len(marks) > 20
+                assert num.sum(marks[:,1]) <= 6
+                assert num.max(marks[:,0]) == len(operator.indices)
+
+            return domain
+
+        for flow_algorithm in ['DE1', 'DE2']:
+            domain = run_rain(flow_algorithm, False)
+            domain_active = run_rain(flow_algorithm, True)
+
+            # The rain started flows away from the initial water
+            active, halo = domain_active.get_number_of_active_cells()
+            assert 0 < active < domain.number_of_elements
+
+            for name in ['stage', 'xmomentum', 'ymomentum']:
+                q = domain.quantities[name].centroid_values
+                q_active = domain_active.quantities[name].centroid_values
+
+                assert num.all(q == q_active)
+
+
+    def test_contiguous_quantity_storage(self):
+        """ Check that storing the quantities in contiguous blocks gives
+        the same results for rk2 and rk3 timestepping
+        """
+
+        for flow_algorithm in ['DE1', 'DE2']:
+            domain = run_dam_break(flow_algorithm, dirichlet=True)
+            domain_contiguous = run_dam_break(flow_algorithm, dirichlet=True,
+                                              contiguous_quantity_storage=True)
+
+            block = domain_contiguous.get_quantity_block('centroid_values')
+            assert block.shape == (3, domain.number_of_elements)
+
+            for i, name in enumerate(['stage', 'xmomentum', 'ymomentum']):
+                q = domain.quantities[name].centroid_values
+                q_contiguous = domain_contiguous.quantities[name].centroid_values
+
+                assert num.all(q == q_contiguous)
+                assert num.all(block[i] == q_contiguous)
+
+
+    def test_profiling(self):
+        """ Check that the evolve profiler records the phases and counters
+        at each yieldstep, writes csv and json and leaves the results
+        unchanged
+        """
+
+        import cPickle
+        import json
+
+        labels = []
+        def add_rain(domain):
+            op = anuga.Rate_operator(domain, rate=0.1, label='rain')
+            labels.append('operator:' + op.label)
+
+        domain = run_dam_break(name='profile_de1', setup=add_rain,
+                               profiling=False)
+        domain_profiled = run_dam_break(name='profile_de1', setup=add_rain,
+                                        profiling=True)
+        rain = labels[-1]
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            q = domain.quantities[name].centroid_values
+            q_profiled = domain_profiled.quantities[name].centroid_values
+            assert num.all(q == q_profiled)
+
+        assert not domain.get_profiling()
+        assert domain_profiled.get_profiling()
+
+        profile = domain_profiled.get_profile()
+        phases = profile['phases']
+        for phase in ['step', 'extrapolation', 'boundary', 'fluxes',
+                      'timestep', 'ghosts', 'storage', rain]:
+            assert phases[phase]['calls'] > 0
+            assert phases[phase]['time'] >= 0.0
+
+        # rk2 timestepping, two flux evaluations per step
+        timesteps = phases['step']['calls']
+        assert phases['fluxes']['calls'] == 2*timesteps
+        assert phases[rain]['calls'] == timesteps
+        assert profile['counters']['flux_evaluations'] > 0
+        assert profile['counters']['wet_cells'] > 0
+
+        # Initial yield and one per yieldstep
+        yieldsteps = profile['yieldsteps']
+        assert len(yieldsteps) == 4
+        assert num.allclose([r['time'] for r in yieldsteps], [0.0, 0.1, 0.2, 0.3])
+        assert sum([r['phases']['step']['calls'] for r in yieldsteps]) == timesteps
+        assert sum([r['counters']['flux_evaluations'] for r in yieldsteps]) \
+               == profile['counters']['flux_evaluations']
+
+        msg = domain_profiled.profile_statistics()
+        assert rain in msg
+        assert 'flux_evaluations' in msg
+
+        domain_profiled.write_profile('profile_de1.csv')
+        lines = open('profile_de1.csv').readlines()
+        assert len(lines) == 5
+        assert 'fluxes_time' in lines[0].split(',')
+
+        domain_profiled.write_profile('profile_de1.json')
+        profile_json = json.load(open('profile_de1.json'))
+        assert profile_json['phases']['step']['calls'] == timesteps
+
+        # Pickling (as done by checkpointing) keeps profiling on
+        domain_norain = run_dam_break(name='profile_de1', finaltime=None,
+                                      profiling=True)
+        for t in domain_norain.evolve(yieldstep=0.1,finaltime=0.1):
+            pass
+        timesteps = domain_norain.get_profile()['phases']['step']['calls']
+
+        domain_copy = cPickle.loads(cPickle.dumps(domain_norain))
+        assert domain_copy.get_profiling()
+        for t in domain_copy.evolve(yieldstep=0.1,finaltime=0.2):
+            pass
+        assert domain_copy.get_profile()['phases']['step']['calls'] > timesteps
+
+        domain_profiled.set_profiling(False)
+        assert 'update_boundary' not in domain_profiled.__dict__
+        try:
+            domain_profiled.get_profile()
+        except Exception:
+            pass
+        else:
+            raise Exception('Should have raised an exception')
+
+
 if __name__ == "__main__":
     suite = unittest.makeSuite(Test_DE1_domain, 'test')
     runner = unittest.TextTestRunner(verbosity=1)
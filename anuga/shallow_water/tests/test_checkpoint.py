@@ -0,0 +1,209 @@
+import os
+import shutil
+import unittest
+import numpy as num
+
+from anuga import rectangular_cross_domain, Reflective_boundary
+from anuga import load_checkpoint_state
+from anuga.file.netcdf import NetCDFFile
+from anuga.operators.collect_max_quantities_operator import \
+     collect_max_quantities_operator
+
+
+class Test_checkpoint(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['test_checkpoint.sww']:
+            try:
+                os.remove(filename)
+            except:
+                pass
+        shutil.rmtree('test_checkpoints', ignore_errors=True)
+
+    def create_domain(self):
+        """Set up a small dam break with an operator and monitored extrema
+        """
+
+        domain = rectangular_cross_domain(6, 4, len1=6.0, len2=4.0)
+        domain.set_name('test_checkpoint')
+        domain.set_quantities_to_be_monitored(['stage'])
+
+        domain.set_quantity('elevation', lambda x, y: -x/6.0)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', lambda x, y: num.where(x < 2.0, 0.5, -x/6.0))
+
+        Br = Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        self.max_operator = collect_max_quantities_operator(domain)
+
+        return domain
+
+    def test_binary_checkpoint(self):
+
+        # Reference run without checkpoints
+        domain = self.create_domain()
+        domain.set_store(False)
+        for t in domain.evolve(yieldstep=0.25, finaltime=1.0):
+            pass
+
+        stage = domain.quantities['stage'].centroid_values.copy()
+        max_speed = self.max_operator.max_speed.copy()
+        extrema = domain.quantities_to_be_monitored['stage'].copy()
+
+        # Run checkpointed at each yieldstep, stopped at 0.5
+        domain = self.create_domain()
+        domain.set_checkpointing(checkpoint_dir='test_checkpoints',
+                                 checkpoint_step=1, checkpoint_format='binary')
+        for t in domain.evolve(yieldstep=0.25, finaltime=0.5):
+            pass
+
+        assert os.path.exists(os.path.join('test_checkpoints',
+                                            'test_checkpoint_0.5.nc'))
+        assert not os.path.exists(os.path.join('test_checkpoints',
+                                               'test_checkpoint_0.5.nc.tmp'))
+
+        # Restart from the last checkpoint in a domain set up again
+        domain = self.create_domain()
+        load_checkpoint_state(domain, 'test_checkpoints')
+
+        assert domain.get_time() == 0.5
+        assert domain.yieldstep_id == 4
+
+        for t in domain.evolve(yieldstep=0.25, finaltime=1.0,
+                               skip_initial_step=True):
+            pass
+
+        assert num.allclose(domain.quantities['stage'].centroid_values, stage)
+        assert num.allclose(self.max_operator.max_speed, max_speed)
+        info_block = domain.quantities_to_be_monitored['stage']
+        assert num.allclose(info_block['max'], extrema['max'])
+        assert num.allclose(info_block['max_location'], extrema['max_location'])
+
+        # The sww file is continued
+        fid = NetCDFFile('test_checkpoint.sww')
+        time = fid.variables['time'][:]
+        fid.close()
+        assert num.allclose(time, [0.0, 0.25, 0.5, 0.75, 1.0])
+
+        # An earlier checkpoint
+        domain = self.create_domain()
+        load_checkpoint_state(domain, 'test_checkpoints', time=0.25)
+        assert domain.get_time() == 0.25
+
+        # A domain not set up as the checkpointed one
+        domain = self.create_domain()
+        collect_max_quantities_operator(domain)
+        self.assertRaises(Exception, load_checkpoint_state,
+                          domain, 'test_checkpoints')
+
+    def test_checkpoint_writer(self):
+
+        from anuga import load_checkpoint_file
+        from anuga.shallow_water.checkpoint import read_manifest
+
+        for format in ['binary', 'pickle']:
+            domain = self.create_domain()
+            domain.set_store(False)
+            domain.set_checkpointing(checkpoint_dir='test_checkpoints',
+                                     checkpoint_step=1,
+                                     checkpoint_format=format,
+                                     checkpoint_asynchronous=True,
+                                     checkpoint_keep=2,
+                                     checkpoint_keep_interval=0.5)
+
+            for t in domain.evolve(yieldstep=0.25, finaltime=1.5):
+                # Published at a later yieldstep, once written
+                times = read_manifest('test_checkpoint', 'test_checkpoints')
+                if times is not None:
+                    assert times[-1] < t
+
+            stage = domain.quantities['stage'].centroid_values.copy()
+            writer = domain.checkpoint_writer
+            assert writer.worker is None
+
+            # The last two and the first in each half second are kept
+            times = read_manifest('test_checkpoint', 'test_checkpoints')
+            assert num.allclose(times, [0.0, 0.5, 1.0, 1.25, 1.5])
+
+            filenames = [writer.get_filename(time) for time in times]
+            assert sorted(os.listdir('test_checkpoints')) == \
+                   sorted([os.path.basename(filename) for filename in filenames]
+                          + ['test_checkpoint_checkpoints.txt'])
+
+            if format == 'binary':
+                domain = self.create_domain()
+                domain.set_store(False)
+                load_checkpoint_state(domain, 'test_checkpoints')
+            else:
+                domain = load_checkpoint_file('test_checkpoint',
+                                              'test_checkpoints')
+
+            assert domain.get_time() == 1.5
+            assert num.allclose(domain.quantities['stage'].centroid_values,
+                                stage)
+
+            shutil.rmtree('test_checkpoints')
+
+    def test_checkpoint_restart(self):
+        """Restarting continues the manifest of the published checkpoints
+        and prunes those published before the restart
+        """
+
+        from anuga import load_checkpoint_file
+        from anuga.shallow_water.checkpoint import read_manifest
+
+        for format in ['binary', 'pickle']:
+            domain = self.create_domain()
+            domain.set_store(False)
+            domain.set_checkpointing(checkpoint_dir='test_checkpoints',
+                                     checkpoint_step=1,
+                                     checkpoint_format=format,
+                                     checkpoint_keep=2,
+                                     checkpoint_keep_interval=0.5)
+
+            for t in domain.evolve(yieldstep=0.25, finaltime=0.5):
+                pass
+
+            times = read_manifest('test_checkpoint', 'test_checkpoints')
+            assert num.allclose(times, [0.0, 0.25, 0.5])
+
+            if format == 'binary':
+                domain = self.create_domain()
+                domain.set_store(False)
+                domain.set_checkpointing(checkpoint_dir='test_checkpoints',
+                                         checkpoint_step=1,
+                                         checkpoint_format=format,
+                                         checkpoint_keep=2,
+                                         checkpoint_keep_interval=0.5)
+                load_checkpoint_state(domain, 'test_checkpoints')
+            else:
+                domain = load_checkpoint_file('test_checkpoint',
+                                              'test_checkpoints')
+
+            assert domain.get_time() == 0.5
+
+            for t in domain.evolve(yieldstep=0.25, finaltime=1.25,
+                                   skip_initial_step=True):
+                pass
+
+            # The last two and the first in each half second are kept,
+            # across the restart
+            times = read_manifest('test_checkpoint', 'test_checkpoints')
+            assert num.allclose(times, [0.0, 0.5, 1.0, 1.25])
+
+            writer = domain.checkpoint_writer
+            filenames = [writer.get_filename(time) for time in times]
+            assert sorted(os.listdir('test_checkpoints')) == \
+                   sorted([os.path.basename(filename) for filename in filenames]
+                          + ['test_checkpoint_checkpoints.txt'])
+
+            shutil.rmtree('test_checkpoints')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_checkpoint, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -57,7 +57,7 @@ class Test_local_extrapolation_and_flux_updating(unittest.TestCase):
 
         return domain
 
-    def test_local_extrapolation_and_flux_updating_DE0(self):
+    def check_local_extrapolation_and_flux_updating(self, flowalg):
         """
 
         We check that results with and without local_extrapolation_and_flux_updating are 'close enough'
@@ -65,7 +65,7 @@ class Test_local_extrapolation_and_flux_updating(unittest.TestCase):
         We also check that the total volume and boundary flux integral are equal for both methods
         """
         
-        domain=self.create_domain('DE0')
+        domain=self.create_domain(flowalg)
         for t in domain.evolve(yieldstep=0.1,finaltime=20.0):
             pass
         # The domain was initially dry
@@ -73,7 +73,7 @@ class Test_local_extrapolation_and_flux_updating(unittest.TestCase):
         boundaryFluxInt=domain.get_boundary_flux_integral()
 
 
-        domain2=self.create_domain('DE0')
+        domain2=self.create_domain(flowalg)
         domain2.set_local_extrapolation_and_flux_updating(nlevels=8)
         for t in domain2.evolve(yieldstep=0.1,finaltime=20.0):
             pass
@@ -86,16 +86,47 @@ class Test_local_extrapolation_and_flux_updating(unittest.TestCase):
         assert(numpy.allclose(vol2,boundaryFluxInt2))
         assert( numpy.all(abs(domain.quantities['stage'].centroid_values-domain2.quantities['stage'].centroid_values) <0.02))
         
-        return
-    
+        return domain2
+
+    def test_local_extrapolation_and_flux_updating_DE0(self):
+        """
+        euler timestepping
+        """
+
+        self.check_local_extrapolation_and_flux_updating('DE0')
+
     def test_local_extrapolation_and_flux_updating_DE1(self):
         """
+        rk2 timestepping, also with the fused C timestep
+        """
+
+        domain=self.check_local_extrapolation_and_flux_updating('DE1')
+
+        domain2=self.create_domain('DE1')
+        domain2.set_fused_timestepping(True)
+        domain2.set_local_extrapolation_and_flux_updating(nlevels=8)
+        for t in domain2.evolve(yieldstep=0.1,finaltime=20.0):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert(numpy.all(domain.quantities[name].centroid_values==
+                             domain2.quantities[name].centroid_values))
+
+    def test_local_extrapolation_and_flux_updating_DE2(self):
+        """
+        rk3 timestepping
+        """
+
+        self.check_local_extrapolation_and_flux_updating('DE2')
+
+    def test_local_extrapolation_and_flux_updating_not_DE(self):
+        """
 
-        LEAFU should fail for DE1 since we don't have support for rk2 timestepping yet
+        LEAFU should fail for the non DE algorithms
 
         """
         
-        domain=self.create_domain('DE1')
+        domain=self.create_domain('1_5')
         Failed=True
         try:
             domain.set_local_extrapolation_and_flux_updating(nlevels=8)
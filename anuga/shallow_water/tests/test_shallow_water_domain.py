@@ -603,6 +603,129 @@ class Test_Shallow_Water(unittest.TestCase):
         # Reflective
         assert domain.quantities['ymomentum'].boundary_values[5] == 40.
 
+    def test_boundary_evaluate_segment(self):
+        """Check that the vectorised evaluate_segment of each boundary
+        gives the same values as evaluating edge by edge
+        """
+
+        from math import sin
+        from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+             import Boundary, Time_space_boundary
+        from anuga.shallow_water.boundaries import \
+             Dirichlet_discharge_boundary, Inflow_boundary
+
+        points, vertices, boundary = rectangular_cross(4, 3, len1=4.0, len2=3.0)
+
+        domain = Domain(points, vertices, boundary)
+        domain.set_quantity('elevation', lambda x, y: -x/10.0)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', lambda x, y: 0.1*x + 0.2*y)
+        domain.set_quantity('xmomentum', lambda x, y: x*y)
+        domain.set_quantity('ymomentum', lambda x, y: x - y)
+        domain.set_time(2.0)
+
+        def vector_function(t, x, y):
+            return [t + x, 0.5*y, 1.0]
+
+        def scalar_function(t, x, y):
+            if x > 2.0:
+                return [sin(t*x), y, 0.0]
+            else:
+                return [t, 0.0, x]
+
+        boundaries = [Time_space_boundary(domain, vector_function),
+                      Time_space_boundary(domain, scalar_function),
+                      Transmissive_stage_zero_momentum_boundary(domain),
+                      Transmissive_momentum_set_stage_boundary(domain,
+                                                         lambda t: 0.5*t),
+                      Dirichlet_discharge_boundary(domain, 0.3, 2.0),
+                      Inflow_boundary(domain, rate=2.0)]
+
+        ids = domain.tag_boundary_cells['left'] + domain.tag_boundary_cells['top']
+        ids = num.array(ids)
+
+        for B in boundaries:
+            B.evaluate_segment(domain, ids)
+            q_segment = [domain.quantities[name].boundary_values[ids].copy()
+                         for name in domain.evolved_quantities]
+
+            for name in domain.evolved_quantities:
+                domain.quantities[name].boundary_values[:] = 0.0
+
+            Boundary.evaluate_segment(B, domain, ids)
+            q_edges = [domain.quantities[name].boundary_values[ids]
+                       for name in domain.evolved_quantities]
+
+            assert num.allclose(q_segment, q_edges)
+
+        assert boundaries[0].vectorised is True
+        assert boundaries[1].vectorised is False
+
+    def test_file_boundary_evaluate_segment(self):
+        """Check that the vectorised evaluate_segment of File_boundary and
+        Field_boundary gives the same values as evaluating edge by edge
+        """
+
+        import time
+        from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+             import Boundary
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular
+
+        # Create sww file of a wave propagating through a square domain
+        points, vertices, boundary = rectangular(4, 4)
+
+        domain1 = Domain(points, vertices, boundary)
+        domain1.smooth = False
+        domain1.store = True
+        domain1.set_datadir('.')
+        domain1.set_name('file_boundary_segment_source' + str(time.time()))
+
+        domain1.set_quantity('elevation', lambda x, y: -x/2.0)
+        domain1.set_quantity('friction', 0)
+        domain1.set_quantity('stage', 0)
+
+        Br = Reflective_boundary(domain1)
+        Bd = Dirichlet_boundary([0.3, 0, 0])
+        domain1.set_boundary({'left': Bd, 'top': Bd, 'right': Br, 'bottom': Br})
+
+        for t in domain1.evolve(yieldstep=0.1, finaltime=0.5):
+            pass
+
+        filename = domain1.get_name() + '.sww'
+
+        # Smaller domain inside domain1
+        points, vertices, boundary = rectangular(3, 3, len1=0.8, len2=0.8,
+                                                 origin=(0.1, 0.1))
+
+        domain2 = Domain(points, vertices, boundary)
+        domain2.set_quantity('elevation', lambda x, y: -x/2.0)
+        domain2.set_quantity('stage', lambda x, y: 0.1*x)
+        domain2.set_time(0.23)
+
+        boundaries = [File_boundary(filename, domain2),
+                      Field_boundary(filename, domain2, mean_stage=0.2)]
+
+        ids = num.array(range(len(domain2.boundary_cells)))
+
+        for B in boundaries:
+            B.evaluate_segment(domain2, ids)
+            q_segment = [domain2.quantities[name].boundary_values[ids].copy()
+                         for name in domain2.evolved_quantities]
+
+            for name in domain2.evolved_quantities:
+                domain2.quantities[name].boundary_values[:] = 0.0
+
+            Boundary.evaluate_segment(B, domain2, ids)
+            q_edges = [domain2.quantities[name].boundary_values[ids]
+                       for name in domain2.evolved_quantities]
+
+            assert num.allclose(q_segment, q_edges)
+
+            # Values vary along the boundary
+            assert num.max(q_segment[0]) > num.min(q_segment[0])
+
+        os.remove(filename)
+
     def test_boundary_conditionsII(self):
         a = [0.0, 0.0]
         b = [0.0, 2.0]
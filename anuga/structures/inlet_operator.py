@@ -116,6 +116,11 @@ class Inlet_operator(anuga.Operator):
 
         return Q    
   
+    def get_changed_indices(self):
+        """The operator only changes the triangles of the inlet
+        """
+        return self.inlet.triangle_indices
+
     def statistics(self):
 
 
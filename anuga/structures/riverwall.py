@@ -396,6 +396,11 @@ class RiverWall:
         # index of edges which are riverwalls 
         self.riverwall_edges=riverwallInds
 
+        # Running count of riverwall edges, so the flux computation can find
+        # the riverwall_elevation index of an edge without a sequential scan
+        domain.edge_river_wall_counter=\
+            numpy.cumsum(domain.edge_flux_type==1).astype(int)
+
         # Record the names of the riverwalls
         self.names=nw_names
 
@@ -488,6 +488,11 @@ class Structure_operator(anuga.Operator):
         raise
             
 
+    def get_changed_indices(self):
+        """The operator only changes the triangles of its inlets
+        """
+        return num.concatenate([inlet.triangle_indices for inlet in self.inlets])
+
     def statistics(self):
 
 
@@ -629,6 +634,20 @@ class Structure_operator(anuga.Operator):
         return message
 
 
+    def get_state(self):
+        """Return the statistics of the structure, stored in binary
+        checkpoints
+        """
+
+        return {'accumulated_flow': self.accumulated_flow,
+                'discharge': self.discharge,
+                'discharge_abs_timemean': self.discharge_abs_timemean,
+                'velocity': self.velocity,
+                'outlet_depth': self.outlet_depth,
+                'delta_total_energy': self.delta_total_energy,
+                'driving_energy': self.driving_energy}
+
+
     def get_inlets(self):
         
         return self.inlets
@@ -47,6 +47,8 @@
 
 """
 from anuga.file.netcdf import NetCDFFile
+from anuga.file.sww import set_chunk_cache
+from anuga.file.lazy_sww import Lazy_sww
 import numpy
 import copy
 import matplotlib.cm
@@ -146,6 +148,9 @@ class get_output:
         p = plot_utils.get_output('channel3.sww', minimum_allowed_height=0.01)
         
        p then contains most relevant information as e.g., p.stage, p.elev, p.xmom, etc 
+
+       filename can also be a Lazy_sww (see anuga.file.lazy_sww), reusing
+       the timesteps it has cached
     """
     def __init__(self, filename, minimum_allowed_height=1.0e-03, timeSlices='all', verbose=False):
                 # FIXME: verbose is not used
@@ -202,6 +207,30 @@ def getInds(varIn, timeSlices, absMax=False):
 
 ############################################################################
 
+def _set_chunk_caches(fid):
+    """
+     Hold a block of timesteps of each chunked (netcdf4) variable in memory,
+     so that reading the file timestep by timestep does not decompress the
+     same chunks repeatedly. Does nothing for classic netcdf files.
+    """
+    for name in fid.variables.keys():
+        set_chunk_cache(fid.variables[name])
+
+def _open_sww(filename):
+    """
+     Return an open sww file and whether it is to be closed after reading.
+     filename can also be a Lazy_sww, which is read through as is (and
+     keeps the timesteps it caches)
+    """
+    if isinstance(filename, Lazy_sww):
+        return filename, False
+
+    fid=NetCDFFile(filename)
+    _set_chunk_caches(fid)
+    return fid, True
+
+############################################################################
+
 def _read_output(filename, minimum_allowed_height, timeSlices):
     """
      Purpose: To read the sww file, and output a number of variables as arrays that 
@@ -211,7 +240,7 @@ def _read_output(filename, minimum_allowed_height, timeSlices):
                 working with centroids directly
     
      Input: filename -- The name of an .sww file to read data from,
-                        e.g. read_sww('channel3.sww')
+                        e.g. read_sww('channel3.sww'), or a Lazy_sww
             minimum_allowed_height -- zero velocity when height < this
             timeSlices -- List of time indices to read (e.g. [100] or [0, 10, 21]), or 'all' or 'last' or 'max'
                           If 'max', the time-max of each variable will be computed. For xmom/ymom/xvel/yvel, the
@@ -225,7 +254,7 @@ def _read_output(filename, minimum_allowed_height, timeSlices):
     """
 
     # Open ncdf connection
-    fid=NetCDFFile(filename)
+    fid, close_fid = _open_sww(filename)
     
     time=fid.variables['time'][:]
 
@@ -318,7 +347,8 @@ def _read_output(filename, minimum_allowed_height, timeSlices):
         xmom = getInds(xmom, timeSlices=inds,absMax=True)
         ymom = getInds(ymom, timeSlices=inds,absMax=True)
 
-    fid.close()
+    if close_fid:
+        fid.close()
 
     return x, y, time, vols, stage, height, elev, friction, xmom, ymom,\
            xvel, yvel, vel, minimum_allowed_height, xllcorner,yllcorner, inds, starttime
@@ -429,7 +459,7 @@ def _get_centroid_values(p, velocity_extrapolation, verbose, timeSlices,
                   The result of e.g. p=util.get_output('mysww.sww'). 
                   See the get_output class defined above. 
                  OR:
-                  Alternatively, the name of an sww file
+                  Alternatively, the name of an sww file or a Lazy_sww
     
            velocity_extrapolation -- If true, and centroid values are not
             in the file, then compute centroid velocities from vertex velocities, and
@@ -446,12 +476,12 @@ def _get_centroid_values(p, velocity_extrapolation, verbose, timeSlices,
     """
 
     #@ Figure out if p is a string (filename) or the output of get_output
-    pIsFile=(type(p) is str)
+    pIsFile=(type(p) is str) or isinstance(p, Lazy_sww)
  
     if(pIsFile): 
-        fid=NetCDFFile(p) 
+        fid, close_fid = _open_sww(p)
     else:
-        fid=NetCDFFile(p.filename)
+        fid, close_fid = _open_sww(p.filename)
 
     # UPDATE: 15/06/2014 -- below, we now get all variables directly from the file
     #         This is more flexible, and allows to get 'max' as well
@@ -637,7 +667,8 @@ def _get_centroid_values(p, velocity_extrapolation, verbose, timeSlices,
         xvel_cent = getInds(xvel_cent, timeSlices=inds, absMax=True)
         yvel_cent = getInds(yvel_cent, timeSlices=inds, absMax=True)
 
-    fid.close()
+    if close_fid:
+        fid.close()
     
     return time, x_cent, y_cent, stage_cent, xmom_cent,\
              ymom_cent, height_cent, elev_cent, elev_cent_orig, friction_cent,\
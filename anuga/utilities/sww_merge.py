@@ -19,7 +19,13 @@ def sww_merge(domain_global_name, np, verbose=False):
     _sww_merge(swwfiles, output, verbose)
 
 
-def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False):
+def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False,
+                       processes=1, block_size=None):
+    """Merge the sww files domain_global_name_P<np>_<rank>.sww of a
+    parallel run into domain_global_name.sww, block_size timesteps at a time
+    (by default as many as fit in max_block_values) using processes
+    processes to read the files.
+    """
 
     output = domain_global_name+".sww"
     swwfiles = [ domain_global_name+"_P"+str(np)+"_"+str(v)+".sww" for v in range(np)]
@@ -36,9 +42,11 @@ def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False):
     fid.close()
 
     if 3*number_of_volumes == number_of_points:
-        _sww_merge_parallel_non_smooth(swwfiles, output, verbose, delete_old)
+        _sww_merge_parallel_non_smooth(swwfiles, output, verbose, delete_old,
+                                       processes, block_size)
     else:
-        _sww_merge_parallel_smooth(swwfiles, output, verbose, delete_old)
+        _sww_merge_parallel_smooth(swwfiles, output, verbose, delete_old,
+                                   processes, block_size)
         
 
 def _sww_merge(swwfiles, output, verbose=False):
@@ -198,16 +206,50 @@ def _sww_merge(swwfiles, output, verbose=False):
     fido.close()
 
 
-def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=False):
+# Number of values of all dynamic quantities in a block of timesteps when
+# merging (sets the default block_size of sww_merge_parallel)
+max_block_values = 2**24
+
+
+def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=False,
+                               processes=1, block_size=None):
+    """
+        Merge a list of sww files stored with smooth vertex values into a
+        single file. See _sww_merge_parallel.
+    """
+
+    _sww_merge_parallel(swwfiles, output, True, verbose, delete_old,
+                        processes, block_size)
+
+
+def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=False,
+                                   processes=1, block_size=None):
+    """
+        Merge a list of sww files stored with unique vertex values into a
+        single file. See _sww_merge_parallel.
+    """
+
+    _sww_merge_parallel(swwfiles, output, False, verbose, delete_old,
+                        processes, block_size)
+
+
+def _sww_merge_parallel(swwfiles, output, smooth, verbose=False, delete_old=False,
+                        processes=1, block_size=None):
     """
         Merge a list of sww files into a single file.
         
-        Use to merge files created by parallel runs.
+        Used to merge files created by parallel runs.
 
         The sww files to be merged must have exactly the same timesteps.
 
-        It is assumed that the separate sww files have been stored in non_smooth
-        format.
+        smooth is True if the files store one value per node and False if
+        they store three values per triangle (non_smooth format).
+
+        The static data is merged and written first. The dynamic quantities
+        are then merged block_size timesteps at a time, so memory use does
+        not depend on the number of timesteps. With processes > 1 the time
+        blocks are read from the sww files by a pool of processes while
+        this process writes the merged blocks.
 
         Note that some advanced information and custom quantities may not be
         exported.
@@ -219,313 +261,200 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
 
     if verbose:
         print "MERGING SWW Files"
-        
-    
-    first_file = True
-    tri_offset = 0
-    for filename in swwfiles:
-        if verbose:
-            print 'Reading file ', filename, ':'    
-    
-        fid = NetCDFFile(filename, netcdf_mode_r)
-         
-        if first_file:
-
-            times    = fid.variables['time'][:]
-            n_steps = len(times)
-            #number_of_timesteps = fid.dimensions['number_of_timesteps']
-            #print n_steps, number_of_timesteps
-            starttime = int(fid.starttime)
-            
-            out_s_quantities = {}
-            out_d_quantities = {}
-
-            out_s_c_quantities = {}
-            out_d_c_quantities = {}
-
-
-            xllcorner = fid.xllcorner
-            yllcorner = fid.yllcorner
-
-            number_of_global_triangles = int(fid.number_of_global_triangles)
-            number_of_global_nodes     = int(fid.number_of_global_nodes)
 
-            order      = fid.order
-            xllcorner  = fid.xllcorner;
-            yllcorner  = fid.yllcorner ;
-            zone       = fid.zone;
-            false_easting  = fid.false_easting;
-            false_northing = fid.false_northing;
-            datum      = fid.datum;
-            projection = fid.projection;
+    fid = NetCDFFile(swwfiles[0], netcdf_mode_r)
 
-            g_volumes = num.zeros((number_of_global_triangles,3),num.int)
-            g_x = num.zeros((number_of_global_nodes,),num.float32)
-            g_y = num.zeros((number_of_global_nodes,),num.float32)
+    times    = fid.variables['time'][:]
+    n_steps = len(times)
+    starttime = int(fid.starttime)
 
-            g_points = num.zeros((number_of_global_nodes,2),num.float32)
+    number_of_global_triangles = int(fid.number_of_global_triangles)
+    number_of_global_nodes     = int(fid.number_of_global_nodes)
 
-            #=====================================
-            # Deal with the vertex based variables
-            #=====================================
-            quantities = set(['elevation', 'friction', 'stage', 'xmomentum',
-                              'ymomentum', 'xvelocity', 'yvelocity', 'height'])
-            variables = set(fid.variables.keys())
+    if smooth:
+        number_of_global_points = number_of_global_nodes
+    else:
+        number_of_global_points = 3*number_of_global_triangles
+
+    georeference = {}
+    for name in ['order', 'xllcorner', 'yllcorner', 'zone', 'false_easting',
+                 'false_northing', 'datum', 'projection']:
+        georeference[name] = getattr(fid, name)
+
+    # Vertex and centroid quantities, static or dynamic
+    variables = set(fid.variables.keys())
+    names = ['elevation', 'friction', 'stage', 'xmomentum',
+             'ymomentum', 'xvelocity', 'yvelocity', 'height']
+
+    static_quantities = []
+    dynamic_quantities = []
+    static_c_quantities = []
+    dynamic_c_quantities = []
+
+    for quantity in names:
+        for q, static, dynamic in \
+                [(quantity, static_quantities, dynamic_quantities),
+                 (quantity + '_c', static_c_quantities, dynamic_c_quantities)]:
+            if q not in variables:
+                continue
+            # Test if quantity is static
+            if n_steps == fid.variables[q].shape[0]:
+                dynamic.append(q)
+            else:
+                static.append(q)
+
+    description = 'merged:' + getattr(fid, 'description')
+    format, options = _get_output_format(fid, dynamic_quantities)
 
-            quantities = list(quantities & variables)
-            
-            static_quantities = []
-            dynamic_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_quantities.append(quantity)
-                else:
-                    static_quantities.append(quantity)
-                
-            for quantity in static_quantities:
-                out_s_quantities[quantity] = num.zeros((number_of_global_nodes,),num.float32)
+    fid.close()
 
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_quantities:
-                out_d_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_nodes),num.float32)
+    #---------------------------------------------
+    # Merge the mesh and static quantities, and the
+    # local to global maps of each file
+    #---------------------------------------------
+    if smooth:
+        g_volumes = num.zeros((number_of_global_triangles,3),num.int)
+    else:
+        g_volumes = num.arange(number_of_global_triangles*3).reshape(-1,3)
 
-            #=======================================
-            # Deal with the centroid based variables
-            #=======================================
-            quantities = set(['elevation_c', 'friction_c', 'stage_c', 'xmomentum_c',
-                              'ymomentum_c', 'xvelocity_c', 'yvelocity_c', 'height_c'])
-            variables = set(fid.variables.keys())
+    g_points = num.zeros((number_of_global_points,2),num.float32)
 
-            quantities = list(quantities & variables)
-            
-            static_c_quantities = []
-            dynamic_c_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_c_quantities.append(quantity)
-                else:
-                    static_c_quantities.append(quantity)
-                
-            for quantity in static_c_quantities:
-                out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
+    out_s_quantities = {}
+    for quantity in static_quantities:
+        out_s_quantities[quantity] = \
+            num.zeros((number_of_global_points,),num.float32)
 
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_c_quantities:
-                out_d_c_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_triangles),num.float32)
-                 
-            description = 'merged:' + getattr(fid, 'description')          
-            first_file = False
+    out_s_c_quantities = {}
+    for quantity in static_c_quantities:
+        out_s_c_quantities[quantity] = \
+            num.zeros((number_of_global_triangles,),num.float32)
 
+    file_maps = []
+    for filename in swwfiles:
+        if verbose:
+            print 'Reading file ', filename, ':'
 
-        # Read in from files and add to global arrays
+        fid = NetCDFFile(filename, netcdf_mode_r)
 
         tri_l2g  = fid.variables['tri_l2g'][:]
         node_l2g = fid.variables['node_l2g'][:]
         tri_full_flag = fid.variables['tri_full_flag'][:]
-        volumes = num.array(fid.variables['volumes'][:],dtype=num.int)
-        l_volumes = num.zeros_like(volumes)
-        l_old_volumes = num.zeros_like(volumes)
-
-
-        # Change the local node ids to global id in the
-        # volume array
-
-        # FIXME SR: Surely we can knock up a numpy way of doing this
-        #for i in range(len(l_volumes)):
-        #    g_n0 = node_l2g[volumes[i,0]]
-        #    g_n1 = node_l2g[volumes[i,1]]
-        #    g_n2 = node_l2g[volumes[i,2]]
-        #
-        #    l_old_volumes[i,:] = [g_n0,g_n1,g_n2]
-
-        g_n0 = node_l2g[volumes[:,0]].reshape(-1,1)
-        g_n1 = node_l2g[volumes[:,1]].reshape(-1,1)
-        g_n2 = node_l2g[volumes[:,2]].reshape(-1,1)
-
-        #print g_n0.shape
-        l_volumes = num.hstack((g_n0,g_n1,g_n2))
-
-        #assert num.allclose(l_volumes, l_old_volumes)
 
         # Just pick out the full triangles
-        ftri_ids = num.where(tri_full_flag>0)
-        ftri_l2g = num.compress(tri_full_flag, tri_l2g)
-        
-        #f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-        #f_gids = tri_l2g[f_ids]
-
-        #print l_volumes
-        #print tri_full_flag
-        #print tri_l2g
-        #print ftri_l2g
-        
-        f_volumes0 = num.compress(tri_full_flag,volumes[:,0])
-        f_volumes1 = num.compress(tri_full_flag,volumes[:,1])
-        f_volumes2 = num.compress(tri_full_flag,volumes[:,2])
-        
-        g_volumes[ftri_l2g,0] = node_l2g[f_volumes0]
-        g_volumes[ftri_l2g,1] = node_l2g[f_volumes1]
-        g_volumes[ftri_l2g,2] = node_l2g[f_volumes2]
-
-        #fg_volumes = num.compress(tri_full_flag,l_volumes,axis=0)
-        #g_volumes[ftri_l2g] = fg_volumes
-
-
-
-
-        #g_x[node_l2g] = fid.variables['x']
-        #g_y[node_l2g] = fid.variables['y']
-
-        g_points[node_l2g,0] = fid.variables['x'][:]
-        g_points[node_l2g,1] = fid.variables['y'][:]
-        
-
-        #print number_of_timesteps
+        f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
+        f_gids = tri_l2g[f_ids]
 
+        if smooth:
+            volumes = num.array(fid.variables['volumes'][:],dtype=num.int)
 
-        # FIXME SR: It seems that some of the "ghost" node quantity values
-        # are being storded. We should only store those nodes which are associated with
-        # full triangles. So we need an index array of "full" nodes, ie those in
-        # full triangles
+            # Change the local node ids to global id in the
+            # volume array of the full triangles
+            f_volumes = volumes[f_ids]
+            g_volumes[f_gids] = node_l2g[f_volumes]
 
-        #use numpy.compress and numpy.unique to get "full nodes
+            g_points[node_l2g,0] = fid.variables['x'][:]
+            g_points[node_l2g,1] = fid.variables['y'][:]
 
-        f_volumes = num.compress(tri_full_flag,volumes,axis=0)
-        fl_nodes = num.unique(f_volumes)
-        f_node_l2g = node_l2g[fl_nodes]
+            # Only store the values of the nodes of full triangles, those
+            # of the other nodes are stored by the processor owning them
+            l_vids = num.unique(f_volumes)
+            g_vids = node_l2g[l_vids]
+        else:
+            g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
+            l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
 
-        #print len(node_l2g)
-        #print len(fl_nodes)
+            g_points[g_vids,0] = num.array(fid.variables['x'][:],dtype=num.float32)[l_vids]
+            g_points[g_vids,1] = num.array(fid.variables['y'][:],dtype=num.float32)[l_vids]
 
         # Read in static quantities
         for quantity in static_quantities:
-            #out_s_quantities[quantity][node_l2g] = \
-            #             num.array(fid.variables[quantity],dtype=num.float32)
-            q = fid.variables[quantity]
-            #print quantity, q.shape
-            out_s_quantities[quantity][f_node_l2g] = \
-                         num.array(q[:],dtype=num.float32)[fl_nodes]
-
-        
-        #Collate all dynamic quantities according to their timestep
-        for quantity in dynamic_quantities:
             q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                #out_d_quantities[quantity][i][node_l2g] = \
-                #           num.array(q[i],dtype=num.float32)
-                out_d_quantities[quantity][i][f_node_l2g] = \
-                           num.array(q[i],dtype=num.float32)[fl_nodes]
-
+            out_s_quantities[quantity][g_vids] = \
+                         num.array(q[:],dtype=num.float32)[l_vids]
 
         # Read in static c quantities
         for quantity in static_c_quantities:
-            #out_s_quantities[quantity][node_l2g] = \
-            #             num.array(fid.variables[quantity],dtype=num.float32)
-            q = fid.variables[quantity]
-            out_s_c_quantities[quantity][ftri_l2g] = \
-                         num.array(q).astype(num.float32)[ftri_ids]
-
-        
-        #Collate all dynamic c quantities according to their timestep
-        for quantity in dynamic_c_quantities:
             q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                out_d_c_quantities[quantity][i][ftri_l2g] = \
-                           num.array(q[i]).astype(num.float32)[ftri_ids]
-
+            out_s_c_quantities[quantity][f_gids] = \
+                         num.array(q[:],dtype=num.float32)[f_ids]
 
         fid.close()
 
+        file_maps.append((filename, l_vids, g_vids, f_ids, f_gids))
 
     #---------------------------
     # Write out the SWW file
     #---------------------------
-    #print g_points.shape
-
-    #print number_of_global_triangles
-    #print number_of_global_nodes
-
 
     if verbose:
             print 'Writing file ', output, ':'
-    fido = NetCDFFile(output, netcdf_mode_w)
 
-    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
+    fido = NetCDFFile(output, netcdf_mode_w, format=format)
+
+    sww = Write_sww(static_quantities, dynamic_quantities,
+                    static_c_quantities, dynamic_c_quantities, **options)
     sww.store_header(fido, starttime,
                              number_of_global_triangles,
-                             number_of_global_nodes,
+                             number_of_global_points,
                              description=description,
                              sww_precision=netcdf_float32)
 
-
-
     from anuga.coordinate_transforms.geo_reference import Geo_reference
     geo_reference = Geo_reference()
-    
+
     sww.store_triangulation(fido, g_points, g_volumes, points_georeference=geo_reference)
 
-    fido.order      = order
-    fido.xllcorner  = xllcorner;
-    fido.yllcorner  = yllcorner ;
-    fido.zone       = zone;
-    fido.false_easting  = false_easting;
-    fido.false_northing = false_northing;
-    fido.datum      = datum;
-    fido.projection = projection;
-       
+    for name, value in georeference.items():
+        setattr(fido, name, value)
+
     sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
     sww.store_static_quantities_centroid(fido, verbose=verbose, **out_s_c_quantities)
 
-    # Write out all the dynamic quantities for each timestep
-
-    for i in range(n_steps):
-        fido.variables['time'][i] = times[i]
-
-        
-    for q in dynamic_quantities:
-        q_values = out_d_quantities[q]
-        if verbose:
-            print '  Writing quantity: ',q
-            
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-        
-        # This updates the _range values
-        q_range = fido.variables[q + Write_sww.RANGE][:]
-        q_values_min = num.min(q_values)
-        if q_values_min < q_range[0]:
-            fido.variables[q + Write_sww.RANGE][0] = q_values_min
-        q_values_max = num.max(q_values)
-        if q_values_max > q_range[1]:
-            fido.variables[q + Write_sww.RANGE][1] = q_values_max        
+    del g_points, g_volumes, out_s_quantities, out_s_c_quantities
+
+    fido.variables['time'][:] = times
+
+    #------------------------------------------------
+    # Merge and write the dynamic quantities by blocks
+    # of timesteps
+    #------------------------------------------------
+    quantities = dynamic_quantities + dynamic_c_quantities
+    if len(quantities) > 0 and n_steps > 0:
+        if block_size is None:
+            values_per_timestep = \
+                len(dynamic_quantities)*number_of_global_points + \
+                len(dynamic_c_quantities)*number_of_global_triangles
+            block_size = max(1, max_block_values/values_per_timestep)
+        blocks = [(start, min(start + block_size, n_steps))
+                  for start in range(0, n_steps, block_size)]
+
+        state = {'file_maps': file_maps,
+                 'dynamic_quantities': dynamic_quantities,
+                 'dynamic_c_quantities': dynamic_c_quantities,
+                 'number_of_global_points': number_of_global_points,
+                 'number_of_global_triangles': number_of_global_triangles}
+
+        ranges = {}
+        for q in dynamic_quantities:
+            ranges[q] = num.array(fido.variables[q + Write_sww.RANGE][:])
+
+        for start, end, values in _merge_blocks(state, blocks, processes):
+            if verbose:
+                print '  Writing timesteps %d to %d' % (start, end - 1)
 
-    for q in dynamic_c_quantities:
-        if verbose:
-            print '  Writing quantity: ',q
-            
-        q_values = out_d_c_quantities[q]
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
+            for q in quantities:
+                fido.variables[q][start:end] = values[q]
 
-                                        
-    #print out_s_quantities
-    #print out_d_quantities
-    
-    #print g_x
-    #print g_y
+            # This updates the _range values
+            for q in dynamic_quantities:
+                ranges[q][0] = min(ranges[q][0], num.min(values[q]))
+                ranges[q][1] = max(ranges[q][1], num.max(values[q]))
 
-    #print g_volumes
+        for q in dynamic_quantities:
+            fido.variables[q + Write_sww.RANGE][:] = ranges[q]
 
     fido.close()
-    
+
     if delete_old:
         import os
         for filename in swwfiles:
@@ -535,269 +464,112 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
             os.remove(filename)
 
 
-def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=False):
-    """
-        Merge a list of sww files into a single file.
-
-        Used to merge files created by parallel runs.
-
-        The sww files to be merged must have exactly the same timesteps.
-
-        It is assumed that the separate sww files have been stored in non_smooth
-        format.
-
-        Note that some advanced information and custom quantities may not be
-        exported.
-
-        swwfiles is a list of .sww files to merge.
-        output is the output filename, including .sww extension.
-        verbose True to log output information
+def _get_output_format(fid, dynamic_quantities):
+    """Return the netcdf format and the Write_sww options of the merged
+    file, so that chunked and compressed (netcdf4) files are merged into
+    a file of the same kind
     """
 
-    if verbose:
-        print "MERGING SWW Files"
-
-
-    first_file = True
-    tri_offset = 0
-    for filename in swwfiles:
-        if verbose:
-            print 'Reading file ', filename, ':'
-
-        fid = NetCDFFile(filename, netcdf_mode_r)
-
-        if first_file:
-
-            times    = fid.variables['time'][:]
-            n_steps = len(times)
-            number_of_timesteps = fid.dimensions['number_of_timesteps']
-            #print n_steps, number_of_timesteps
-            starttime = int(fid.starttime)
-
-            out_s_quantities = {}
-            out_d_quantities = {}
-
-            out_s_c_quantities = {}
-            out_d_c_quantities = {}
-
-
-            xllcorner = fid.xllcorner
-            yllcorner = fid.yllcorner
-
-            number_of_global_triangles = int(fid.number_of_global_triangles)
-            number_of_global_nodes     = int(fid.number_of_global_nodes)
-            number_of_global_triangle_vertices = 3*number_of_global_triangles
-
-
-            order      = fid.order
-            xllcorner  = fid.xllcorner;
-            yllcorner  = fid.yllcorner ;
-            zone       = fid.zone;
-            false_easting  = fid.false_easting;
-            false_northing = fid.false_northing;
-            datum      = fid.datum;
-            projection = fid.projection;
-
-            g_volumes = num.arange(number_of_global_triangles*3).reshape(-1,3)
-
-
-
-            g_x = num.zeros((number_of_global_triangle_vertices,),num.float32)
-            g_y = num.zeros((number_of_global_triangle_vertices,),num.float32)
+    format = getattr(fid, 'file_format', 'NETCDF3_64BIT')
+    if format.startswith('NETCDF3') or len(dynamic_quantities) == 0:
+        return None, {}
 
-            g_points = num.zeros((number_of_global_triangle_vertices,2),num.float32)
+    var = fid.variables[dynamic_quantities[0]]
 
-            #=======================================
-            # Deal with the vertex based variables
-            #=======================================
-            quantities = set(['elevation', 'friction', 'stage', 'xmomentum',
-                              'ymomentum', 'xvelocity', 'yvelocity', 'height'])
-            variables = set(fid.variables.keys())
+    options = {}
+    chunk_shape = var.chunking()
+    if chunk_shape != 'contiguous':
+        if chunk_shape[0] == 1:
+            options['chunking'] = 'frames'
+        else:
+            options['chunking'] = 'timeseries'
 
-            quantities = list(quantities & variables)
+    filters = var.filters()
+    if filters is not None and filters.get('zlib'):
+        options['zlib_level'] = filters['complevel']
 
-            static_quantities = []
-            dynamic_quantities = []
+    if 'least_significant_digit' in var.ncattrs():
+        options['least_significant_digit'] = var.least_significant_digit
 
-            for quantity in quantities:
-                # Test if elevation is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_quantities.append(quantity)
-                else:
-                    static_quantities.append(quantity)
+    return format, options
 
-            # Static Quantities are stored as a 1D array
-            for quantity in static_quantities:
-                out_s_quantities[quantity] = num.zeros((3*number_of_global_triangles,),num.float32)
 
-            #=======================================
-            # Deal with the centroid based variables
-            #=======================================
-            quantities = set(['elevation_c', 'friction_c', 'stage_c', 'xmomentum_c',
-                              'ymomentum_c', 'xvelocity_c', 'yvelocity_c', 'height_c'])
-            variables = set(fid.variables.keys())
+# State of the process merging blocks of timesteps, see _init_merge
+_merge_state = {}
 
-            quantities = list(quantities & variables)
-            
-            static_c_quantities = []
-            dynamic_c_quantities = []
-
-            for quantity in quantities:
-                # Test if quantity is static
-                if n_steps == fid.variables[quantity].shape[0]:
-                    dynamic_c_quantities.append(quantity)
-                else:
-                    static_c_quantities.append(quantity)
-                
-            for quantity in static_c_quantities:
-                out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
-
-            description = 'merged:' + getattr(fid, 'description')
-            first_file = False
 
+def _init_merge(state):
+    """Set the local to global maps and quantities used by _merge_block
+    (the initializer of the pool of processes)
+    """
 
-        # Read in from files and add to global arrays
-
-        tri_l2g  = fid.variables['tri_l2g'][:]
-        node_l2g = fid.variables['node_l2g'][:]
-        tri_full_flag = fid.variables['tri_full_flag'][:]
-
-        f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-        f_gids = tri_l2g[f_ids]
-
-        g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-        l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-
+    _merge_state.clear()
+    _merge_state.update(state)
 
-        l_x = num.array(fid.variables['x'][:],dtype=num.float32)
-        l_y = num.array(fid.variables['y'][:],dtype=num.float32)
 
-        
-        g_x[g_vids] = l_x[l_vids]
-        g_y[g_vids] = l_y[l_vids]
-
-        g_points[g_vids,0] = g_x[g_vids]
-        g_points[g_vids,1] = g_y[g_vids]
+def _merge_block(start, end):
+    """Read timesteps start to end - 1 of the dynamic quantities from all
+    files and return them as arrays of global values
+    """
 
+    state = _merge_state
+    dynamic_quantities = state['dynamic_quantities']
+    dynamic_c_quantities = state['dynamic_c_quantities']
 
-        ## Read in static quantities
-        for quantity in static_quantities:
-            q = fid.variables[quantity]
-            out_s_quantities[quantity][g_vids] = \
-                         num.array(q).astype(num.float32)[l_vids]
-                         #num.array(q,dtype=num.float32)[l_vids]
+    values = {}
+    for q in dynamic_quantities:
+        values[q] = num.zeros((end - start, state['number_of_global_points']),
+                              num.float32)
+    for q in dynamic_c_quantities:
+        values[q] = num.zeros((end - start, state['number_of_global_triangles']),
+                              num.float32)
 
+    for filename, l_vids, g_vids, f_ids, f_gids in state['file_maps']:
+        fid = NetCDFFile(filename, netcdf_mode_r)
 
-        # Read in static c quantities
-        for quantity in static_c_quantities:
-            q = fid.variables[quantity]
-            out_s_c_quantities[quantity][f_gids] = \
-                         num.array(q).astype(num.float32)[f_ids]
-                         #num.array(q,dtype=num.float32)[f_ids]
+        for q in dynamic_quantities:
+            values[q][:, g_vids] = \
+                num.array(fid.variables[q][start:end], dtype=num.float32)[:, l_vids]
+        for q in dynamic_c_quantities:
+            values[q][:, f_gids] = \
+                num.array(fid.variables[q][start:end], dtype=num.float32)[:, f_ids]
 
-        
         fid.close()
 
-    #---------------------------
-    # Write out the SWW file
-    #---------------------------
-
-    if verbose:
-            print 'Writing file ', output, ':'
+    return start, end, values
 
-    fido = NetCDFFile(output, netcdf_mode_w)
-    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
-    sww.store_header(fido, starttime,
-                             number_of_global_triangles,
-                             number_of_global_triangles*3,
-                             description=description,
-                             sww_precision=netcdf_float32)
-
-
-    from anuga.coordinate_transforms.geo_reference import Geo_reference
-    geo_reference = Geo_reference()
-
-    sww.store_triangulation(fido, g_points, g_volumes, points_georeference=geo_reference)
 
-    fido.order      = order
-    fido.xllcorner  = xllcorner;
-    fido.yllcorner  = yllcorner ;
-    fido.zone       = zone;
-    fido.false_easting  = false_easting;
-    fido.false_northing = false_northing;
-    fido.datum      = datum;
-    fido.projection = projection;
-
-    sww.store_static_quantities(fido, verbose=verbose, **out_s_quantities)
-    sww.store_static_quantities_centroid(fido, verbose=verbose, **out_s_c_quantities)
-    
-    # Write out all the dynamic quantities for each timestep
-
-    for i in range(n_steps):
-        fido.variables['time'][i] = times[i]
-
-    for q in (dynamic_quantities + dynamic_c_quantities):
-
-        if verbose:
-            print '  Writing quantity: ',q
-                    
-        # Initialise q_values with zeros
-        if q in dynamic_quantities:
-            q_values = num.zeros((n_steps, 3*number_of_global_triangles), num.float32)
-        elif q in dynamic_c_quantities:
-            q_values = num.zeros((n_steps, number_of_global_triangles), num.float32)
-
-
-        # Read the quantities one at a time, to reduce memory usage
-        for filename in swwfiles:
-            fid = NetCDFFile(filename, netcdf_mode_r)
-
-            # Index information
-            tri_l2g  = fid.variables['tri_l2g'][:]
-            node_l2g = fid.variables['node_l2g'][:]
-            tri_full_flag = fid.variables['tri_full_flag'][:]
-            f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-            f_gids = tri_l2g[f_ids]
-            g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            for i in range(n_steps):
-                # Different indices for vertex and centroid quantities
-                if q in dynamic_quantities:
-                    q_values[i][g_vids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[l_vids]
-                elif q in dynamic_c_quantities:
-                    q_values[i][f_gids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[f_ids]
-
-            fid.close()
-
-        # Write to the file
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-
-        if q in dynamic_quantities:
-            # This updates the _range values
-            q_range = fido.variables[q + Write_sww.RANGE][:]
-            q_values_min = num.min(q_values)
-            if q_values_min < q_range[0]:
-                fido.variables[q + Write_sww.RANGE][0] = q_values_min
-            q_values_max = num.max(q_values)
-            if q_values_max > q_range[1]:
-                fido.variables[q + Write_sww.RANGE][1] = q_values_max
-
-    fido.close()
-
-    if delete_old:
-        import os
-        for filename in swwfiles:
+def _merge_blocks(state, blocks, processes=1):
+    """Generate (start, end, values) for each block of timesteps (start, end)
+    in order. With processes > 1 the blocks are merged by a pool of
+    processes, with at most two blocks per process in memory at a time.
+    """
 
-            if verbose:
-                print 'Deleting file ', filename, ':'
-            os.remove(filename)
+    if processes <= 1:
+        _init_merge(state)
+        for start, end in blocks:
+            yield _merge_block(start, end)
+        _merge_state.clear()
+        return
 
+    from multiprocessing import Pool
+    from collections import deque
 
+    pool = Pool(processes, _init_merge, (state,))
+    try:
+        pending = deque()
+        for start, end in blocks:
+            if len(pending) >= 2*processes:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(_merge_block, (start, end)))
 
+        while pending:
+            yield pending.popleft().get()
 
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
 
 
 if __name__ == "__main__":
@@ -815,16 +587,23 @@ if __name__ == "__main__":
                    help='verbosity')
     parser.add_argument('-delete_old', nargs='?', type=bool, const=True, default=False,
                    help='Flag to delete the input files')
+    parser.add_argument('-processes', type=int, default = 1,
+                   help='number of processes reading the sww files')
+    parser.add_argument('-block_size', type=int, default = None,
+                   help='number of timesteps merged at a time')
     args = parser.parse_args()
 
     np = args.np
     domain_global_name = args.f
     verbose = args.v
     delete_old = args.delete_old
+    processes = args.processes
+    block_size = args.block_size
 
 
     try:
-        sww_merge_parallel(domain_global_name, np, verbose, delete_old)
+        sww_merge_parallel(domain_global_name, np, verbose, delete_old,
+                           processes, block_size)
     except:
         msg = 'ERROR: When merging sww files %s '% domain_global_name
         print msg
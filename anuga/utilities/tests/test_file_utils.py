@@ -146,8 +146,91 @@ class Test_FileUtils(unittest.TestCase):
 			os.remove('test1.sww')
 			os.remove('test2.sww')
 			os.remove(outfile)      
-        
-        
+
+
+    def create_parallel_swwfiles(self, name, numprocs, smooth):
+        """Store the sww files of each partition of a domain, as a parallel
+        run on numprocs processors would, with linear stage and xmomentum
+        """
+        from anuga import rectangular_cross_domain
+        from anuga.parallel.sequential_distribute import \
+             sequential_distribute_dump, sequential_distribute_load_pickle_file
+
+        domain = rectangular_cross_domain(6, 5)
+        domain.set_name(name)
+        sequential_distribute_dump(domain, numprocs)
+
+        for p in range(numprocs):
+            pickle_name = '%s_P%d_%d.pickle' % (name, numprocs, p)
+            domain = sequential_distribute_load_pickle_file(pickle_name, numprocs)
+            os.remove(pickle_name)
+
+            if not smooth:
+                domain.set_store_vertices_uniquely()
+            domain.set_store_centroids(True)
+            domain.set_quantity('elevation', lambda x, y: -x)
+            for i in range(5):
+                t = 0.5*i
+                domain.set_time(t)
+                domain.set_quantity('stage', lambda x, y: x + 2*y + t)
+                domain.set_quantity('xmomentum', lambda x, y: x - y*t)
+                if i == 0:
+                    domain.initialise_storage()
+                domain.store_timestep()
+
+    def test_merge_parallel_swwfiles(self):
+        """Check that merging by blocks of timesteps, with or without a pool
+        of processes, gives the global values
+        """
+        from anuga.utilities.sww_merge import sww_merge_parallel
+        from anuga.file.netcdf import NetCDFFile
+        import numpy as num
+
+        for smooth in [True, False]:
+            self.create_parallel_swwfiles('test_merge', 3, smooth)
+
+            results = []
+            for processes, block_size in [(1, None), (1, 2), (2, 1)]:
+                sww_merge_parallel('test_merge', 3, processes=processes,
+                                   block_size=block_size)
+
+                fid = NetCDFFile('test_merge.sww')
+                x = fid.variables['x'][:]
+                y = fid.variables['y'][:]
+                volumes = fid.variables['volumes'][:]
+                time = fid.variables['time'][:]
+                stage = fid.variables['stage'][:]
+                stage_c = fid.variables['stage_c'][:]
+                xmomentum_c = fid.variables['xmomentum_c'][:]
+
+                assert len(volumes) == 120
+                if smooth:
+                    assert len(x) == 72
+                else:
+                    assert len(x) == 360
+                assert num.allclose(time, [0.0, 0.5, 1.0, 1.5, 2.0])
+
+                # Centroid values are exact for linear functions
+                xc = num.mean(x[volumes], axis=1)
+                yc = num.mean(y[volumes], axis=1)
+                assert num.allclose(fid.variables['elevation_c'][:], -xc)
+                for i, t in enumerate(time):
+                    assert num.allclose(stage_c[i], xc + 2*yc + t)
+                    assert num.allclose(xmomentum_c[i], xc - yc*t)
+
+                assert num.allclose(fid.variables['stage_range'][:],
+                                    [num.min(stage), num.max(stage)])
+                results.append((stage, stage_c))
+                fid.close()
+                os.remove('test_merge.sww')
+
+            for stage, stage_c in results[1:]:
+                assert num.all(stage == results[0][0])
+                assert num.all(stage_c == results[0][1])
+
+            for p in range(3):
+                os.remove('test_merge_P3_%d.sww' % p)
+
 
 #-------------------------------------------------------------
 
@@ -17,10 +17,12 @@ class Test_plot_utils(unittest.TestCase):
     def tearDown(self):
         pass
 
-    def create_domain(self, InitialOceanStage, InitialLandStage, flowAlg, verbose):
+    def create_domain(self, InitialOceanStage, InitialLandStage, flowAlg, verbose,
+                      sww_format=None):
         """
          Make the domain and set the flow algorithm for a test. Produces an sww
-         that we can use for testing
+         that we can use for testing. sww_format is a dictionary of
+         arguments of set_sww_format
         """
         boundaryPolygon=[ [0., 0.], [0., 100.], [100.0, 100.0], [100.0, 0.0]]
         anuga.create_mesh_from_regions(boundaryPolygon, 
@@ -43,6 +45,8 @@ class Test_plot_utils(unittest.TestCase):
         domain.set_name('test_plot_utils')
 
         domain.set_store_vertices_uniquely()
+        if sww_format is not None:
+            domain.set_sww_format(**sww_format)
        
         def topography(x,y):
             return -x/150. 
@@ -255,6 +259,61 @@ class Test_plot_utils(unittest.TestCase):
         os.remove('test_plot_utils.sww')
         
 
+    def test_netcdf4_format(self):
+        """
+            Check that chunked and compressed netcdf4 files give the same
+            outputs as classic files
+        """
+        self.create_domain(InitialOceanStage=1., InitialLandStage=0., flowAlg='DE1', verbose=verbose)
+        os.rename('test_plot_utils.sww', 'test_plot_utils_classic.sww')
+        self.create_domain(InitialOceanStage=1., InitialLandStage=0., flowAlg='DE1', verbose=verbose,
+                           sww_format={'format': 'netcdf4', 'chunking': 'timeseries'})
+
+        p1=util.get_output('test_plot_utils_classic.sww')
+        p2=util.get_output('test_plot_utils.sww')
+        self.everything_equal(p1, -1, p2, -1)
+        assert(np.all(p1.stage==p2.stage))
+
+        pc1=util.get_centroids(p1, velocity_extrapolation=True)
+        pc2=util.get_centroids(p2, velocity_extrapolation=True)
+        assert(np.all(pc1.stage==pc2.stage))
+        assert(np.all(pc1.xvel==pc2.xvel))
+
+        pc1=util.get_centroids('test_plot_utils_classic.sww', timeSlices='max')
+        pc2=util.get_centroids('test_plot_utils.sww', timeSlices='max')
+        assert(np.all(pc1.vel==pc2.vel))
+
+        os.remove('test_plot_utils_classic.sww')
+        os.remove('test_plot_utils.sww')
+
+    def test_lazy_sww(self):
+        """
+            Check that reading through a Lazy_sww gives the same outputs
+            as reading the file
+        """
+        from anuga.file.lazy_sww import Lazy_sww
+
+        self.create_domain(InitialOceanStage=1., InitialLandStage=0., flowAlg='DE1', verbose=verbose)
+
+        sww = Lazy_sww('test_plot_utils.sww')
+        for timeSlices in ['all', [3, 1], 'max']:
+            p1=util.get_output('test_plot_utils.sww', timeSlices=timeSlices)
+            p2=util.get_output(sww, timeSlices=timeSlices)
+            for name in ['stage', 'height', 'xmom', 'vel', 'elev']:
+                assert(np.all(getattr(p1, name)==getattr(p2, name)))
+
+            pc1=util.get_centroids(p1, velocity_extrapolation=True)
+            pc2=util.get_centroids(p2, velocity_extrapolation=True)
+            assert(np.all(pc1.stage==pc2.stage))
+            assert(np.all(pc1.xvel==pc2.xvel))
+
+        pc1=util.get_centroids('test_plot_utils.sww', timeSlices='last')
+        pc2=util.get_centroids(sww, timeSlices='last')
+        assert(np.all(pc1.vel==pc2.vel))
+
+        sww.close()
+        os.remove('test_plot_utils.sww')
+
     def test_timeslices(self):
         """
             Check that outputs from timeslice-subsets agree with bulk outputs
@@ -0,0 +1,143 @@
+"""Dam break on a graded mesh, with and without local timestepping
+
+The channel is discretised with cells which are 10 times smaller near
+the dam than at the ends of the channel, so that the global timestep is
+controlled by a small part of the domain. Local timestepping updates the
+fluxes of the coarse cells less often.
+
+Run directly to compare the two runs with the analytical solution, e.g.
+
+    python numerical_local_timestepping.py -alg DE1
+"""
+
+#------------------------------------------------------------------------------
+# Import necessary modules
+#------------------------------------------------------------------------------
+import os
+import sys
+import time
+
+import numpy
+import anuga
+from anuga import Domain
+
+
+#================================================================================
+# Setup parameters and globally used functions
+#================================================================================
+L = 1000.
+W = 5.
+
+h_upstream = 10.0
+
+finaltime = 20.0
+yieldstep = 10.0
+
+# Levels of local timestepping to compare with the global timestep
+nlevels = 3
+
+here = os.path.dirname(os.path.abspath(__file__))
+for case in ['dam_break_wet', 'dam_break_dry']:
+    sys.path.append(os.path.join(here, os.path.pardir, case))
+
+
+def graded_points(points, a=3.0):
+    """Stretch the x coordinates so that cells near x=0 are 1+3a times
+    smaller than at the ends of the channel
+    """
+
+    points = numpy.array(points, numpy.float)
+    xi = 2.0*points[:,0]/L
+    points[:,0] = 0.5*L*(xi + a*xi**3)/(1.0 + a)
+
+    return points
+
+
+def run_dam_break(alg, h_downstream, nlevels=0, n=400):
+    """Evolve the dam break until finaltime and return the domain and the
+    wall clock time spent in evolve
+    """
+
+    points, vertices, boundary = anuga.rectangular_cross(n, 2, L, W,
+                                                         (-L/2.0, -W/2.0))
+
+    domain = Domain(graded_points(points), vertices, boundary)
+    domain.set_flow_algorithm(alg)
+    domain.set_store(False)
+    domain.set_local_extrapolation_and_flux_updating(nlevels=nlevels)
+
+    def stage(x, y):
+        return numpy.where(x <= 0.0, h_upstream, h_downstream)
+
+    domain.set_quantity('elevation', 0.0)
+    domain.set_quantity('friction', 0.0)
+    domain.set_quantity('stage', stage)
+
+    Br = anuga.Reflective_boundary(domain)
+    Bt = anuga.Transmissive_boundary(domain)
+    domain.set_boundary({'left': Bt, 'right': Bt, 'top': Br, 'bottom': Br})
+
+    t0 = time.time()
+    for t in domain.evolve(yieldstep=yieldstep, finaltime=finaltime):
+        pass
+
+    return domain, time.time() - t0
+
+
+def stage_error(domain, analytic, h_downstream):
+    """Relative L^1 error in stage and xmomentum at the final time
+    """
+
+    x = domain.centroid_coordinates[:,0]
+    areas = domain.areas
+
+    h, u = analytic.vec_dam_break(x, domain.get_time(),
+                                  h0=h_downstream, h1=h_upstream)
+
+    stage = domain.quantities['stage'].centroid_values
+    xmom = domain.quantities['xmomentum'].centroid_values
+
+    eh = numpy.sum(areas*numpy.abs(stage - h))/numpy.sum(areas*numpy.abs(h))
+    euh = numpy.sum(areas*numpy.abs(xmom - u*h))/numpy.sum(areas*numpy.abs(u*h))
+
+    return eh, euh
+
+
+def compare(alg, verbose=False):
+    """Return a dictionary, for the wet and dry dam break, of the errors
+    with the global timestep, the errors with local timestepping and
+    the speedup from local timestepping
+    """
+
+    import analytical_dam_break_wet
+    import analytical_dam_break_dry
+
+    results = {}
+    for case, analytic, h_downstream in \
+            [('wet', analytical_dam_break_wet, 1.0),
+             ('dry', analytical_dam_break_dry, 0.0)]:
+
+        domain, global_time = run_dam_break(alg, h_downstream)
+        domain_local, local_time = run_dam_break(alg, h_downstream, nlevels)
+
+        global_errors = stage_error(domain, analytic, h_downstream)
+        local_errors = stage_error(domain_local, analytic, h_downstream)
+
+        results[case] = (global_errors, local_errors, global_time/local_time)
+
+        if verbose:
+            print '%s dam break (%s, %d triangles)' \
+                  % (case, alg, domain.number_of_elements)
+            print '    global timestep: stage error %.4e, xmom error %.4e, %.2f s' \
+                  % (global_errors[0], global_errors[1], global_time)
+            print '    local timestep:  stage error %.4e, xmom error %.4e, %.2f s' \
+                  % (local_errors[0], local_errors[1], local_time)
+            print '    speedup %.2f' % (global_time/local_time)
+
+    return results
+
+
+if __name__ == '__main__':
+
+    args = anuga.get_args()
+    compare(args.alg, verbose=True)
@@ -0,0 +1,60 @@
+"""Automatic verification that local timestepping keeps the accuracy
+of the global timestep for the wet and dry dam break.
+See functions exercised by this wrapper for more details
+"""
+
+import unittest
+import anuga
+
+args = anuga.get_args()
+
+indent = anuga.indent
+
+verbose = args.verbose
+
+class Test_results(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_local_timestepping(self):
+
+        import numerical_local_timestepping as numerical
+
+        alg = args.alg
+        if not alg.startswith('DE'):
+            # Local timestepping is only available for the DE algorithms
+            alg = 'DE0'
+
+        if verbose:
+            print
+            print indent+'Running simulations with and without local timestepping'
+
+        results = numerical.compare(alg, verbose=verbose)
+
+        for case in ['wet', 'dry']:
+            global_errors, local_errors, speedup = results[case]
+
+            print
+            print indent+'%s dam break, errors in stage and xmomentum' % case
+            print indent+'    global timestep: ', global_errors[0], global_errors[1]
+            print indent+'    local timestep:  ', local_errors[0], local_errors[1]
+            print indent+'    speedup: ', speedup
+
+            eh, euh = local_errors
+            assert eh < 0.01,  'L^1 error %g greater than 1\%'% eh
+            assert euh < 0.02,  'L^1 error %g greater than 2\%'% euh
+
+            # Not much less accurate than the global timestep
+            assert eh < 1.5*global_errors[0]
+            assert euh < 1.5*global_errors[1]
+
+
+
+#-------------------------------------------------------------
+if __name__ == '__main__':
+    suite = unittest.makeSuite(Test_results, 'test')
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)